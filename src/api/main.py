@@ -1,14 +1,119 @@
+from contextlib import asynccontextmanager
+from datetime import timedelta
+
 from fastapi import FastAPI, status
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from core.config import settings, JsonRender
+from core.admission import AdmissionMiddleware, admission_classes
+from core.cache import close_shared_backends
+from core.config import get_settings, JsonRender
+from core.deadline import DeadlineMiddleware
+from core.idempotency import Idempotency_Key, IdempotencyMiddleware
+from core.logs import RequestIdMiddleware, configure_logging, stop_logging
+from core.negotiation import NegotiationMiddleware
+from core.database import database
+from core.tasks import PeriodicTasks
+from auth.models import Refresh_Token
+from auth.revocation import revocation_index
+from work.archive import archive_closed_jobs
+from work.dispatch import DispatchEngine
+from work.events import stop_event_buffers
+from work.feed import start_job_feed, stop_job_feed
+from work.stats import rebuild_job_stats
 from auth.api import v1 as auth
 from work.api import v1 as work
 from emailManager.api import v1 as mail
 
 
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # The engine (and its pool) is created here rather than at import
+    # time, so importing the app stays cheap and every worker process
+    # opens its own connections.
+    settings = get_settings()
+    configure_logging(settings.LOG_LEVEL, settings.LOG_FORMAT,
+                      settings.LOG_QUEUE_SIZE, settings.LOG_SAMPLE_RATES)
+    database.connect()
+
+    revocation_index.sync(database)
+    tasks = PeriodicTasks()
+    tasks.add("revocation-sync", settings.REVOCATION_SYNC_SECONDS,
+              lambda: revocation_index.sync(database))
+    tasks.add("dispatch", settings.DISPATCH_INTERVAL_SECONDS,
+              DispatchEngine(database, settings.DISPATCH_BATCH_SIZE,
+                             settings.DISPATCH_MAX_JOBS).run_cycle)
+    tasks.add("job-stats", settings.JOB_STATS_RECONCILE_SECONDS,
+              lambda: rebuild_job_stats(database))
+    tasks.add("job-archive", settings.JOB_ARCHIVE_INTERVAL_SECONDS,
+              lambda: archive_closed_jobs(
+                  database, timedelta(days=settings.JOB_ARCHIVE_AFTER_DAYS),
+                  settings.JOB_ARCHIVE_BATCH_SIZE))
+    tasks.add("idempotency-purge",
+              settings.IDEMPOTENCY_PURGE_INTERVAL_SECONDS,
+              lambda: Idempotency_Key.purge_expired(database))
+    tasks.add("refresh-token-purge",
+              settings.REFRESH_TOKEN_PURGE_INTERVAL_SECONDS,
+              lambda: Refresh_Token.purge_expired(database))
+    tasks.start()
+    start_job_feed(database)
+    yield
+    await tasks.stop()
+    stop_job_feed(database)
+    stop_event_buffers()
+    close_shared_backends()
+    database.dispose()
+    stop_logging()
+
+
+# Which class each route runs under, for admission control
+# (ADMISSION_LIMITS) and deadlines (REQUEST_DEADLINES); the first
+# matching rule wins.
+ADMISSION_RULES = (
+    # Health checks and long-lived streams are never limited.
+    (None, r"/$", None),
+    (None, r"/bookings/feed/stream$", None),
+    (("POST",), r"/auth/(register|login)$", "auth"),
+    (("PUT",), r"/auth/update_user$", "auth"),
+    (("GET",), r"/(auth/export_users|bookings/export_jobs)$", "export"),
+    (("GET", "HEAD"), r"/", "read"),
+    (None, r"/", "write"),
+)
+
+# Routes whose retries with the same Idempotency-Key header replay the
+# first response instead of running again.
+IDEMPOTENT_ROUTES = (
+    (("POST",), r"/auth/register$", "idempotent"),
+    (("POST",), r"/bookings/post_job$", "idempotent"),
+)
+
+
 def get_application():
-    _app = FastAPI(title=settings.PROJECT_NAME)
+    settings = get_settings()
+    _app = FastAPI(title=settings.PROJECT_NAME, lifespan=lifespan)
+
+    # Innermost, so time spent queued for admission does not count.
+    _app.add_middleware(DeadlineMiddleware,
+                        seconds=settings.REQUEST_DEADLINES,
+                        rules=ADMISSION_RULES)
+    # Inside the rest, so shed responses still get CORS and request id
+    # headers.
+    if settings.ADMISSION_CONTROL:
+        _app.add_middleware(
+            AdmissionMiddleware,
+            classes=admission_classes(settings.ADMISSION_LIMITS),
+            rules=ADMISSION_RULES)
+    # Outside admission control, so replays are never shed or queued.
+    _app.add_middleware(
+        IdempotencyMiddleware,
+        database=database,
+        secret=settings.JWT_SECRET_KEY,
+        rules=IDEMPOTENT_ROUTES,
+        ttl=settings.IDEMPOTENCY_TTL_SECONDS,
+        lease=settings.IDEMPOTENCY_LEASE_SECONDS,
+        wait=settings.IDEMPOTENCY_WAIT_SECONDS,
+        max_body=settings.IDEMPOTENCY_MAX_RESPONSE_BYTES,
+        cache_size=settings.IDEMPOTENCY_CACHE_SIZE,
+    )
 
     _app.add_middleware(
         CORSMiddleware,
@@ -18,6 +123,14 @@ def get_application():
         allow_methods=["*"],
         allow_headers=["*"],
     )
+    _app.add_middleware(
+        NegotiationMiddleware,
+        minimum_size=settings.RESPONSE_COMPRESSION_MIN_BYTES,
+        thread_size=settings.RESPONSE_COMPRESSION_THREAD_BYTES,
+        gzip_level=settings.RESPONSE_GZIP_LEVEL,
+        brotli_quality=settings.RESPONSE_BROTLI_QUALITY,
+    )
+    _app.add_middleware(RequestIdMiddleware)
     return _app
 
 
@@ -36,4 +149,5 @@ async def index() -> JSONResponse:
 
 app.include_router(auth.router)
 app.include_router(work.router)
+app.include_router(work.stream_router)
 app.include_router(mail.router)
@@ -1,22 +1,67 @@
-from fastapi import APIRouter, HTTPException, status, Depends, Cookie, Request
+from fastapi import (APIRouter, HTTPException, status, Depends, Cookie,
+                     Query, Request, Response)
 from fastapi.responses import JSONResponse
 from fastapi.encoders import jsonable_encoder
+import logging
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import List, Optional
 
-from core.config import JsonRender
+from starlette.concurrency import run_in_threadpool
+
+from core.conditional import (make_etag, is_not_modified, not_modified,
+                              set_validators)
+from core.config import JsonRender, get_settings
+from core.dataloader import DataLoader, parse_ids, request_loader
+from core.export import export_response
 from core.database import database
 
+from auth.export import USERS_EXPORT
 from auth.models import User
 from auth.crud import TokenHandler, check_password_strength
 from auth.enums import USER_ROLES
-from auth.middleware import (get_current_user, check_auth,
-                             get_current_admin)
+from auth.middleware import (get_current_user, get_current_principal,
+                             check_auth, check_refresh, get_current_admin,
+                             AuthRateLimit)
+from auth.schemas import Decoded_Token, Principal
 from auth.schemas import (Register_User, Login_User,
-                          Update_User_Parameters)
+                          Update_User_Parameters, User_Selection)
 
 NAMESPACE = "Auth Routes"
 
+logger = logging.getLogger(__name__)
+
+
+def users_loader(request: Request) -> DataLoader:
+    """
+    The request's User.get_by_id loader; lookups made while handling one
+    request are answered by one User.get_by_ids query.
+    """
+    return request_loader(request, "users",
+                          lambda ids: User.get_by_ids(database, ids))
+
+
+def _check_password(password: str):
+    try:
+        check_password_strength(password)
+    except ValueError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={
+                "status": "400",
+                "message": str(exc)
+            })
+
+
+def _user_content(user: User, admin: bool) -> dict:
+    # Only admins see ids and password hashes.
+    if admin:
+        return jsonable_encoder(user)
+    content = jsonable_encoder(user, exclude=["id", "password"])
+    content["additional"].pop("id")
+    content["additional"].pop("user_id")
+    return content
+
+
 router = APIRouter(
     prefix="/auth",
     tags=["auth"],
@@ -27,14 +72,17 @@ router = APIRouter(
 # Post Routes Defined Below
 @router.post("/register",
              response_class=JsonRender,
+             dependencies=[Depends(AuthRateLimit("register"))],
              status_code=status.HTTP_200_OK)
 async def register(json: Register_User) -> JSONResponse:
 
     try:
-        check_password_strength(json.password)
-        user = User(json.name, json.email,
-                    json.password, USER_ROLES(json.type))
-        user.create(database)
+        _check_password(json.password)
+        # Hashing is CPU bound; it runs in the threadpool so the event
+        # loop keeps serving other requests.
+        user = await run_in_threadpool(User, json.name, json.email,
+                                       json.password, USER_ROLES(json.type))
+        await run_in_threadpool(user.create, database)
 
         content = {
             "status": 200,
@@ -48,13 +96,15 @@ async def register(json: Register_User) -> JSONResponse:
 
 @router.post("/login",
              response_class=JsonRender,
+             dependencies=[Depends(AuthRateLimit("login"))],
              status_code=status.HTTP_200_OK)
 async def login(json: Login_User, res: JsonRender) -> JSONResponse:
 
     user: User = User.get_by_email(db=database, email=json.email)
     if (not user) or (
         json.email != user.email) or (
-            not user.verify_password(json.password) or (
+            not await run_in_threadpool(user.verify_password,
+                                        json.password) or (
                 user.type.name == "REMOVED") or (
                     user.type.name == "INACTIVE")):
         raise HTTPException(
@@ -67,8 +117,7 @@ async def login(json: Login_User, res: JsonRender) -> JSONResponse:
 
     AccessToken = TokenHandler.encode_token(user_id=user.id,
                                             token_type="Access")
-    RefreshToken = TokenHandler.encode_token(user_id=user.id,
-                                             token_type="Refresh")
+    RefreshToken = TokenHandler.issue_refresh(database, user_id=user.id)
     res.headers["Authorization"] = f"Bearer {AccessToken.token}"
 
     expires_at = 60 * 60 * 24 * 14
@@ -83,6 +132,36 @@ async def login(json: Login_User, res: JsonRender) -> JSONResponse:
     return content
 
 
+@router.post("/logout",
+             response_class=JsonRender,
+             status_code=status.HTTP_200_OK)
+async def logout(res: JsonRender,
+                 refresh: Decoded_Token = Depends(check_refresh)
+                 ) -> JSONResponse:
+    TokenHandler.revoke_family(database, refresh)
+    res.delete_cookie(key="Authorization", httponly=True, secure=True)
+    content = {
+        "status": "200",
+        "message": "Signed out successfully"
+    }
+    return content
+
+
+@router.post("/logout_all",
+             response_class=JsonRender,
+             status_code=status.HTTP_200_OK)
+async def logout_everywhere(res: JsonRender,
+                            refresh: Decoded_Token = Depends(check_refresh)
+                            ) -> JSONResponse:
+    TokenHandler.revoke_user(database, refresh.user_id)
+    res.delete_cookie(key="Authorization", httponly=True, secure=True)
+    content = {
+        "status": "200",
+        "message": "Signed out of every session successfully"
+    }
+    return content
+
+
 # Get Routes Defined Below.
 @router.get("/",
             response_class=JsonRender,
@@ -98,11 +177,19 @@ def get_auth():
 async def token_refresh(req: Request, res: JsonRender,
                         Authorization: Optional[str] = Cookie(None)
                         ) -> JSONResponse:
-    DecodedRefresh = TokenHandler.decode_token(Authorization)
+    try:
+        DecodedRefresh = TokenHandler.decode_token(Authorization)
+        NewRefresh = TokenHandler.rotate_refresh(database, DecodedRefresh)
+    except Exception as exc:
+        raise HTTPException(
+            status.HTTP_401_UNAUTHORIZED,
+            detail={
+                "status": "401",
+                "message": f"{exc}; Please Sign back-in"
+            }
+        )
     NewAccess = TokenHandler.encode_token(DecodedRefresh.user_id,
                                           "Access")
-    NewRefresh = TokenHandler.encode_token(DecodedRefresh.user_id,
-                                           "Refresh")
 
     expires_at = 60 * 60 * 24 * 14
     max_age = datetime.utcnow() + timedelta(days=14)
@@ -121,8 +208,28 @@ async def token_refresh(req: Request, res: JsonRender,
             response_class=JsonRender,
             dependencies=[Depends(check_auth)],
             status_code=status.HTTP_200_OK)
-async def get_user(user: User = Depends(get_current_user)
+async def get_user(request: Request, response: Response,
+                   token: Decoded_Token = Depends(check_auth)
                    ) -> JSONResponse:
+    # The validators are read with one light query, so an unchanged user
+    # is answered with a 304 before the full user graph is loaded.
+    validators = User.get_validators(database, token.user_id)
+    if validators is None or validators[0] in (USER_ROLES.INACTIVE,
+                                               USER_ROLES.REMOVED):
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail={
+                "status": "500",
+                "message": "Error retrieving User; Please try again later."
+            }
+        )
+
+    _, fingerprint, last_modified = validators
+    etag = make_etag("user", token.user_id, "self", *fingerprint)
+    if is_not_modified(request, etag, last_modified):
+        return not_modified(etag, last_modified)
+
+    user = User.get_by_id(database, token.user_id)
     if not user:
         errorMessage = {
             "message": "User ID must be integer",
@@ -134,6 +241,7 @@ async def get_user(user: User = Depends(get_current_user)
     content = jsonable_encoder(user, exclude=["password", "id"])
     content["additional"].pop("user_id")
     content["additional"].pop("id")
+    set_validators(response, etag, last_modified)
     return content
 
 
@@ -141,8 +249,10 @@ async def get_user(user: User = Depends(get_current_user)
             response_class=JsonRender,
             dependencies=[Depends(check_auth)],
             status_code=status.HTTP_200_OK)
-async def get_specific_user(targ_user_id: str,
-                            decoded: User = Depends(get_current_user)
+async def get_specific_user(targ_user_id: str, request: Request,
+                            response: Response,
+                            decoded: Principal = Depends(
+                                get_current_principal)
                             ) -> JSONResponse:
     content = None
     if not targ_user_id.isnumeric():
@@ -154,10 +264,11 @@ async def get_specific_user(targ_user_id: str,
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=content)
 
-    targ_user: User = User.get_by_id(database, int(targ_user_id))
+    validators = User.get_validators(database, int(targ_user_id))
 
-    if not targ_user or (
-            decoded.type.name != "ADMIN" and targ_user.type.name == "ADMIN"):
+    if not validators or validators[0] in (
+            USER_ROLES.INACTIVE, USER_ROLES.REMOVED) or (
+            decoded.type.name != "ADMIN" and validators[0].name == "ADMIN"):
         content = {
             "status": "404",
             "message": "User not Found"
@@ -166,16 +277,51 @@ async def get_specific_user(targ_user_id: str,
             status_code=status.HTTP_404_NOT_FOUND,
             detail=content)
 
-    if decoded.type.name == "ADMIN":
-        content = jsonable_encoder(targ_user)
-    elif decoded.type.name != "ADMIN":
-        content = jsonable_encoder(targ_user, exclude=["id", "password"])
-        content["additional"].pop("id")
-        content["additional"].pop("user_id")
+    # Admins see a different representation, so the tag includes it.
+    _, fingerprint, last_modified = validators
+    scope = "admin" if decoded.type.name == "ADMIN" else "public"
+    etag = make_etag("user", targ_user_id, scope, *fingerprint)
+    if is_not_modified(request, etag, last_modified):
+        return not_modified(etag, last_modified)
+
+    targ_user: User = User.get_by_id(database, int(targ_user_id))
+    if targ_user is None:
+        # Deactivated since the validators were read.
+        content = {
+            "status": "404",
+            "message": "User not Found"
+        }
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=content)
+    content = _user_content(targ_user, decoded.type.name == "ADMIN")
 
+    set_validators(response, etag, last_modified)
     return content
 
 
+@router.get("/retrieve_users_by_id",
+            response_class=JsonRender,
+            status_code=status.HTTP_200_OK)
+async def get_users_by_id(ids: List[str] = Query(...),
+                          decoded: Principal = Depends(get_current_principal),
+                          users: DataLoader = Depends(users_loader)
+                          ) -> JSONResponse:
+    """
+    Many users at once (?ids=1,2,3 or ?ids=1&ids=2), with one query.
+    Users that don't exist, or that the caller may not see, map to null.
+    """
+    user_ids = parse_ids(ids, get_settings().BATCH_LOOKUP_MAX_IDS)
+    admin = decoded.type == USER_ROLES.ADMIN
+    content = {}
+    for user_id, user in zip(user_ids, await users.load_many(user_ids)):
+        visible = user is not None and (
+            admin or user.type != USER_ROLES.ADMIN)
+        content[str(user_id)] = _user_content(user, admin) if visible \
+            else None
+    return {"users": content}
+
+
 @router.get("/retrieve_users",
             response_class=JsonRender,
             dependencies=[Depends(get_current_admin)],
@@ -183,13 +329,35 @@ async def get_specific_user(targ_user_id: str,
 async def get_users() -> JSONResponse:
     content = {
         "status": "200",
-        "users":  database.get_db().query(User).all()
+        "users":  database.get_db(readonly=True).query(User).all()
     }
 
     content = jsonable_encoder(content)
     return content
 
 
+@router.get("/export_users", dependencies=[Depends(get_current_admin)],
+            status_code=status.HTTP_200_OK)
+async def export_users(format: str = "csv", chunk_size: int = 5000):
+    try:
+        return export_response(database, USERS_EXPORT, format,
+                               max(100, min(chunk_size, 50_000)))
+    except ValueError as exc:
+        content = {
+            "status": 400,
+            "message": str(exc)
+        }
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=content)
+    except RuntimeError as exc:
+        content = {
+            "status": 501,
+            "message": str(exc)
+        }
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED,
+                            detail=content)
+
+
 @router.get("/retrieve_users/{group}", response_class=JsonRender,
             dependencies=[Depends(get_current_admin)],
             status_code=status.HTTP_200_OK)
@@ -198,12 +366,13 @@ async def get_users_by_group(group: int):
     try:
         content = {
             "status": "200",
-            "users": database.get_db().query(User).filter_by(type=group).all()
+            "users": database.get_db(readonly=True).query(
+                User).filter_by(type=group).all()
         }
         return content
 
-    except Exception as exc:
-        print(str(exc))
+    except Exception:
+        logger.exception("error retrieving users of group %s", group)
         raise HTTPException(detail={
             "status": "500",
             "message": "Sorry something went wrong; Try again later"
@@ -218,13 +387,75 @@ async def get_users_by_group(group: int):
 async def update_user_parameters(data: Update_User_Parameters,
                                  decoded: User = Depends(get_current_user)
                                  ) -> JSONResponse:
-    decoded.update(database, data.dict(exclude_unset=True))
+    if data.password is not None:
+        _check_password(data.password)
+    await run_in_threadpool(decoded.update, database,
+                            data.dict(exclude_unset=True))
     content = jsonable_encoder(decoded, exclude=["password", "id"])
     content["additional"].pop("id")
     content["additional"].pop("user_id")
     return content
 
 
+async def _change_users_state(change: str, selection: User_Selection,
+                              admin: Principal) -> JSONResponse:
+    if selection.ids is None and selection.type is None and (
+            selection.created_before is None):
+        content = {
+            "status": "400",
+            "message": "Select users by ids, type or created_before"
+        }
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=content)
+    try:
+        user_type = USER_ROLES(selection.type) if (
+            selection.type is not None) else None
+    except ValueError:
+        content = {
+            "status": "400",
+            "message": f"Unknown user type {selection.type}"
+        }
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=content)
+
+    # Admins cannot lock themselves out through a bulk operation.
+    user_ids = await run_in_threadpool(
+        User.change_state, database, change, selection.ids, user_type,
+        selection.created_before, [admin.id])
+    content = {
+        "status": "200",
+        "user_ids": user_ids
+    }
+    return content
+
+
+@router.put("/archive_users",
+            response_class=JsonRender,
+            status_code=status.HTTP_200_OK)
+async def archive_users(selection: User_Selection,
+                        admin: Principal = Depends(get_current_admin)
+                        ) -> JSONResponse:
+    return await _change_users_state("archive", selection, admin)
+
+
+@router.put("/remove_users",
+            response_class=JsonRender,
+            status_code=status.HTTP_200_OK)
+async def remove_users(selection: User_Selection,
+                       admin: Principal = Depends(get_current_admin)
+                       ) -> JSONResponse:
+    return await _change_users_state("remove", selection, admin)
+
+
+@router.put("/restore_users",
+            response_class=JsonRender,
+            status_code=status.HTTP_200_OK)
+async def restore_users(selection: User_Selection,
+                        admin: Principal = Depends(get_current_admin)
+                        ) -> JSONResponse:
+    return await _change_users_state("restore", selection, admin)
+
+
 # Delete Routes Defined Below
 @router.delete("/retrieve_user/remove",
                response_class=JsonRender,
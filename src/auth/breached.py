@@ -0,0 +1,222 @@
+import heapq
+import logging
+import mmap
+import os
+import struct
+import tempfile
+from functools import lru_cache
+from hashlib import sha1
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple
+
+from auth.revocation import BloomFilter
+from core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# File layout, all integers little-endian:
+#   header   MAGIC, version (H), digest size (H), bloom probes (I),
+#            bloom bits (Q), record count (Q)
+#   bloom    ceil(bloom bits / 8) bytes, padded to a multiple of 8
+#   records  record count SHA-1 digests, truncated to digest size bytes,
+#            sorted and unique
+MAGIC = b"BRCHPWD1"
+VERSION = 1
+_HEADER = struct.Struct("<8sHHIQQ")
+SHA1_SIZE = 20
+
+
+def _bloom_positions(digest: bytes, probes: int, bits: int) -> Iterator[int]:
+    # SHA-1 output is already uniform, so its own bytes seed the probes
+    # (double hashing) instead of hashing again.
+    first = int.from_bytes(digest[:8], "little")
+    second = int.from_bytes(digest[8:16], "little") | 1
+    for index in range(probes):
+        yield (first + index * second) % bits
+
+
+def _bloom_offset() -> int:
+    return _HEADER.size
+
+
+def _records_offset(bloom_bits: int) -> int:
+    return _HEADER.size + ((bloom_bits + 63) // 64) * 8
+
+
+class BreachedPasswords:
+    """
+    Read-only view of a breached password file (see `build`).
+
+    The file is memory-mapped, so every worker on a machine shares one
+    copy of it in the page cache and nothing is read up front. A lookup
+    hashes the password once; the bloom filter rules out almost every
+    password not in the list with a few bit probes, and bloom hits are
+    confirmed by a binary search over the sorted digests.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magic, version, self.digest_size, self.probes, self.bloom_bits,
+             self.count) = _HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a breached password file")
+            self._records = _records_offset(self.bloom_bits)
+            if len(self._map) != (self._records
+                                  + self.count * self.digest_size):
+                raise ValueError(f"{path} is truncated")
+        except (ValueError, struct.error):
+            self._map.close()
+            raise
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, password: str) -> bool:
+        return self.contains_digest(sha1(password.encode()).digest())
+
+    def contains_digest(self, digest: bytes) -> bool:
+        """
+        Whether the SHA-1 `digest` (all 20 bytes) is in the list.
+        """
+        bloom, mapped = _bloom_offset(), self._map
+        for position in _bloom_positions(digest, self.probes,
+                                         self.bloom_bits):
+            if not mapped[bloom + (position >> 3)] & (1 << (position & 7)):
+                return False
+
+        size, start = self.digest_size, self._records
+        key = digest[:size]
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            offset = start + middle * size
+            record = mapped[offset:offset + size]
+            if record < key:
+                low = middle + 1
+            elif record > key:
+                high = middle
+            else:
+                return True
+        return False
+
+    def close(self):
+        self._map.close()
+
+
+def parse_hashes(lines: Iterable[str]) -> Iterator[bytes]:
+    """
+    Reads SHA-1 digests from hex lines, one per line, with anything
+    after a colon ignored (so "HASH:COUNT" lists work as they are).
+
+    Raises:
+        ValueError: On a line that is not a 40 digit hex digest.
+    """
+    for number, line in enumerate(lines, 1):
+        text = line.split(":", 1)[0].strip()
+        if not text:
+            continue
+        if len(text) != SHA1_SIZE * 2:
+            raise ValueError(f"line {number}: expected a SHA-1 hex digest")
+        yield bytes.fromhex(text)
+
+
+def _sorted_runs(digests: Iterable[bytes], run_size: int,
+                 directory: str) -> Tuple[List[str], int]:
+    # External sort, first half: sorted runs of `run_size` digests.
+    runs, run, total = [], [], 0
+    for digest in digests:
+        run.append(digest)
+        total += 1
+        if len(run) >= run_size:
+            runs.append(_write_run(run, directory))
+            run = []
+    if run or not runs:
+        runs.append(_write_run(run, directory))
+    return runs, total
+
+
+def _write_run(run: List[bytes], directory: str) -> str:
+    run.sort()
+    descriptor, path = tempfile.mkstemp(dir=directory, suffix=".run")
+    with os.fdopen(descriptor, "wb") as file:
+        file.write(b"".join(run))
+    return path
+
+
+def _read_run(path: str) -> Iterator[bytes]:
+    with open(path, "rb") as file:
+        while True:
+            digest = file.read(SHA1_SIZE)
+            if len(digest) < SHA1_SIZE:
+                return
+            yield digest
+
+
+def build(digests: Iterable[bytes], output: BinaryIO,
+          digest_size: int = SHA1_SIZE, error_rate: float = 0.01,
+          run_size: int = 5_000_000) -> int:
+    """
+    Writes SHA-1 `digests` (any order, duplicates allowed) to `output` in
+    the breached password file format.
+
+    Input larger than `run_size` digests is sorted in runs on disk and
+    merged, so memory stays bounded by one run plus the bloom filter.
+
+    Args:
+        digest_size (int): Bytes of each digest kept; 8 or more keeps
+            false matches negligible for lists of billions.
+        error_rate (float): Bloom false positive rate; the cost of a
+            false positive is one binary search.
+
+    Returns:
+        int: Distinct digests written.
+    """
+    if not 4 <= digest_size <= SHA1_SIZE:
+        raise ValueError(f"digest_size must be 4 to {SHA1_SIZE} bytes")
+
+    with tempfile.TemporaryDirectory() as directory:
+        runs, total = _sorted_runs(digests, run_size, directory)
+        bloom_bits, probes = BloomFilter.dimensions(total, error_rate)
+        bloom = bytearray(_records_offset(bloom_bits) - _bloom_offset())
+
+        output.seek(_records_offset(bloom_bits))
+        count, previous = 0, None
+        for digest in heapq.merge(*(_read_run(path) for path in runs)):
+            # Probes hash the full digest, so every input sets its bits,
+            # even one whose truncated record duplicates the last.
+            for position in _bloom_positions(digest, probes, bloom_bits):
+                bloom[position >> 3] |= 1 << (position & 7)
+            record = digest[:digest_size]
+            if record == previous:
+                continue
+            previous = record
+            output.write(record)
+            count += 1
+
+    output.seek(0)
+    output.write(_HEADER.pack(MAGIC, VERSION, digest_size, probes,
+                              bloom_bits, count))
+    output.write(bloom)
+    return count
+
+
+@lru_cache()
+def breached_passwords() -> Optional[BreachedPasswords]:
+    """
+    The configured list (BREACHED_PASSWORDS_FILE), opened on first use,
+    or None when none is configured.
+    """
+    path = get_settings().BREACHED_PASSWORDS_FILE
+    if not path:
+        return None
+    passwords = BreachedPasswords(path)
+    logger.info("loaded %d breached password hashes from %s",
+                len(passwords), path)
+    return passwords
+
+
+def is_breached(password: str) -> bool:
+    passwords = breached_passwords()
+    return passwords is not None and password in passwords
@@ -0,0 +1,60 @@
+from typing import Optional
+from weakref import WeakKeyDictionary
+
+from auth.models import User, user_observers
+from core.cache import (ReadThroughCache, serializer_from_name,
+                        shared_backend)
+from core.config import get_settings
+from core.database import Database
+
+# Keys: user:{user_id}, the dict from User.get_principal.
+_caches: "WeakKeyDictionary[Database, ReadThroughCache]" = (
+    WeakKeyDictionary())
+
+
+def principal_cache(db: Database) -> ReadThroughCache:
+    """
+    Returns the principal cache for `db`, creating it on first use.
+
+    Every targeted write to a user notifies auth.models.user_observers,
+    and _forget_users drops that user here (and, through the shared backend's
+    broadcast, in every other worker).
+    """
+    cache = _caches.get(db)
+    if cache is None:
+        settings = get_settings()
+        backend = shared_backend(settings.CACHE_BACKEND_URL)
+        cache = _caches.setdefault(db, ReadThroughCache(
+            "principals", settings.PRINCIPAL_CACHE_SIZE,
+            settings.PRINCIPAL_CACHE_TTL_SECONDS, backend=backend,
+            local_ttl=settings.PRINCIPAL_CACHE_LOCAL_TTL_SECONDS if backend
+            else None,
+            serializer=serializer_from_name(settings.CACHE_SERIALIZER)))
+    return cache
+
+
+def _forget_users(ids):
+    # user_observers is process-wide, so every database's cache drops
+    # the ids; at worst another database's entry is reloaded.
+    keys = [f"user:{id}" for id in ids]
+    for cache in list(_caches.values()):
+        cache.invalidate(*keys)
+
+
+user_observers.append(_forget_users)
+
+
+def get_principal(db: Database, user_id: int) -> Optional[dict]:
+    """
+    User.get_principal through the cache.
+    """
+    return principal_cache(db).get_or_load(
+        f"user:{user_id}", lambda: User.get_principal(db, user_id))
+
+
+async def get_principal_async(db: Database, user_id: int) -> Optional[dict]:
+    """
+    get_principal for the event loop; a miss is loaded in the threadpool.
+    """
+    return await principal_cache(db).get_or_load_async(
+        f"user:{user_id}", lambda: User.get_principal(db, user_id))
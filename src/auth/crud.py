@@ -2,14 +2,28 @@ import jwt
 import re
 from pydantic import EmailStr
 from datetime import timedelta, datetime
+from typing import Optional
+from uuid import uuid4
 
+from auth.breached import is_breached
+from auth.models import Refresh_Token
+from auth.revocation import revocation_index
 from auth.schemas import Decoded_Token, Encoded_Token
-from core.config import settings
+from core.config import get_settings
+from core.database import Database
+
+
+class RefreshTokenReused(Exception):
+    """
+    Raised when an already rotated or revoked refresh token is presented
+    again; its whole family has been revoked as a precaution.
+    """
 
 
 class TokenHandler():
 
-    def encode_token(user_id: int, token_type: str) -> Encoded_Token:
+    def encode_token(user_id: int, token_type: str,
+                     family: Optional[str] = None) -> Encoded_Token:
         """
         Encode a token to be used in requests. This is a helper
         method to encode an auth token that can be used in requests.
@@ -18,6 +32,8 @@ class TokenHandler():
             uuid: The UUID of the user
             username: The username of the user ( if any )
             token_type: specifies which token to create: 'Refresh' or 'Access'
+            family: The refresh token family to continue; a new family is
+                started when omitted. Ignored for access tokens.
 
         Returns:
             The encoded token as a base64 - encoded string. Note that you must
@@ -38,13 +54,94 @@ class TokenHandler():
         if token_type.lower() == "refresh":
             payload["exp"] = datetime.utcnow() + timedelta(
                 days=14, hours=0, minutes=0)
+            payload["jti"] = uuid4().hex
+            payload["family"] = family or uuid4().hex
 
-        payload = jwt.encode(
+        token = jwt.encode(
             payload,
-            settings.JWT_SECRET_KEY,
+            get_settings().JWT_SECRET_KEY,
             algorithm="HS256"
         )
-        return Encoded_Token(token=payload)
+        return Encoded_Token(token=token, jti=payload.get("jti"),
+                             family=payload.get("family"),
+                             expires=payload["exp"])
+
+    def issue_refresh(db: Database, user_id: int,
+                      family: Optional[str] = None) -> Encoded_Token:
+        """
+        Creates a refresh token and records its jti so it can later be
+        rotated or revoked.
+
+        Args:
+            db: The database to record the token in.
+            user_id: The id of the user the token belongs to.
+            family: The family to continue, or None to start a new one.
+
+        Returns:
+            The encoded refresh token.
+        """
+        encoded = TokenHandler.encode_token(user_id, "Refresh", family)
+        Refresh_Token(encoded.jti, encoded.family, user_id,
+                      datetime.utcnow(), encoded.expires).create(db)
+        return encoded
+
+    def rotate_refresh(db: Database, decoded: Decoded_Token) -> Encoded_Token:
+        """
+        Exchanges a refresh token for a new one in the same family and
+        revokes the old one.
+
+        Tokens issued before jti tracking existed carry no jti; they are
+        exchanged for a token in a new, tracked family.
+
+        Raises:
+            RefreshTokenReused: If the token was already rotated or
+                revoked. Its whole family is revoked before raising.
+        """
+        if not decoded.jti:
+            return TokenHandler.issue_refresh(db, decoded.user_id)
+
+        if revocation_index.is_revoked(decoded.jti):
+            TokenHandler.revoke_family(db, decoded)
+            raise RefreshTokenReused("Refresh token was already used")
+
+        encoded = TokenHandler.encode_token(decoded.user_id, "Refresh",
+                                            decoded.family)
+        successor = Refresh_Token(encoded.jti, encoded.family,
+                                  decoded.user_id, datetime.utcnow(),
+                                  encoded.expires)
+        if not Refresh_Token.rotate(db, decoded.jti, successor):
+            TokenHandler.revoke_family(db, decoded)
+            raise RefreshTokenReused("Refresh token was already used")
+
+        revocation_index.add(decoded.jti, decoded.exp)
+        return encoded
+
+    def revoke_family(db: Database, decoded: Decoded_Token) -> int:
+        """
+        Revokes every token issued from the same login as `decoded`.
+
+        Returns:
+            The number of tokens revoked.
+        """
+        if decoded.jti:
+            revocation_index.add(decoded.jti, decoded.exp)
+        if not decoded.family:
+            return 0
+        revoked = Refresh_Token.revoke(db, family=decoded.family)
+        revocation_index.sync(db)
+        return revoked
+
+    def revoke_user(db: Database, user_id: int) -> int:
+        """
+        Revokes every refresh token of a user, signing them out on every
+        device.
+
+        Returns:
+            The number of tokens revoked.
+        """
+        revoked = Refresh_Token.revoke(db, user_id=user_id)
+        revocation_index.sync(db)
+        return revoked
 
     def decode_token(token: str) -> Decoded_Token:
         """
@@ -61,7 +158,7 @@ class TokenHandler():
         try:
             payload = jwt.decode(
                 token,
-                settings.JWT_SECRET_KEY,
+                get_settings().JWT_SECRET_KEY,
                 algorithms="HS256")
         except jwt.ExpiredSignatureError as exc:
             raise exc
@@ -107,5 +204,10 @@ def check_password_strength(password) -> bool:
     if len(password) < 8:
         raise ValueError("Password must be at least 8 characters long")
 
+    # Check the password is not in the breached password list, if any
+    if is_breached(password):
+        raise ValueError("Password has appeared in a data breach; "
+                         "please choose another")
+
     # If all conditions are met, return True indicating the password is strong
     return True
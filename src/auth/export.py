@@ -0,0 +1,33 @@
+from sqlalchemy import select
+
+from auth.models import User, Additional, Contractor_Additional
+from core.export import Dataset, ExportColumn
+
+# Plain tables rather than the polymorphic entities, which would add
+# their own joins to the inheritance parent.
+_users = User.__table__
+_additional = Additional.__table__
+_contractor = Contractor_Additional.__table__
+
+USERS_EXPORT = Dataset(
+    name="users",
+    columns=(
+        ExportColumn("id", _users.c.id, "int"),
+        ExportColumn("name", _users.c.name),
+        ExportColumn("email", _users.c.email),
+        ExportColumn("type", _users.c.type),
+        ExportColumn("role", _additional.c.type),
+        ExportColumn("additional_id", _additional.c.id, "int"),
+        ExportColumn("max_active_jobs", _contractor.c.max_active_jobs,
+                     "int"),
+        ExportColumn("max_job_amount", _contractor.c.max_job_amount,
+                     "float"),
+        ExportColumn("created_on", _users.c.created_on, "datetime"),
+        ExportColumn("updated_on", _users.c.updated_on, "datetime"),
+    ),
+    build_query=lambda columns: select(*columns)
+    .select_from(_users)
+    .outerjoin(_additional, _additional.c.user_id == _users.c.id)
+    .outerjoin(_contractor, _contractor.c.id == _additional.c.id)
+    .order_by(_users.c.id),
+)
@@ -1,12 +1,22 @@
 from fastapi import (Request, HTTPException,
                      status, Depends,
-                     Cookie)
+                     Cookie, WebSocket)
+import logging
+from functools import lru_cache
+from math import ceil
 from typing import Optional
 
+from core.config import get_settings
 from core.database import database
+from core.ratelimit import RateLimiter, rate_limit_backend_from_url
+from auth.enums import USER_ROLES
 from auth.models import User
+from auth.cache import get_principal_async
 from auth.crud import TokenHandler
-from auth.schemas import Decoded_Token
+from auth.revocation import revocation_index
+from auth.schemas import Decoded_Token, Principal
+
+logger = logging.getLogger(__name__)
 
 
 def check_refresh(Authorization: Optional[str] = Cookie(None)
@@ -23,6 +33,55 @@ def check_refresh(Authorization: Optional[str] = Cookie(None)
         )
 
 
+@lru_cache()
+def get_auth_rate_limiter() -> RateLimiter:
+    settings = get_settings()
+    return RateLimiter(
+        rate_limit_backend_from_url(settings.RATE_LIMIT_BACKEND_URL))
+
+
+class AuthRateLimit:
+    """
+    Dependency that throttles an auth route per client IP and per target
+    email before the route runs, so rejected attempts never reach argon2.
+
+    Args:
+        scope (str): Name of the protected action, e.g. "login".
+    """
+
+    def __init__(self, scope: str):
+        self.scope = scope
+
+    async def __call__(self, request: Request):
+        settings = get_settings()
+        limiter = get_auth_rate_limiter()
+        period = settings.AUTH_RATE_LIMIT_PERIOD_SECONDS
+
+        client_ip = request.client.host if request.client else "unknown"
+        retry_after = limiter.check(f"{self.scope}:ip", client_ip,
+                                    settings.AUTH_RATE_LIMIT_PER_IP, period)
+
+        if not retry_after:
+            try:
+                email = (await request.json()).get("email")
+            except Exception:
+                email = None
+            if isinstance(email, str):
+                retry_after = limiter.check(
+                    f"{self.scope}:email", email.strip().lower(),
+                    settings.AUTH_RATE_LIMIT_PER_EMAIL, period)
+
+        if retry_after:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail={
+                    "status": "429",
+                    "message": "Too many attempts; Please try again later"
+                },
+                headers={"Retry-After": str(ceil(retry_after))}
+            )
+
+
 # In Testing
 # Middleware function to validate tokens and check user ID and email
 async def validate_tokens(request: Request):  # , next):
@@ -43,6 +102,24 @@ async def validate_tokens(request: Request):  # , next):
     return await next(request)
 
 
+def _decode_refresh(token: Optional[str]) -> Decoded_Token:
+    refresh = TokenHandler.decode_token(token)
+    if refresh.token_type.lower() != "refresh":
+        raise ValueError("Invalid refresh token")
+    # An O(1) in-memory check; the index is synced in the background
+    # so revocation adds no database query to the request.
+    if refresh.jti and revocation_index.is_revoked(refresh.jti):
+        raise ValueError("Session has been revoked")
+    return refresh
+
+
+def _decode_access(token: str, refresh: Decoded_Token) -> Decoded_Token:
+    DecodedAccess = TokenHandler.decode_token(token)
+    if DecodedAccess.user_id == refresh.user_id:
+        return DecodedAccess
+    raise ValueError("Please Try again later")
+
+
 async def check_auth(request: Request,
                      Authorization: Optional[str] = Cookie(None)
                      ) -> Decoded_Token:
@@ -64,11 +141,7 @@ async def check_auth(request: Request,
         or if the token is invalid.
     """
     try:
-        refresh = TokenHandler.decode_token(Authorization)
-        if refresh.token_type.lower() == "refresh":
-            # user: User = User.get_by_id(database, refresh.user_id)
-            # if user.if_user_is_active():
-            pass
+        refresh = _decode_refresh(Authorization)
     except Exception as exc:
         raise HTTPException(
             status.HTTP_401_UNAUTHORIZED,
@@ -77,23 +150,44 @@ async def check_auth(request: Request,
                 "message": f"{exc}; Please Sign back-in"
             }
         )
-    finally:
-        try:
-            AccessToken = request.headers["Authorization"].split(" ")[1]
-            DecodedAccess = TokenHandler.decode_token(AccessToken)
-            if DecodedAccess.user_id == refresh.user_id:
-                return DecodedAccess
-            raise ValueError("Please Try again later")
 
-        except Exception as exc:
+    try:
+        AccessToken = request.headers["Authorization"].split(" ")[1]
+        return _decode_access(AccessToken, refresh)
 
-            raise HTTPException(
-                status_code=status.HTTP_418_IM_A_TEAPOT,
-                detail={
-                    "status": "418",
-                    "message": str(exc)
-                }
-            )
+    except Exception as exc:
+
+        raise HTTPException(
+            status_code=status.HTTP_418_IM_A_TEAPOT,
+            detail={
+                "status": "418",
+                "message": str(exc)
+            }
+        )
+
+
+async def websocket_user(websocket: WebSocket) -> Optional[User]:
+    """
+    Authenticates a WebSocket handshake the way check_auth does a request.
+
+    Browsers cannot set headers on a WebSocket, so the access token may
+    also be passed as the `access_token` query parameter.
+
+    Returns:
+        User: The active user, or None if the session is not valid.
+    """
+    try:
+        refresh = _decode_refresh(websocket.cookies.get("Authorization"))
+        header = websocket.headers.get("Authorization")
+        AccessToken = header.split(" ")[1] if header else (
+            websocket.query_params["access_token"])
+        decoded = _decode_access(AccessToken, refresh)
+        user = User.get_by_id(database, decoded.user_id)
+        if user is not None and user.if_user_is_active():
+            return user
+    except Exception:
+        pass
+    return None
 
 
 async def get_current_user(token: Decoded_Token = Depends(check_auth)
@@ -103,8 +197,26 @@ async def get_current_user(token: Decoded_Token = Depends(check_auth)
         if DecodedUser.if_user_is_active():
             return DecodedUser
 
-    except Exception as exc:
-        print(str(exc))
+    except Exception:
+        logger.exception("error retrieving user %s", token.user_id)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail={
+                "status": "500",
+                "message": "Error retrieving User; Please try again later."
+            }
+        )
+
+
+async def get_current_principal(token: Decoded_Token = Depends(check_auth)
+                                ) -> Principal:
+    """
+    The active user making the request, from the principal cache; for
+    routes that only need to know who is asking, not the full user.
+    """
+    principal = await get_principal_async(database, token.user_id)
+    if principal is None or USER_ROLES(principal["type"]) in (
+            USER_ROLES.INACTIVE, USER_ROLES.REMOVED):
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail={
@@ -112,10 +224,12 @@ async def get_current_user(token: Decoded_Token = Depends(check_auth)
                 "message": "Error retrieving User; Please try again later."
             }
         )
+    return Principal(**principal)
 
 
-async def get_current_admin(user: User = Depends(get_current_user)) -> User:
-    if user.type.name.lower() != "admin":
+async def get_current_admin(user: Principal = Depends(get_current_principal)
+                            ) -> Principal:
+    if user.type != USER_ROLES.ADMIN:
         content = {
             "status": "500",
             "message": "Sorry something went wrong; Try again later"
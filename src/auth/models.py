@@ -1,20 +1,57 @@
 from fastapi import HTTPException, status
 from sqlalchemy import (ForeignKey,
-                        Column, Integer,
-                        String, Enum)
-from sqlalchemy.orm import relationship, joinedload
+                        Column, Integer, Float,
+                        String, Enum, UniqueConstraint, literal_column,
+                        select, update)
+from sqlalchemy.orm import relationship, joinedload, with_polymorphic
 from sqlalchemy.sql import func
 from sqlalchemy.types import DateTime
 from pydantic import EmailStr
 
-from argon2 import PasswordHasher
-from argon2.exceptions import (VerifyMismatchError,
-                               InvalidHashError, VerificationError)
+from datetime import datetime
+from functools import lru_cache
 from os import urandom
+import logging
+from typing import Callable, Dict, List, Optional
 
-from auth.enums import USER_ROLES
+from auth.enums import USER_ROLES, CATEGORY_STATES
 from core.database import ModelBase as Base, Database
 
+logger = logging.getLogger(__name__)
+
+_ACTIVE_ROLES = (USER_ROLES.ADMIN, USER_ROLES.CLIENT, USER_ROLES.CONTRACTOR,
+                 USER_ROLES.OFFICER)
+
+# change: (the role users move to, the roles the change applies to). A
+# None target means the role recorded on the user's additional row.
+USER_STATE_CHANGES = {
+    "archive": (USER_ROLES.INACTIVE, _ACTIVE_ROLES),
+    "remove": (USER_ROLES.REMOVED, _ACTIVE_ROLES + (USER_ROLES.INACTIVE,)),
+    "restore": (None, (USER_ROLES.INACTIVE, USER_ROLES.REMOVED)),
+}
+
+# Called with the ids of users whose row was changed by a targeted
+# UPDATE; caches holding user data register here to drop those users.
+user_observers: List[Callable[[List[int]], None]] = []
+
+
+def _notify_user_observers(ids: List[int]):
+    for observer in user_observers:
+        try:
+            observer(ids)
+        except Exception:
+            logger.exception("user observer failed")
+
+
+@lru_cache()
+def _password_hasher():
+    """
+    Builds the shared argon2 PasswordHasher on first use, so argon2 is
+    only imported by workers that actually hash or verify passwords.
+    """
+    from argon2 import PasswordHasher
+    return PasswordHasher(salt_len=16)
+
 
 class User(Base):
 
@@ -25,6 +62,12 @@ class User(Base):
     created_on = Column(DateTime(timezone=True), server_default=func.now(),
                         nullable=False)
     type = Column(Enum(USER_ROLES), nullable=False)
+    # Bumped by every UPDATE of the row; together with updated_on these
+    # are the validators behind the user ETag/Last-Modified headers.
+    version = Column(Integer, nullable=False, default=1,
+                     onupdate=literal_column("version") + 1)
+    updated_on = Column(DateTime(timezone=True), server_default=func.now(),
+                        onupdate=func.now(), nullable=False)
 
     # Define a polymorphic relationship
     additional = relationship("Additional", uselist=False, lazy="joined")
@@ -38,17 +81,20 @@ class User(Base):
 
     def set_password(self, password: str):
         if password:
-            ph = PasswordHasher(salt_len=16)
+            ph = _password_hasher()
             self.password = ph.hash(password=password, salt=urandom(16))
 
     def verify_password(self, password: str) -> bool:
-        ph = PasswordHasher()
+        from argon2.exceptions import (VerifyMismatchError,
+                                       InvalidHashError, VerificationError)
+        ph = _password_hasher()
         try:
             return ph.verify(hash=self.password, password=password)
         except (VerifyMismatchError,
                 InvalidHashError,
                 VerificationError) as exc:
-            print(str(exc))
+            logger.debug("password verification failed for user %s: %s",
+                         self.id, type(exc).__name__)
             return False
 
     def change_password(self, db: Database,
@@ -67,10 +113,7 @@ class User(Base):
         if not self.verify_password(old_password):
             return False
 
-        with db.get_db() as session:
-            self.set_password(new_password)
-            session.merge(self)
-            session.commit()
+        self.update(db, {"password": new_password})
         return True
 
     def create(self, db: Database):
@@ -101,12 +144,17 @@ class User(Base):
             session.add(self)
             session.commit()
             session.refresh(self)
+        # Caches may hold a "no such user" answer for this id.
+        _notify_user_observers([self.id])
         return True
 
     def update(self, db: Database, fields: dict):
         """
         Updates the user object in the database with the provided fields.
 
+        Only the given columns are written, with one UPDATE; the row's
+        version and updated_on move on as part of it.
+
         Args:
             fields (dict): A dictionary containing the fields to update
             and their new values.
@@ -115,38 +163,169 @@ class User(Base):
             User: The updated user object.
         """
 
+        values = {}
         for field, value in fields.items():
             setattr(self, field, value) if (
                 field != "password") else self.set_password(value)
+            values[field] = getattr(self, field)
+        if not values:
+            return self
 
         with db.get_db() as session:
-            session.merge(self)
+            session.execute(update(User.__table__).where(
+                User.id == self.id).values(**values))
             session.commit()
-            return self
+        self.version = (self.version or 0) + 1
+        _notify_user_observers([self.id])
+        return self
+
+    def change_state(db: Database, change: str,
+                     ids: Optional[List[int]] = None,
+                     type: Optional[USER_ROLES] = None,
+                     created_before: Optional[datetime] = None,
+                     exclude: Optional[List[int]] = None) -> List[int]:
+        """
+        Archives, removes or restores every user matching the filters
+        with a single UPDATE (see USER_STATE_CHANGES for what each change
+        applies to). Restoring gives users back the role of their
+        additional row.
 
-    def archive_user(self, db: Database):
-        self.type = USER_ROLES.INACTIVE
+        On Postgres the affected ids come back from the UPDATE itself;
+        elsewhere they are selected first in the same transaction.
 
-        with db.get_db() as session:
-            session.merge(self)
-            session.commit()
-            return self
+        Args:
+            change (str): "archive", "remove" or "restore".
+            ids (list[int], optional): Only these users.
+            type (USER_ROLES, optional): Only users currently in this role.
+            created_before (datetime, optional): Only users created
+                before this moment.
+            exclude (list[int], optional): Never these users.
 
-    def remove_user(self, db: Database):
-        self.type = USER_ROLES.REMOVED
+        Returns:
+            list[int]: The ids of the users that changed state.
 
+        Raises:
+            ValueError: If `change` is unknown.
+        """
+        try:
+            new_type, from_types = USER_STATE_CHANGES[change]
+        except KeyError:
+            raise ValueError(f"Unknown user state change {change!r}")
+
+        users = User.__table__
+        additional = Additional.__table__
+        conditions = [users.c.type.in_(from_types)]
+        if ids is not None:
+            conditions.append(users.c.id.in_(ids))
+        if type is not None:
+            conditions.append(users.c.type == type)
+        if created_before is not None:
+            conditions.append(users.c.created_on < created_before)
+        if exclude:
+            conditions.append(users.c.id.notin_(exclude))
+        if new_type is None:
+            new_type = select(additional.c.type).where(
+                additional.c.user_id == users.c.id).scalar_subquery()
+            conditions.append(users.c.id.in_(select(additional.c.user_id)))
+
+        statement = update(users).values(type=new_type)
         with db.get_db() as session:
-            session.merge(self)
+            if session.bind.dialect.name == "postgresql":
+                changed = session.execute(
+                    statement.where(*conditions).returning(users.c.id)
+                ).scalars().all()
+            else:
+                changed = session.execute(
+                    select(users.c.id).where(*conditions)).scalars().all()
+                if changed:
+                    session.execute(statement.where(
+                        users.c.id.in_(changed), *conditions))
             session.commit()
-            return self
+
+        if changed:
+            _notify_user_observers(changed)
+        return changed
+
+    def _change_own_state(self, db: Database, change: str):
+        if self.id in User.change_state(db, change, ids=[self.id]):
+            new_type = USER_STATE_CHANGES[change][0]
+            self.type = new_type if new_type is not None else (
+                self.additional.type)
+        return self
+
+    def archive_user(self, db: Database):
+        return self._change_own_state(db, "archive")
+
+    def remove_user(self, db: Database):
+        return self._change_own_state(db, "remove")
 
     def restore_user(self, db: Database):
-        self.type = self.additional.type
+        return self._change_own_state(db, "restore")
 
-        with db.get_db() as session:
-            session.merge(self)
-            session.commit()
-            return self
+    def get_validators(db: Database, user_id: int):
+        """
+        Reads what a user's representation depends on without loading it:
+        the user row's version and a fingerprint of the jobs embedded in
+        it (posted jobs for clients, taken jobs for contractors).
+
+        Args:
+            user_id (int): The Id number of the user.
+
+        Returns:
+            tuple | None: (type, fingerprint, last_modified), or None if
+            the user does not exist.
+        """
+        from work.models import Jobs
+
+        users = User.__table__
+        additional = Additional.__table__
+        with db.get_db(readonly=True) as session:
+            row = session.execute(
+                select(users.c.type, users.c.version, users.c.updated_on,
+                       additional.c.id)
+                .select_from(users)
+                .outerjoin(additional, additional.c.user_id == users.c.id)
+                .where(users.c.id == user_id)).first()
+            if row is None:
+                return None
+            user_type, version, last_modified, additional_id = row
+
+            owner = {USER_ROLES.CLIENT: Jobs.poster_id,
+                     USER_ROLES.CONTRACTOR: Jobs.taken_by_user_id
+                     }.get(user_type)
+            jobs = (0, 0, 0, None)
+            if owner is not None and additional_id is not None:
+                # Versions only grow, so any edit, addition or removal
+                # changes the count or one of the sums.
+                jobs = tuple(session.execute(
+                    select(func.count(Jobs.id), func.sum(Jobs.id),
+                           func.sum(Jobs.version), func.max(Jobs.updated_on))
+                    .where(owner == additional_id)).first())
+
+        if jobs[3] is not None and jobs[3] > last_modified:
+            last_modified = jobs[3]
+        return user_type, (version, additional_id) + jobs[:3], last_modified
+
+    def get_principal(db: Database, user_id: int) -> Optional[dict]:
+        """
+        Reads what authorizing a request needs, with one query and
+        without loading the user's jobs.
+
+        Returns:
+            dict | None: id, type (the role's value) and additional_id,
+            or None if the user does not exist.
+        """
+        users = User.__table__
+        additional = Additional.__table__
+        with db.get_db(readonly=True) as session:
+            row = session.execute(
+                select(users.c.id, users.c.type, additional.c.id)
+                .select_from(users)
+                .outerjoin(additional, additional.c.user_id == users.c.id)
+                .where(users.c.id == user_id)).first()
+        if row is None:
+            return None
+        return {"id": row[0], "type": row[1].value, "additional_id": row[2]}
 
     def get_by_id(db: Database, user_id: int):
         """
@@ -159,7 +338,7 @@ class User(Base):
             User | None: The user object if found, None otherwise.
         """
 
-        with db.get_db() as session:
+        with db.get_db(readonly=True) as session:
             user = session.query(User).filter_by(
                 id=user_id).scalar()
             user_type = user.type if user else None
@@ -191,6 +370,29 @@ class User(Base):
                     joinedload(User.additional.of_type(
                         Officer_Additional))).scalar()
 
+    def get_by_ids(db: Database, user_ids: List[int]) -> Dict[int, "User"]:
+        """
+        Retrieves many users with one query, loaded exactly as get_by_id
+        loads each of them.
+
+        Args:
+            user_ids (list): The Ids of the users to retrieve.
+
+        Returns:
+            dict: Each active user found, by Id. Inactive, removed and
+            missing users are left out.
+        """
+        additional = with_polymorphic(
+            Additional, [Admin_Additional, Officer_Additional,
+                         Contractor_Additional, Client_Additional],
+            flat=True)
+        with db.get_db(readonly=True) as session:
+            users = session.query(User).join(Additional).filter(
+                User.id.in_(user_ids), User.type.in_(_ACTIVE_ROLES),
+                Additional.type == User.type).options(
+                joinedload(User.additional.of_type(additional))).all()
+        return {user.id: user for user in users}
+
     def get_by_email(db: Database, email: EmailStr):
         """
         Retrieves a user object by their email address.
@@ -202,7 +404,7 @@ class User(Base):
             User | None: The user object if found, None otherwise.
         """
 
-        with db.get_db() as session:
+        with db.get_db(readonly=True) as session:
 
             user = session.query(User).filter_by(
                 email=email).scalar()
@@ -307,11 +509,85 @@ class Contractor_Additional(Additional):
     # Add role-specific columns for Contractor
     jobs = relationship("Jobs", back_populates="taken_by_user",
                         lazy="joined", uselist=True)
+    # Dispatch limits: how many open jobs the contractor takes at once and,
+    # optionally, the largest job amount they accept.
+    max_active_jobs = Column(Integer, nullable=False, default=3)
+    max_job_amount = Column(Float, nullable=True)
+    skills = relationship("Contractor_Skill", lazy="select", uselist=True,
+                          cascade="all, delete-orphan")
+    # Service area: on-site jobs are dispatched to the contractor only
+    # within service_radius_km of this point. Without one, the contractor
+    # may be sent anywhere.
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    service_radius_km = Column(Float, nullable=True)
 
     __mapper_args__ = {
         'polymorphic_identity': USER_ROLES.CONTRACTOR
     }
 
+    def set_service_area(db: Database, contractor_id: int, user_id: int,
+                         latitude: Optional[float],
+                         longitude: Optional[float],
+                         radius_km: Optional[float]) -> bool:
+        """
+        Sets (or, with None, clears) a contractor's service area. The
+        user's row is touched in the same transaction, so its version
+        (and the user's ETag) moves on with it.
+
+        Returns:
+            bool: False if there is no such contractor.
+        """
+        table = Contractor_Additional.__table__
+        with db.get_db() as session:
+            result = session.execute(update(table).where(
+                table.c.id == contractor_id).values(
+                latitude=latitude, longitude=longitude,
+                service_radius_km=radius_km))
+            if result.rowcount == 1:
+                session.execute(update(User.__table__).where(
+                    User.id == user_id).values(
+                    version=User.__table__.c.version + 1))
+            session.commit()
+        _notify_user_observers([user_id])
+        return result.rowcount == 1
+
+    def dispatch_profile(db: Database, contractor_id: int
+                         ) -> Optional[dict]:
+        """
+        What decides which jobs suit a contractor: the service area,
+        max_job_amount and skills (an empty list for generalists).
+        """
+        table = Contractor_Additional.__table__
+        with db.get_db(readonly=True) as session:
+            row = session.execute(select(
+                table.c.latitude, table.c.longitude,
+                table.c.service_radius_km, table.c.max_job_amount).where(
+                table.c.id == contractor_id)).first()
+            if row is None:
+                return None
+            skills = session.execute(select(Contractor_Skill.category).where(
+                Contractor_Skill.contractor_id == contractor_id)
+            ).scalars().all()
+        return {"latitude": row.latitude, "longitude": row.longitude,
+                "service_radius_km": row.service_radius_km,
+                "max_job_amount": row.max_job_amount, "skills": skills}
+
+
+class Contractor_Skill(Base):
+    """
+    A job category a contractor can be dispatched for. Contractors with
+    no skills recorded are treated as generalists by the dispatcher.
+    """
+
+    id = Column(Integer, primary_key=True, index=True, nullable=False)
+    contractor_id = Column(Integer, ForeignKey(Contractor_Additional.id,
+                                               ondelete="CASCADE"),
+                           index=True, nullable=False)
+    category = Column(Enum(CATEGORY_STATES), nullable=False)
+
+    __table_args__ = (UniqueConstraint("contractor_id", "category"),)
+
 
 class Client_Additional(Additional):
 
@@ -323,3 +599,128 @@ class Client_Additional(Additional):
     __mapper_args__ = {
         'polymorphic_identity': USER_ROLES.CLIENT
     }
+
+
+class Refresh_Token(Base):
+    """
+    Server-side record of every refresh token issued, keyed by its jti.
+
+    Tokens issued from the same login share a `family`; rotating a token
+    revokes it and records its successor, so presenting an already
+    rotated token again is detectable as reuse.
+    """
+
+    id = Column(Integer, primary_key=True, index=True, nullable=False)
+    jti = Column(String(length=32), unique=True, index=True, nullable=False)
+    family = Column(String(length=32), index=True, nullable=False)
+    user_id = Column(Integer, ForeignKey(User.id, ondelete="CASCADE"),
+                     index=True, nullable=False)
+    issued_on = Column(DateTime(timezone=True), nullable=False)
+    expires_on = Column(DateTime(timezone=True), nullable=False)
+    revoked_on = Column(DateTime(timezone=True), index=True, nullable=True)
+    replaced_by = Column(String(length=32), nullable=True)
+
+    def __init__(self, jti: str, family: str, user_id: int,
+                 issued_on: datetime, expires_on: datetime):
+        self.jti = jti
+        self.family = family
+        self.user_id = user_id
+        self.issued_on = issued_on
+        self.expires_on = expires_on
+
+    def create(self, db: Database):
+        with db.get_db() as session:
+            session.add(self)
+            session.commit()
+        return True
+
+    def rotate(db: Database, old_jti: str, new_token: "Refresh_Token"
+               ) -> bool:
+        """
+        Revokes `old_jti` and stores its successor in one transaction.
+
+        The revoke only matches a token that is still live, so when two
+        requests race to rotate the same token only one of them wins.
+
+        Returns:
+            bool: True if the old token was live and has been rotated,
+            False if it was already revoked (i.e. it is being reused).
+        """
+
+        with db.get_db() as session:
+            result = session.execute(
+                update(Refresh_Token).where(
+                    Refresh_Token.jti == old_jti,
+                    Refresh_Token.revoked_on.is_(None)
+                ).values(revoked_on=datetime.utcnow(),
+                         replaced_by=new_token.jti))
+            if result.rowcount != 1:
+                session.rollback()
+                return False
+            session.add(new_token)
+            session.commit()
+        return True
+
+    def revoke(db: Database, family: Optional[str] = None,
+               user_id: Optional[int] = None) -> int:
+        """
+        Revokes every live token in a family, or every live token of a
+        user (logout everywhere).
+
+        Returns:
+            int: The number of tokens revoked.
+        """
+
+        statement = update(Refresh_Token).where(
+            Refresh_Token.revoked_on.is_(None))
+        if family is not None:
+            statement = statement.where(Refresh_Token.family == family)
+        if user_id is not None:
+            statement = statement.where(Refresh_Token.user_id == user_id)
+
+        with db.get_db() as session:
+            result = session.execute(
+                statement.values(revoked_on=datetime.utcnow()))
+            session.commit()
+            return result.rowcount
+
+    def get_by_jti(db: Database, jti: str):
+        with db.get_db() as session:
+            return session.query(Refresh_Token).filter_by(jti=jti).scalar()
+
+    def revoked_since(db: Database, since: Optional[datetime]
+                      ) -> List["Refresh_Token"]:
+        """
+        Lists tokens revoked at or after `since` that have not expired
+        yet; with no cursor, every revoked and unexpired token.
+        """
+
+        # Read from the primary: a lagging replica could hide revocations
+        # that the cursor has already moved past.
+        with db.get_db() as session:
+            query = session.query(Refresh_Token).filter(
+                Refresh_Token.revoked_on.isnot(None),
+                Refresh_Token.expires_on > datetime.utcnow())
+            if since is not None:
+                query = query.filter(Refresh_Token.revoked_on >= since)
+            return query.order_by(Refresh_Token.revoked_on).all()
+
+    def purge_expired(db: Database) -> int:
+        """
+        Deletes tokens past their expiry; they are refused on their own
+        and no longer needed to detect reuse.
+
+        Returns:
+            int: The number of tokens deleted.
+        """
+
+        with db.get_db() as session:
+            deleted = session.query(Refresh_Token).filter(
+                Refresh_Token.expires_on <= datetime.utcnow()
+            ).delete(synchronize_session=False)
+            session.commit()
+        return deleted
+
+# Jobs is referenced by name from the Additional relationships above, so its
+# mapper must be registered before any User query configures the mappers.
+import work.models  # noqa: E402,F401
@@ -0,0 +1,154 @@
+import math
+from datetime import datetime, timedelta, timezone
+from hashlib import blake2b
+from threading import Lock
+from typing import Dict, Iterable, Optional
+
+from core.database import Database
+
+
+def _naive_utc(moment: datetime) -> datetime:
+    # Postgres returns aware timestamps and SQLite naive ones; compare
+    # everything as naive UTC like the rest of the token code.
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+class BloomFilter:
+    """
+    Fixed-size bloom filter over strings.
+
+    Sized for `capacity` items at `error_rate` false positives; each
+    lookup hashes once and probes `hash_count` bits, so it is O(1) and
+    never returns a false negative.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.capacity = max(1, capacity)
+        self.size, self.hash_count = self.dimensions(self.capacity,
+                                                     error_rate)
+        self._bits = bytearray((self.size + 7) // 8)
+
+    @staticmethod
+    def dimensions(capacity: int, error_rate: float):
+        """
+        Bits and probes per item for `capacity` items at `error_rate`.
+        """
+        capacity = max(1, capacity)
+        size = max(8, int(-capacity * math.log(error_rate)
+                          / (math.log(2) ** 2)))
+        return size, max(1, round(size / capacity * math.log(2)))
+
+    def _positions(self, item: str):
+        digest = blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        for index in range(self.hash_count):
+            yield (first + index * second) % self.size
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(item))
+
+
+class RevocationIndex:
+    """
+    In-memory view of revoked refresh tokens, kept in step with the
+    refresh_token table.
+
+    `is_revoked` answers from memory: the bloom filter rules out almost
+    every live token with a few bit probes, and only bloom hits are
+    confirmed against the exact jti map. `sync` pulls revocations made
+    since the last cursor (including those made by other workers), so the
+    database is queried once per sync interval rather than per request.
+
+    Entries are dropped once their token has expired, since an expired
+    token is rejected by its signature check anyway.
+    """
+
+    # Revocations are ordered by their application timestamp, not commit
+    # order; re-reading a small window behind the cursor catches rows
+    # committed slightly out of order.
+    SYNC_OVERLAP = timedelta(seconds=5)
+
+    def __init__(self, capacity: int = 10_000, error_rate: float = 0.001):
+        self.error_rate = error_rate
+        self._lock = Lock()
+        self._revoked: Dict[str, datetime] = {}
+        self._bloom = BloomFilter(capacity, error_rate)
+        self._cursor: Optional[datetime] = None
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+    def is_revoked(self, jti: str) -> bool:
+        if jti not in self._bloom:
+            return False
+        return jti in self._revoked
+
+    def add(self, jti: str, expires_on: datetime):
+        """
+        Marks a token revoked locally; used by this worker right after it
+        revokes a token, before the next sync would pick it up.
+        """
+        with self._lock:
+            self._add(jti, expires_on)
+
+    def _add(self, jti: str, expires_on: datetime):
+        if jti in self._revoked:
+            return
+        self._revoked[jti] = _naive_utc(expires_on)
+        if len(self._revoked) > self._bloom.capacity:
+            self._rebuild(capacity=self._bloom.capacity * 2)
+        else:
+            self._bloom.add(jti)
+
+    def add_many(self, tokens: Iterable):
+        with self._lock:
+            for token in tokens:
+                self._add(token.jti, token.expires_on)
+
+    def _rebuild(self, capacity: int):
+        bloom = BloomFilter(capacity, self.error_rate)
+        for jti in self._revoked:
+            bloom.add(jti)
+        self._bloom = bloom
+
+    def prune(self, now: Optional[datetime] = None):
+        """
+        Forgets revocations whose tokens have expired and rebuilds the
+        bloom filter without them.
+        """
+        now = now or datetime.utcnow()
+        with self._lock:
+            expired = [jti for jti, expires_on in self._revoked.items()
+                       if expires_on <= now]
+            if not expired:
+                return
+            for jti in expired:
+                del self._revoked[jti]
+            self._rebuild(capacity=max(self._bloom.capacity // 2,
+                                       len(self._revoked) * 2, 1))
+
+    def sync(self, db: Database):
+        """
+        Loads revocations recorded since the last sync. The first call
+        loads every revoked token that has not expired yet.
+        """
+        from auth.models import Refresh_Token
+
+        since = self._cursor - self.SYNC_OVERLAP if self._cursor else None
+        tokens = Refresh_Token.revoked_since(db, since)
+        self.add_many(tokens)
+        if tokens:
+            latest = _naive_utc(tokens[-1].revoked_on)
+            self._cursor = max(self._cursor or latest, latest)
+        self.prune()
+
+
+revocation_index = RevocationIndex()
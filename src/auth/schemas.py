@@ -1,46 +1,83 @@
 from pydantic import EmailStr
 from datetime import datetime
-from pydantic_sqlalchemy import sqlalchemy_to_pydantic
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Type
 
-from auth.models import (User, Admin_Additional, Client_Additional,
-                         Contractor_Additional)
-from work.models import Jobs
+from auth.enums import USER_ROLES
 from core.database import BaseSchema as Base
 
 
-# Generate Pydantic schemas
-JobDataSchema = sqlalchemy_to_pydantic(Jobs)
+@lru_cache()
+def _generated_schemas() -> Dict[str, Type[Base]]:
+    """
+    Generates the ORM backed Pydantic schemas once, on first use.
 
-sql_contractor_data = sqlalchemy_to_pydantic(Contractor_Additional)
-sql_admin_data = sqlalchemy_to_pydantic(Admin_Additional)
-sql_client_data = sqlalchemy_to_pydantic(Client_Additional)
+    Running sqlalchemy_to_pydantic configures every mapper and builds five
+    models, which is too expensive to pay for on every worker boot when
+    most requests never touch these schemas.
 
-sql_user = sqlalchemy_to_pydantic(User)
+    Returns:
+        dict: The generated schema classes keyed by their public name.
+    """
+    from pydantic_sqlalchemy import sqlalchemy_to_pydantic
 
+    from auth.models import (User, Admin_Additional, Client_Additional,
+                             Contractor_Additional)
+    from work.models import Jobs
 
-# Include nested schemas
-class Additional_Contractor_Schema(sql_contractor_data):
-    jobs: list[JobDataSchema] or None = None
+    # Generate Pydantic schemas
+    JobDataSchema = sqlalchemy_to_pydantic(Jobs)
 
+    sql_contractor_data = sqlalchemy_to_pydantic(Contractor_Additional)
+    sql_admin_data = sqlalchemy_to_pydantic(Admin_Additional)
+    sql_client_data = sqlalchemy_to_pydantic(Client_Additional)
 
-class ContractorSchema(sql_user):
-    additional: Additional_Contractor_Schema or None = None
+    sql_user = sqlalchemy_to_pydantic(User)
 
+    # Include nested schemas
+    class Additional_Contractor_Schema(sql_contractor_data):
+        jobs: list[JobDataSchema] or None = None
 
-class Additional_Client_Schema(sql_client_data):
-    posted_jobs: JobDataSchema or None = None
+    class ContractorSchema(sql_user):
+        additional: Additional_Contractor_Schema or None = None
 
+    class Additional_Client_Schema(sql_client_data):
+        posted_jobs: JobDataSchema or None = None
 
-class ClientSchema(sql_user):
-    additional: Additional_Client_Schema or None = None
+    class ClientSchema(sql_user):
+        additional: Additional_Client_Schema or None = None
 
+    class Additional_Admin_Schema(sql_admin_data):
+        contractor_roster: list[ContractorSchema] or None = None
 
-class Additional_Admin_Schema(sql_admin_data):
-    contractor_roster: list[ContractorSchema] or None = None
+    class AdminSchema(sql_user):
+        additional: Additional_Admin_Schema or None = None
 
+    return {
+        "JobDataSchema": JobDataSchema,
+        "Additional_Contractor_Schema": Additional_Contractor_Schema,
+        "ContractorSchema": ContractorSchema,
+        "Additional_Client_Schema": Additional_Client_Schema,
+        "ClientSchema": ClientSchema,
+        "Additional_Admin_Schema": Additional_Admin_Schema,
+        "AdminSchema": AdminSchema,
+    }
 
-class AdminSchema(sql_user):
-    additional: Additional_Admin_Schema or None = None
+
+def __getattr__(name: str) -> Any:
+    # `from auth.schemas import ContractorSchema` still works; the schema
+    # is generated (and cached) the first time any of them is requested.
+    schemas = _generated_schemas() if name in _GENERATED_NAMES else {}
+    if name in schemas:
+        return schemas[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+_GENERATED_NAMES = frozenset((
+    "JobDataSchema", "Additional_Contractor_Schema", "ContractorSchema",
+    "Additional_Client_Schema", "ClientSchema", "Additional_Admin_Schema",
+    "AdminSchema",
+))
 
 
 class Decoded_Token(Base):
@@ -49,10 +86,25 @@ class Decoded_Token(Base):
     iat: datetime
     user_id: int
     token_type: str
+    jti: Optional[str] = None
+    family: Optional[str] = None
+
+
+class Principal(Base):
+    """
+    Who is making a request: enough of the user to authorize it, cheap
+    to cache (see auth.cache) and to share between workers.
+    """
+    id: int
+    type: USER_ROLES
+    additional_id: Optional[int] = None
 
 
 class Encoded_Token(Base):
     token: str
+    jti: Optional[str] = None
+    family: Optional[str] = None
+    expires: Optional[datetime] = None
 
 
 class Register_User(Base):
@@ -68,6 +120,16 @@ class Update_User_Parameters(Base):
     password: str or None = None
 
 
+class User_Selection(Base):
+    """
+    Which users a bulk admin operation applies to; every given filter
+    must match.
+    """
+    ids: Optional[List[int]] = None
+    type: Optional[int] = None
+    created_before: Optional[datetime] = None
+
+
 class Register_User_Payload(Base):
     status: str
     message: str
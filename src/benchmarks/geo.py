@@ -0,0 +1,116 @@
+#!/usr/bin/env python3.9
+"""
+Times nearest-job searches over a seeded database:
+
+    python -m benchmarks.geo --jobs 1000000 --database sqlite:///geo.db
+
+Seeds `--jobs` jobs (see seed.py; most are on site around SEED_CITIES)
+unless the database already has them, then reports latency percentiles
+of Jobs.nearest (the geohash index in the database) and of GridIndex
+nearest searches over the open jobs held in memory (as dispatch does),
+for random points around the cities. --json prints the results as JSON.
+"""
+import argparse
+import json
+import random
+import sys
+from time import perf_counter
+from typing import Callable, Dict, List
+
+from sqlalchemy import func, select
+
+from core.database import Database, ModelBase
+from core.geo import GridIndex
+from seed import SEED_CITIES, generate
+from work.emuns import JOB_STATUS_STATES
+from work.models import Jobs
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    samples = sorted(samples)
+    return {f"p{point}": samples[min(len(samples) - 1,
+                                     len(samples) * point // 100)] * 1000
+            for point in (50, 90, 99)}
+
+
+def _timed(search: Callable[[float, float], int], points) -> dict:
+    samples, found = [], 0
+    for latitude, longitude in points:
+        started = perf_counter()
+        found += search(latitude, longitude)
+        samples.append(perf_counter() - started)
+    return {**_percentiles(samples), "mean_found": found / len(points)}
+
+
+def open_job_grid(db: Database, cell_km: float) -> GridIndex:
+    grid = GridIndex(cell_km)
+    with db.get_db() as session:
+        for job_id, latitude, longitude in session.execute(
+                select(Jobs.id, Jobs.latitude, Jobs.longitude).where(
+                    Jobs.status == JOB_STATUS_STATES.UNASSIGNED,
+                    Jobs.geohash.isnot(None))):
+            grid.add(job_id, latitude, longitude)
+    return grid
+
+
+def measure(db: Database, searches: int, limit: int, radius_km: float,
+            seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    points = []
+    for _ in range(searches):
+        latitude, longitude = rng.choice(SEED_CITIES)
+        points.append((latitude + rng.gauss(0, 0.3),
+                       longitude + rng.gauss(0, 0.3)))
+
+    with db.get_db() as session:
+        jobs = session.execute(select(func.count(Jobs.id))).scalar()
+    results = {"jobs": jobs, "searches": searches, "limit": limit,
+               "radius_km": radius_km}
+    results["database"] = _timed(lambda latitude, longitude: len(
+        Jobs.nearest(db, latitude, longitude, limit, radius_km)), points)
+
+    started = perf_counter()
+    grid = open_job_grid(db, cell_km=5.0)
+    results["grid_build_seconds"] = perf_counter() - started
+    results["grid_jobs"] = len(grid)
+    results["grid"] = _timed(lambda latitude, longitude: len(
+        grid.nearest(latitude, longitude, limit, radius_km)), points)
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--jobs", type=int, default=100_000)
+    parser.add_argument("--database", default="sqlite:///geo.db")
+    parser.add_argument("--searches", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--radius-km", type=float, default=50.0)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    db = Database(args.database)
+    ModelBase.metadata.create_all(db.engine)
+    with db.get_db() as session:
+        existing = session.execute(select(func.count(Jobs.id))).scalar()
+    if existing < args.jobs:
+        generate(db, users=max(10, args.jobs // 100),
+                 jobs=args.jobs - existing)
+
+    results = measure(db, args.searches, args.limit, args.radius_km)
+    db.dispose()
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"{results['jobs']:,} jobs, {results['grid_jobs']:,} open and "
+          f"located; {args.searches} searches for the {args.limit} nearest "
+          f"within {args.radius_km} km")
+    for name in ("database", "grid"):
+        row = results[name]
+        print(f"{name:<9} p50 {row['p50']:7.2f} ms  p90 {row['p90']:7.2f} ms"
+              f"  p99 {row['p99']:7.2f} ms  found {row['mean_found']:.1f}")
+    print(f"grid built in {results['grid_build_seconds']:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
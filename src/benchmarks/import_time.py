@@ -0,0 +1,90 @@
+#!/usr/bin/env python3.9
+"""
+Measures how long a fresh interpreter takes to import the application.
+
+Every worker pays this cost on boot (and again whenever the autoscaler
+adds capacity), so it is measured in a clean subprocess each run:
+
+    python -m benchmarks.import_time --runs 5 --budget-ms 1500
+
+The script exits non-zero when the median exceeds the budget or when one
+of the modules that should only load on first use shows up at import.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Modules that must stay off the import path of `api.main`.
+DEFERRED_MODULES = (
+    "sendgrid",
+    "jinja2",
+    "argon2",
+    "pydantic_sqlalchemy",
+    "emailManager.html_templates",
+    "psycopg2",
+    "msgpack",
+    "brotli",
+)
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": elapsed,
+    "loaded": [m for m in {deferred!r} if m in sys.modules],
+}}))
+"""
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_import(module: str = "api.main", env: dict = None) -> dict:
+    """
+    Imports a module in a fresh interpreter and reports the result.
+
+    Args:
+        module (str): The dotted module path to import.
+        env (dict, optional): Environment for the child interpreter;
+            defaults to the current environment.
+
+    Returns:
+        dict: "seconds" spent importing and the "loaded" deferred modules.
+    """
+    probe = _PROBE.format(module=module, deferred=DEFERRED_MODULES)
+    output = subprocess.run(
+        [sys.executable, "-c", probe], cwd=SRC_DIR, env=env or os.environ,
+        check=True, capture_output=True, text=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--module", default="api.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=None)
+    args = parser.parse_args(argv)
+
+    results = [measure_import(args.module) for _ in range(args.runs)]
+    timings = [result["seconds"] * 1000 for result in results]
+    median = statistics.median(timings)
+    loaded = sorted({name for result in results for name in result["loaded"]})
+
+    print(f"import {args.module}: median {median:.1f} ms, "
+          f"min {min(timings):.1f} ms, max {max(timings):.1f} ms "
+          f"over {args.runs} runs")
+    if loaded:
+        print(f"deferred modules loaded at import: {', '.join(loaded)}")
+        return 1
+    if args.budget_ms is not None and median > args.budget_ms:
+        print(f"over budget: {median:.1f} ms > {args.budget_ms:.1f} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3.9
+"""
+Compares the representations and codings a list response can be sent in:
+
+    python -m benchmarks.payloads --jobs 100 1000 10000
+
+For a list of seeded jobs (as /bookings/retrieve_jobs returns them) it
+reports, per representation (JSON, msgpack) and coding (none, gzip,
+brotli): bytes on the wire, and the CPU milliseconds the server spends
+encoding and the client spends decoding. --json prints the rows as JSON
+for comparison between runs.
+"""
+import argparse
+import gzip
+import importlib
+import importlib.util
+import json
+import sys
+from time import perf_counter
+from typing import Callable, Dict, List, Tuple
+
+from fastapi.encoders import jsonable_encoder
+
+from core.database import Database, ModelBase
+from core.negotiation import (content_encoders, dump_msgpack,
+                              msgpack_available)
+from seed import generate
+from work.models import Jobs
+
+Codec = Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]
+
+
+def job_payload(count: int) -> dict:
+    """
+    The {"data": [...]} envelope of `count` seeded jobs.
+    """
+    db = Database("sqlite://")
+    ModelBase.metadata.create_all(db.engine)
+    generate(db, users=max(10, count // 50), jobs=count)
+    with db.get_db() as session:
+        jobs = session.query(Jobs).order_by(Jobs.id).limit(count).all()
+        payload = {"data": jsonable_encoder(jobs)}
+    db.dispose()
+    return payload
+
+
+def representations() -> Dict[str, Codec]:
+    formats: Dict[str, Codec] = {
+        "json": (lambda content: json.dumps(content).encode(), json.loads)}
+    if msgpack_available():
+        import msgpack
+        formats["msgpack"] = (dump_msgpack, lambda raw: msgpack.unpackb(
+            raw, raw=False))
+    return formats
+
+
+def codings() -> Dict[str, Codec]:
+    identity = (lambda body: body, lambda body: body)
+    result: Dict[str, Codec] = {"identity": identity}
+    for level in (1, 6, 9):
+        result[f"gzip-{level}"] = (content_encoders(gzip_level=level)["gzip"],
+                                   gzip.decompress)
+    for module in ("brotli", "brotlicffi"):
+        if importlib.util.find_spec(module):
+            brotli = importlib.import_module(module)
+            for quality in (1, 4, 11):
+                result[f"br-{quality}"] = (
+                    content_encoders(brotli_quality=quality)["br"],
+                    brotli.decompress)
+            break
+    return result
+
+
+def _timed(function, argument, runs: int):
+    best, result = float("inf"), None
+    for _ in range(runs):
+        started = perf_counter()
+        result = function(argument)
+        best = min(best, perf_counter() - started)
+    return result, best * 1000
+
+
+def measure(payload: dict, runs: int = 5) -> List[dict]:
+    """
+    One row per representation and coding: bytes (and their ratio to
+    plain JSON), and the best of `runs` encode and decode times in
+    milliseconds.
+    """
+    rows = []
+    baseline = len(json.dumps(payload).encode())
+    for name, (dump, load) in representations().items():
+        body, dump_ms = _timed(dump, payload, runs)
+        for coding, (compress, decompress) in codings().items():
+            wire, compress_ms = _timed(compress, body, runs)
+            _, decompress_ms = _timed(decompress, wire, runs)
+            _, load_ms = _timed(load, body, runs)
+            rows.append({"format": name, "coding": coding,
+                         "bytes": len(wire),
+                         "ratio": len(wire) / baseline,
+                         "encode_ms": dump_ms + compress_ms,
+                         "decode_ms": decompress_ms + load_ms})
+    return rows
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1000])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    results = []
+    for count in args.jobs:
+        for row in measure(job_payload(count), args.runs):
+            results.append({"jobs": count, **row})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"{'jobs':>6} {'format':<8} {'coding':<9} {'bytes':>10} "
+          f"{'ratio':>6} {'encode ms':>10} {'decode ms':>10}")
+    for row in results:
+        print(f"{row['jobs']:>6} {row['format']:<8} {row['coding']:<9} "
+              f"{row['bytes']:>10,} {row['ratio']:>6.2f} "
+              f"{row['encode_ms']:>10.2f} {row['decode_ms']:>10.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3.9
+"""
+Builds the breached password file (BREACHED_PASSWORDS_FILE) from a list
+of SHA-1 password hashes:
+
+    python breached.py pwned-passwords-sha1.txt breached.bin
+    python breached.py --digest-size 10 hashes.txt breached.bin
+    python breached.py --check 'Passw0rd!' breached.bin
+
+The input holds one hex SHA-1 per line in any order; anything after a
+colon on a line (e.g. a breach count) is ignored, so Have I Been Pwned
+downloads can be used as they are. "-" reads standard input.
+"""
+import argparse
+import os
+import sys
+from time import perf_counter
+
+from auth.breached import BreachedPasswords, build, parse_hashes
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("input", nargs="?", help="hash list, or - for stdin")
+    parser.add_argument("output", help="file to write (or check)")
+    parser.add_argument("--digest-size", type=int, default=20,
+                        help="bytes of each SHA-1 to keep (4-20)")
+    parser.add_argument("--error-rate", type=float, default=0.01,
+                        help="bloom filter false positive rate")
+    parser.add_argument("--run-size", type=int, default=5_000_000,
+                        help="hashes sorted in memory at once")
+    parser.add_argument("--check", metavar="PASSWORD",
+                        help="look a password up in OUTPUT instead")
+    args = parser.parse_args(argv)
+
+    if args.check is not None:
+        passwords = BreachedPasswords(args.output)
+        found = args.check in passwords
+        print("breached" if found else "not found")
+        passwords.close()
+        return 0 if found else 1
+    if args.input is None:
+        parser.error("an input hash list is required")
+
+    started = perf_counter()
+    source = sys.stdin if args.input == "-" else open(args.input)
+    partial = args.output + ".partial"
+    try:
+        with source, open(partial, "wb") as output:
+            count = build(parse_hashes(source), output, args.digest_size,
+                          args.error_rate, args.run_size)
+    except ValueError as exc:
+        os.remove(partial)
+        print(f"error: {exc}", file=sys.stderr)
+        return 1
+    # Replaced atomically, so workers mapping the old file keep it until
+    # they reopen.
+    os.replace(partial, args.output)
+    print(f"wrote {count} hashes ({os.path.getsize(args.output):,} bytes) "
+          f"in {perf_counter() - started:.2f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import math
+import re
+from collections import deque
+from typing import (Deque, Dict, FrozenSet, List, Mapping, Optional,
+                    Pattern, Sequence, Tuple)
+
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+# (methods, path pattern, class name): the first rule whose methods (None
+# for any) and pattern match a request picks its admission class; a class
+# name of None exempts the request.
+Rule = Tuple[Optional[Sequence[str]], str, Optional[str]]
+_CompiledRule = Tuple[Optional[FrozenSet[str]], Pattern, Optional[str]]
+
+
+def compile_rules(rules: Sequence[Rule]) -> List[_CompiledRule]:
+    return [(frozenset(methods) if methods else None, re.compile(pattern),
+             name) for methods, pattern, name in rules]
+
+
+def match_rules(rules: Sequence[_CompiledRule], method: str,
+                path: str) -> Optional[str]:
+    """
+    The class name of the first of the compiled `rules` matching the
+    request, or None when it is exempt or matches none.
+    """
+    for methods, pattern, name in rules:
+        if (methods is None or method in methods) and pattern.match(path):
+            return name
+    return None
+
+
+class AdmissionClass:
+    """
+    A concurrency limit for one class of requests, in one worker.
+
+    At most `limit` requests run at once. Up to `queue_size` more wait,
+    in arrival order, for at most `max_wait` seconds each; requests that
+    find the queue full, or wait too long, are shed. Bounding both the
+    queue and the wait keeps latency for admitted requests bounded under
+    overload instead of letting every request time out together.
+    """
+
+    def __init__(self, name: str, limit: int, queue_size: int = 0,
+                 max_wait: float = 0.0):
+        self.name = name
+        self.limit = max(1, limit)
+        self.queue_size = max(0, queue_size)
+        self.max_wait = max_wait
+        # Clients are told to come back once a queued request would have
+        # given up.
+        self.retry_after = max(1, math.ceil(max_wait))
+        self.active = 0
+        self.admitted = 0
+        self.shed = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> bool:
+        """
+        Waits for a slot; False if the request should be shed instead.
+        Every True must be paired with a `release`.
+        """
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return True
+        if len(self._waiters) >= self.queue_size or self.max_wait <= 0:
+            self.shed += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.max_wait)
+        except asyncio.TimeoutError:
+            if not waiter.done():
+                self._waiters.remove(waiter)
+                waiter.cancel()
+                self.shed += 1
+                return False
+            # A slot was handed over just as the wait ran out.
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                self._waiters.remove(waiter)
+                waiter.cancel()
+            raise
+        self.admitted += 1
+        return True
+
+    def release(self):
+        # The slot passes straight to the longest waiting request, so a
+        # request arriving meanwhile cannot jump the queue.
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self) -> Dict[str, int]:
+        return {"limit": self.limit, "active": self.active,
+                "waiting": self.waiting, "admitted": self.admitted,
+                "shed": self.shed}
+
+
+class AdmissionMiddleware:
+    """
+    Runs each HTTP request under the AdmissionClass its route belongs to
+    (see `rules`) and answers 503 with Retry-After, without running the
+    route, when that class sheds it. Requests matching no rule, and
+    websockets, are not limited.
+
+    Limits apply per worker process.
+    """
+
+    def __init__(self, app, classes: Mapping[str, AdmissionClass],
+                 rules: Sequence[Rule]):
+        self.app = app
+        self.classes = dict(classes)
+        self.rules = compile_rules(rules)
+        unknown = {name for _, _, name in self.rules
+                   if name is not None and name not in self.classes}
+        if unknown:
+            raise ValueError(f"No admission class {', '.join(unknown)}")
+
+    def classify(self, method: str, path: str) -> Optional[AdmissionClass]:
+        name = match_rules(self.rules, method, path)
+        return None if name is None else self.classes[name]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        admission = self.classify(scope["method"], scope["path"])
+        if admission is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not await admission.acquire():
+            logger.debug("shed %s %s (%s)", scope["method"], scope["path"],
+                         admission.name)
+            response = JSONResponse(
+                status_code=503,
+                content={"detail": {
+                    "status": "503",
+                    "message": "Server is busy; please retry shortly"
+                }},
+                headers={"Retry-After": str(admission.retry_after)})
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.release()
+
+
+def admission_classes(limits: Mapping[str, Sequence[float]]
+                      ) -> Dict[str, AdmissionClass]:
+    """
+    Builds classes from {name: (limit, queue size, max wait seconds)}.
+    """
+    return {name: AdmissionClass(name, int(limit), int(queue_size),
+                                 float(max_wait))
+            for name, (limit, queue_size, max_wait) in limits.items()}
@@ -0,0 +1,307 @@
+import asyncio
+import json
+import logging
+import select
+from threading import Event, Thread
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+Deliver = Callable[[List[str]], None]
+
+
+class BroadcastBackend:
+    """
+    Carries published messages to every worker's Broadcaster. Subclasses
+    decide how far a message travels: this process only, or every
+    process listening on the same channel.
+    """
+
+    def start(self, channel: str, deliver: Deliver):
+        """
+        Begins delivering messages published on `channel`. `deliver` may be
+        called from any thread with a list of raw payloads.
+        """
+        raise NotImplementedError
+
+    def publish(self, channel: str, payloads: List[str]):
+        raise NotImplementedError
+
+    def stop(self):
+        pass
+
+
+class MemoryBroadcastBackend(BroadcastBackend):
+    """
+    Delivers messages straight back to this process. Used for single
+    worker deployments and as the stand-in for a shared backend in tests.
+    """
+
+    def __init__(self):
+        self._channels: Dict[str, List[Deliver]] = {}
+
+    def start(self, channel: str, deliver: Deliver):
+        self._channels.setdefault(channel, []).append(deliver)
+
+    def publish(self, channel: str, payloads: List[str]):
+        for deliver in self._channels.get(channel, ()):
+            deliver(payloads)
+
+    def stop(self):
+        self._channels.clear()
+
+
+class PostgresBroadcastBackend(BroadcastBackend):
+    """
+    Fans messages out across workers with Postgres LISTEN/NOTIFY.
+
+    Each worker holds one dedicated connection in LISTEN mode, waited on
+    by a background thread with select(), so idle subscribers cost no
+    queries at all. A publish sends one NOTIFY per message in a single
+    transaction; payloads must stay under Postgres' 8000 byte limit.
+
+    Args:
+        db: The database whose primary carries the notifications.
+        poll_seconds: How often the listener checks for shutdown.
+    """
+
+    def __init__(self, db, poll_seconds: float = 1.0):
+        self.db = db
+        self.poll_seconds = poll_seconds
+        self._stopping = Event()
+        self._threads: List[Thread] = []
+
+    def start(self, channel: str, deliver: Deliver):
+        thread = Thread(target=self._listen, args=(channel, deliver),
+                        daemon=True, name=f"listen-{channel}")
+        self._threads.append(thread)
+        thread.start()
+
+    def _connect(self, channel: str):
+        # Detached from the pool: the connection stays in LISTEN mode for
+        # the life of the worker and must not be handed to anyone else.
+        pooled = self.db.engine.raw_connection()
+        pooled.detach()
+        connection = pooled.connection
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute(f'LISTEN "{channel}"')
+        return connection
+
+    def _listen(self, channel: str, deliver: Deliver):
+        connection = None
+        while not self._stopping.is_set():
+            try:
+                if connection is None:
+                    connection = self._connect(channel)
+                readable, _, _ = select.select([connection], [], [],
+                                               self.poll_seconds)
+                if not readable:
+                    continue
+                connection.poll()
+                payloads = [notify.payload for notify in connection.notifies]
+                connection.notifies.clear()
+                if payloads:
+                    deliver(payloads)
+            except Exception:
+                logger.exception("listening on %s failed; reconnecting",
+                                 channel)
+                if connection is not None:
+                    connection.close()
+                    connection = None
+                self._stopping.wait(self.poll_seconds)
+        if connection is not None:
+            connection.close()
+
+    def publish(self, channel: str, payloads: List[str]):
+        with self.db.engine.begin() as connection:
+            connection.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                [{"channel": channel, "payload": payload}
+                 for payload in payloads])
+
+    def stop(self):
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self._stopping.clear()
+
+
+class Subscription:
+    """
+    One subscriber's view of a Broadcaster: a bounded queue of messages
+    whose topic is in `topics` (every topic when `topics` is None).
+
+    Iterate it (or await `get`) to receive messages; iteration ends when
+    the subscription is closed, and `dropped` tells whether that was
+    because the subscriber fell `maxsize` messages behind.
+    """
+
+    __slots__ = ("topics", "queue", "dropped", "closed", "_broadcaster")
+
+    def __init__(self, broadcaster: "Broadcaster",
+                 topics: Optional[Set[str]], maxsize: int):
+        self.topics = topics
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.dropped = False
+        self.closed = False
+        self._broadcaster = broadcaster
+
+    async def get(self) -> Optional[dict]:
+        """
+        Waits for the next message; returns None once closed.
+        """
+        if self.closed:
+            return None
+        return await self.queue.get()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> dict:
+        message = await self.get()
+        if message is None:
+            raise StopAsyncIteration
+        return message
+
+    def _close(self):
+        self.closed = True
+        # Wake a waiting reader; the queue may be full of messages that
+        # will never be read, so make room for the sentinel first.
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+    def close(self):
+        self._broadcaster.unsubscribe(self)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+
+class Broadcaster:
+    """
+    In-process fan-out of published messages to subscribers, filtered by
+    topic.
+
+    Subscribers are indexed by topic, so a message touches only the
+    queues that want it. Queues are bounded; a subscriber that falls
+    `queue_size` messages behind is dropped (its subscription closes)
+    rather than slowing the publisher or growing memory. Fan-out runs on
+    the event loop the broadcaster was started on; `publish` may be
+    called from any thread and goes through the backend, so with a shared
+    backend every worker's subscribers receive it.
+
+    Example:
+        broadcaster = Broadcaster("jobs")
+        broadcaster.start(MemoryBroadcastBackend())
+        async with broadcaster.subscribe({"PLUMBING"}) as subscription:
+            async for message in subscription:
+                ...
+    """
+
+    def __init__(self, channel: str, queue_size: int = 100):
+        self.channel = channel
+        self.queue_size = queue_size
+        self.backend: Optional[BroadcastBackend] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._by_topic: Dict[str, Set[Subscription]] = {}
+        self._everything: Set[Subscription] = set()
+
+    @property
+    def started(self) -> bool:
+        return self.backend is not None
+
+    def __len__(self) -> int:
+        subscriptions = set(self._everything)
+        for topic in self._by_topic.values():
+            subscriptions |= topic
+        return len(subscriptions)
+
+    def start(self, backend: BroadcastBackend):
+        """
+        Attaches to the running event loop and starts receiving messages
+        from `backend`. Call from within the loop.
+        """
+        self._loop = asyncio.get_running_loop()
+        self.backend = backend
+        backend.start(self.channel, self._deliver)
+
+    def stop(self):
+        """
+        Stops the backend and closes every subscription.
+        """
+        if self.backend is not None:
+            self.backend.stop()
+        self.backend = None
+        for subscription in list(self._everything) + [
+                subscription for topic in self._by_topic.values()
+                for subscription in topic]:
+            self.unsubscribe(subscription)
+        self._loop = None
+
+    def subscribe(self, topics: Optional[Iterable[str]] = None,
+                  maxsize: Optional[int] = None) -> Subscription:
+        """
+        Registers a subscriber for `topics` (None for every topic).
+        """
+        topics = set(topics) if topics is not None else None
+        subscription = Subscription(self, topics, maxsize or self.queue_size)
+        if topics is None:
+            self._everything.add(subscription)
+        for topic in topics or ():
+            self._by_topic.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        if subscription.closed:
+            return
+        self._everything.discard(subscription)
+        for topic in subscription.topics or ():
+            subscribers = self._by_topic.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._by_topic[topic]
+        subscription._close()
+
+    def publish(self, messages: List[Tuple[str, dict]]):
+        """
+        Publishes (topic, message) pairs to every worker. Safe to call from
+        any thread; a no-op until the broadcaster is started.
+        """
+        backend = self.backend
+        if backend is None or not messages:
+            return
+        backend.publish(self.channel, [
+            json.dumps({"topic": topic, "message": message},
+                       default=str, separators=(",", ":"))
+            for topic, message in messages])
+
+    def _deliver(self, payloads: List[str]):
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            loop.call_soon_threadsafe(self._fan_out, payloads)
+        except RuntimeError:
+            pass  # the loop has closed during shutdown
+
+    def _fan_out(self, payloads: List[str]):
+        for payload in payloads:
+            envelope = json.loads(payload)
+            message = envelope["message"]
+            for subscription in (
+                    self._by_topic.get(envelope["topic"], set())
+                    | self._everything):
+                try:
+                    subscription.queue.put_nowait(message)
+                except asyncio.QueueFull:
+                    subscription.dropped = True
+                    self.unsubscribe(subscription)
@@ -0,0 +1,510 @@
+import json
+import logging
+from collections import OrderedDict
+from threading import Event, Lock
+from time import monotonic, sleep
+from typing import Any, Callable, Dict, Hashable, List, Optional
+from uuid import uuid4
+from weakref import WeakMethod
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+
+class LRUCache:
+    """
+    Bounded in-process cache with per-entry expiry.
+
+    Lookups and stores are O(1) (an OrderedDict move-to-end under one
+    lock); the least recently used entry is evicted once `maxsize` is
+    reached, and expired entries are dropped when they are next read.
+    """
+
+    def __init__(self, maxsize: int = 10_000, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = Lock()
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Any:
+        """
+        Returns the cached value, or MISSING if absent or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            value, expires = entry
+            if expires <= monotonic():
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        expires = monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class JsonSerializer:
+    name = "json"
+
+    def dumps(self, value: Any) -> bytes:
+        return json.dumps(value).encode()
+
+    def loads(self, raw: bytes) -> Any:
+        return json.loads(raw)
+
+
+class MsgpackSerializer:
+    """
+    Smaller and faster to encode and decode than JSON for the dicts and
+    lists cached here (principals, jobs).
+    """
+    name = "msgpack"
+
+    def __init__(self):
+        try:
+            import msgpack
+        except ImportError as exc:
+            raise RuntimeError(
+                "The msgpack package is required for msgpack cache "
+                "serialization; install it or use json instead."
+            ) from exc
+        self._msgpack = msgpack
+
+    def dumps(self, value: Any) -> bytes:
+        return self._msgpack.packb(value, use_bin_type=True)
+
+    def loads(self, raw: bytes) -> Any:
+        return self._msgpack.unpackb(raw, raw=False)
+
+
+def serializer_from_name(name: Optional[str]):
+    """
+    "json", "msgpack", or "auto"/None for msgpack when it is installed
+    and JSON otherwise.
+    """
+    if name in (None, "", "auto"):
+        try:
+            return MsgpackSerializer()
+        except RuntimeError:
+            return JsonSerializer()
+    if name == "msgpack":
+        return MsgpackSerializer()
+    if name == "json":
+        return JsonSerializer()
+    raise ValueError(f"Unsupported cache serializer {name!r}")
+
+
+class CacheBackend:
+    """
+    A cache shared by every worker. Values are bytes; keys are strings.
+
+    Backends also carry broadcasts between workers (used to invalidate
+    their local tiers): `publish` sends bytes on a channel and `subscribe`
+    calls a function with every message on it, from any worker.
+    """
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ttl: float):
+        raise NotImplementedError
+
+    def add(self, key: str, value: bytes, ttl: float) -> bool:
+        """
+        Stores `value` only if `key` is absent; True if it was stored.
+        """
+        raise NotImplementedError
+
+    def delete(self, *keys: str):
+        raise NotImplementedError
+
+    def publish(self, channel: str, message: bytes):
+        raise NotImplementedError
+
+    def subscribe(self, channel: str, callback: Callable[[bytes], None]):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    In-process stand-in for a shared cache, used in single worker
+    deployments and in tests (several caches sharing one instance behave
+    like workers sharing a server).
+    """
+
+    def __init__(self, maxsize: int = 100_000):
+        self._cache = LRUCache(maxsize)
+        self._lock = Lock()
+        self._subscribers: Dict[str, List[Callable[[bytes], None]]] = {}
+
+    def get(self, key: str) -> Optional[bytes]:
+        value = self._cache.get(key)
+        return None if value is MISSING else value
+
+    def set(self, key: str, value: bytes, ttl: float):
+        self._cache.set(key, value, ttl)
+
+    def add(self, key: str, value: bytes, ttl: float) -> bool:
+        with self._lock:
+            if self._cache.get(key) is not MISSING:
+                return False
+            self._cache.set(key, value, ttl)
+            return True
+
+    def delete(self, *keys: str):
+        for key in keys:
+            self._cache.delete(key)
+
+    def publish(self, channel: str, message: bytes):
+        for callback in list(self._subscribers.get(channel, ())):
+            callback(message)
+
+    def subscribe(self, channel: str, callback: Callable[[bytes], None]):
+        self._subscribers.setdefault(channel, []).append(callback)
+
+    def close(self):
+        self._subscribers.clear()
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Shared cache kept in Redis (or anything speaking its protocol).
+    """
+
+    def __init__(self, url: str, prefix: str = "cache:"):
+        try:
+            import redis
+        except ImportError as exc:
+            raise RuntimeError(
+                "The redis package is required for a shared cache backend; "
+                "install it or use memory:// instead."
+            ) from exc
+
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._listeners = []
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._client.get(self.prefix + key)
+
+    def set(self, key: str, value: bytes, ttl: float):
+        self._client.set(self.prefix + key, value, px=int(ttl * 1000))
+
+    def add(self, key: str, value: bytes, ttl: float) -> bool:
+        return bool(self._client.set(self.prefix + key, value, nx=True,
+                                     px=int(ttl * 1000)))
+
+    def delete(self, *keys: str):
+        if keys:
+            self._client.delete(*(self.prefix + key for key in keys))
+
+    def publish(self, channel: str, message: bytes):
+        self._client.publish(self.prefix + channel, message)
+
+    def subscribe(self, channel: str, callback: Callable[[bytes], None]):
+        # Each subscription listens on its own connection and thread.
+        pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{self.prefix + channel:
+                            lambda message: callback(message["data"])})
+        self._listeners.append(pubsub.run_in_thread(sleep_time=1.0,
+                                                    daemon=True))
+
+    def close(self):
+        for listener in self._listeners:
+            listener.stop()
+        self._listeners = []
+        self._client.close()
+
+
+def cache_backend_from_url(url: Optional[str]) -> Optional[CacheBackend]:
+    """
+    Builds the shared backend named by a URL: redis:// (or rediss://) for
+    Redis, memory:// for the in-process stand-in, nothing for none.
+    """
+    if not url:
+        return None
+    if url.startswith(("redis://", "rediss://")):
+        return RedisCacheBackend(url)
+    if url.startswith("memory://"):
+        return MemoryCacheBackend()
+    raise ValueError(f"Unsupported cache backend URL {url!r}")
+
+
+_shared_backends: Dict[str, CacheBackend] = {}
+_shared_backends_lock = Lock()
+
+
+def shared_backend(url: Optional[str]) -> Optional[CacheBackend]:
+    """
+    The process-wide backend for `url`, so every cache in a worker shares
+    one connection pool (and memory:// one store).
+    """
+    if not url:
+        return None
+    with _shared_backends_lock:
+        backend = _shared_backends.get(url)
+        if backend is None:
+            backend = _shared_backends[url] = cache_backend_from_url(url)
+        return backend
+
+
+def close_shared_backends():
+    """
+    Stops every shared backend's listeners; called on shutdown.
+    """
+    with _shared_backends_lock:
+        backends = list(_shared_backends.values())
+        _shared_backends.clear()
+    for backend in backends:
+        backend.close()
+
+
+class _Flight:
+    __slots__ = ("done", "value", "error", "stale")
+
+    def __init__(self):
+        self.done = Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+        self.stale = False
+
+
+def _ignore(message: bytes):
+    pass
+
+
+class ReadThroughCache:
+    """
+    Read-through cache: an in-process LRU in front of an optional shared
+    backend in front of the loader (usually a database query).
+
+    Only one caller per process runs the loader for a given key at a time
+    (single flight); concurrent callers wait for and share its result.
+    With a shared backend a short lease (set-if-absent) extends that
+    across workers: callers that lose the lease poll the backend for the
+    winner's value for up to `lease_seconds` before loading themselves.
+
+    `invalidate` removes keys from both tiers. A load that was in flight
+    when its key was invalidated still answers the callers already
+    waiting on it but is not stored, so it cannot re-cache data older
+    than the write. With a shared backend the keys are also broadcast to
+    every other cache of the same namespace, which drop them from their
+    local tiers; `local_ttl` only bounds staleness if a broadcast is lost
+    (e.g. while a worker reconnects).
+
+    Values must be serializable by `serializer` (JSON or msgpack: dicts,
+    lists, strings, numbers, booleans and None).
+
+    Args:
+        namespace: Prefix for keys in the shared backend, and the name of
+            the invalidation channel.
+        maxsize: Entries kept in the local LRU.
+        ttl: Seconds entries live in the shared backend (and locally,
+            without one).
+        backend: Optional shared CacheBackend.
+        local_ttl: Seconds entries live in the local LRU; defaults to
+            `ttl`.
+        lease_seconds: How long a worker may take to load a key before
+            others stop waiting for it.
+        serializer: Encodes values for the shared backend; JSON by
+            default.
+    """
+
+    def __init__(self, namespace: str, maxsize: int = 10_000,
+                 ttl: float = 60.0, backend: Optional[CacheBackend] = None,
+                 local_ttl: Optional[float] = None,
+                 lease_seconds: float = 5.0, serializer=None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.backend = backend
+        self.local = LRUCache(maxsize, ttl if local_ttl is None
+                              else local_ttl)
+        self.lease_seconds = lease_seconds
+        self.serializer = serializer or JsonSerializer()
+        self.hits = 0
+        self.misses = 0
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = Lock()
+        # Tags this cache's broadcasts so it can ignore its own.
+        self._origin = uuid4().hex
+        if backend is not None:
+            # The backend outlives caches (one per process); a weak
+            # reference lets a discarded cache be collected.
+            on_broadcast = WeakMethod(self._on_broadcast)
+            backend.subscribe(self._channel, lambda message: (
+                on_broadcast() or _ignore)(message))
+
+    @property
+    def _channel(self) -> str:
+        return f"invalidate:{self.namespace}"
+
+    def _shared_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def get_or_load(self, key: str, loader: Callable[[], Any]) -> Any:
+        """
+        Returns the cached value for `key`, calling `loader` on a miss.
+        """
+        value = self.local.get(key)
+        if value is not MISSING:
+            self.hits += 1
+            return value
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            self.hits += 1
+            return flight.value
+
+        self.misses += 1
+        try:
+            flight.value = self._load(key, loader, flight)
+            return flight.value
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.done.set()
+
+    async def get_or_load_async(self, key: str,
+                                loader: Callable[[], Any]) -> Any:
+        """
+        `get_or_load` for the event loop: a local hit is answered inline,
+        while a miss, which may wait on another worker's lease or the
+        loader, runs in the threadpool.
+        """
+        value = self.local.get(key)
+        if value is not MISSING:
+            self.hits += 1
+            return value
+        return await run_in_threadpool(self.get_or_load, key, loader)
+
+    def _load(self, key: str, loader: Callable[[], Any],
+              flight: _Flight) -> Any:
+        if self.backend is None:
+            value = loader()
+            if not flight.stale:
+                self.local.set(key, value)
+            return value
+
+        # The shared tier only saves loads: while it fails, callers load
+        # for themselves instead of failing.
+        shared_key = self._shared_key(key)
+        lease_key = shared_key + ":lease"
+        value = self._shared_get(shared_key)
+        leased = None
+        if value is MISSING:
+            leased = self._shared_call("lease", self.backend.add, lease_key,
+                                       b"1", self.lease_seconds)
+        if leased is False:
+            deadline = monotonic() + self.lease_seconds
+            while value is MISSING and monotonic() < deadline:
+                sleep(0.02)
+                value = self._shared_get(shared_key)
+
+        if value is MISSING:
+            try:
+                value = loader()
+                if not flight.stale:
+                    self._shared_call("write", self.backend.set, shared_key,
+                                      self.serializer.dumps(value), self.ttl)
+            finally:
+                # Released even if the loader failed, so others stop
+                # waiting for it.
+                if leased:
+                    self._shared_call("lease release", self.backend.delete,
+                                      lease_key)
+        if not flight.stale:
+            self.local.set(key, value)
+        return value
+
+    def _shared_call(self, action: str, method: Callable, *args) -> Any:
+        # None when the backend failed.
+        try:
+            return method(*args)
+        except Exception:
+            logger.exception("shared cache %s failed", action)
+            return None
+
+    def _shared_get(self, shared_key: str) -> Any:
+        try:
+            raw = self.backend.get(shared_key)
+            # An entry another serializer wrote is treated as a miss.
+            return MISSING if raw is None else self.serializer.loads(raw)
+        except Exception:
+            logger.exception("shared cache read failed")
+            return MISSING
+
+    def _drop_local(self, keys):
+        with self._lock:
+            for key in keys:
+                # Callers arriving from now on start a fresh load instead
+                # of joining one that may have read the old row.
+                flight = self._flights.pop(key, None)
+                if flight is not None:
+                    flight.stale = True
+        for key in keys:
+            self.local.delete(key)
+
+    def _on_broadcast(self, message: bytes):
+        try:
+            content = json.loads(message)
+        except ValueError:
+            logger.warning("ignoring malformed cache invalidation")
+            return
+        if content.get("origin") != self._origin:
+            self._drop_local(content.get("keys", ()))
+
+    def invalidate(self, *keys: str):
+        """
+        Drops `keys` from the local and shared tiers, and from the local
+        tier of every other cache of this namespace.
+        """
+        if not keys:
+            return
+        self._drop_local(keys)
+        if self.backend is not None:
+            self._shared_call("delete", self.backend.delete,
+                              *map(self._shared_key, keys))
+            try:
+                self.backend.publish(self._channel, json.dumps(
+                    {"origin": self._origin, "keys": keys}).encode())
+            except Exception:
+                logger.exception("broadcasting cache invalidation failed")
+
+    def clear(self):
+        self.local.clear()
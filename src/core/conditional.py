@@ -0,0 +1,80 @@
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from hashlib import blake2b
+from typing import Optional
+
+from fastapi import Request, Response, status
+
+
+def make_etag(*parts) -> str:
+    """
+    Builds a weak ETag from the values a representation depends on (row
+    versions, the viewer's scope, ...). Equal parts give equal tags.
+    """
+    digest = blake2b("|".join(map(str, parts)).encode(), digest_size=12)
+    return f'W/"{digest.hexdigest()}"'
+
+
+def _utc(moment: datetime) -> datetime:
+    # SQLite returns naive timestamps, which are UTC here.
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc)
+
+
+def http_date(moment: datetime) -> str:
+    return format_datetime(_utc(moment), usegmt=True)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # Weak comparison: W/"x" and "x" match.
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def is_not_modified(request: Request, etag: str,
+                    last_modified: Optional[datetime] = None) -> bool:
+    """
+    Evaluates If-None-Match (or, without it, If-Modified-Since) against
+    the current validators, following RFC 9110 precedence.
+    """
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+
+    if_modified_since = request.headers.get("If-Modified-Since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        # HTTP dates have one second resolution.
+        return _utc(last_modified).replace(microsecond=0) <= _utc(since)
+    return False
+
+
+def set_validators(response: Response, etag: str,
+                   last_modified: Optional[datetime] = None):
+    """
+    Adds ETag/Last-Modified to a response. `private, no-cache` lets the
+    client keep the body but makes it revalidate on every use.
+    """
+    response.headers["ETag"] = etag
+    if last_modified is not None:
+        response.headers["Last-Modified"] = http_date(last_modified)
+    response.headers["Cache-Control"] = "private, no-cache"
+
+
+def not_modified(etag: str,
+                 last_modified: Optional[datetime] = None) -> Response:
+    response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    set_validators(response, etag, last_modified)
+    return response
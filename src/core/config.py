@@ -1,9 +1,14 @@
-from typing import Any, Dict, List, Optional, Union
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple, Union, TYPE_CHECKING
 from pydantic import AnyHttpUrl, PostgresDsn, validator, BaseSettings
 
-from sendgrid import SendGridAPIClient
 from fastapi.responses import JSONResponse
 
+from core.negotiation import MSGPACK, dump_msgpack, response_format
+
+if TYPE_CHECKING:
+    from sendgrid import SendGridAPIClient
+
 
 class Settings(BaseSettings):
     PROJECT_NAME: str
@@ -23,12 +28,149 @@ class Settings(BaseSettings):
     POSTGRES_PASSWORD: str
     POSTGRES_DB: str
     DATABASE_URI: Optional[PostgresDsn] = None
+    DATABASE_REPLICA_URIS: List[str] = []
+    DATABASE_REPLICA_EJECT_SECONDS: float = 30.0
+    DATABASE_READ_YOUR_WRITES_SECONDS: float = 5.0
+
+    @validator("DATABASE_REPLICA_URIS", pre=True)
+    def assemble_replica_uris(cls, v: Union[str, List[str]]) -> List[str]:
+        if isinstance(v, str) and not v.startswith("["):
+            return [i.strip() for i in v.split(",") if i.strip()]
+        elif isinstance(v, (list, str)):
+            return v
+        raise ValueError(v)
 
     JWT_SECRET_KEY: str
+    REVOCATION_SYNC_SECONDS: float = 5.0
+    REFRESH_TOKEN_PURGE_INTERVAL_SECONDS: float = 3600.0
+
+    RATE_LIMIT_BACKEND_URL: Optional[str] = None
+    AUTH_RATE_LIMIT_PER_IP: int = 20
+    AUTH_RATE_LIMIT_PER_EMAIL: int = 5
+    AUTH_RATE_LIMIT_PERIOD_SECONDS: float = 60.0
+
+    # File built by breached.py; passwords in it are refused at
+    # registration and password change. Unset disables the check.
+    BREACHED_PASSWORDS_FILE: Optional[str] = None
 
     SENDGRID_API_KEY: str
 
-    async def SENDGRID_CLIENT(cls) -> SendGridAPIClient:
+    DISPATCH_INTERVAL_SECONDS: float = 30.0
+    DISPATCH_BATCH_SIZE: int = 500
+    DISPATCH_MAX_JOBS: int = 50_000
+
+    JOB_EVENT_BATCH_SIZE: int = 500
+    JOB_EVENT_FLUSH_SECONDS: float = 1.0
+    JOB_STATS_RECONCILE_SECONDS: float = 300.0
+
+    # "memory" (this worker only) or "postgres" (LISTEN/NOTIFY on the
+    # primary database, shared by every worker).
+    JOB_FEED_BACKEND: str = "memory"
+    JOB_FEED_QUEUE_SIZE: int = 100
+    JOB_FEED_HEARTBEAT_SECONDS: float = 15.0
+
+    # Largest radius /bookings/nearby_jobs searches, and its default when
+    # the caller has no service area; most jobs one search returns.
+    NEARBY_JOBS_MAX_RADIUS_KM: float = 100.0
+    NEARBY_JOBS_MAX_RESULTS: int = 100
+
+    # Optional shared tier for the read caches (jobs, principals):
+    # redis://... or memory:// (in-process stand-in). Without one, only
+    # the local LRU is used and invalidation is exact. With one, writes
+    # are broadcast to every worker's local tier. Values are encoded with
+    # CACHE_SERIALIZER: "msgpack", "json" or "auto" (msgpack if
+    # installed).
+    CACHE_BACKEND_URL: Optional[str] = None
+    CACHE_SERIALIZER: str = "auto"
+    # Overrides CACHE_BACKEND_URL for the job cache.
+    JOB_CACHE_BACKEND_URL: Optional[str] = None
+    JOB_CACHE_SIZE: int = 10_000
+    JOB_CACHE_TTL_SECONDS: float = 60.0
+    # Local LRU lifetime when a shared tier is configured; bounds how long
+    # other workers may serve a job after it changes if an invalidation
+    # broadcast is lost.
+    JOB_CACHE_LOCAL_TTL_SECONDS: float = 2.0
+    PRINCIPAL_CACHE_SIZE: int = 10_000
+    PRINCIPAL_CACHE_TTL_SECONDS: float = 300.0
+    PRINCIPAL_CACHE_LOCAL_TTL_SECONDS: float = 30.0
+
+    # Completed and cancelled jobs untouched for this many days move to
+    # jobs_archive, JOB_ARCHIVE_BATCH_SIZE rows per transaction.
+    JOB_ARCHIVE_AFTER_DAYS: float = 30.0
+    JOB_ARCHIVE_BATCH_SIZE: int = 1000
+    JOB_ARCHIVE_INTERVAL_SECONDS: float = 3600.0
+
+    # Production launcher (server.py). Without SERVER_WORKERS one worker
+    # is started per usable CPU, up to SERVER_MAX_WORKERS. Workers are
+    # recycled after SERVER_MAX_REQUESTS (+ up to the jitter) requests.
+    SERVER_HOST: str = "0.0.0.0"
+    SERVER_PORT: int = 8000
+    SERVER_WORKERS: Optional[int] = None
+    SERVER_MAX_WORKERS: int = 16
+    SERVER_MAX_REQUESTS: int = 10_000
+    SERVER_MAX_REQUESTS_JITTER: int = 1000
+    SERVER_GRACEFUL_TIMEOUT_SECONDS: float = 30.0
+    SERVER_KEEPALIVE_SECONDS: float = 5.0
+
+    # Responses of at least RESPONSE_COMPRESSION_MIN_BYTES are compressed
+    # (brotli if installed, else gzip) for clients that accept it; from
+    # RESPONSE_COMPRESSION_THREAD_BYTES on, off the event loop.
+    RESPONSE_COMPRESSION_MIN_BYTES: int = 1024
+    RESPONSE_COMPRESSION_THREAD_BYTES: int = 64 * 1024
+    RESPONSE_GZIP_LEVEL: int = 6
+    RESPONSE_BROTLI_QUALITY: int = 4
+
+    # Admission control (core.admission), per worker: for each class of
+    # route, (concurrent requests, requests allowed to queue, seconds a
+    # queued request may wait) before it is shed with a 503. "auth" routes
+    # hash passwords with argon2 and are CPU bound.
+    ADMISSION_CONTROL: bool = True
+    ADMISSION_LIMITS: Dict[str, Tuple[int, int, float]] = {
+        "auth": (4, 32, 2.0),
+        "export": (2, 4, 5.0),
+        "read": (64, 256, 1.0),
+        "write": (32, 128, 2.0),
+    }
+
+    # Seconds each class of route (as classified for admission control)
+    # may run before it is cancelled with a 504; database statements it
+    # runs are stopped at the same deadline. 0 disables the deadline.
+    REQUEST_DEADLINES: Dict[str, float] = {
+        "auth": 10.0,
+        "export": 0.0,
+        "read": 5.0,
+        "write": 10.0,
+    }
+
+    # Idempotency-Key support (core.idempotency) on the routes in
+    # api.main.IDEMPOTENT_ROUTES. Responses are kept for
+    # IDEMPOTENCY_TTL_SECONDS; a retry of a request still running waits up
+    # to IDEMPOTENCY_WAIT_SECONDS for it. A worker that dies mid-request
+    # holds its key for IDEMPOTENCY_LEASE_SECONDS.
+    IDEMPOTENCY_TTL_SECONDS: float = 86400.0
+    IDEMPOTENCY_WAIT_SECONDS: float = 10.0
+    IDEMPOTENCY_LEASE_SECONDS: float = 60.0
+    IDEMPOTENCY_CACHE_SIZE: int = 10_000
+    IDEMPOTENCY_MAX_RESPONSE_BYTES: int = 64 * 1024
+    IDEMPOTENCY_PURGE_INTERVAL_SECONDS: float = 3600.0
+
+    # Logging goes through a bounded queue to a writer thread (core.logs).
+    # LOG_FORMAT is "json" or "text". LOG_SAMPLE_RATES keeps that share
+    # of records below WARNING per logger prefix, e.g.
+    # {"core.cache": 0.01}.
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"
+    LOG_QUEUE_SIZE: int = 10_000
+    LOG_SAMPLE_RATES: Dict[str, float] = {}
+
+    # Most ids one batch lookup (retrieve_users_by_id, retrieve_jobs_by_id)
+    # may ask for.
+    BATCH_LOOKUP_MAX_IDS: int = 100
+
+    async def SENDGRID_CLIENT(cls) -> "SendGridAPIClient":
+        # sendgrid is only needed by the email routes; importing it here
+        # keeps it off the worker boot path.
+        from sendgrid import SendGridAPIClient
         return SendGridAPIClient(cls.SENDGRID_API_KEY)
 
     @validator("DATABASE_URI", pre=True)
@@ -55,11 +197,34 @@ class JsonRender(JSONResponse):
     allow content that needs to be return as an object to utilize
     the reponse_model argument on an API Endpoint but it keeps
     consistency of the Apps Json-scheme.
+
+    When the client asked for msgpack (see core.negotiation) the same
+    envelope is rendered as msgpack instead.
     """
 
     def render(self, content: any) -> bytes:
         # Here you can modify the response content or headers as needed
+        if response_format.get() == "msgpack":
+            self.media_type = MSGPACK
+            return dump_msgpack({'data': content})
         return super().render({'data': content})
 
 
-settings = Settings()
+@lru_cache()
+def get_settings() -> Settings:
+    """
+    Builds the application Settings on first use and caches them.
+
+    Reading the environment and .env file is deferred until something
+    actually needs a setting, so importing models or schemas does not
+    require a fully configured environment.
+    """
+    return Settings()
+
+
+def __getattr__(name: str) -> Any:
+    # Keeps `from core.config import settings` working while deferring
+    # construction of Settings until the attribute is first requested.
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,21 +1,221 @@
-from sqlalchemy import create_engine
+import itertools
+from contextvars import ContextVar
+from time import monotonic
+from typing import List, Optional, Sequence
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import as_declarative, declared_attr
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import StaticPool
 from pydantic import BaseModel as Base
-from typing import ContextManager
 
-from core.config import settings
+from core.config import Settings, get_settings
+from core.deadline import apply_statement_timeout, install_sqlite_interrupt
+
+
+def _create_engine(uri: str) -> Engine:
+    options = {}
+    if uri.startswith("sqlite"):
+        # Sessions are handed between the event loop and the threadpool.
+        options["connect_args"] = {"check_same_thread": False}
+        if uri in ("sqlite://", "sqlite:///:memory:"):
+            # An in-memory database only exists on its connection; share
+            # that one connection with background threads too.
+            options["poolclass"] = StaticPool
+    engine = create_engine(uri, pool_pre_ping=True, echo=False, **options)
+    if uri.startswith("sqlite"):
+        event.listen(engine, "connect", install_sqlite_interrupt)
+    return engine
+
+
+def _session_factory(engine: Engine) -> sessionmaker:
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    # Statements run for a request stop at its deadline (core.deadline).
+    event.listen(factory, "after_begin", apply_statement_timeout)
+    return factory
+
+
+def _setting(settings, name: str):
+    # Databases built with an explicit URI (scripts, tests) do not need a
+    # configured environment; they fall back to the Settings defaults.
+    if settings is None:
+        return Settings.__fields__[name].default
+    return getattr(settings, name)
+
+
+class Replica:
+    """
+    A read-only replica engine plus its health state.
+
+    A replica that raises a connection-level error is ejected for
+    `eject_seconds` and skipped by the round-robin until it expires.
+    """
+
+    def __init__(self, uri: str, eject_seconds: float):
+        self.uri = uri
+        self.eject_seconds = eject_seconds
+        self.ejected_until = 0.0
+        self.engine = _create_engine(uri)
+        self.session_factory = _session_factory(self.engine)
+        event.listen(self.engine, "handle_error", self._on_error)
+
+    @property
+    def healthy(self) -> bool:
+        return monotonic() >= self.ejected_until
+
+    def eject(self):
+        self.ejected_until = monotonic() + self.eject_seconds
+
+    def _on_error(self, context):
+        # Only connection-level failures say anything about the replica's
+        # health; a bad statement would fail on every replica alike.
+        if context.is_disconnect or context.connection is None:
+            self.eject()
+
+    def dispose(self):
+        self.engine.dispose()
 
 
 class Database:
-    def __init__(self):
-        self.engine = create_engine(str(settings.DATABASE_URI),
-                                    pool_pre_ping=True, echo=False)
-        self.SessionLocal = sessionmaker(autocommit=False,
-                                         autoflush=False, bind=self.engine)
-
-    def get_db(self) -> Session:
-        db = self.SessionLocal()
+    """
+    Lazily connected wrapper around the application's engine and
+    session factory.
+
+    No engine is created on construction; `connect` is called from the
+    application's startup hook (or on first use) so importing models
+    never opens a connection pool.
+
+    When replica URIs are configured, `get_db(readonly=True)` hands out
+    sessions bound to the replicas in round-robin order, skipping ejected
+    ones and falling back to the primary when none are healthy. Reads made
+    within `read_your_writes_seconds` of a commit from the same request
+    stay on the primary so callers always see their own writes.
+    """
+
+    def __init__(self, uri: Optional[str] = None,
+                 replica_uris: Optional[Sequence[str]] = None,
+                 replica_eject_seconds: Optional[float] = None,
+                 read_your_writes_seconds: Optional[float] = None):
+        self.uri = uri
+        self.replica_uris = replica_uris
+        self.replica_eject_seconds = replica_eject_seconds
+        self.read_your_writes_seconds = read_your_writes_seconds
+        self.replicas: List[Replica] = []
+        self._round_robin = itertools.count()
+        # Monotonic time of the last commit on the primary made from the
+        # current request (or task); reads shortly after it stay there.
+        self._last_commit: ContextVar[Optional[float]] = ContextVar(
+            f"database_last_commit_{id(self)}", default=None)
+        self._engine: Optional[Engine] = None
+        self._session_factory: Optional[sessionmaker] = None
+
+    def connect(self) -> Engine:
+        """
+        Creates the engines and session factories if they do not exist yet.
+
+        Returns:
+            Engine: The primary engine bound to this database.
+        """
+        if self._engine is None:
+            settings = get_settings() if self.uri is None else None
+            uri = self.uri or str(settings.DATABASE_URI)
+            if self.replica_uris is None:
+                self.replica_uris = (
+                    settings.DATABASE_REPLICA_URIS if settings else [])
+            if self.replica_eject_seconds is None:
+                self.replica_eject_seconds = _setting(
+                    settings, "DATABASE_REPLICA_EJECT_SECONDS")
+            if self.read_your_writes_seconds is None:
+                self.read_your_writes_seconds = _setting(
+                    settings, "DATABASE_READ_YOUR_WRITES_SECONDS")
+
+            self.replicas = [Replica(str(replica_uri),
+                                     self.replica_eject_seconds)
+                             for replica_uri in self.replica_uris]
+            self._engine = _create_engine(uri)
+            self._session_factory = _session_factory(self._engine)
+            event.listen(self._session_factory, "after_commit",
+                         self._on_primary_commit)
+        return self._engine
+
+    def dispose(self):
+        """
+        Closes every pooled connection and forgets the engines, so the
+        next use reconnects from scratch.
+        """
+        if self._engine is not None:
+            self._engine.dispose()
+        for replica in self.replicas:
+            replica.dispose()
+        self.replicas = []
+        self._engine = None
+        self._session_factory = None
+
+    def reset_after_fork(self):
+        """
+        Forgets the engines in a freshly forked worker without closing
+        their connections, which still belong to the parent; the worker
+        then opens its own pool on first use.
+        """
+        if self._engine is not None:
+            self._engine.dispose(close=False)
+        for replica in self.replicas:
+            replica.engine.dispose(close=False)
+        self.replicas = []
+        self._engine = None
+        self._session_factory = None
+
+    @property
+    def engine(self) -> Engine:
+        return self.connect()
+
+    @property
+    def SessionLocal(self) -> sessionmaker:
+        self.connect()
+        return self._session_factory
+
+    def _on_primary_commit(self, session: Session):
+        self._last_commit.set(monotonic())
+
+    def pick_replica(self) -> Optional[Replica]:
+        """
+        Chooses the next healthy replica in round-robin order.
+
+        Returns:
+            Replica | None: The replica to read from, or None when reads
+            must go to the primary (no healthy replicas, or a recent write
+            from this request).
+        """
+        self.connect()
+        if not self.replicas:
+            return None
+
+        last_commit = self._last_commit.get()
+        if last_commit is not None and (
+                monotonic() - last_commit < self.read_your_writes_seconds):
+            return None
+
+        start = next(self._round_robin)
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            if replica.healthy:
+                return replica
+        return None
+
+    def get_db(self, readonly: bool = False) -> Session:
+        """
+        Opens a session on the primary, or on a replica for read-only work.
+
+        Args:
+            readonly (bool): True when the session will only read; it may
+                then be served by a replica.
+
+        Returns:
+            Session: A new session.
+        """
+        replica = self.pick_replica() if readonly else None
+        db = replica.session_factory() if replica else self.SessionLocal()
         try:
             return db
         finally:
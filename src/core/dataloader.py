@@ -0,0 +1,130 @@
+import asyncio
+from typing import (Callable, Dict, Generic, Hashable, Iterable, List,
+                    TypeVar)
+
+from fastapi import HTTPException, Request, status
+from starlette.concurrency import run_in_threadpool
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class DataLoader(Generic[K, V]):
+    """
+    Coalesces lookups by key. Every key requested in the same pass of the
+    event loop (e.g. by coroutines gathered together) is fetched with one
+    call to `batch_load`, and each key is fetched at most once for the
+    lifetime of the loader, so loaders are made per request (see
+    `request_loader`) and never hold data across requests.
+
+    Args:
+        batch_load: Synchronous function from a list of keys to a dict of
+            the values found; run in the threadpool. Keys it leaves out
+            load as None.
+        max_batch_size: Keys per `batch_load` call.
+    """
+
+    def __init__(self, batch_load: Callable[[List[K]], Dict[K, V]],
+                 max_batch_size: int = 500):
+        self.batch_load = batch_load
+        self.max_batch_size = max_batch_size
+        self.batches = 0
+        self._futures: Dict[K, asyncio.Future] = {}
+        self._queue: List[K] = []
+
+    def load(self, key: K) -> "asyncio.Future[V]":
+        """
+        The value for `key`, to be awaited.
+        """
+        future = self._futures.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._futures[key] = loop.create_future()
+            if not self._queue:
+                # Dispatch once the coroutines already scheduled have had
+                # their turn to queue keys too.
+                loop.call_soon(lambda: loop.create_task(self._dispatch()))
+            self._queue.append(key)
+        return future
+
+    async def load_many(self, keys: Iterable[K]) -> List[V]:
+        """
+        The values for `keys`, in order, fetched in as few batches as
+        possible.
+        """
+        return list(await asyncio.gather(*[self.load(key) for key in keys]))
+
+    def prime(self, key: K, value: V):
+        """
+        Records a value already at hand so loading `key` does not query.
+        """
+        if key not in self._futures:
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(value)
+            self._futures[key] = future
+
+    async def _dispatch(self):
+        keys, self._queue = self._queue, []
+        for start in range(0, len(keys), self.max_batch_size):
+            chunk = keys[start:start + self.max_batch_size]
+            self.batches += 1
+            try:
+                found = await run_in_threadpool(self.batch_load, chunk)
+            except Exception as exc:
+                # Failures are not remembered; a later load retries.
+                for key in chunk:
+                    future = self._futures.pop(key)
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            for key in chunk:
+                future = self._futures[key]
+                if not future.done():
+                    future.set_result(found.get(key))
+
+
+def request_loader(request: Request, name: str,
+                   batch_load: Callable[[List[K]], Dict[K, V]]
+                   ) -> DataLoader[K, V]:
+    """
+    The request's loader called `name`, created with `batch_load` on
+    first use; every dependency and route handling the request shares it.
+    """
+    loaders = getattr(request.state, "loaders", None)
+    if loaders is None:
+        loaders = request.state.loaders = {}
+    loader = loaders.get(name)
+    if loader is None:
+        loader = loaders[name] = DataLoader(batch_load)
+    return loader
+
+
+def parse_ids(values: List[str], maximum: int) -> List[int]:
+    """
+    Reads an `ids` query parameter, given repeated (ids=1&ids=2) or comma
+    separated (ids=1,2), into distinct ids in the order given.
+
+    Raises:
+        HTTPException: 400 when an id is not an integer, none are given
+            or more than `maximum` are.
+    """
+    ids: Dict[int, None] = {}
+    for value in values:
+        for part in value.split(","):
+            part = part.strip()
+            if not part.isnumeric():
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail={
+                        "status": "400",
+                        "message": "ids must be integers"
+                    })
+            ids[int(part)] = None
+    if not ids or len(ids) > maximum:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={
+                "status": "400",
+                "message": f"Between 1 and {maximum} ids may be requested"
+            })
+    return list(ids)
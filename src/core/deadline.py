@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import sqlite3
+from contextvars import ContextVar
+from time import monotonic
+from typing import Mapping, Optional, Sequence
+
+from fastapi.responses import JSONResponse
+from sqlalchemy import exc as sa_exc
+
+from core.admission import Rule, compile_rules, match_rules
+
+logger = logging.getLogger(__name__)
+
+# Monotonic time by which the current request must be done, or None. The
+# threadpool copies the context, so database work run there sees it too.
+deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+# SQLite calls the progress handler every this many VM instructions.
+SQLITE_PROGRESS_STEPS = 1000
+# Postgres: canceling statement due to statement timeout.
+_QUERY_CANCELED = "57014"
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised instead of starting database work once the deadline passed.
+    """
+
+
+def remaining() -> Optional[float]:
+    """
+    Seconds left before the current deadline, None without one.
+    """
+    until = deadline.get()
+    return None if until is None else until - monotonic()
+
+
+def is_timeout(exc: BaseException) -> bool:
+    """
+    Whether `exc` is a deadline running out: DeadlineExceeded, or a
+    statement the database cancelled for it.
+    """
+    if isinstance(exc, DeadlineExceeded):
+        return True
+    if isinstance(exc, sa_exc.OperationalError):
+        orig = exc.orig
+        if getattr(orig, "pgcode", None) == _QUERY_CANCELED:
+            return True
+        return (isinstance(orig, sqlite3.OperationalError)
+                and str(orig) == "interrupted")
+    return False
+
+
+def apply_statement_timeout(session, transaction, connection):
+    """
+    Session `after_begin` hook: bounds every statement of a transaction
+    begun under a deadline by the time left. On Postgres this is a
+    transaction-local statement_timeout, so connections go back to the
+    pool without it; SQLite is interrupted by `_sqlite_progress`.
+    """
+    left = remaining()
+    if left is None:
+        return
+    if left <= 0:
+        raise DeadlineExceeded("request deadline exceeded")
+    if connection.dialect.name == "postgresql":
+        connection.exec_driver_sql(
+            f"SET LOCAL statement_timeout = {max(1, int(left * 1000))}")
+
+
+def _sqlite_progress() -> int:
+    # A non-zero result interrupts the running statement.
+    until = deadline.get()
+    return 1 if until is not None and monotonic() >= until else 0
+
+
+def install_sqlite_interrupt(dbapi_connection, connection_record):
+    """
+    Engine `connect` hook for SQLite: statements running past the
+    deadline of the request they run for are interrupted.
+    """
+    dbapi_connection.set_progress_handler(_sqlite_progress,
+                                          SQLITE_PROGRESS_STEPS)
+
+
+class DeadlineMiddleware:
+    """
+    Gives each HTTP request the deadline of its route class (see `rules`
+    and `seconds`); classes without a positive number of seconds, and
+    exempt routes, get none.
+
+    The deadline bounds database statements (see
+    `apply_statement_timeout`) and the route itself: when it passes, the
+    route is cancelled. Either way the client gets 504 if no response
+    was started yet. A full connection pool is answered with 503.
+    """
+
+    def __init__(self, app, seconds: Mapping[str, float],
+                 rules: Sequence[Rule]):
+        self.app = app
+        self.seconds = dict(seconds)
+        self.rules = compile_rules(rules)
+
+    def timeout(self, method: str, path: str) -> Optional[float]:
+        name = match_rules(self.rules, method, path)
+        seconds = self.seconds.get(name) if name is not None else None
+        return seconds if seconds and seconds > 0 else None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        seconds = self.timeout(scope["method"], scope["path"])
+        if seconds is None:
+            await self.app(scope, receive, send)
+            return
+
+        started = False
+
+        async def send_tracked(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        token = deadline.set(monotonic() + seconds)
+        try:
+            await asyncio.wait_for(self.app(scope, receive, send_tracked),
+                                   seconds)
+        except asyncio.TimeoutError:
+            logger.warning("%s %s cancelled after %.1fs", scope["method"],
+                           scope["path"], seconds)
+            if not started:
+                await self._error(scope, receive, send, 504)
+        except Exception as exc:
+            if started:
+                raise
+            if is_timeout(exc):
+                logger.warning("%s %s ran out of time in the database",
+                               scope["method"], scope["path"])
+                await self._error(scope, receive, send, 504)
+            elif isinstance(exc, sa_exc.TimeoutError):
+                logger.warning("%s %s found the connection pool full",
+                               scope["method"], scope["path"])
+                await self._error(scope, receive, send, 503)
+            else:
+                raise
+        finally:
+            deadline.reset(token)
+
+    @staticmethod
+    async def _error(scope, receive, send, status_code: int):
+        if status_code == 504:
+            message = "The request took too long; please try again"
+            headers = None
+        else:
+            message = "Server is busy; please retry shortly"
+            headers = {"Retry-After": "1"}
+        response = JSONResponse(
+            status_code=status_code,
+            content={"detail": {"status": str(status_code),
+                                "message": message}},
+            headers=headers)
+        await response(scope, receive, send)
@@ -0,0 +1,254 @@
+import csv
+import io
+import logging
+from enum import Enum
+from time import perf_counter
+from typing import Callable, Iterator, List, NamedTuple, Optional, Sequence
+
+from pydantic import BaseModel
+
+from core.database import Database
+
+logger = logging.getLogger(__name__)
+
+
+class ExportColumn(NamedTuple):
+    """
+    One exported column: its header, the SQL expression it is read from
+    and its kind ("int", "float", "str", "bool" or "datetime"), which
+    fixes the columnar type even when a chunk holds only NULLs.
+    """
+    name: str
+    expression: object
+    kind: str = "str"
+
+
+class Dataset(NamedTuple):
+    """
+    A named export: its columns, and a function that turns their
+    expressions into the ordered SELECT to stream.
+    """
+    name: str
+    columns: Sequence[ExportColumn]
+    build_query: Callable[[Sequence[object]], object]
+
+
+class Export_Report(BaseModel):
+    dataset: str
+    format: str
+    rows: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+    rows_per_second: float = 0.0
+
+
+def _plain(value):
+    return value.name if isinstance(value, Enum) else value
+
+
+class _Drain(io.RawIOBase):
+    """
+    Write-only file that keeps what is written until it is taken, so a
+    columnar writer can be drained chunk by chunk.
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def take(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+class CsvEncoder:
+    media_type = "text/csv"
+    extension = "csv"
+
+    def __init__(self, columns: Sequence[ExportColumn]):
+        self.columns = columns
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+
+    def _take(self) -> bytes:
+        data = self._buffer.getvalue().encode()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+    def begin(self) -> bytes:
+        self._writer.writerow([column.name for column in self.columns])
+        return self._take()
+
+    def encode(self, rows: Sequence[Sequence]) -> bytes:
+        self._writer.writerows([[_plain(value) for value in row]
+                                for row in rows])
+        return self._take()
+
+    def finish(self) -> bytes:
+        return b""
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError as exc:
+        raise RuntimeError(
+            "The pyarrow package is required for Parquet and Arrow "
+            "exports; install it or export CSV instead.") from exc
+    return pyarrow
+
+
+class _ColumnarEncoder:
+    """
+    Encodes each chunk as one Arrow record batch. Subclasses choose the
+    container: an Arrow IPC stream or a Parquet file (one row group per
+    chunk).
+    """
+
+    def __init__(self, columns: Sequence[ExportColumn]):
+        pa = self._pa = _pyarrow()
+        types = {"int": pa.int64(), "float": pa.float64(),
+                 "str": pa.string(), "bool": pa.bool_(),
+                 "datetime": pa.timestamp("us", tz="UTC")}
+        self.columns = columns
+        self.schema = pa.schema([(column.name, types[column.kind])
+                                 for column in columns])
+        self._sink = _Drain()
+        self._writer = None
+
+    def _open(self):
+        raise NotImplementedError
+
+    def begin(self) -> bytes:
+        self._writer = self._open()
+        return self._sink.take()
+
+    def encode(self, rows: Sequence[Sequence]) -> bytes:
+        arrays = [self._pa.array([_plain(row[index]) for row in rows],
+                                 type=field.type)
+                  for index, field in enumerate(self.schema)]
+        self._write(self._pa.RecordBatch.from_arrays(arrays,
+                                                     schema=self.schema))
+        return self._sink.take()
+
+    def _write(self, batch):
+        self._writer.write_batch(batch)
+
+    def finish(self) -> bytes:
+        self._writer.close()
+        return self._sink.take()
+
+
+class ArrowEncoder(_ColumnarEncoder):
+    media_type = "application/vnd.apache.arrow.stream"
+    extension = "arrows"
+
+    def _open(self):
+        return self._pa.ipc.new_stream(self._sink, self.schema)
+
+
+class ParquetEncoder(_ColumnarEncoder):
+    media_type = "application/vnd.apache.parquet"
+    extension = "parquet"
+
+    def _open(self):
+        import pyarrow.parquet as pq
+        return pq.ParquetWriter(self._sink, self.schema)
+
+    def _write(self, batch):
+        self._writer.write_batch(batch, row_group_size=batch.num_rows)
+
+
+ENCODERS = {"csv": CsvEncoder, "arrow": ArrowEncoder,
+            "parquet": ParquetEncoder}
+
+
+def get_encoder(format: str, columns: Sequence[ExportColumn]):
+    """
+    Builds the encoder for `format`.
+
+    Raises:
+        ValueError: If the format is unknown.
+        RuntimeError: If the format needs pyarrow and it is missing.
+    """
+    try:
+        encoder = ENCODERS[format]
+    except KeyError:
+        raise ValueError(f"Unknown export format {format!r}; expected one "
+                         f"of {', '.join(ENCODERS)}")
+    return encoder(columns)
+
+
+def stream_export(db: Database, dataset: Dataset, encoder,
+                  chunk_size: int = 5000,
+                  report: Optional[Export_Report] = None
+                  ) -> Iterator[bytes]:
+    """
+    Streams `dataset` from a read replica (or the primary) through a
+    server-side cursor, `chunk_size` rows at a time, yielding encoded
+    bytes as each chunk is read. Only one chunk is ever held in memory,
+    whatever the size of the table.
+
+    Args:
+        report (Export_Report, optional): Filled in with the row count,
+            byte count and throughput as the export runs.
+    """
+    report = report or Export_Report(dataset=dataset.name,
+                                     format=encoder.extension)
+    started = perf_counter()
+    query = dataset.build_query([column.expression
+                                 for column in dataset.columns])
+
+    def emit(data: bytes) -> bytes:
+        report.bytes += len(data)
+        return data
+
+    yield emit(encoder.begin())
+    with db.get_db(readonly=True) as session:
+        # yield_per makes the ORM session stream (a server-side cursor
+        # where the driver has one) instead of buffering every row.
+        result = session.execute(query.execution_options(
+            yield_per=chunk_size))
+        for rows in result.partitions(chunk_size):
+            report.rows += len(rows)
+            yield emit(encoder.encode(rows))
+    yield emit(encoder.finish())
+
+    report.seconds = perf_counter() - started
+    if report.seconds > 0:
+        report.rows_per_second = report.rows / report.seconds
+    logger.info("export finished: %s", report.dict())
+
+
+def export_response(db: Database, dataset: Dataset, format: str,
+                    chunk_size: int = 5000):
+    """
+    Builds a StreamingResponse that sends `dataset` as a `format`
+    attachment. The generator is synchronous, so Starlette runs the
+    database reads and encoding in its threadpool.
+
+    Raises:
+        ValueError: If the format is unknown.
+        RuntimeError: If the format needs pyarrow and it is missing.
+    """
+    from fastapi.responses import StreamingResponse
+
+    encoder = get_encoder(format, dataset.columns)
+    filename = f"{dataset.name}.{encoder.extension}"
+    return StreamingResponse(
+        stream_export(db, dataset, encoder, chunk_size),
+        media_type=encoder.media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'})
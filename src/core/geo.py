@@ -0,0 +1,231 @@
+import math
+from collections import defaultdict
+from typing import (Callable, Dict, Generic, Hashable, Iterator, List,
+                    Optional, Tuple, TypeVar)
+
+T = TypeVar("T", bound=Hashable)
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_BASE32_INDEX = {char: index for index, char in enumerate(_BASE32)}
+# Stored with every located row; cells of 4.8m x 4.8m.
+GEOHASH_PRECISION = 9
+
+# (min latitude, min longitude, max latitude, max longitude)
+Box = Tuple[float, float, float, float]
+
+
+def valid_location(latitude: float, longitude: float) -> bool:
+    return -90 <= latitude <= 90 and -180 <= longitude <= 180
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float
+                ) -> float:
+    """
+    Great-circle (haversine) distance between two points.
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    half_dphi = (phi2 - phi1) / 2
+    half_dlambda = math.radians(lon2 - lon1) / 2
+    a = (math.sin(half_dphi) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(half_dlambda) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def encode(latitude: float, longitude: float,
+           precision: int = GEOHASH_PRECISION) -> str:
+    """
+    The geohash of a point. Points in one cell share the cell's geohash
+    as a prefix, so a cell's points are one range of a sorted index.
+    """
+    lat_low, lat_high, lon_low, lon_high = -90.0, 90.0, -180.0, 180.0
+    chars, value, bits, even = [], 0, 0, True
+    while len(chars) < precision:
+        if even:
+            middle = (lon_low + lon_high) / 2
+            if longitude >= middle:
+                value, lon_low = value * 2 + 1, middle
+            else:
+                value, lon_high = value * 2, middle
+        else:
+            middle = (lat_low + lat_high) / 2
+            if latitude >= middle:
+                value, lat_low = value * 2 + 1, middle
+            else:
+                value, lat_high = value * 2, middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            value, bits = 0, 0
+    return "".join(chars)
+
+
+def cell_degrees(precision: int) -> Tuple[float, float]:
+    """
+    (latitude, longitude) degrees spanned by a geohash cell.
+    """
+    lon_bits = (precision * 5 + 1) // 2
+    lat_bits = precision * 5 // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def bounding_boxes(latitude: float, longitude: float,
+                   radius_km: float) -> List[Box]:
+    """
+    Boxes covering every point within `radius_km`: one, or two when the
+    circle crosses the antimeridian. Circles reaching a pole span every
+    longitude.
+    """
+    dlat = radius_km / KM_PER_DEGREE
+    min_lat, max_lat = latitude - dlat, latitude + dlat
+    if min_lat <= -90 or max_lat >= 90:
+        return [(max(min_lat, -90.0), -180.0, min(max_lat, 90.0), 180.0)]
+
+    # The widest longitude span of the circle is at the latitude where
+    # its meridian tangents touch it.
+    ratio = math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(
+        math.radians(latitude))
+    if ratio >= 1:
+        return [(min_lat, -180.0, max_lat, 180.0)]
+    dlon = math.degrees(math.asin(ratio))
+    min_lon, max_lon = longitude - dlon, longitude + dlon
+    if min_lon < -180:
+        return [(min_lat, min_lon + 360, max_lat, 180.0),
+                (min_lat, -180.0, max_lat, max_lon)]
+    if max_lon > 180:
+        return [(min_lat, min_lon, max_lat, 180.0),
+                (min_lat, -180.0, max_lat, max_lon - 360)]
+    return [(min_lat, min_lon, max_lat, max_lon)]
+
+
+def _cell_span(low: float, high: float, offset: float, size: float,
+               cells: int) -> range:
+    first = int((low + offset) // size)
+    last = int((high + offset) // size)
+    return range(max(0, first), min(cells - 1, last) + 1)
+
+
+def covering_cells(boxes: List[Box], max_cells: int = 16) -> List[str]:
+    """
+    The geohash cells of the highest precision (up to
+    GEOHASH_PRECISION) covering `boxes` with at most `max_cells` cells;
+    [""] (everything) when even one-character cells are too many.
+    """
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_degrees(precision)
+        rows, columns = round(180 / height), round(360 / width)
+        spans = [(_cell_span(box[0], box[2], 90, height, rows),
+                  _cell_span(box[1], box[3], 180, width, columns))
+                 for box in boxes]
+        if sum(len(lats) * len(lons) for lats, lons in spans) > max_cells:
+            continue
+        cells = {encode((row + 0.5) * height - 90,
+                        (column + 0.5) * width - 180, precision)
+                 for lats, lons in spans for row in lats for column in lons}
+        return sorted(cells)
+    return [""]
+
+
+def prefix_range(cell: str) -> Tuple[str, Optional[str]]:
+    """
+    [low, high) bounds of the geohashes starting with `cell`; high is
+    None when there is no upper bound.
+    """
+    chars = list(cell)
+    while chars:
+        index = _BASE32_INDEX[chars[-1]]
+        if index + 1 < len(_BASE32):
+            chars[-1] = _BASE32[index + 1]
+            return cell, "".join(chars)
+        chars.pop()
+    return cell, None
+
+
+class Grid:
+    """
+    A grid of `cell_km`-sized latitude/longitude cells: the cell of a
+    point and the cells a circle overlaps.
+    """
+
+    def __init__(self, cell_km: float = 10.0):
+        self.cell_km = cell_km
+        self.cell_degrees = min(90.0, cell_km / KM_PER_DEGREE)
+
+    def cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return (int((latitude + 90) // self.cell_degrees),
+                int((longitude + 180) // self.cell_degrees))
+
+    def cells(self, latitude: float, longitude: float, radius_km: float
+              ) -> Iterator[Tuple[int, int]]:
+        """
+        Every cell with a point within `radius_km` (and a few more at
+        the corners of the circle's bounding box).
+        """
+        for min_lat, min_lon, max_lat, max_lon in bounding_boxes(
+                latitude, longitude, radius_km):
+            low_row, low_column = self.cell(min_lat, min_lon)
+            high_row, high_column = self.cell(max_lat, max_lon)
+            for row in range(low_row, high_row + 1):
+                for column in range(low_column, high_column + 1):
+                    yield row, column
+
+
+class GridIndex(Grid, Generic[T]):
+    """
+    In-memory spatial index: items bucketed by Grid cell.
+
+    A radius query only looks at the cells overlapping the circle's
+    bounding box, so its cost follows the number of items nearby rather
+    than the number indexed. Pick `cell_km` around the typical query
+    radius.
+    """
+
+    def __init__(self, cell_km: float = 10.0):
+        super().__init__(cell_km)
+        self._cells: Dict[Tuple[int, int], List[
+            Tuple[float, float, T]]] = defaultdict(list)
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, item: T, latitude: float, longitude: float):
+        self._cells[self.cell(latitude, longitude)].append(
+            (latitude, longitude, item))
+        self._count += 1
+
+    def within(self, latitude: float, longitude: float, radius_km: float,
+               accept: Optional[Callable[[T], bool]] = None
+               ) -> List[Tuple[float, T]]:
+        """
+        (distance in km, item) of every item within `radius_km` that
+        `accept` (if given) accepts, nearest first.
+        """
+        found = []
+        for cell in self.cells(latitude, longitude, radius_km):
+            for lat, lon, item in self._cells.get(cell, ()):
+                distance = distance_km(latitude, longitude, lat, lon)
+                if distance <= radius_km and (accept is None
+                                              or accept(item)):
+                    found.append((distance, item))
+        found.sort(key=lambda hit: hit[0])
+        return found
+
+    def nearest(self, latitude: float, longitude: float, k: int,
+                max_radius_km: float,
+                accept: Optional[Callable[[T], bool]] = None
+                ) -> List[Tuple[float, T]]:
+        """
+        The `k` nearest accepted items within `max_radius_km`, nearest
+        first. The search radius starts at one cell and doubles until k
+        items are found inside it, so every closer item has been seen.
+        """
+        radius = min(self.cell_km, max_radius_km)
+        while True:
+            found = self.within(latitude, longitude, radius, accept)
+            if len(found) >= k or radius >= max_radius_km:
+                return found[:k]
+            radius = min(radius * 2, max_radius_km)
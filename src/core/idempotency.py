@@ -0,0 +1,362 @@
+import asyncio
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Sequence, Tuple
+
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy import Column, Integer, LargeBinary, String
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.types import DateTime
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+
+from core.admission import Rule, compile_rules, match_rules
+from core.cache import MISSING, LRUCache
+from core.database import Database, ModelBase as Base
+from core.negotiation import (JSON, MSGPACK, dump_msgpack, load_msgpack,
+                              response_format)
+
+logger = logging.getLogger(__name__)
+
+MAX_KEY_LENGTH = 255
+# Responses that say nothing final about the request are not kept, so a
+# retry runs it again: conflicts, rate limits, timeouts, server errors.
+_NOT_STORED = frozenset((408, 409, 425, 429))
+
+# (fingerprint, status code, media type, body)
+StoredResponse = Tuple[str, int, Optional[str], bytes]
+
+
+class Idempotency_Key(Base):
+    """
+    A request made with an Idempotency-Key header, and once it finished
+    its response, kept until `expires_on`.
+
+    `key` and `fingerprint` are keyed digests (see IdempotencyMiddleware),
+    never the raw header or request body. A row with no `status_code` is
+    a claim by the worker running the request; its short expiry lets
+    another worker take over if that one dies.
+    """
+
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String(length=32), primary_key=True, nullable=False)
+    fingerprint = Column(String(length=32), nullable=False)
+    status_code = Column(Integer, nullable=True)
+    media_type = Column(String(length=64), nullable=True)
+    body = Column(LargeBinary, nullable=True)
+    expires_on = Column(DateTime, index=True, nullable=False)
+
+    @property
+    def completed(self) -> bool:
+        return self.status_code is not None
+
+    def stored(self) -> StoredResponse:
+        return (self.fingerprint, self.status_code, self.media_type,
+                self.body or b"")
+
+    def claim(db: Database, key: str, fingerprint: str, lease: float
+              ) -> Tuple[bool, Optional["Idempotency_Key"]]:
+        """
+        Claims `key` for a request about to run, replacing an expired
+        row.
+
+        Returns:
+            tuple: (True, None) when the caller now owns the key,
+            otherwise (False, the row holding it), the row being None
+            when it disappeared in between.
+        """
+        now = datetime.utcnow()
+        with db.get_db() as session:
+            session.query(Idempotency_Key).filter(
+                Idempotency_Key.key == key,
+                Idempotency_Key.expires_on <= now
+            ).delete(synchronize_session=False)
+            session.add(Idempotency_Key(
+                key=key, fingerprint=fingerprint,
+                expires_on=now + timedelta(seconds=lease)))
+            try:
+                session.commit()
+                return True, None
+            except IntegrityError:
+                session.rollback()
+            return False, session.get(Idempotency_Key, key)
+
+    def complete(db: Database, key: str, stored: StoredResponse,
+                 ttl: float):
+        _, status_code, media_type, body = stored
+        with db.get_db() as session:
+            session.query(Idempotency_Key).filter_by(key=key).update(
+                {"status_code": status_code, "media_type": media_type,
+                 "body": body,
+                 "expires_on": datetime.utcnow() + timedelta(seconds=ttl)},
+                synchronize_session=False)
+            session.commit()
+
+    def release(db: Database, key: str):
+        """
+        Gives up an unfinished claim so the request can be retried.
+        """
+        with db.get_db() as session:
+            session.query(Idempotency_Key).filter(
+                Idempotency_Key.key == key,
+                Idempotency_Key.status_code.is_(None)
+            ).delete(synchronize_session=False)
+            session.commit()
+
+    def purge_expired(db: Database) -> int:
+        with db.get_db() as session:
+            deleted = session.query(Idempotency_Key).filter(
+                Idempotency_Key.expires_on <= datetime.utcnow()
+            ).delete(synchronize_session=False)
+            session.commit()
+        return deleted
+
+
+def _error(status_code: int, message: str,
+           headers: Optional[Dict[str, str]] = None) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content={"detail": {"status": str(status_code), "message": message}},
+        headers=headers)
+
+
+class IdempotencyMiddleware:
+    """
+    Makes the routes matched by `rules` (class name "idempotent")
+    idempotent for clients that send an Idempotency-Key header: the
+    first request with a key runs, and its response is stored for `ttl`
+    seconds and replayed, without running the route again, to every
+    retry with the same key and body.
+
+    Retries are answered from an in-process cache, then from the
+    idempotency_keys table shared by every worker. A retry arriving
+    while the first request still runs waits up to `wait` seconds for
+    its response (409 after that). Reusing a key with a different body
+    is refused with 422. Responses that are errors on the server's side
+    (5xx, 408, 409, 425, 429), or larger than `max_body` bytes, are not
+    kept; the claim is dropped and the next retry runs again.
+
+    Keys are scoped to the route and to the credentials sent with the
+    request, and are stored only as digests keyed with `secret`.
+
+    A response is stored as the first request negotiated it (JSON or
+    msgpack, see core.negotiation); a retry asking for the other one gets
+    the same content re-encoded.
+    """
+
+    header = "idempotency-key"
+
+    def __init__(self, app, database: Database, secret: str,
+                 rules: Sequence[Rule], ttl: float = 86400.0,
+                 lease: float = 60.0, wait: float = 10.0,
+                 max_body: int = 64 * 1024, cache_size: int = 10_000):
+        self.app = app
+        self.database = database
+        self.secret = hashlib.sha256(secret.encode()).digest()
+        self.rules = compile_rules(rules)
+        self.ttl = ttl
+        self.lease = lease
+        self.wait = wait
+        self.max_body = max_body
+        self.cache = LRUCache(cache_size, ttl)
+        self._running: Dict[str, asyncio.Future] = {}
+
+    def _digest(self, *parts: bytes) -> str:
+        digest = hashlib.blake2b(key=self.secret, digest_size=16)
+        for part in parts:
+            digest.update(len(part).to_bytes(4, "little"))
+            digest.update(part)
+        return digest.hexdigest()
+
+    def _key(self, scope, headers: Headers, value: str) -> str:
+        credential = headers.get("authorization") or ""
+        if not credential:
+            cookie = headers.get("cookie") or ""
+            credential = next((part.strip() for part in cookie.split(";")
+                               if part.strip().startswith("Authorization=")),
+                              "")
+        return self._digest(scope["method"].encode(), scope["path"].encode(),
+                            credential.encode(), value.encode())
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http"
+                or match_rules(self.rules, scope["method"],
+                               scope["path"]) != "idempotent"):
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        value = headers.get(self.header)
+        if value is None:
+            await self.app(scope, receive, send)
+            return
+        if not value.strip() or len(value) > MAX_KEY_LENGTH:
+            response = _error(400, f"Idempotency-Key must be 1 to "
+                                   f"{MAX_KEY_LENGTH} characters")
+            await response(scope, receive, send)
+            return
+
+        body = await _read_body(receive)
+        key = self._key(scope, headers, value)
+        fingerprint = self._digest(body)
+        response = await self._replay_or_claim(key, fingerprint)
+        if response is not None:
+            await response(scope, receive, send)
+            return
+        await self._run(scope, _replay_body(body, receive), send, key,
+                        fingerprint)
+
+    async def _replay_or_claim(self, key: str, fingerprint: str
+                               ) -> Optional[Response]:
+        # None once this request owns the key and must run.
+        loop = asyncio.get_running_loop()
+        give_up = loop.time() + self.wait
+        poll = 0.05
+        while True:
+            stored = self.cache.get(key)
+            if stored is not MISSING:
+                return _replay(stored, fingerprint)
+
+            running = self._running.get(key)
+            if running is not None:
+                try:
+                    await asyncio.wait_for(asyncio.shield(running),
+                                           give_up - loop.time())
+                except asyncio.TimeoutError:
+                    return self._in_progress()
+                continue
+
+            running = self._running[key] = loop.create_future()
+            try:
+                claimed, row = await run_in_threadpool(
+                    Idempotency_Key.claim, self.database, key, fingerprint,
+                    self.lease)
+            except BaseException:
+                self._finish(key)
+                raise
+            if claimed:
+                return None
+            self._finish(key)
+            if row is not None and row.completed:
+                self._remember(key, row.stored(), row.expires_on)
+                continue
+            if row is not None and row.fingerprint != fingerprint:
+                return _mismatch()
+            # Running in another worker.
+            if loop.time() + poll > give_up:
+                return self._in_progress()
+            await asyncio.sleep(poll)
+            poll = min(poll * 2, 1.0)
+
+    async def _run(self, scope, receive, send, key: str, fingerprint: str):
+        status_code, media_type, chunks, size = None, None, [], 0
+
+        async def capture(message):
+            nonlocal status_code, media_type, size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                media_type = Headers(raw=message["headers"]).get(
+                    "content-type")
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+                if size <= self.max_body:
+                    chunks.append(message.get("body", b""))
+            await send(message)
+
+        kept = False
+        try:
+            await self.app(scope, receive, capture)
+            if (status_code is not None and status_code < 500
+                    and status_code not in _NOT_STORED
+                    and size <= self.max_body):
+                stored = (fingerprint, status_code, media_type,
+                          b"".join(chunks))
+                await run_in_threadpool(Idempotency_Key.complete,
+                                        self.database, key, stored, self.ttl)
+                self._remember(key, stored)
+                kept = True
+        finally:
+            if not kept:
+                try:
+                    await run_in_threadpool(Idempotency_Key.release,
+                                            self.database, key)
+                except Exception:
+                    logger.exception("releasing an idempotency key failed")
+            self._finish(key)
+
+    def _remember(self, key: str, stored: StoredResponse,
+                  expires_on: Optional[datetime] = None):
+        ttl = self.ttl
+        if expires_on is not None:
+            ttl = (expires_on - datetime.utcnow()).total_seconds()
+        if ttl > 0:
+            self.cache.set(key, stored, min(ttl, self.ttl))
+
+    def _finish(self, key: str):
+        # Wakes the requests waiting on this one; they look again.
+        running = self._running.pop(key, None)
+        if running is not None and not running.done():
+            running.set_result(None)
+
+    def _in_progress(self) -> Response:
+        return _error(409, "A request with this Idempotency-Key is still "
+                           "in progress", {"Retry-After": "1"})
+
+
+def _replay(stored: StoredResponse, fingerprint: str) -> Response:
+    stored_fingerprint, status_code, media_type, body = stored
+    if stored_fingerprint != fingerprint:
+        return _mismatch()
+    body, media_type = _renegotiated(body, media_type)
+    response = Response(body, status_code=status_code)
+    if media_type:
+        response.headers["content-type"] = media_type
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _renegotiated(body: bytes, media_type: Optional[str]
+                  ) -> Tuple[bytes, Optional[str]]:
+    # The stored body in the representation this request negotiated.
+    wanted = response_format.get()
+    stored = {JSON: "json", MSGPACK: "msgpack"}.get(
+        (media_type or "").split(";")[0].strip())
+    if stored is None or stored == wanted or not body:
+        return body, media_type
+    if stored == "msgpack":
+        content = load_msgpack(body)
+        return JSONResponse(content).body, JSON
+    return dump_msgpack(json.loads(body)), MSGPACK
+
+
+def _mismatch() -> Response:
+    return _error(422, "Idempotency-Key was already used for a different "
+                       "request")
+
+
+async def _read_body(receive) -> bytes:
+    chunks, more = [], True
+    while more:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        more = message.get("more_body", False)
+    return b"".join(chunks)
+
+
+def _replay_body(body: bytes, receive):
+    # The body was read to fingerprint it; hand it to the route once,
+    # then pass through (e.g. for disconnects).
+    sent = False
+
+    async def replayed():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body,
+                    "more_body": False}
+        return await receive()
+    return replayed
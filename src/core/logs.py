@@ -0,0 +1,272 @@
+import json
+import logging
+import queue
+import random
+import re
+import sys
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Mapping, Optional, TextIO
+from uuid import uuid4
+
+from starlette.datastructures import Headers, MutableHeaders
+
+# The id of the request being handled, attached to every record logged
+# while handling it (including from the threadpool, which copies the
+# context).
+request_id: ContextVar[Optional[str]] = ContextVar("request_id",
+                                                   default=None)
+
+REDACTED = "[REDACTED]"
+# Fields (passed with extra=) whose name contains one of these are never
+# written.
+SENSITIVE_KEYS = ("password", "token", "authorization", "cookie", "secret",
+                  "jwt", "api_key")
+# Applied to messages and string fields.
+_SENSITIVE_TEXT = (
+    (re.compile(r"(?i)\b(bearer)\s+[\w\-.~+/]+=*"), r"\1 " + REDACTED),
+    (re.compile(r"\beyJ[\w-]+\.[\w-]+\.[\w-]*"), REDACTED),
+    (re.compile(r"\$argon2\w*\$\S+"), REDACTED),
+    (re.compile(r"(?i)\b(password|passwd|pwd|secret|token)(\s*[=:]\s*)"
+                r"[^\s,;&]+"), r"\1\2" + REDACTED),
+)
+
+_RECORD_FIELDS = frozenset(logging.makeLogRecord({}).__dict__) | {
+    "message", "asctime", "request_id", "sample_rate"}
+
+_VALID_REQUEST_ID = re.compile(r"[A-Za-z0-9._\-]{1,128}")
+
+
+def redact(value, key: Optional[str] = None):
+    """
+    `value` with secrets removed: the whole value when `key` names a
+    sensitive field, otherwise tokens, password hashes and
+    password=... pairs found in strings, recursively.
+    """
+    if key is not None and any(name in key.lower()
+                               for name in SENSITIVE_KEYS):
+        return REDACTED
+    if isinstance(value, str):
+        for pattern, replacement in _SENSITIVE_TEXT:
+            value = pattern.sub(replacement, value)
+        return value
+    if isinstance(value, Mapping):
+        return {name: redact(item, str(name)) for name, item in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [redact(item) for item in value]
+    return value
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    One JSON object per line: time, level, logger, message, request_id,
+    any fields passed with extra=, and the traceback, all redacted.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc)
+            .isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": redact(record.getMessage()),
+        }
+        for field in ("request_id", "sample_rate"):
+            if getattr(record, field, None) is not None:
+                entry[field] = getattr(record, field)
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = redact(value, key)
+        if record.exc_info:
+            entry["exc"] = redact(self.formatException(record.exc_info))
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """
+    Human readable lines for development, redacted like the JSON ones.
+    """
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s "
+                         "[%(request_id)s] %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        if not hasattr(record, "request_id"):
+            record.request_id = None
+        return redact(super().format(record))
+
+
+class _ContextFilter(logging.Filter):
+    """
+    Attached to the queue handler, so it runs on the thread that logs,
+    before the record is queued: drops sampled-out records and stamps
+    the rest with the request id current on that thread.
+
+    A record is kept with probability `sample_rate` when passed with
+    extra=, else the rate of the longest matching logger prefix in
+    `sample_rates`. Warnings and errors are always kept.
+    """
+
+    def __init__(self, sample_rates: Mapping[str, float]):
+        super().__init__()
+        self.sample_rates = dict(sample_rates)
+        self._rates: Dict[str, float] = {}
+
+    def _rate(self, name: str) -> float:
+        rate = self._rates.get(name)
+        if rate is None:
+            prefixes = [prefix for prefix in self.sample_rates
+                        if name == prefix or name.startswith(prefix + ".")]
+            rate = self._rates[name] = self.sample_rates[
+                max(prefixes, key=len)] if prefixes else 1.0
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING:
+            rate = getattr(record, "sample_rate", None)
+            if rate is None:
+                rate = self._rate(record.name)
+            if rate < 1.0:
+                if random.random() >= rate:
+                    return False
+                record.sample_rate = rate
+        record.request_id = request_id.get()
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Hands records to the writer thread without formatting them and
+    without ever waiting: when the queue is full the record is dropped
+    and counted, so a slow log sink cannot stall request handling.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Formatting (and redaction) happens in the writer thread.
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _Writer(QueueListener):
+    """
+    The background thread writing queued records; reports records the
+    handler had to drop.
+    """
+
+    def __init__(self, handler: NonBlockingQueueHandler, *outputs):
+        super().__init__(handler.queue, *outputs, respect_handler_level=True)
+        self.handler = handler
+        self._reported = 0
+
+    def handle(self, record: logging.LogRecord):
+        super().handle(record)
+        dropped = self.handler.dropped
+        if dropped > self._reported:
+            notice = logging.LogRecord(
+                __name__, logging.WARNING, __file__, 0,
+                "log queue full; dropped %d records", (
+                    dropped - self._reported,), None)
+            self._reported = dropped
+            super().handle(notice)
+
+    def enqueue_sentinel(self):
+        # Unlike records, the stop signal must get through.
+        self.queue.put(self._sentinel)
+
+
+_active = None
+
+
+def configure_logging(level: str = "INFO", format: str = "json",
+                      queue_size: int = 10_000,
+                      sample_rates: Optional[Mapping[str, float]] = None,
+                      stream: Optional[TextIO] = None
+                      ) -> NonBlockingQueueHandler:
+    """
+    Routes every log record through a bounded queue to a background
+    writer thread, which formats, redacts and writes it to `stream`
+    (stdout by default). Logging on the request path is then one
+    non-blocking enqueue.
+
+    Replaces the root logger's handlers until `stop_logging`.
+
+    Args:
+        format (str): "json" (StructuredFormatter) or "text".
+        sample_rates (dict, optional): Share of records below WARNING
+            kept per logger name prefix, e.g. {"core.cache": 0.01}.
+    """
+    global _active
+    stop_logging()
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(StructuredFormatter() if format == "json"
+                        else TextFormatter())
+    handler = NonBlockingQueueHandler(queue.Queue(queue_size))
+    handler.addFilter(_ContextFilter(sample_rates or {}))
+    writer = _Writer(handler, output)
+
+    root = logging.getLogger()
+    _active = (handler, writer, root.handlers[:], root.level)
+    root.handlers = [handler]
+    root.setLevel(level)
+    writer.start()
+    return handler
+
+
+def stop_logging():
+    """
+    Writes out what is still queued, stops the writer thread and puts the
+    root logger's previous handlers back.
+    """
+    global _active
+    if _active is None:
+        return
+    _, writer, handlers, level = _active
+    _active = None
+    root = logging.getLogger()
+    root.handlers = handlers
+    root.setLevel(level)
+    writer.stop()
+
+
+class RequestIdMiddleware:
+    """
+    Gives every request an id: the caller's X-Request-ID when it is a
+    plausible id, otherwise a new one. It is set in `request_id` for the
+    records logged while handling the request and echoed in the
+    response's X-Request-ID header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        incoming = Headers(scope=scope).get("x-request-id")
+        value = incoming if incoming and _VALID_REQUEST_ID.fullmatch(
+            incoming) else uuid4().hex
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("X-Request-ID", value)
+            await send(message)
+
+        token = request_id.set(value)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id.reset(token)
@@ -0,0 +1,258 @@
+import gzip
+import importlib
+import importlib.util
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from anyio import to_thread
+from starlette.datastructures import Headers, MutableHeaders
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+# Media types clients send for msgpack; all are answered with MSGPACK.
+MSGPACK_TYPES = (MSGPACK, "application/x-msgpack", "application/vnd.msgpack")
+
+# Content types worth compressing. Exports (Parquet, Arrow) are already
+# compact and are streamed, so they are never buffered to compress.
+COMPRESSIBLE_TYPES = (JSON, MSGPACK, "text/")
+
+# The representation JsonRender produces for the current request: "json"
+# or "msgpack". Set per request by NegotiationMiddleware.
+response_format: ContextVar[str] = ContextVar("response_format",
+                                              default="json")
+
+
+def _parse(header: Optional[str]) -> List[Tuple[str, float]]:
+    """
+    Splits an Accept or Accept-Encoding header into (token, q) pairs.
+    """
+    items = []
+    for part in (header or "").split(","):
+        token, *params = part.split(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        items.append((token, quality))
+    return items
+
+
+def _quality(items: List[Tuple[str, float]], candidates: Sequence[str]
+             ) -> Optional[float]:
+    # The most specific range listed wins: candidates go from the exact
+    # token to the broadest wildcard.
+    listed = dict(items)
+    for candidate in candidates:
+        if candidate in listed:
+            return listed[candidate]
+    return None
+
+
+def accepted_media_type(accept: Optional[str], offered: Sequence[str]
+                        ) -> Optional[str]:
+    """
+    The offered media type the Accept header prefers; ties go to the
+    first offered. Without an Accept header the first offered type.
+    None if the client accepts none of them.
+    """
+    if not accept:
+        return offered[0]
+    items = _parse(accept)
+    best, best_quality = None, 0.0
+    for media_type in offered:
+        quality = _quality(items, (media_type,
+                                   media_type.split("/")[0] + "/*", "*/*"))
+        if quality is not None and quality > best_quality:
+            best, best_quality = media_type, quality
+    return best
+
+
+def accepted_encoding(accept_encoding: Optional[str],
+                      offered: Sequence[str]) -> Optional[str]:
+    """
+    The offered content coding the Accept-Encoding header prefers (ties
+    go to the first offered), or None to send the body as it is.
+    """
+    items = _parse(accept_encoding)
+    best, best_quality = None, 0.0
+    for encoding in offered:
+        quality = _quality(items, (encoding, "*"))
+        if quality is not None and quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+@lru_cache()
+def msgpack_available() -> bool:
+    return importlib.util.find_spec("msgpack") is not None
+
+
+def dump_msgpack(content) -> bytes:
+    """
+    Encodes JSON-ready content as msgpack.
+    """
+    import msgpack
+    return msgpack.packb(content, use_bin_type=True)
+
+
+def load_msgpack(body: bytes):
+    import msgpack
+    return msgpack.unpackb(body, raw=False)
+
+
+def negotiated_format(accept: Optional[str]) -> str:
+    """
+    "msgpack" when the client prefers it to JSON and msgpack is
+    installed, otherwise "json".
+    """
+    if not accept or not msgpack_available():
+        return "json"
+    items = _parse(accept)
+    if not any(token in MSGPACK_TYPES for token, _ in items):
+        return "json"
+    preferred = accepted_media_type(accept, (JSON,) + MSGPACK_TYPES)
+    return "msgpack" if preferred in MSGPACK_TYPES else "json"
+
+
+def _gzip_encoder(level: int) -> Callable[[bytes], bytes]:
+    def encode(body: bytes) -> bytes:
+        return gzip.compress(body, compresslevel=level, mtime=0)
+    return encode
+
+
+def _brotli_encoder(quality: int) -> Optional[Callable[[bytes], bytes]]:
+    for module in ("brotli", "brotlicffi"):
+        if importlib.util.find_spec(module):
+            # Imported on first use to keep it off the worker boot path.
+            def encode(body: bytes, module=module) -> bytes:
+                return importlib.import_module(module).compress(
+                    body, quality=quality)
+            return encode
+    return None
+
+
+def content_encoders(gzip_level: int = 6, brotli_quality: int = 4
+                     ) -> Dict[str, Callable[[bytes], bytes]]:
+    """
+    The available codings by preference: brotli (when the brotli or
+    brotlicffi package is installed), then gzip.
+    """
+    encoders = {}
+    brotli = _brotli_encoder(brotli_quality)
+    if brotli is not None:
+        encoders["br"] = brotli
+    encoders["gzip"] = _gzip_encoder(gzip_level)
+    return encoders
+
+
+def _add_vary(headers: MutableHeaders, *names: str):
+    present = {value.strip().lower()
+               for value in headers.get("vary", "").split(",")
+               if value.strip()}
+    for name in names:
+        if name.lower() not in present:
+            headers.add_vary_header(name)
+
+
+class NegotiationMiddleware:
+    """
+    Content negotiation for buffered responses:
+
+    * Accept: chooses between the JSON and msgpack representations of
+      the {"data": ...} envelope JsonRender builds.
+    * Accept-Encoding: compresses bodies of at least `minimum_size` bytes
+      with brotli or gzip. Bodies of `thread_size` bytes or more are
+      compressed in the threadpool so the event loop keeps serving other
+      requests meanwhile.
+
+    Streamed responses (exports, the job feed) pass through untouched, as
+    do bodies that already carry a Content-Encoding.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024,
+                 thread_size: int = 64 * 1024, gzip_level: int = 6,
+                 brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.thread_size = thread_size
+        self.encoders = content_encoders(gzip_level, brotli_quality)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        token = response_format.set(negotiated_format(headers.get("accept")))
+        encoding = accepted_encoding(headers.get("accept-encoding"),
+                                     list(self.encoders))
+        try:
+            await self.app(scope, receive, _Responder(self, encoding, send))
+        finally:
+            response_format.reset(token)
+
+
+class _Responder:
+    """
+    Holds back the response start until the first body message shows
+    whether the body is complete (and so can be compressed) or streamed.
+    """
+
+    def __init__(self, middleware: NegotiationMiddleware,
+                 encoding: Optional[str], send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.send = send
+        self.start = None
+        self.streaming = False
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if message["type"] != "http.response.body" or self.start is None:
+            await self.send(message)
+            return
+        if self.streaming:
+            await self.send(message)
+            return
+
+        start, self.start = self.start, None
+        headers = MutableHeaders(raw=start["headers"])
+        content_type = headers.get("content-type", "")
+        compressible = content_type.startswith(COMPRESSIBLE_TYPES)
+        if content_type.startswith((JSON, MSGPACK)):
+            _add_vary(headers, "Accept")
+        if compressible:
+            _add_vary(headers, "Accept-Encoding")
+
+        if message.get("more_body", False):
+            self.streaming = True
+            await self.send(start)
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        if (compressible and self.encoding is not None
+                and "content-encoding" not in headers
+                and len(body) >= self.middleware.minimum_size):
+            body = await self._compress(body)
+            headers["content-encoding"] = self.encoding
+            headers["content-length"] = str(len(body))
+            message = {**message, "body": body}
+        await self.send(start)
+        await self.send(message)
+
+    async def _compress(self, body: bytes) -> bytes:
+        encode = self.middleware.encoders[self.encoding]
+        if len(body) >= self.middleware.thread_size:
+            return await to_thread.run_sync(encode, body)
+        return encode(body)
@@ -0,0 +1,172 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Optional
+from zlib import crc32
+
+
+class RateLimitBackend:
+    """
+    Storage for token buckets. Subclasses decide where bucket state lives:
+    in this process or in a store shared by every worker.
+    """
+
+    def hit(self, key: str, limit: int, period: float,
+            cost: int = 1) -> float:
+        """
+        Takes `cost` tokens from the bucket stored under `key`.
+
+        Each bucket holds at most `limit` tokens and refills continuously
+        at `limit / period` tokens per second.
+
+        Args:
+            key (str): The bucket to draw from.
+            limit (int): Bucket capacity.
+            period (float): Seconds for an empty bucket to refill.
+            cost (int): Tokens this request consumes.
+
+        Returns:
+            float: 0 when the request is allowed, otherwise the number of
+            seconds until enough tokens will be available.
+        """
+        raise NotImplementedError
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """
+    In-process token buckets, sharded by key hash so concurrent checks
+    rarely contend on the same lock.
+
+    Every check is O(1): one dict lookup, a refill calculation and a
+    move-to-end on the shard's OrderedDict. Memory is bounded by
+    `max_keys`; the least recently used buckets are evicted first, and
+    idle buckets are pruned as they age past a full refill, at which
+    point they are indistinguishable from a fresh bucket anyway.
+
+    Used directly in single-worker deployments and as the in-process
+    stand-in for a shared backend in tests.
+    """
+
+    def __init__(self, shards: int = 16, max_keys: int = 100_000):
+        self._shards = [(Lock(), OrderedDict()) for _ in range(shards)]
+        self._max_keys_per_shard = max(1, max_keys // shards)
+
+    def _shard(self, key: str):
+        return self._shards[crc32(key.encode()) % len(self._shards)]
+
+    def hit(self, key: str, limit: int, period: float,
+            cost: int = 1) -> float:
+        rate = limit / period
+        now = monotonic()
+        lock, buckets = self._shard(key)
+
+        with lock:
+            tokens, updated = buckets.pop(key, (limit, now))
+            tokens = min(limit, tokens + (now - updated) * rate)
+
+            if tokens >= cost:
+                tokens -= cost
+                retry_after = 0.0
+            else:
+                retry_after = (cost - tokens) / rate
+
+            buckets[key] = (tokens, now)
+            self._prune(buckets, now, period)
+        return retry_after
+
+    def _prune(self, buckets: OrderedDict, now: float, period: float):
+        # The oldest entry sits at the front; drop it when the shard is over
+        # its bound or it has been idle long enough to be full again.
+        while len(buckets) > self._max_keys_per_shard:
+            buckets.popitem(last=False)
+        if buckets:
+            oldest_key = next(iter(buckets))
+            if now - buckets[oldest_key][1] >= period:
+                del buckets[oldest_key]
+
+    def __len__(self) -> int:
+        return sum(len(buckets) for _, buckets in self._shards)
+
+
+class RedisRateLimitBackend(RateLimitBackend):
+    """
+    Token buckets kept in Redis so every worker and host shares one view.
+
+    The refill-and-take step runs as a Lua script, so each check is a
+    single round trip and atomic across workers. Keys expire once a bucket
+    would be full again, which bounds memory on the Redis side.
+    """
+
+    _SCRIPT = """
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local limit = tonumber(ARGV[1])
+    local period = tonumber(ARGV[2])
+    local cost = tonumber(ARGV[3])
+    local now = tonumber(ARGV[4])
+    local rate = limit / period
+    local tokens = tonumber(bucket[1]) or limit
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(limit, tokens + (now - updated) * rate)
+    local retry_after = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+    else
+        retry_after = (cost - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+    redis.call('PEXPIRE', KEYS[1], math.ceil(period * 1000))
+    return tostring(retry_after)
+    """
+
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        try:
+            import redis
+        except ImportError as exc:
+            raise RuntimeError(
+                "The redis package is required for a shared rate limit "
+                "backend; install it or leave RATE_LIMIT_BACKEND_URL unset."
+            ) from exc
+
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(self._SCRIPT)
+
+    def hit(self, key: str, limit: int, period: float,
+            cost: int = 1) -> float:
+        from time import time
+        result = self._script(keys=[self.prefix + key],
+                              args=[limit, period, cost, time()])
+        return float(result)
+
+
+class RateLimiter:
+    """
+    Applies a named limit to a key through a RateLimitBackend.
+
+    Example:
+        limiter = RateLimiter(MemoryRateLimitBackend())
+        retry_after = limiter.check("login:ip", "10.0.0.1", 20, 60)
+    """
+
+    def __init__(self, backend: Optional[RateLimitBackend] = None):
+        self.backend = backend or MemoryRateLimitBackend()
+
+    def check(self, scope: str, key: str, limit: int, period: float,
+              cost: int = 1) -> float:
+        """
+        Records one attempt for `key` within `scope`.
+
+        Returns:
+            float: 0 when allowed, otherwise seconds until retry.
+        """
+        return self.backend.hit(f"{scope}:{key}", limit, period, cost)
+
+
+def rate_limit_backend_from_url(url: Optional[str]) -> RateLimitBackend:
+    """
+    Builds the backend named by a URL: redis:// (or rediss://) for a
+    shared store, anything else (or nothing) for in-process buckets.
+    """
+    if url and url.startswith(("redis://", "rediss://")):
+        return RedisRateLimitBackend(url)
+    return MemoryRateLimitBackend()
@@ -0,0 +1,50 @@
+import asyncio
+import logging
+from typing import Callable, List, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTasks:
+    """
+    Runs blocking maintenance jobs (index syncs, reconciliation, flushes)
+    on a fixed interval for the lifetime of the application.
+
+    Each job runs in the threadpool so database work never blocks the
+    event loop; a failing run is logged and retried on the next tick.
+    """
+
+    def __init__(self):
+        self._jobs: List[Tuple[str, float, Callable[[], None]]] = []
+        self._tasks: List[asyncio.Task] = []
+
+    def add(self, name: str, interval: float, job: Callable[[], None]):
+        """
+        Registers a job to run every `interval` seconds once started.
+        Jobs with a non-positive interval are ignored (disabled).
+        """
+        if interval and interval > 0:
+            self._jobs.append((name, interval, job))
+
+    async def _run(self, name: str, interval: float,
+                   job: Callable[[], None]):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await run_in_threadpool(job)
+            except Exception:
+                logger.exception("periodic task %s failed", name)
+
+    def start(self):
+        for name, interval, job in self._jobs:
+            self._tasks.append(asyncio.get_running_loop().create_task(
+                self._run(name, interval, job), name=name))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._jobs = []
@@ -6,5 +6,5 @@ import subprocess
 if __name__ == "__main__":
 
     args = ["--reload"]
-    app_file = os.getenv("FASTAPI_APP", "app.main")
+    app_file = os.getenv("FASTAPI_APP", "api.main")
     subprocess.call(["uvicorn", f"{app_file}:app", *args])
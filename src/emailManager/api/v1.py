@@ -1,17 +1,30 @@
-
+import logging
 from fastapi import APIRouter
-from core.config import settings
-from sendgrid.helpers.mail import Mail, HtmlContent
-from jinja2 import Template
+from functools import lru_cache
+from core.config import get_settings
 
-from emailManager.html_templates import basic_email_template
 from emailManager.schemas import job_form_schema
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(
     prefix="/emailManager"
 )
 
 
+@lru_cache()
+def _email_template():
+    """
+    Compiles the inbound-client email template on first use.
+
+    jinja2 and the (large) template module are only imported by workers
+    that actually send mail, keeping them off the boot path.
+    """
+    from jinja2 import Template
+    from emailManager.html_templates import basic_email_template
+    return Template(basic_email_template)
+
+
 @router.get("/")
 def get_auth():
     return "app/auth app created!"
@@ -19,8 +32,9 @@ def get_auth():
 
 @router.post("/submit")
 async def send_email(payload: job_form_schema):
+    from sendgrid.helpers.mail import Mail, HtmlContent
 
-    temp = Template(basic_email_template)
+    temp = _email_template()
     html_content = temp.render(firstName=payload.firstName,
                                lastName=payload.lastName,
                                companyName=payload.companyName,
@@ -32,11 +46,10 @@ async def send_email(payload: job_form_schema):
                subject="Potential IT Client: Inbound",
                html_content=HtmlContent(html_content))
 
-    client = await settings.SENDGRID_CLIENT()
+    client = await get_settings().SENDGRID_CLIENT()
 
     response = client.send(msg)
-    print(response.status_code)
-    print(response.body)
-    print(response.headers)
+    logger.info("inbound client email sent", extra={
+        "status_code": response.status_code,
+        "message_id": response.headers.get("X-Message-Id")})
     return "200"
-
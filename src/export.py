@@ -0,0 +1,56 @@
+#!/usr/bin/env python3.9
+"""
+Exports users or jobs to a local file without holding the table in memory:
+
+    python export.py jobs --format parquet --output jobs.parquet
+    python export.py users --format csv --chunk-size 10000
+
+Rows are read through a server-side cursor and encoded chunk by chunk;
+the row count and throughput are printed when the export finishes.
+"""
+import argparse
+import sys
+
+from auth.export import USERS_EXPORT
+from core.database import database
+from core.export import ENCODERS, Export_Report, get_encoder, stream_export
+from work.export import JOBS_EXPORT
+
+DATASETS = {dataset.name: dataset for dataset in (USERS_EXPORT, JOBS_EXPORT)}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("dataset", choices=sorted(DATASETS))
+    parser.add_argument("--format", choices=sorted(ENCODERS), default="csv")
+    parser.add_argument("--output", help="file to write; defaults to "
+                        "<dataset>.<extension>, '-' for stdout")
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    dataset = DATASETS[args.dataset]
+    try:
+        encoder = get_encoder(args.format, dataset.columns)
+    except RuntimeError as exc:
+        print(exc, file=sys.stderr)
+        return 2
+
+    output = args.output or f"{dataset.name}.{encoder.extension}"
+    report = Export_Report(dataset=dataset.name, format=args.format)
+    target = sys.stdout.buffer if output == "-" else open(output, "wb")
+    try:
+        for chunk in stream_export(database, dataset, encoder,
+                                   args.chunk_size, report):
+            target.write(chunk)
+    finally:
+        if target is not sys.stdout.buffer:
+            target.close()
+
+    print(f"exported {report.rows} {dataset.name} rows "
+          f"({report.bytes} bytes) to {output} in {report.seconds:.2f}s: "
+          f"{report.rows_per_second:,.0f} rows/sec", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3.9
+"""
+Fills a database with synthetic users and jobs for load and scale tests:
+
+    python seed.py --users 100000 --jobs 250000 --database sqlite:///seed.db
+    python seed.py --users 20000 --reset   # the configured database
+
+Users are spread over every USER_ROLES (with their Additional rows,
+contractor limits, skills and service areas) and jobs over every
+status, category and the last JOB_AGE_DAYS days; most jobs are on site
+around one of SEED_CITIES. Everything is written with multi-row
+INSERTs, so 1e5 rows take seconds rather than minutes. All users share
+SEED_PASSWORD.
+"""
+import argparse
+import random
+import sys
+from datetime import datetime, timedelta
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, insert, select, text
+
+from auth.enums import CATEGORY_STATES, JOB_STATUS_STATES, USER_ROLES
+from auth.models import (User, Additional, Admin_Additional,
+                         Officer_Additional, Client_Additional,
+                         Contractor_Additional, Contractor_Skill,
+                         _password_hasher)
+from core import geo
+from core.database import Database, ModelBase
+from work.models import Jobs
+
+SEED_PASSWORD = "Seed-Passw0rd!"
+
+# Share of users in each role. Inactive and removed users keep the client
+# or contractor additional row they had before.
+ROLE_WEIGHTS = {
+    USER_ROLES.CLIENT: 0.60,
+    USER_ROLES.CONTRACTOR: 0.30,
+    USER_ROLES.ADMIN: 0.01,
+    USER_ROLES.OFFICER: 0.01,
+    USER_ROLES.INACTIVE: 0.05,
+    USER_ROLES.REMOVED: 0.03,
+}
+
+STATUS_WEIGHTS = {
+    JOB_STATUS_STATES.UNASSIGNED: 0.25,
+    JOB_STATUS_STATES.ASSIGNED: 0.10,
+    JOB_STATUS_STATES.IN_PROGRESS: 0.10,
+    JOB_STATUS_STATES.PENDING: 0.05,
+    JOB_STATUS_STATES.COMPLETED: 0.40,
+    JOB_STATUS_STATES.CANCELLED: 0.10,
+}
+
+JOB_AGE_DAYS = 180
+
+# (latitude, longitude) of the metro areas jobs and contractors cluster
+# around, and the share of each that has a location at all.
+SEED_CITIES = ((40.71, -74.01), (34.05, -118.24), (41.88, -87.63),
+               (29.76, -95.37), (47.61, -122.33), (51.51, -0.13),
+               (48.86, 2.35), (35.68, 139.69), (-33.87, 151.21),
+               (19.43, -99.13))
+LOCATED_SHARE = 0.8
+
+# Tables with their own id sequence on Postgres, moved past the
+# explicitly inserted ids once seeding is done.
+_SEQUENCED_TABLES = ("user", "additional", "jobs", "contractor_skill")
+
+
+def _place(places: random.Random
+           ) -> Tuple[Optional[float], Optional[float]]:
+    if places.random() >= LOCATED_SHARE:
+        return None, None
+    latitude, longitude = places.choice(SEED_CITIES)
+    return (round(latitude + places.gauss(0, 0.25), 6),
+            round(longitude + places.gauss(0, 0.25), 6))
+
+
+def _next_id(session, column) -> int:
+    return (session.execute(select(func.max(column))).scalar() or 0) + 1
+
+
+def _insert(session, table, rows: List[dict], batch_size: int):
+    for start in range(0, len(rows), batch_size):
+        session.execute(insert(table), rows[start:start + batch_size])
+
+
+def generate(db: Database, users: int = 1000, jobs: int = 5000,
+             seed: Optional[int] = 0, batch_size: int = 5000
+             ) -> Dict[str, int]:
+    """
+    Adds `users` users and `jobs` jobs to `db` after any rows already
+    there, in one transaction.
+
+    Args:
+        users (int): Users to create, spread by ROLE_WEIGHTS. At least
+            one client is created when `jobs` is positive.
+        jobs (int): Jobs to create, posted by random clients and, once
+            past UNASSIGNED, taken by random contractors.
+        seed (int, optional): Seed for the random choices; None for a
+            different data set each run.
+        batch_size (int): Rows per INSERT.
+
+    Returns:
+        dict: Rows written per table.
+    """
+    rng = random.Random(seed)
+    # Locations come from their own generator, so the rest of the data
+    # for a seed does not depend on them.
+    places = random.Random(seed + 1)
+    password = _password_hasher().hash(SEED_PASSWORD)
+    now = datetime.utcnow()
+    counts: Dict[str, int] = {}
+
+    with db.get_db() as session:
+        first_user = _next_id(session, User.id)
+        first_additional = _next_id(session, Additional.id)
+        first_skill = _next_id(session, Contractor_Skill.id)
+        first_job = _next_id(session, Jobs.id)
+
+        roles = rng.choices(list(ROLE_WEIGHTS), list(ROLE_WEIGHTS.values()),
+                            k=users)
+        if jobs and USER_ROLES.CLIENT not in roles and roles:
+            roles[0] = USER_ROLES.CLIENT
+
+        user_rows, additional_rows = [], []
+        role_rows: Dict[type, List[dict]] = {
+            Admin_Additional: [], Officer_Additional: [],
+            Client_Additional: [], Contractor_Additional: []}
+        skill_rows = []
+        clients, contractors = [], []
+        for offset, role in enumerate(roles):
+            user_id = first_user + offset
+            additional_id = first_additional + offset
+            created_on = now - timedelta(seconds=rng.randrange(
+                JOB_AGE_DAYS * 86400))
+            user_rows.append(dict(
+                id=user_id, name=f"user {user_id}",
+                email=f"user{user_id}@seed.example.com", password=password,
+                type=role, created_on=created_on, updated_on=created_on))
+
+            kind = role
+            if role in (USER_ROLES.INACTIVE, USER_ROLES.REMOVED):
+                kind = rng.choice((USER_ROLES.CLIENT, USER_ROLES.CONTRACTOR))
+            additional_rows.append(dict(id=additional_id, user_id=user_id,
+                                        type=kind))
+            if kind == USER_ROLES.CLIENT:
+                role_rows[Client_Additional].append(dict(id=additional_id))
+                if role == USER_ROLES.CLIENT:
+                    clients.append(additional_id)
+            elif kind == USER_ROLES.CONTRACTOR:
+                latitude, longitude = _place(places)
+                role_rows[Contractor_Additional].append(dict(
+                    id=additional_id, max_active_jobs=rng.randint(1, 10),
+                    max_job_amount=rng.choice((None, 500.0, 1000.0, 5000.0)),
+                    latitude=latitude, longitude=longitude,
+                    service_radius_km=places.choice((10.0, 25.0, 50.0))
+                    if latitude is not None else None))
+                skills = rng.sample(list(CATEGORY_STATES), rng.randint(0, 3))
+                skill_rows += [dict(id=first_skill + len(skill_rows) + index,
+                                    contractor_id=additional_id,
+                                    category=category)
+                               for index, category in enumerate(skills)]
+                if role == USER_ROLES.CONTRACTOR:
+                    contractors.append(additional_id)
+            elif kind == USER_ROLES.ADMIN:
+                role_rows[Admin_Additional].append(dict(id=additional_id))
+            else:
+                role_rows[Officer_Additional].append(dict(id=additional_id))
+
+        job_rows = []
+        statuses = rng.choices(list(STATUS_WEIGHTS),
+                               list(STATUS_WEIGHTS.values()), k=jobs)
+        categories = list(CATEGORY_STATES)
+        for offset, job_status in enumerate(statuses):
+            contractor = None
+            if job_status != JOB_STATUS_STATES.UNASSIGNED and contractors:
+                contractor = rng.choice(contractors)
+            elif job_status != JOB_STATUS_STATES.UNASSIGNED:
+                job_status = JOB_STATUS_STATES.UNASSIGNED
+            updated_on = now - timedelta(seconds=rng.randrange(
+                JOB_AGE_DAYS * 86400))
+            latitude, longitude = _place(places)
+            job_rows.append(dict(
+                id=first_job + offset, title=f"job {first_job + offset}",
+                description="Synthetic job",
+                category=rng.choice(categories),
+                poster_id=rng.choice(clients) if clients else None,
+                taken_by_user_id=contractor,
+                amount=float(rng.randint(10, 5000)), status=job_status,
+                version=1, updated_on=updated_on, latitude=latitude,
+                longitude=longitude,
+                geohash=geo.encode(latitude, longitude)
+                if latitude is not None else None))
+
+        for table, rows in ((User.__table__, user_rows),
+                            (Additional.__table__, additional_rows),
+                            *((model.__table__, rows)
+                              for model, rows in role_rows.items()),
+                            (Contractor_Skill.__table__, skill_rows),
+                            (Jobs.__table__, job_rows)):
+            _insert(session, table, rows, batch_size)
+            counts[table.name] = len(rows)
+
+        if session.bind.dialect.name == "postgresql":
+            for table in _SEQUENCED_TABLES:
+                session.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('\"{table}\"', "
+                    f"'id'), (SELECT max(id) FROM \"{table}\"))"))
+        session.commit()
+    return counts
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--jobs", type=int, default=5000)
+    parser.add_argument("--database", help="database URI; defaults to "
+                        "the configured DATABASE_URI")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--reset", action="store_true",
+                        help="drop and recreate every table first")
+    args = parser.parse_args(argv)
+
+    db = Database(args.database)
+    if args.reset:
+        ModelBase.metadata.drop_all(db.engine)
+    ModelBase.metadata.create_all(db.engine)
+
+    started = perf_counter()
+    counts = generate(db, args.users, args.jobs, args.seed, args.batch_size)
+    seconds = perf_counter() - started
+    rows = sum(counts.values())
+    for table, count in counts.items():
+        print(f"{table}: {count}", file=sys.stderr)
+    print(f"seeded {rows} rows in {seconds:.2f}s: "
+          f"{rows / max(seconds, 1e-9):,.0f} rows/sec", file=sys.stderr)
+    db.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3.9
+"""
+Production entry point: serves api.main:app from several worker processes.
+
+    python server.py
+    python server.py --workers 8 --bind 0.0.0.0:8080
+
+With gunicorn installed (the supported setup) the app is imported once in
+the master and forked into SERVER_WORKERS uvicorn workers (one per usable
+CPU by default), so imported code is shared copy-on-write between them.
+Each worker opens its own database pool on startup, after the fork.
+Workers are recycled after SERVER_MAX_REQUESTS requests, with jitter so
+they do not all restart at once.
+
+Signals to the master:
+    HUP     start fresh workers, then gracefully stop the old ones
+            (config reload; code is the preloaded code)
+    USR2    start a new master with the new code next to the old one;
+            then send WINCH and QUIT to the old master for a rolling
+            deploy with no dropped connections
+    TERM    graceful shutdown within SERVER_GRACEFUL_TIMEOUT_SECONDS
+
+Without gunicorn (e.g. on Windows) uvicorn's own process manager is used
+instead; it neither preloads the app nor recycles workers.
+"""
+import argparse
+import importlib.util
+import logging
+import os
+import sys
+from typing import Dict, Optional
+
+from core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+APP = "api.main:app"
+
+
+def usable_cpus() -> int:
+    """
+    CPUs this process may run on, which inside a container or under
+    taskset can be fewer than the machine has.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0)) or 1
+    return os.cpu_count() or 1
+
+
+def worker_count(configured: Optional[int] = None,
+                 maximum: int = 16) -> int:
+    """
+    Workers to start: the configured number, or one per usable CPU up to
+    `maximum`. Workers are asynchronous, so one per CPU keeps every core
+    busy without the 2n+1 oversubscription blocking workers need.
+    """
+    if configured:
+        return max(1, configured)
+    return max(1, min(usable_cpus(), maximum))
+
+
+def event_loop() -> str:
+    """
+    uvloop if it is installed, otherwise asyncio's own loop.
+    """
+    return "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+
+
+def http_protocol() -> str:
+    """
+    The httptools parser if it is installed, otherwise h11.
+    """
+    return "httptools" if importlib.util.find_spec("httptools") else "h11"
+
+
+def _post_fork(server, worker):
+    # The master should never have connected, but if anything it
+    # imported did, the worker must not share those sockets.
+    from core.database import database
+    database.reset_after_fork()
+
+
+def gunicorn_options(bind: str, workers: int) -> Dict[str, object]:
+    settings = get_settings()
+    return {
+        "bind": bind,
+        "workers": workers,
+        "worker_class": _worker_class(),
+        "preload_app": True,
+        "max_requests": settings.SERVER_MAX_REQUESTS,
+        "max_requests_jitter": settings.SERVER_MAX_REQUESTS_JITTER,
+        "graceful_timeout": int(settings.SERVER_GRACEFUL_TIMEOUT_SECONDS),
+        "keepalive": int(settings.SERVER_KEEPALIVE_SECONDS),
+        "post_fork": _post_fork,
+        "accesslog": "-",
+    }
+
+
+def _worker_class():
+    from uvicorn.workers import UvicornWorker
+
+    class Worker(UvicornWorker):
+        CONFIG_KWARGS = {"loop": event_loop(), "http": http_protocol(),
+                         "lifespan": "on"}
+
+    return Worker
+
+
+def _serve_gunicorn(options: Dict[str, object]):
+    from gunicorn.app.base import BaseApplication
+
+    class Application(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            # Runs once in the master because of preload_app.
+            from api.main import app
+            return app
+
+    Application().run()
+
+
+def _serve_uvicorn(host: str, port: int, workers: int):
+    import uvicorn
+
+    settings = get_settings()
+    uvicorn.run(APP, host=host, port=port, workers=workers,
+                loop=event_loop(), http=http_protocol(),
+                timeout_keep_alive=int(settings.SERVER_KEEPALIVE_SECONDS),
+                timeout_graceful_shutdown=int(
+                    settings.SERVER_GRACEFUL_TIMEOUT_SECONDS))
+
+
+def main(argv=None) -> int:
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--bind", default=f"{settings.SERVER_HOST}:"
+                        f"{settings.SERVER_PORT}", help="HOST:PORT")
+    parser.add_argument("--workers", type=int,
+                        default=settings.SERVER_WORKERS)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    workers = worker_count(args.workers, settings.SERVER_MAX_WORKERS)
+    logger.info("starting %d workers on %s (loop=%s, http=%s)", workers,
+                args.bind, event_loop(), http_protocol())
+
+    if importlib.util.find_spec("gunicorn"):
+        _serve_gunicorn(gunicorn_options(args.bind, workers))
+    else:
+        logger.warning("gunicorn is not installed; serving without app "
+                       "preloading or worker recycling")
+        host, _, port = args.bind.rpartition(":")
+        _serve_uvicorn(host, int(port), workers)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,40 @@
 import unittest
 from tests.admin_unit import TestAdminsModel
+from tests.startup_unit import TestStartupImport
+from tests.database_unit import TestReplicaRouting
+from tests.ratelimit_unit import (TestMemoryRateLimitBackend,
+                                  TestRateLimiter)
+from tests.revocation_unit import TestBloomFilter, TestRevocationIndex
+from tests.dispatch_unit import TestContractorIndex, TestDispatchEngine
+from tests.claim_unit import TestJobVersioning, TestConcurrentClaims
+from tests.events_unit import (TestJobTransitions, TestJobEventLog,
+                               TestPostgresJobEventLog)
+from tests.broadcast_unit import TestBroadcaster, TestPostgresBroadcast
+from tests.conditional_unit import TestConditionalRequests, TestValidators
+from tests.cache_unit import (TestLRUCache, TestReadThroughCache,
+                              TestSharedInvalidation, TestJobCache,
+                              TestPrincipalCache)
+from tests.stats_unit import TestJobStats, TestPostgresJobStats
+from tests.export_unit import TestExport, TestPostgresExport
+from tests.archive_unit import TestJobArchive, TestPostgresJobArchive
+from tests.users_unit import (TestUserStateChanges,
+                              TestPostgresUserStateChanges)
+from tests.scale_unit import TestEndpointsAtScale, TestSeedGenerator
+from tests.server_unit import TestLauncher
+from tests.negotiation_unit import (TestAcceptHeaders,
+                                    TestNegotiationMiddleware)
+from tests.batch_unit import TestDataLoader, TestBatchLookups
+from tests.breached_unit import TestBreachedPasswords
+from tests.logs_unit import (TestRedaction, TestStructuredLogging,
+                             TestRequestIds)
+from tests.admission_unit import (TestAdmissionClass,
+                                  TestAdmissionMiddleware)
+from tests.deadline_unit import (TestStatementDeadlines,
+                                 TestPostgresStatementTimeout,
+                                 TestDeadlineMiddleware)
+from tests.idempotency_unit import TestIdempotencyKeys
+from tests.geo_unit import (TestGeo, TestNearestJobs,
+                            TestServiceAreaDispatch)
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,14 @@
+import os
+
+# Settings are read from the environment; give the test run a complete,
+# self-contained configuration unless the caller provides one.
+for _key, _value in {
+    "PROJECT_NAME": "final-labz-test",
+    "POSTGRES_SERVER": "localhost",
+    "POSTGRES_USER": "test",
+    "POSTGRES_PASSWORD": "test",
+    "POSTGRES_DB": "test",
+    "JWT_SECRET_KEY": "test-secret",
+    "SENDGRID_API_KEY": "test-key",
+}.items():
+    os.environ.setdefault(_key, _value)
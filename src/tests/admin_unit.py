@@ -1,39 +1,58 @@
 import unittest
-from unittest.mock import MagicMock
 
-from auth.models import Admins, Linked_Admin_Data
 from argon2 import PasswordHasher
 
+from auth.enums import USER_ROLES
+from auth.models import User, Admin_Additional
+from core.database import Database, ModelBase
+
 
 class TestAdminsModel(unittest.TestCase):
     def setUp(self):
-        self.db_session = MagicMock()  # Mock the database session
+        self.db = Database("sqlite://")
+        ModelBase.metadata.create_all(self.db.engine)
+        self.addCleanup(self.db.dispose)
         self.ph = PasswordHasher(salt_len=16)
 
+    def _admin(self, password="mypassword"):
+        return User(name="Test Admin", email="test@example.com",
+                    password=password, type=USER_ROLES.ADMIN)
+
     def test_hash_password(self):
-        admin = Admins(self.db_session, name="Test Admin",
-                       email="test@example.com", password="mypassword")
+        admin = self._admin()
 
         # Using Argon2 to verify the hashed result for correctness:
         self.assertTrue(self.ph.verify(admin.password, "mypassword"))
 
     def test_verify_password(self):
         password = "testpassword"
-        admin = Admins(self.db_session, name="Test Admin",
-                       email="test@example.com", password=password)
+        admin = self._admin(password)
 
         self.assertFalse(admin.verify_password("incorrect_password"))
         self.assertTrue(admin.verify_password(password))
 
     def test_create_user(self):
-        admin = Admins(self.db_session, name="Test Admin",
-                       email="test@example.com", password="testpassword")
-        admin.additional_data = Linked_Admin_Data()
-        admin.create()
-
-        self.db_session.add.assert_called_once_with(
-            admin)
-        self.db_session.commit.assert_called_once()
-
-    # ... Add more tests for change_password,
-    # get_by_id, get_by_email, update, has_type
+        admin = self._admin()
+        admin.create(self.db)
+
+        stored = User.get_by_id(self.db, admin.id)
+        self.assertEqual(stored.email, "test@example.com")
+        self.assertIsInstance(stored.additional, Admin_Additional)
+        self.assertEqual(User.get_by_email(self.db, "test@example.com").id,
+                         admin.id)
+
+    def test_change_password(self):
+        admin = self._admin()
+        admin.create(self.db)
+
+        self.assertFalse(admin.change_password(self.db, "wrong", "new"))
+        self.assertTrue(admin.change_password(self.db, "mypassword",
+                                              "newpassword"))
+        self.assertTrue(User.get_by_id(self.db, admin.id)
+                        .verify_password("newpassword"))
+
+    def test_has_type(self):
+        admin = self._admin()
+
+        self.assertTrue(admin.has_type(USER_ROLES.ADMIN))
+        self.assertFalse(admin.has_type(USER_ROLES.CLIENT))
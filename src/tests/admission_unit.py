@@ -0,0 +1,145 @@
+import asyncio
+import unittest
+from time import perf_counter
+
+import httpx
+from fastapi import FastAPI
+
+from api.main import ADMISSION_RULES
+from core.admission import (AdmissionClass, AdmissionMiddleware,
+                            admission_classes)
+from core.config import get_settings
+
+
+class TestAdmissionClass(unittest.TestCase):
+
+    def test_waiters_are_admitted_in_order(self):
+        admission = AdmissionClass("test", limit=1, queue_size=2,
+                                   max_wait=1.0)
+        order = []
+
+        async def request(name):
+            if await admission.acquire():
+                order.append(name)
+                await asyncio.sleep(0.01)
+                admission.release()
+
+        async def run():
+            await asyncio.gather(*(request(name) for name in "abc"))
+
+        asyncio.run(run())
+        self.assertEqual(order, ["a", "b", "c"])
+        self.assertEqual(admission.stats()["active"], 0)
+
+    def test_full_queue_sheds_at_once(self):
+        admission = AdmissionClass("test", limit=1, queue_size=1,
+                                   max_wait=5.0)
+
+        async def run():
+            self.assertTrue(await admission.acquire())
+            queued = asyncio.ensure_future(admission.acquire())
+            await asyncio.sleep(0)
+            started = perf_counter()
+            shed = await admission.acquire()
+            elapsed = perf_counter() - started
+            admission.release()
+            self.assertTrue(await queued)
+            admission.release()
+            return shed, elapsed
+
+        shed, elapsed = asyncio.run(run())
+        self.assertFalse(shed)
+        self.assertLess(elapsed, 0.05)
+        self.assertEqual(admission.shed, 1)
+        self.assertEqual(admission.active, 0)
+
+    def test_waits_are_bounded(self):
+        admission = AdmissionClass("test", limit=1, queue_size=5,
+                                   max_wait=0.05)
+
+        async def run():
+            await admission.acquire()
+            started = perf_counter()
+            admitted = await admission.acquire()
+            return admitted, perf_counter() - started
+
+        admitted, elapsed = asyncio.run(run())
+        self.assertFalse(admitted)
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(admission.waiting, 0)
+
+    def test_cancelled_waiters_do_not_leak_slots(self):
+        admission = AdmissionClass("test", limit=1, queue_size=5,
+                                   max_wait=5.0)
+
+        async def run():
+            await admission.acquire()
+            waiter = asyncio.ensure_future(admission.acquire())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            await asyncio.sleep(0)
+            admission.release()
+            return await admission.acquire()
+
+        self.assertTrue(asyncio.run(run()))
+        self.assertEqual(admission.active, 1)
+
+
+class TestAdmissionMiddleware(unittest.TestCase):
+
+    def _app(self, release: asyncio.Event):
+        app = FastAPI()
+
+        @app.get("/slow")
+        async def slow():
+            await release.wait()
+            return {"status": "200"}
+
+        @app.get("/free")
+        async def free():
+            return {"status": "200"}
+
+        return AdmissionMiddleware(
+            app, {"read": AdmissionClass("read", 1, 1, 0.2)},
+            [(None, r"/free$", None), (("GET",), r"/", "read")])
+
+    def test_overload_is_shed_with_retry_after(self):
+        async def run():
+            release = asyncio.Event()
+            transport = httpx.ASGITransport(app=self._app(release))
+            async with httpx.AsyncClient(transport=transport,
+                                         base_url="http://test") as client:
+                running = asyncio.ensure_future(client.get("/slow"))
+                await asyncio.sleep(0.05)
+                queued = asyncio.ensure_future(client.get("/slow"))
+                await asyncio.sleep(0.05)
+                shed = await client.get("/slow")
+                free = await client.get("/free")
+                timed_out = await queued
+                release.set()
+                return await running, timed_out, shed, free
+
+        running, timed_out, shed, free = asyncio.run(run())
+        self.assertEqual(running.status_code, 200)
+        self.assertEqual(shed.status_code, 503)
+        self.assertEqual(shed.headers["retry-after"], "1")
+        self.assertEqual(shed.json()["detail"]["status"], "503")
+        self.assertEqual(timed_out.status_code, 503)
+        self.assertEqual(free.status_code, 200)
+
+    def test_application_routes_are_classified(self):
+        middleware = AdmissionMiddleware(
+            None, admission_classes(get_settings().ADMISSION_LIMITS),
+            ADMISSION_RULES)
+
+        def name(method, path):
+            admission = middleware.classify(method, path)
+            return admission and admission.name
+
+        self.assertEqual(name("POST", "/auth/login"), "auth")
+        self.assertEqual(name("PUT", "/auth/update_user"), "auth")
+        self.assertEqual(name("GET", "/bookings/export_jobs"), "export")
+        self.assertEqual(name("GET", "/bookings/retrieve_jobs"), "read")
+        self.assertEqual(name("POST", "/bookings/claim_job"), "write")
+        self.assertIsNone(name("GET", "/"))
+        self.assertIsNone(name("GET", "/bookings/feed/stream"))
@@ -0,0 +1,131 @@
+import asyncio
+import os
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from fastapi import HTTPException
+from sqlalchemy import update
+
+from auth.enums import JOB_STATUS_STATES, USER_ROLES
+from auth.schemas import Principal
+from core.database import Database
+from tests.claim_unit import _seed
+from work.api.v1 import retrieve_archived_job, retrieve_job_history
+from work.archive import archive_closed_jobs
+from work.cache import get_job
+from work.events import event_buffer
+from work.models import Jobs, Archived_Job, Job_Event, Job_Stat
+from work.stats import rebuild_job_stats
+
+# e.g. postgresql+psycopg2://postgres@localhost/final_labz_test
+POSTGRES_URI = os.getenv("TEST_POSTGRES_URI")
+
+
+class TestJobArchive(unittest.TestCase):
+
+    URI = "sqlite://"
+
+    def setUp(self):
+        self.db = Database(self.URI)
+        self.addCleanup(self.db.dispose)
+        self.events = event_buffer(self.db)
+        self.addCleanup(self.events.stop)
+        _seed(self.db, contractors=2, jobs=8)
+        rebuild_job_stats(self.db)
+
+        # Jobs 1-5 completed or cancelled a year ago, job 6 cancelled
+        # just now, jobs 7 and 8 still open.
+        long_ago = datetime.now(timezone.utc) - timedelta(days=365)
+        with self.db.engine.begin() as connection:
+            connection.execute(
+                update(Jobs.__table__).where(Jobs.id <= 3).values(
+                    status=JOB_STATUS_STATES.COMPLETED, taken_by_user_id=2,
+                    updated_on=long_ago))
+            connection.execute(
+                update(Jobs.__table__).where(Jobs.id.in_((4, 5))).values(
+                    status=JOB_STATUS_STATES.CANCELLED, updated_on=long_ago))
+            connection.execute(
+                update(Jobs.__table__).where(Jobs.id == 6).values(
+                    status=JOB_STATUS_STATES.CANCELLED))
+
+    def _archive(self, **kwargs):
+        return archive_closed_jobs(self.db, timedelta(days=30), **kwargs)
+
+    def test_moves_only_old_closed_jobs_in_batches(self):
+        report = self._archive(batch_size=2)
+        self.assertEqual((report.archived, report.batches), (5, 3))
+
+        with self.db.get_db() as session:
+            remaining = [id for (id,) in session.query(Jobs.id)
+                         .order_by(Jobs.id)]
+        self.assertEqual(remaining, [6, 7, 8])
+
+        archived = Archived_Job.get_by_id(self.db, 1)
+        self.assertEqual(archived.title, "job 0")
+        self.assertEqual(archived.status, JOB_STATUS_STATES.COMPLETED)
+        self.assertEqual(archived.taken_by_user_id, 2)
+        self.assertEqual(self._archive().archived, 0)
+
+    def test_max_batches_bounds_a_run(self):
+        report = self._archive(batch_size=2, max_batches=1)
+        self.assertEqual(report.archived, 2)
+        self.assertEqual(self._archive(batch_size=2).archived, 3)
+
+    def test_history_pages_newest_first(self):
+        self._archive()
+        first = Archived_Job.history(self.db, poster_id=1, limit=3)
+        self.assertEqual([job.id for job in first], [5, 4, 3])
+        rest = Archived_Job.history(self.db, poster_id=1, cursor=3)
+        self.assertEqual([job.id for job in rest], [2, 1])
+        taken = Archived_Job.history(self.db, contractor_id=2)
+        self.assertEqual([job.id for job in taken], [3, 2, 1])
+
+    def test_history_is_only_for_its_owners_and_admins(self):
+        self._archive()
+        # Additional ids are shared between roles: an officer whose id
+        # equals the poster's must still see nothing.
+        officer = Principal(id=9, type=USER_ROLES.OFFICER, additional_id=1)
+        client = Principal(id=1, type=USER_ROLES.CLIENT, additional_id=1)
+        admin = Principal(id=8, type=USER_ROLES.ADMIN, additional_id=8)
+        with patch("work.api.v1.database", self.db):
+            with self.assertRaises(HTTPException) as raised:
+                asyncio.run(retrieve_job_history(user=officer))
+            self.assertEqual(raised.exception.status_code, 403)
+            with self.assertRaises(HTTPException) as raised:
+                asyncio.run(retrieve_archived_job(1, user=officer))
+            self.assertEqual(raised.exception.status_code, 404)
+
+            self.assertEqual(asyncio.run(retrieve_archived_job(
+                1, user=client))["id"], 1)
+            everything = asyncio.run(retrieve_job_history(user=admin))
+            self.assertEqual([job["id"] for job in everything["jobs"]],
+                             [5, 4, 3, 2, 1])
+
+    def test_archiving_is_logged_and_leaves_the_stats(self):
+        self.assertEqual(get_job(self.db, 1)["id"], 1)
+        self._archive()
+        self.assertIsNone(get_job(self.db, 1))
+
+        self.events.flush()
+        events = Job_Event.since(self.db, job_id=4)
+        self.assertEqual(events[-1].event_type, "archived")
+        self.assertEqual(events[-1].from_status, JOB_STATUS_STATES.CANCELLED)
+
+        # The counters were built before the jobs closed, so rebuild to
+        # compare archiving against a fresh count of the hot table.
+        incremental = Job_Stat.summary(self.db)
+        self.assertEqual(incremental["jobs"], 3)
+        rebuild_job_stats(self.db)
+        rebuilt = Job_Stat.summary(self.db)
+        self.assertEqual(rebuilt["jobs"], 3)
+        self.assertNotIn("COMPLETED", rebuilt["by_status"])
+
+
+@unittest.skipUnless(POSTGRES_URI, "set TEST_POSTGRES_URI to run")
+class TestPostgresJobArchive(TestJobArchive):
+    """
+    The same checks through the single-statement Postgres path.
+    """
+
+    URI = POSTGRES_URI
@@ -0,0 +1,176 @@
+import asyncio
+import shutil
+import tempfile
+import unittest
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from auth.crud import TokenHandler
+from auth.enums import USER_ROLES
+from auth.models import User
+from core.dataloader import DataLoader
+from core.database import Database, ModelBase, database
+from seed import generate
+from work.events import event_buffer
+from work.models import Jobs
+
+
+class TestDataLoader(unittest.TestCase):
+
+    def _loader(self, fail=False, **kwargs):
+        calls = []
+
+        def batch_load(keys):
+            calls.append(list(keys))
+            if fail and len(calls) == 1:
+                raise RuntimeError("down")
+            return {key: key * 10 for key in keys if key > 0}
+
+        return DataLoader(batch_load, **kwargs), calls
+
+    def test_concurrent_loads_share_one_batch(self):
+        loader, calls = self._loader()
+
+        async def run():
+            return await asyncio.gather(
+                loader.load(1), loader.load(2), loader.load(1),
+                loader.load_many([3, 0]))
+
+        self.assertEqual(asyncio.run(run()), [10, 20, 10, [30, None]])
+        self.assertEqual(calls, [[1, 2, 3, 0]])
+
+    def test_loaded_keys_are_not_fetched_again(self):
+        loader, calls = self._loader()
+
+        async def run():
+            loader.prime(5, "primed")
+            first = await loader.load_many([1, 2, 5])
+            second = await loader.load_many([2, 3])
+            return first, second
+
+        self.assertEqual(asyncio.run(run()), ([10, 20, "primed"], [20, 30]))
+        self.assertEqual(calls, [[1, 2], [3]])
+
+    def test_batches_are_capped(self):
+        loader, calls = self._loader(max_batch_size=2)
+        asyncio.run(loader.load_many([1, 2, 3]))
+        self.assertEqual(calls, [[1, 2], [3]])
+        self.assertEqual(loader.batches, 2)
+
+    def test_failures_are_retried(self):
+        loader, calls = self._loader(fail=True)
+
+        async def run():
+            with self.assertRaises(RuntimeError):
+                await loader.load(1)
+            return await loader.load(1)
+
+        self.assertEqual(asyncio.run(run()), 10)
+        self.assertEqual(calls, [[1], [1]])
+
+
+class TestBatchLookups(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        uri = f"sqlite:///{cls.directory}/batch.db"
+        seeder = Database(uri)
+        ModelBase.metadata.create_all(seeder.engine)
+        generate(seeder, users=60, jobs=50)
+        seeder.dispose()
+
+        cls.previous_uri = database.uri
+        database.dispose()
+        database.uri = uri
+        cls.client = TestClient(__import__("api.main").main.app,
+                                base_url="https://testserver")
+        with database.get_db() as session:
+            cls.roles = dict(session.execute(select(User.id, User.type)).all())
+
+    @classmethod
+    def tearDownClass(cls):
+        event_buffer(database).stop()
+        database.dispose()
+        database.uri = cls.previous_uri
+        shutil.rmtree(cls.directory, ignore_errors=True)
+
+    def _first(self, role):
+        return min(id for id, type in self.roles.items() if type == role)
+
+    def _get(self, path, user_id):
+        refresh = TokenHandler.encode_token(user_id, "Refresh")
+        access = TokenHandler.encode_token(user_id, "Access")
+        self.client.cookies = {"Authorization": refresh.token}
+        return self.client.get(path, headers={
+            "Authorization": f"Bearer {access.token}"})
+
+    def test_users_load_as_get_by_id_does(self):
+        users = User.get_by_ids(database, list(self.roles))
+        for user_id, role in self.roles.items():
+            single = User.get_by_id(database, user_id)
+            if role in (USER_ROLES.INACTIVE, USER_ROLES.REMOVED):
+                self.assertNotIn(user_id, users)
+            else:
+                self.assertEqual(jsonable_encoder(users[user_id]),
+                                 jsonable_encoder(single))
+
+    def test_jobs_load_as_get_by_id_does(self):
+        jobs = Jobs.get_by_ids(database, [1, 2, 999])
+        self.assertEqual(sorted(jobs), [1, 2])
+        self.assertEqual(jsonable_encoder(jobs[2]),
+                         jsonable_encoder(Jobs.get_by_id(database, 2)))
+
+    def test_non_admins_see_public_profiles_only(self):
+        admin = self._first(USER_ROLES.ADMIN)
+        client = self._first(USER_ROLES.CLIENT)
+        inactive = self._first(USER_ROLES.INACTIVE)
+        response = self._get(f"/auth/retrieve_users_by_id?ids={admin},"
+                             f"{client}&ids={inactive}&ids=99999",
+                             self._first(USER_ROLES.CONTRACTOR))
+        users = response.json()["data"]["users"]
+        self.assertEqual(list(users), [str(admin), str(client),
+                                       str(inactive), "99999"])
+        self.assertIsNone(users[str(admin)])
+        self.assertIsNone(users[str(inactive)])
+        self.assertIsNone(users["99999"])
+        self.assertNotIn("id", users[str(client)])
+        self.assertNotIn("password", users[str(client)])
+        self.assertNotIn("user_id", users[str(client)]["additional"])
+
+    def test_admins_see_everything(self):
+        admin = self._first(USER_ROLES.ADMIN)
+        response = self._get(f"/auth/retrieve_users_by_id?ids={admin}",
+                             admin)
+        self.assertEqual(response.json()["data"]["users"][str(admin)]["id"],
+                         admin)
+
+    def test_inactive_users_are_not_found(self):
+        inactive = self._first(USER_ROLES.INACTIVE)
+        for viewer in (self._first(USER_ROLES.CONTRACTOR),
+                       self._first(USER_ROLES.ADMIN)):
+            response = self._get(f"/auth/retrieve_user/{inactive}", viewer)
+            self.assertEqual(response.status_code, 404, response.text)
+
+    def test_jobs_by_id(self):
+        response = self._get("/bookings/retrieve_jobs_by_id?ids=3,1,999",
+                             self._first(USER_ROLES.CLIENT))
+        jobs = response.json()["data"]["jobs"]
+        self.assertEqual(list(jobs), ["3", "1", "999"])
+        self.assertEqual(jobs["1"]["id"], 1)
+        self.assertIsNone(jobs["999"])
+
+    def test_bad_ids_are_rejected(self):
+        user = self._first(USER_ROLES.CLIENT)
+        for ids in ("1,x", ",", ",".join(map(str, range(1, 102)))):
+            response = self._get(f"/bookings/retrieve_jobs_by_id?ids={ids}",
+                                 user)
+            self.assertEqual(response.status_code, 400, ids)
+
+    def test_unknown_nearby_category_is_rejected(self):
+        response = self._get("/bookings/nearby_jobs?latitude=48.85"
+                             "&longitude=2.35&category=999",
+                             self._first(USER_ROLES.CLIENT))
+        self.assertEqual(response.status_code, 400, response.text)
@@ -0,0 +1,94 @@
+import io
+import os
+import tempfile
+import unittest
+from hashlib import sha1
+
+from auth.breached import (BreachedPasswords, breached_passwords, build,
+                           parse_hashes)
+from auth.crud import check_password_strength
+from core.config import get_settings
+
+BREACHED = [f"Breached-{number}!" for number in range(2000)]
+
+
+def _hex(password: str) -> str:
+    return sha1(password.encode()).hexdigest().upper()
+
+
+class TestBreachedPasswords(unittest.TestCase):
+
+    def _build(self, passwords, **kwargs) -> BreachedPasswords:
+        descriptor, path = tempfile.mkstemp()
+        self.addCleanup(os.remove, path)
+        lines = [f"{_hex(password)}:{index}\n"
+                 for index, password in enumerate(passwords)]
+        with os.fdopen(descriptor, "wb") as output:
+            self.count = build(parse_hashes(lines), output, **kwargs)
+        checker = BreachedPasswords(path)
+        self.addCleanup(checker.close)
+        return checker
+
+    def test_finds_every_listed_password(self):
+        # Duplicates and several on-disk runs are merged into one list.
+        checker = self._build(BREACHED + BREACHED[:100], run_size=300)
+        self.assertEqual(self.count, len(BREACHED))
+        self.assertEqual(len(checker), len(BREACHED))
+        self.assertTrue(all(password in checker for password in BREACHED))
+
+    def test_rejects_unlisted_passwords(self):
+        checker = self._build(BREACHED)
+        self.assertFalse(any(f"Safe-{number}!" in checker
+                             for number in range(2000)))
+
+    def test_truncated_digests(self):
+        checker = self._build(BREACHED, digest_size=8)
+        self.assertTrue(all(password in checker for password in BREACHED))
+        self.assertNotIn("Safe-1!", checker)
+        self.assertEqual(os.path.getsize(checker.path),
+                         checker._records + 8 * len(BREACHED))
+
+    def test_digests_sharing_a_truncated_record(self):
+        # Both keep one 4-byte record, but their bloom probes (from the
+        # full digests) differ and must all be set.
+        first = bytes(range(20))
+        second = first[:4] + bytes(range(100, 116))
+        descriptor, path = tempfile.mkstemp()
+        self.addCleanup(os.remove, path)
+        with os.fdopen(descriptor, "wb") as output:
+            self.assertEqual(build([first, second], output, digest_size=4),
+                             1)
+        checker = BreachedPasswords(path)
+        self.addCleanup(checker.close)
+        self.assertTrue(checker.contains_digest(first))
+        self.assertTrue(checker.contains_digest(second))
+
+    def test_empty_list(self):
+        checker = self._build([])
+        self.assertEqual(len(checker), 0)
+        self.assertNotIn("anything", checker)
+
+    def test_bad_input_is_rejected(self):
+        with self.assertRaises(ValueError):
+            list(parse_hashes(["not a hash\n"]))
+        with self.assertRaises(ValueError):
+            build([], io.BytesIO(), digest_size=2)
+        with tempfile.NamedTemporaryFile() as file:
+            file.write(b"x" * 64)
+            file.flush()
+            with self.assertRaises(ValueError):
+                BreachedPasswords(file.name)
+
+    def test_password_strength_check_uses_the_configured_list(self):
+        checker = self._build(["Passw0rd!"])
+        settings = get_settings()
+        previous = settings.BREACHED_PASSWORDS_FILE
+        settings.BREACHED_PASSWORDS_FILE = checker.path
+        breached_passwords.cache_clear()
+        self.addCleanup(breached_passwords.cache_clear)
+        self.addCleanup(setattr, settings, "BREACHED_PASSWORDS_FILE",
+                        previous)
+
+        with self.assertRaises(ValueError):
+            check_password_strength("Passw0rd!")
+        self.assertTrue(check_password_strength("Unl1sted-Passw0rd!"))
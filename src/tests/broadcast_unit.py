@@ -0,0 +1,104 @@
+import asyncio
+import json
+import os
+import threading
+import unittest
+
+from core.broadcast import (Broadcaster, MemoryBroadcastBackend,
+                            PostgresBroadcastBackend)
+from core.database import Database
+from work.feed import feed_message
+
+# e.g. postgresql+psycopg2://postgres@localhost/final_labz_test
+POSTGRES_URI = os.getenv("TEST_POSTGRES_URI")
+
+
+async def _next(subscription, timeout=2.0):
+    return await asyncio.wait_for(subscription.get(), timeout)
+
+
+class TestBroadcaster(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.broadcaster = Broadcaster("test", queue_size=3)
+        self.broadcaster.start(MemoryBroadcastBackend())
+        self.addCleanup(self.broadcaster.stop)
+
+    async def test_messages_are_filtered_by_topic(self):
+        plumbing = self.broadcaster.subscribe({"PLUMBING"})
+        everything = self.broadcaster.subscribe()
+
+        self.broadcaster.publish([("PLUMBING", {"job_id": 1}),
+                                  ("OTHER", {"job_id": 2})])
+
+        self.assertEqual(await _next(plumbing), {"job_id": 1})
+        self.assertEqual(await _next(everything), {"job_id": 1})
+        self.assertEqual(await _next(everything), {"job_id": 2})
+        self.assertTrue(plumbing.queue.empty())
+
+    async def test_slow_consumer_is_dropped(self):
+        slow = self.broadcaster.subscribe()
+        fast = self.broadcaster.subscribe()
+
+        received = []
+        for job_id in range(5):
+            self.broadcaster.publish([("OTHER", {"job_id": job_id})])
+            await asyncio.sleep(0)
+            received.append(await _next(fast))
+
+        self.assertEqual(len(received), 5)
+        self.assertTrue(slow.dropped)
+        self.assertIsNone(await _next(slow))
+        self.assertEqual(len(self.broadcaster), 1)
+
+    async def test_publish_from_another_thread(self):
+        subscription = self.broadcaster.subscribe({"OTHER"})
+        thread = threading.Thread(target=self.broadcaster.publish,
+                                  args=([("OTHER", {"job_id": 7})],))
+        thread.start()
+        thread.join()
+        self.assertEqual(await _next(subscription), {"job_id": 7})
+
+    async def test_closing_ends_iteration(self):
+        subscription = self.broadcaster.subscribe()
+        self.broadcaster.publish([("OTHER", {"job_id": 1})])
+        received = []
+        async for message in subscription:
+            received.append(message)
+            subscription.close()
+        self.assertEqual(received, [{"job_id": 1}])
+        self.assertEqual(len(self.broadcaster), 0)
+
+    def test_feed_message_carries_the_new_state(self):
+        row = {"job_id": 3, "event_type": "status",
+               "from_status": "UNASSIGNED", "to_status": "ASSIGNED",
+               "payload": json.dumps({"before": None, "after": {
+                   "status": "ASSIGNED", "category": "PLUMBING"}})}
+        topic, message = feed_message(row)
+        self.assertEqual(topic, "PLUMBING")
+        self.assertEqual(message["status"], "ASSIGNED")
+        self.assertIsNone(feed_message(dict(row, event_type="updated")))
+
+
+@unittest.skipUnless(POSTGRES_URI, "set TEST_POSTGRES_URI to run")
+class TestPostgresBroadcast(unittest.IsolatedAsyncioTestCase):
+    """
+    Two broadcasters standing in for two workers share messages through
+    LISTEN/NOTIFY.
+    """
+
+    async def test_messages_reach_every_worker(self):
+        db = Database(POSTGRES_URI)
+        self.addCleanup(db.dispose)
+        workers = [Broadcaster("test_feed"), Broadcaster("test_feed")]
+        for worker in workers:
+            worker.start(PostgresBroadcastBackend(db, poll_seconds=0.1))
+            self.addCleanup(worker.stop)
+        subscriptions = [worker.subscribe({"OTHER"}) for worker in workers]
+        await asyncio.sleep(0.5)  # let both listeners connect
+
+        await asyncio.get_running_loop().run_in_executor(
+            None, workers[0].publish, [("OTHER", {"job_id": 1})])
+
+        for subscription in subscriptions:
+            self.assertEqual(await _next(subscription, 5), {"job_id": 1})
@@ -0,0 +1,278 @@
+import asyncio
+import gc
+import importlib.util
+import threading
+import unittest
+import weakref
+from time import sleep
+
+from auth.cache import get_principal, principal_cache
+from auth.enums import USER_ROLES
+from auth.models import User
+from core.cache import (LRUCache, MISSING, JsonSerializer,
+                        MemoryCacheBackend, MsgpackSerializer,
+                        ReadThroughCache, serializer_from_name)
+from core.database import Database
+from tests.claim_unit import _seed
+from work.cache import get_job, get_jobs_by_poster, job_cache
+from work.events import event_buffer
+from work.models import Jobs
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIs(cache.get("b"), MISSING)
+
+    def test_entries_expire(self):
+        cache = LRUCache(ttl=0.01)
+        cache.set("a", 1)
+        sleep(0.02)
+        self.assertIs(cache.get("a"), MISSING)
+        self.assertEqual(len(cache), 0)
+
+
+class TestReadThroughCache(unittest.TestCase):
+
+    def _slow_loader(self, calls, release, value="fresh"):
+        def load():
+            calls.append(1)
+            release.wait(5)
+            return value
+        return load
+
+    def _race(self, caches, loader, callers=8):
+        results = []
+        threads = [threading.Thread(target=lambda cache=cache: results.append(
+            cache.get_or_load("key", loader)))
+            for index in range(callers) for cache in [caches[index % len(
+                caches)]]]
+        for thread in threads:
+            thread.start()
+        return threads, results
+
+    def test_concurrent_misses_load_once(self):
+        cache = ReadThroughCache("test")
+        calls, release = [], threading.Event()
+        threads, results = self._race([cache],
+                                      self._slow_loader(calls, release))
+        sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["fresh"] * 8)
+
+    def test_workers_sharing_a_backend_load_once(self):
+        backend = MemoryCacheBackend()
+        workers = [ReadThroughCache("test", backend=backend)
+                   for _ in range(3)]
+        calls, release = [], threading.Event()
+        threads, results = self._race(workers,
+                                      self._slow_loader(calls, release), 9)
+        sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["fresh"] * 9)
+
+    def test_load_invalidated_in_flight_is_not_stored(self):
+        cache = ReadThroughCache("test")
+        calls, release = [], threading.Event()
+        thread = threading.Thread(target=cache.get_or_load, args=(
+            "key", self._slow_loader(calls, release, "old")))
+        thread.start()
+        sleep(0.05)
+        cache.invalidate("key")
+        release.set()
+        thread.join()
+        self.assertEqual(cache.get_or_load("key", lambda: "new"), "new")
+
+    def test_invalidate_reaches_the_shared_tier(self):
+        backend = MemoryCacheBackend()
+        first = ReadThroughCache("test", backend=backend)
+        second = ReadThroughCache("test", backend=backend)
+        first.get_or_load("key", lambda: "old")
+        first.invalidate("key")
+        self.assertEqual(second.get_or_load("key", lambda: "new"), "new")
+
+    def test_async_miss_does_not_block_the_event_loop(self):
+        backend = MemoryCacheBackend()
+        cache = ReadThroughCache("test", backend=backend, lease_seconds=0.2)
+        # Another worker holds the lease and never finishes.
+        backend.add("test:key:lease", b"1", 5)
+        ticks = []
+
+        async def tick():
+            while True:
+                ticks.append(1)
+                await asyncio.sleep(0.01)
+
+        async def run():
+            ticker = asyncio.ensure_future(tick())
+            value = await cache.get_or_load_async("key", lambda: "fresh")
+            ticker.cancel()
+            return value
+
+        self.assertEqual(asyncio.run(run()), "fresh")
+        self.assertGreater(len(ticks), 5)
+
+    def test_failing_backend_falls_back_to_the_loader(self):
+        class DownBackend(MemoryCacheBackend):
+            def get(self, *args):
+                raise ConnectionError("down")
+            set = add = delete = get
+
+        cache = ReadThroughCache("test", backend=DownBackend())
+        self.assertEqual(cache.get_or_load("key", lambda: "fresh"), "fresh")
+        cache.invalidate("key")
+        self.assertEqual(cache.get_or_load("key", lambda: "new"), "new")
+
+    def test_failed_load_releases_the_lease(self):
+        backend = MemoryCacheBackend()
+        first = ReadThroughCache("test", backend=backend)
+        second = ReadThroughCache("test", backend=backend)
+
+        def fail():
+            raise RuntimeError("database down")
+
+        with self.assertRaises(RuntimeError):
+            first.get_or_load("key", fail)
+        self.assertTrue(backend.add("test:key:lease", b"1", 5))
+        backend.delete("test:key:lease")
+        self.assertEqual(second.get_or_load("key", lambda: "new"), "new")
+
+
+class TestJobCache(unittest.TestCase):
+
+    def setUp(self):
+        self.db = Database("sqlite://")
+        self.addCleanup(self.db.dispose)
+        self.addCleanup(event_buffer(self.db).stop)
+        _seed(self.db, contractors=1, jobs=2)
+
+    def test_reads_are_served_from_cache(self):
+        self.assertEqual(get_job(self.db, 1)["title"], "job 0")
+        get_job(self.db, 1)
+        self.assertEqual(job_cache(self.db).hits, 1)
+
+    def test_writes_invalidate_detail_and_listing(self):
+        self.assertEqual(len(get_jobs_by_poster(self.db, 1)), 2)
+        self.assertEqual(get_job(self.db, 1)["version"], 1)
+
+        Jobs.get_by_id(self.db, 1).update(self.db, {"title": "renamed"})
+        self.assertEqual(get_job(self.db, 1)["title"], "renamed")
+
+        Jobs.claim(self.db, 2, job_id=1)
+        self.assertEqual(get_job(self.db, 1)["taken_by_user_id"], 2)
+
+        poster = User.get_by_id(self.db, 1).additional
+        Jobs(title="new", description="", category="OTHER", amount=1,
+             status="UNASSIGNED", poster=poster).create(self.db)
+        self.assertEqual(len(get_jobs_by_poster(self.db, 1)), 3)
+
+    def test_untouched_keys_survive_writes(self):
+        get_job(self.db, 2)
+        Jobs.get_by_id(self.db, 1).update(self.db, {"title": "renamed"})
+        get_job(self.db, 2)
+        self.assertEqual(job_cache(self.db).hits, 1)
+
+
+class TestSharedInvalidation(unittest.TestCase):
+
+    def test_invalidate_drops_other_workers_local_tier(self):
+        backend = MemoryCacheBackend()
+        first = ReadThroughCache("test", backend=backend, local_ttl=60)
+        second = ReadThroughCache("test", backend=backend, local_ttl=60)
+        first.get_or_load("key", lambda: "old")
+        self.assertEqual(second.get_or_load("key", lambda: "unused"), "old")
+
+        first.invalidate("key")
+        self.assertIs(second.local.get("key"), MISSING)
+        self.assertEqual(second.get_or_load("key", lambda: "new"), "new")
+
+    def test_other_namespaces_are_untouched(self):
+        backend = MemoryCacheBackend()
+        jobs = ReadThroughCache("jobs", backend=backend)
+        users = ReadThroughCache("users", backend=backend)
+        users.get_or_load("key", lambda: "kept")
+        jobs.invalidate("key")
+        self.assertEqual(users.local.get("key"), "kept")
+
+    def test_malformed_broadcast_is_ignored(self):
+        backend = MemoryCacheBackend()
+        cache = ReadThroughCache("test", backend=backend)
+        cache.get_or_load("key", lambda: "kept")
+        backend.publish("invalidate:test", b"\xff")
+        self.assertEqual(cache.local.get("key"), "kept")
+
+    def test_discarded_cache_is_collected(self):
+        backend = MemoryCacheBackend()
+        cache = weakref.ref(ReadThroughCache("test", backend=backend))
+        gc.collect()
+        self.assertIsNone(cache())
+        ReadThroughCache("test", backend=backend).invalidate("key")
+
+    @unittest.skipUnless(importlib.util.find_spec("msgpack"),
+                         "msgpack is not installed")
+    def test_msgpack_round_trip(self):
+        backend = MemoryCacheBackend()
+        value = {"id": 1, "title": "job", "amount": 2.5, "tags": [None, True]}
+        writer = ReadThroughCache("test", backend=backend,
+                                  serializer=MsgpackSerializer())
+        reader = ReadThroughCache("test", backend=backend,
+                                  serializer=serializer_from_name("msgpack"))
+        writer.get_or_load("key", lambda: value)
+        self.assertEqual(reader.get_or_load("key", lambda: None), value)
+
+    def test_entry_in_another_format_is_a_miss(self):
+        backend = MemoryCacheBackend()
+        backend.set("test:key", b"\xc1 not json", 60)
+        cache = ReadThroughCache("test", backend=backend,
+                                 serializer=JsonSerializer())
+        self.assertEqual(cache.get_or_load("key", lambda: "loaded"),
+                         "loaded")
+
+
+class TestPrincipalCache(unittest.TestCase):
+
+    def setUp(self):
+        self.db = Database("sqlite://")
+        self.addCleanup(self.db.dispose)
+        self.addCleanup(event_buffer(self.db).stop)
+        _seed(self.db, contractors=1, jobs=1)
+
+    def test_principals_are_served_from_cache(self):
+        self.assertEqual(get_principal(self.db, 2),
+                         {"id": 2, "type": USER_ROLES.CONTRACTOR.value,
+                          "additional_id": 2})
+        get_principal(self.db, 2)
+        self.assertEqual(principal_cache(self.db).hits, 1)
+
+    def test_state_changes_invalidate(self):
+        get_principal(self.db, 2)
+        User.change_state(self.db, "archive", ids=[2])
+        self.assertEqual(get_principal(self.db, 2)["type"],
+                         USER_ROLES.INACTIVE.value)
+        User.change_state(self.db, "restore", ids=[2])
+        self.assertEqual(get_principal(self.db, 2)["type"],
+                         USER_ROLES.CONTRACTOR.value)
+
+    def test_updates_and_creates_invalidate(self):
+        self.assertIsNone(get_principal(self.db, 3))
+        User(name="new", email="new@example.com", password="secret",
+             type=USER_ROLES.CLIENT).create(self.db)
+        self.assertEqual(get_principal(self.db, 3)["type"],
+                         USER_ROLES.CLIENT.value)
+
+        User.get_by_id(self.db, 3).update(self.db,
+                                          {"type": USER_ROLES.INACTIVE})
+        self.assertEqual(get_principal(self.db, 3)["type"],
+                         USER_ROLES.INACTIVE.value)
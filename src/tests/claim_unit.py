@@ -0,0 +1,126 @@
+import os
+import threading
+import unittest
+from collections import Counter
+
+from sqlalchemy import event, insert, select
+from sqlalchemy.orm.exc import StaleDataError
+
+from auth.enums import CATEGORY_STATES, JOB_STATUS_STATES, USER_ROLES
+from auth.models import (User, Additional, Client_Additional,
+                         Contractor_Additional)
+from core.database import Database, ModelBase
+from work.events import event_buffer
+from work.models import Jobs
+
+# e.g. postgresql+psycopg2://postgres@localhost/final_labz_test
+POSTGRES_URI = os.getenv("TEST_POSTGRES_URI")
+
+
+def _seed(db: Database, contractors: int, jobs: int):
+    ModelBase.metadata.drop_all(db.engine)
+    ModelBase.metadata.create_all(db.engine)
+    ids = range(1, contractors + 2)
+    with db.engine.begin() as connection:
+        connection.execute(insert(User.__table__), [
+            dict(id=id, name=f"user {id}", email=f"{id}@example.com",
+                 password="unused",
+                 type=USER_ROLES.CLIENT if id == 1 else USER_ROLES.CONTRACTOR)
+            for id in ids])
+        connection.execute(insert(Additional.__table__), [
+            dict(id=id, user_id=id,
+                 type=USER_ROLES.CLIENT if id == 1 else USER_ROLES.CONTRACTOR)
+            for id in ids])
+        connection.execute(insert(Client_Additional.__table__), [dict(id=1)])
+        connection.execute(insert(Contractor_Additional.__table__),
+                           [dict(id=id, max_active_jobs=3) for id in ids[1:]])
+        if jobs:
+            connection.execute(insert(Jobs.__table__), [
+                dict(title=f"job {number}", description="", poster_id=1,
+                     category=CATEGORY_STATES.OTHER, amount=10,
+                     status=JOB_STATUS_STATES.UNASSIGNED)
+                for number in range(jobs)])
+
+
+class TestJobVersioning(unittest.TestCase):
+
+    def setUp(self):
+        self.db = Database("sqlite://")
+        self.addCleanup(self.db.dispose)
+        self.addCleanup(event_buffer(self.db).stop)
+        _seed(self.db, contractors=2, jobs=3)
+
+    def test_stale_update_is_rejected(self):
+        first = Jobs.get_by_id(self.db, 1)
+        second = Jobs.get_by_id(self.db, 1)
+
+        first.update(self.db, {"title": "first"})
+        with self.assertRaises(StaleDataError):
+            second.update(self.db, {"title": "second"})
+
+        self.assertEqual(Jobs.get_by_id(self.db, 1).title, "first")
+        self.assertEqual(Jobs.get_by_id(self.db, 1).version, 2)
+
+    def test_claim_specific_job_once(self):
+        self.assertEqual(Jobs.claim(self.db, 2, job_id=2), 2)
+        self.assertIsNone(Jobs.claim(self.db, 3, job_id=2))
+        self.assertEqual(Jobs.claim(self.db, 3), 1)
+
+
+@unittest.skipUnless(POSTGRES_URI, "set TEST_POSTGRES_URI to run")
+class TestConcurrentClaims(unittest.TestCase):
+    """
+    Many contractors race to claim the same pool of jobs; every job must
+    be claimed exactly once and each claim must be a single statement.
+    """
+
+    JOBS = 400
+    WORKERS = 16
+
+    def setUp(self):
+        self.db = Database(POSTGRES_URI)
+        self.addCleanup(self.db.dispose)
+        self.addCleanup(event_buffer(self.db).stop)
+        _seed(self.db, contractors=self.WORKERS, jobs=self.JOBS)
+
+    def test_each_job_claimed_once_in_one_round_trip(self):
+        statements = Counter()
+        calls = Counter()
+
+        @event.listens_for(self.db.engine, "before_cursor_execute")
+        def count(conn, cursor, statement, *args):
+            statements[threading.get_ident()] += 1
+
+        claimed = []
+        lock = threading.Lock()
+        start = threading.Barrier(self.WORKERS)
+
+        def contractor(contractor_id: int):
+            start.wait()
+            while True:
+                calls[threading.get_ident()] += 1
+                job_id = Jobs.claim(self.db, contractor_id)
+                if job_id is None:
+                    return
+                with lock:
+                    claimed.append((job_id, contractor_id))
+
+        threads = [threading.Thread(target=contractor, args=(id,))
+                   for id in range(2, self.WORKERS + 2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        job_ids = [job_id for job_id, _ in claimed]
+        self.assertEqual(len(job_ids), self.JOBS)
+        self.assertEqual(len(set(job_ids)), self.JOBS)
+        # Only the claiming threads count: the job event flusher may
+        # write a batch from its own thread meanwhile.
+        self.assertEqual({ident: statements[ident] for ident in calls},
+                         calls)
+
+        with self.db.engine.connect() as connection:
+            rows = dict(connection.execute(
+                select(Jobs.id, Jobs.taken_by_user_id)).all())
+        self.assertEqual(rows, dict(claimed))
@@ -0,0 +1,81 @@
+import unittest
+from datetime import datetime
+
+from starlette.requests import Request
+
+from auth.enums import USER_ROLES
+from auth.models import User
+from core.conditional import http_date, is_not_modified, make_etag
+from core.database import Database
+from tests.claim_unit import _seed
+from work.events import event_buffer
+from work.models import Jobs
+
+
+def _request(**headers) -> Request:
+    return Request({"type": "http", "method": "GET", "headers": [
+        (name.replace("_", "-").lower().encode(), value.encode())
+        for name, value in headers.items()]})
+
+
+class TestConditionalRequests(unittest.TestCase):
+
+    def test_if_none_match(self):
+        etag = make_etag("job", 1, 3)
+        self.assertTrue(is_not_modified(_request(If_None_Match=etag), etag))
+        self.assertTrue(is_not_modified(
+            _request(If_None_Match=f'"other", {etag[2:]}'), etag))
+        self.assertTrue(is_not_modified(_request(If_None_Match="*"), etag))
+        self.assertFalse(is_not_modified(
+            _request(If_None_Match=make_etag("job", 1, 4)), etag))
+
+    def test_if_modified_since(self):
+        modified = datetime(2024, 5, 1, 12, 0, 0, 500)
+        etag = make_etag("job", 1, 1)
+        self.assertTrue(is_not_modified(
+            _request(If_Modified_Since=http_date(modified)), etag, modified))
+        self.assertFalse(is_not_modified(
+            _request(If_Modified_Since="Tue, 30 Apr 2024 12:00:00 GMT"),
+            etag, modified))
+        # If-None-Match wins when both are sent.
+        self.assertFalse(is_not_modified(
+            _request(If_None_Match='"stale"',
+                     If_Modified_Since=http_date(modified)), etag, modified))
+
+    def test_etag_depends_on_every_part(self):
+        self.assertEqual(make_etag("user", 1, "self"),
+                         make_etag("user", 1, "self"))
+        self.assertNotEqual(make_etag("user", 1, "self"),
+                            make_etag("user", 1, "admin"))
+
+
+class TestValidators(unittest.TestCase):
+
+    def setUp(self):
+        self.db = Database("sqlite://")
+        self.addCleanup(self.db.dispose)
+        self.addCleanup(event_buffer(self.db).stop)
+        _seed(self.db, contractors=1, jobs=2)
+
+    def test_user_validators_follow_user_and_job_changes(self):
+        user_type, first, _ = User.get_validators(self.db, 1)
+        self.assertEqual(user_type, USER_ROLES.CLIENT)
+
+        Jobs.get_by_id(self.db, 1).update(self.db, {"title": "renamed"})
+        _, second, _ = User.get_validators(self.db, 1)
+        self.assertNotEqual(first, second)
+
+        User.get_by_id(self.db, 1).update(self.db, {"name": "renamed"})
+        _, third, _ = User.get_validators(self.db, 1)
+        self.assertEqual(third[0], second[0] + 1)
+
+    def test_contractor_validators_follow_claims(self):
+        _, before, _ = User.get_validators(self.db, 2)
+        Jobs.claim(self.db, 2, job_id=1)
+        _, after, _ = User.get_validators(self.db, 2)
+        self.assertNotEqual(before, after)
+
+    def test_missing_rows(self):
+        self.assertIsNone(User.get_validators(self.db, 99))
+        self.assertIsNone(Jobs.get_validators(self.db, 99))
+        self.assertEqual(Jobs.get_validators(self.db, 1)[0], 1)
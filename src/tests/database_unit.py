@@ -0,0 +1,80 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from sqlalchemy import text
+
+from core.database import Database
+
+
+def _make_sqlite(path: str, label: str):
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE origin (label TEXT)")
+    connection.execute("INSERT INTO origin VALUES (?)", (label,))
+    connection.commit()
+    connection.close()
+
+
+class TestReplicaRouting(unittest.TestCase):
+    """
+    Routes reads across two SQLite "replicas" that each label their rows,
+    so the session's origin is visible from the query result.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.uris = {}
+        for label in ("primary", "replica_a", "replica_b"):
+            path = os.path.join(self.tmp.name, f"{label}.db")
+            _make_sqlite(path, label)
+            self.uris[label] = f"sqlite:///{path}"
+
+        self.db = Database(self.uris["primary"],
+                           [self.uris["replica_a"], self.uris["replica_b"]],
+                           replica_eject_seconds=60)
+
+    def tearDown(self):
+        self.db.dispose()
+        self.tmp.cleanup()
+
+    def _origin(self, session) -> str:
+        return session.execute(text("SELECT label FROM origin")).scalar()
+
+    def test_reads_round_robin_across_replicas(self):
+        origins = [self._origin(self.db.get_db(readonly=True))
+                   for _ in range(4)]
+        self.assertEqual(origins,
+                         ["replica_a", "replica_b", "replica_a", "replica_b"])
+
+    def test_writes_use_primary(self):
+        self.assertEqual(self._origin(self.db.get_db()), "primary")
+
+    def test_reads_after_commit_stay_on_primary(self):
+        session = self.db.get_db()
+        session.execute(text("INSERT INTO origin VALUES ('written')"))
+        session.commit()
+
+        self.assertEqual(self._origin(self.db.get_db(readonly=True)),
+                         "primary")
+
+    def test_failing_replica_is_ejected(self):
+        broken = os.path.join(self.tmp.name, "missing", "replica.db")
+        db = Database(self.uris["primary"],
+                      [f"sqlite:///{broken}", self.uris["replica_b"]],
+                      replica_eject_seconds=60)
+        self.addCleanup(db.dispose)
+
+        with self.assertRaises(Exception):
+            self._origin(db.get_db(readonly=True))
+
+        origins = {self._origin(db.get_db(readonly=True)) for _ in range(4)}
+        self.assertEqual(origins, {"replica_b"})
+
+    def test_falls_back_to_primary_without_healthy_replicas(self):
+        self.db.connect()
+        for replica in self.db.replicas:
+            replica.eject()
+
+        self.assertEqual(self._origin(self.db.get_db(readonly=True)),
+                         "primary")
@@ -0,0 +1,149 @@
+import asyncio
+import os
+import unittest
+from time import monotonic, perf_counter
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import exc as sa_exc
+from sqlalchemy import text
+
+from core.database import Database
+from core.deadline import (DeadlineExceeded, DeadlineMiddleware, deadline,
+                           is_timeout)
+
+POSTGRES_URI = os.getenv("TEST_POSTGRES_URI")
+
+# Counts to a billion; far longer than any deadline below.
+SLOW_SQLITE = text(
+    "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n "
+    "WHERE i < 1000000000) SELECT count(*) FROM n")
+
+
+def _within(seconds: float):
+    return deadline.set(monotonic() + seconds)
+
+
+class TestStatementDeadlines(unittest.TestCase):
+
+    def setUp(self):
+        self.db = Database("sqlite://")
+
+    def tearDown(self):
+        self.db.dispose()
+
+    def test_sqlite_statements_are_interrupted(self):
+        token = _within(0.1)
+        started = perf_counter()
+        try:
+            with self.db.get_db() as session:
+                with self.assertRaises(sa_exc.OperationalError) as caught:
+                    session.execute(SLOW_SQLITE)
+        finally:
+            deadline.reset(token)
+        self.assertTrue(is_timeout(caught.exception))
+        self.assertLess(perf_counter() - started, 2)
+
+        # The connection goes back to the pool usable.
+        with self.db.get_db() as session:
+            self.assertEqual(session.execute(text("SELECT 1")).scalar(), 1)
+
+    def test_expired_deadline_starts_no_work(self):
+        token = _within(-1)
+        try:
+            with self.db.get_db() as session:
+                with self.assertRaises(DeadlineExceeded):
+                    session.execute(text("SELECT 1"))
+        finally:
+            deadline.reset(token)
+
+    def test_no_deadline_no_limit(self):
+        with self.db.get_db() as session:
+            self.assertEqual(session.execute(text("SELECT 1")).scalar(), 1)
+
+
+@unittest.skipUnless(POSTGRES_URI, "set TEST_POSTGRES_URI to run")
+class TestPostgresStatementTimeout(unittest.TestCase):
+
+    def setUp(self):
+        self.db = Database(POSTGRES_URI)
+
+    def tearDown(self):
+        self.db.dispose()
+
+    def test_statement_timeout_is_transaction_local(self):
+        token = _within(0.2)
+        try:
+            with self.db.get_db() as session:
+                with self.assertRaises(sa_exc.OperationalError) as caught:
+                    session.execute(text("SELECT pg_sleep(5)"))
+        finally:
+            deadline.reset(token)
+        self.assertTrue(is_timeout(caught.exception))
+
+        with self.db.get_db() as session:
+            self.assertEqual(session.execute(
+                text("SHOW statement_timeout")).scalar(), "0")
+
+
+class TestDeadlineMiddleware(unittest.TestCase):
+
+    def setUp(self):
+        app = FastAPI()
+
+        @app.get("/slow")
+        async def slow():
+            await asyncio.sleep(5)
+
+        # Blocks the event loop, so only the database can stop it.
+        @app.get("/query")
+        async def query():
+            db = Database("sqlite://")
+            try:
+                with db.get_db() as session:
+                    session.execute(SLOW_SQLITE)
+            finally:
+                db.dispose()
+
+        @app.get("/pool")
+        def pool():
+            raise sa_exc.TimeoutError("QueuePool limit reached")
+
+        @app.get("/free")
+        async def free():
+            await asyncio.sleep(0.2)
+            return {"left": deadline.get()}
+
+        app.add_middleware(DeadlineMiddleware, seconds={"read": 0.1},
+                           rules=[(None, r"/free$", None),
+                                  (None, r"/", "read")])
+        self.app = app
+
+    def _get(self, path: str) -> httpx.Response:
+        async def run():
+            transport = httpx.ASGITransport(app=self.app)
+            async with httpx.AsyncClient(transport=transport,
+                                         base_url="http://test") as client:
+                return await client.get(path)
+        return asyncio.run(run())
+
+    def test_slow_routes_are_cancelled(self):
+        started = perf_counter()
+        response = self._get("/slow")
+        self.assertLess(perf_counter() - started, 2)
+        self.assertEqual(response.status_code, 504)
+        self.assertEqual(response.json()["detail"]["status"], "504")
+
+    def test_database_timeouts_are_504(self):
+        response = self._get("/query")
+        self.assertEqual(response.status_code, 504)
+
+    def test_full_pool_is_503(self):
+        response = self._get("/pool")
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("retry-after", response.headers)
+
+    def test_exempt_routes_have_no_deadline(self):
+        response = self._get("/free")
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.json()["left"])
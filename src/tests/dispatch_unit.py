@@ -0,0 +1,100 @@
+import unittest
+
+from sqlalchemy import insert, select
+
+from auth.enums import CATEGORY_STATES, JOB_STATUS_STATES, USER_ROLES
+from auth.models import (User, Additional, Client_Additional,
+                         Contractor_Additional, Contractor_Skill)
+from core.database import Database, ModelBase
+from work.dispatch import ContractorIndex, DispatchEngine, _Contractor
+from work.events import event_buffer
+from work.models import Jobs
+
+
+class TestContractorIndex(unittest.TestCase):
+
+    def test_prefers_least_loaded_contractor(self):
+        busy = _Contractor(1, capacity=5, max_amount=None, load=2)
+        idle = _Contractor(2, capacity=5, max_amount=None, load=0)
+        index = ContractorIndex([busy, idle], {})
+
+        picked = [index.take(CATEGORY_STATES.OTHER, 10).id for _ in range(3)]
+        self.assertEqual(picked, [2, 2, 1])
+
+    def test_respects_skills_capacity_and_amount(self):
+        builder = _Contractor(1, capacity=1, max_amount=None, load=0)
+        capped = _Contractor(2, capacity=5, max_amount=50, load=0)
+        index = ContractorIndex([builder, capped], {
+            1: [CATEGORY_STATES.PC_CUSTOM_BUILD],
+        })
+
+        self.assertIsNone(index.take(CATEGORY_STATES.SERVER_SETUP, 100))
+        self.assertEqual(index.take(CATEGORY_STATES.PC_CUSTOM_BUILD, 100).id,
+                         1)
+        self.assertIsNone(index.take(CATEGORY_STATES.PC_CUSTOM_BUILD, 100))
+        self.assertEqual(index.take(CATEGORY_STATES.PC_CUSTOM_BUILD, 40).id,
+                         2)
+
+
+class TestDispatchEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.db = Database("sqlite://")
+        ModelBase.metadata.create_all(self.db.engine)
+        self.addCleanup(self.db.dispose)
+        self.addCleanup(event_buffer(self.db).stop)
+
+        roles = {1: USER_ROLES.CLIENT, 2: USER_ROLES.CONTRACTOR,
+                 3: USER_ROLES.CONTRACTOR, 4: USER_ROLES.INACTIVE}
+        with self.db.engine.begin() as connection:
+            connection.execute(insert(User.__table__), [
+                dict(id=id, name=f"user {id}", email=f"{id}@example.com",
+                     password="unused", type=role)
+                for id, role in roles.items()])
+            connection.execute(insert(Additional.__table__), [
+                dict(id=id, user_id=id, type=(
+                    role if id != 4 else USER_ROLES.CONTRACTOR))
+                for id, role in roles.items()])
+            connection.execute(insert(Client_Additional.__table__),
+                               [dict(id=1)])
+            connection.execute(insert(Contractor_Additional.__table__), [
+                dict(id=2, max_active_jobs=2),
+                dict(id=3, max_active_jobs=2),
+                dict(id=4, max_active_jobs=2)])
+            connection.execute(insert(Contractor_Skill.__table__), [
+                dict(contractor_id=3, category=CATEGORY_STATES.SERVER_SETUP)])
+            connection.execute(insert(Jobs.__table__), [
+                dict(title=f"job {number}", description="", poster_id=1,
+                     category=CATEGORY_STATES.SERVER_SETUP,
+                     amount=100 + number,
+                     status=JOB_STATUS_STATES.UNASSIGNED)
+                for number in range(6)])
+
+    def _assignments(self):
+        with self.db.engine.connect() as connection:
+            return connection.execute(
+                select(Jobs.id, Jobs.taken_by_user_id, Jobs.status)
+                .order_by(Jobs.id)).all()
+
+    def test_cycle_assigns_in_batches_up_to_capacity(self):
+        report = DispatchEngine(self.db, batch_size=3).run_cycle()
+
+        self.assertEqual(report.jobs_considered, 6)
+        self.assertEqual(report.assigned, 4)
+        self.assertEqual(report.unmatched, 2)
+        self.assertEqual(report.batches, 2)
+
+        rows = self._assignments()
+        assigned = [row for row in rows if row.taken_by_user_id]
+        self.assertEqual(sorted(row.taken_by_user_id for row in assigned),
+                         [2, 2, 3, 3])
+        self.assertTrue(all(row.status == JOB_STATUS_STATES.ASSIGNED
+                            for row in assigned))
+        # The highest paying jobs are matched first.
+        self.assertEqual({row.id for row in assigned}, {3, 4, 5, 6})
+
+    def test_second_cycle_respects_existing_load(self):
+        DispatchEngine(self.db).run_cycle()
+        report = DispatchEngine(self.db).run_cycle()
+
+        self.assertEqual(report.assigned, 0)
@@ -0,0 +1,169 @@
+import json
+import threading
+import unittest
+
+from sqlalchemy import insert, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm.exc import StaleDataError
+
+from auth.enums import JOB_STATUS_STATES
+from auth.models import User
+from core.database import Database
+from tests.claim_unit import POSTGRES_URI, _seed
+from work.dispatch import DispatchEngine
+from work.events import _EVENTS_LOCK_KEY, event_buffer
+from work.models import Jobs, Job_Event, InvalidTransition
+
+
+class TestJobTransitions(unittest.TestCase):
+
+    def setUp(self):
+        self.db = Database("sqlite://")
+        self.addCleanup(self.db.dispose)
+        _seed(self.db, contractors=2, jobs=3)
+        self.events = event_buffer(self.db)
+        self.addCleanup(self.events.stop)
+
+    def test_allowed_path_to_completion(self):
+        Jobs.claim(self.db, 2, job_id=1)
+        job = Jobs.get_by_id(self.db, 1)
+        for state in (JOB_STATUS_STATES.IN_PROGRESS,
+                      JOB_STATUS_STATES.PENDING,
+                      JOB_STATUS_STATES.COMPLETED):
+            job.transition(self.db, state, actor_id=1)
+
+        stored = Jobs.get_by_id(self.db, 1)
+        self.assertEqual(stored.status, JOB_STATUS_STATES.COMPLETED)
+        self.assertEqual(stored.version, 5)
+
+    def test_invalid_transition_is_rejected(self):
+        job = Jobs.get_by_id(self.db, 1)
+        with self.assertRaises(InvalidTransition):
+            job.transition(self.db, JOB_STATUS_STATES.COMPLETED)
+
+        job.transition(self.db, JOB_STATUS_STATES.CANCELLED)
+        with self.assertRaises(InvalidTransition):
+            job.transition(self.db, JOB_STATUS_STATES.UNASSIGNED)
+
+    def test_concurrent_transition_conflicts(self):
+        first = Jobs.get_by_id(self.db, 1)
+        second = Jobs.get_by_id(self.db, 1)
+        first.transition(self.db, JOB_STATUS_STATES.CANCELLED)
+        with self.assertRaises(StaleDataError):
+            second.transition(self.db, JOB_STATUS_STATES.CANCELLED)
+
+    def test_jobs_are_not_assigned_without_a_contractor(self):
+        job = Jobs.get_by_id(self.db, 1)
+        with self.assertRaises(InvalidTransition):
+            job.transition(self.db, JOB_STATUS_STATES.ASSIGNED)
+        stored = Jobs.get_by_id(self.db, 1)
+        self.assertEqual(stored.status, JOB_STATUS_STATES.UNASSIGNED)
+        self.assertEqual(Jobs.claim(self.db, 2, job_id=1), 1)
+
+    def test_concurrent_assignments_do_not_both_win(self):
+        first = Jobs.get_by_id(self.db, 1)
+        second = Jobs.get_by_id(self.db, 1)
+        self.assertIs(first.assign_contractor(
+            self.db, User.get_by_id(self.db, 2)), True)
+        with self.assertRaises(StaleDataError):
+            second.assign_contractor(self.db, User.get_by_id(self.db, 3))
+        stored = Jobs.get_by_id(self.db, 1)
+        self.assertEqual(stored.taken_by_user_id, first.taken_by_user_id)
+        self.assertEqual(stored.version, 2)
+
+    def test_new_jobs_must_start_unassigned(self):
+        job = Jobs(title="t", description="d", category="OTHER", amount=1,
+                   status="COMPLETED", poster=None)
+        with self.assertRaises(InvalidTransition):
+            job.create(self.db)
+
+
+class TestJobEventLog(unittest.TestCase):
+
+    def setUp(self):
+        self.db = Database("sqlite://")
+        self.addCleanup(self.db.dispose)
+        _seed(self.db, contractors=2, jobs=3)
+        self.events = event_buffer(self.db)
+        self.addCleanup(self.events.stop)
+
+    def test_changes_are_recorded_in_order(self):
+        job = Jobs.get_by_id(self.db, 1)
+        job.update(self.db, {"title": "renamed"}, actor_id=1)
+        Jobs.claim(self.db, 2, job_id=1)
+        self.events.flush()
+
+        events = Job_Event.since(self.db, 0)
+        self.assertEqual([event.event_type for event in events],
+                         ["updated", "status"])
+        self.assertEqual(events[1].from_status, JOB_STATUS_STATES.UNASSIGNED)
+        self.assertEqual(events[1].to_status, JOB_STATUS_STATES.ASSIGNED)
+        self.assertEqual(json.loads(events[1].payload)["after"]
+                         ["contractor_id"], 2)
+
+    def test_feed_resumes_from_cursor(self):
+        for job_id in (1, 2, 3):
+            Jobs.claim(self.db, 2, job_id=job_id)
+        self.events.flush()
+
+        first = Job_Event.since(self.db, 0, limit=2)
+        rest = Job_Event.since(self.db, first[-1].id)
+        self.assertEqual([event.job_id for event in first + rest], [1, 2, 3])
+        self.assertEqual(
+            [event.job_id for event in Job_Event.since(self.db, 0, job_id=2)],
+            [2])
+
+    def test_dispatch_records_one_event_per_assignment(self):
+        report = DispatchEngine(self.db).run_cycle()
+        self.events.flush()
+        self.assertEqual(len(Job_Event.since(self.db, 0)), report.assigned)
+
+    def test_events_are_append_only(self):
+        Jobs.claim(self.db, 2, job_id=1)
+        self.events.flush()
+        with self.db.get_db() as session:
+            event = session.query(Job_Event).first()
+            event.event_type = "tampered"
+            with self.assertRaises(SQLAlchemyError):
+                session.commit()
+
+    def test_batches_are_written_in_the_background(self):
+        self.events.batch_size = 2
+        Jobs.claim(self.db, 2, job_id=1)
+        Jobs.claim(self.db, 2, job_id=2)
+        self.events._thread.join(timeout=5)
+        self.assertEqual(len(Job_Event.since(self.db, 0)), 2)
+
+
+@unittest.skipUnless(POSTGRES_URI, "set TEST_POSTGRES_URI to run")
+class TestPostgresJobEventLog(unittest.TestCase):
+
+    def setUp(self):
+        self.db = Database(POSTGRES_URI)
+        self.addCleanup(self.db.dispose)
+        _seed(self.db, contractors=1, jobs=2)
+        self.events = event_buffer(self.db)
+        self.addCleanup(self.events.stop)
+
+    def test_batches_commit_in_id_order(self):
+        # Another worker's batch, still uncommitted.
+        other = self.db.engine.connect()
+        self.addCleanup(other.close)
+        transaction = other.begin()
+        other.execute(text("SELECT pg_advisory_xact_lock(:key)"),
+                      {"key": _EVENTS_LOCK_KEY})
+        other.execute(insert(Job_Event.__table__), [dict(
+            job_id=1, event_type="updated", payload="{}")])
+
+        Jobs.claim(self.db, 2, job_id=2)
+        flusher = threading.Thread(target=self.events.flush)
+        flusher.start()
+        flusher.join(timeout=0.5)
+        # This batch waits rather than commit a higher id first.
+        self.assertTrue(flusher.is_alive())
+        self.assertEqual(Job_Event.since(self.db, 0), [])
+
+        transaction.commit()
+        flusher.join(timeout=5)
+        self.assertEqual([event.job_id
+                          for event in Job_Event.since(self.db, 0)], [1, 2])
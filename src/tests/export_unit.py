@@ -0,0 +1,109 @@
+import csv
+import io
+import os
+import tracemalloc
+import unittest
+
+from sqlalchemy import insert
+
+from auth.export import USERS_EXPORT
+from core.database import Database
+from core.export import (CsvEncoder, Export_Report, get_encoder,
+                         stream_export)
+from tests.claim_unit import _seed
+from work.events import event_buffer
+from work.export import JOBS_EXPORT
+from work.models import Jobs
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+# e.g. postgresql+psycopg2://postgres@localhost/final_labz_test
+POSTGRES_URI = os.getenv("TEST_POSTGRES_URI")
+
+
+class TestExport(unittest.TestCase):
+
+    URI = "sqlite://"
+
+    def setUp(self):
+        self.db = Database(self.URI)
+        self.addCleanup(self.db.dispose)
+        self.addCleanup(event_buffer(self.db).stop)
+        _seed(self.db, contractors=2, jobs=25)
+
+    def _export(self, dataset, format, chunk_size=10):
+        report = Export_Report(dataset=dataset.name, format=format)
+        chunks = list(stream_export(self.db, dataset,
+                                    get_encoder(format, dataset.columns),
+                                    chunk_size, report))
+        return b"".join(chunks), chunks, report
+
+    def test_csv_streams_in_chunks(self):
+        data, chunks, report = self._export(JOBS_EXPORT, "csv")
+        rows = list(csv.DictReader(io.StringIO(data.decode())))
+        self.assertEqual(len(rows), 25)
+        self.assertEqual(rows[0]["status"], "UNASSIGNED")
+        self.assertEqual(report.rows, 25)
+        # header, three chunks of at most 10 rows, trailer
+        self.assertEqual(len(chunks), 5)
+        self.assertGreater(report.rows_per_second, 0)
+
+    def test_users_include_role_data(self):
+        data, _, _ = self._export(USERS_EXPORT, "csv")
+        rows = list(csv.DictReader(io.StringIO(data.decode())))
+        self.assertNotIn("password", rows[0])
+        self.assertEqual([row["role"] for row in rows],
+                         ["CLIENT", "CONTRACTOR", "CONTRACTOR"])
+        self.assertEqual(rows[1]["max_active_jobs"], "3")
+
+    @unittest.skipUnless(pyarrow, "pyarrow is not installed")
+    def test_parquet_has_one_row_group_per_chunk(self):
+        import pyarrow.parquet as pq
+
+        data, _, _ = self._export(JOBS_EXPORT, "parquet")
+        table = pq.ParquetFile(io.BytesIO(data))
+        self.assertEqual(table.metadata.num_rows, 25)
+        self.assertEqual(table.metadata.num_row_groups, 3)
+        self.assertEqual(table.read().column("amount").to_pylist()[0], 10.0)
+
+    @unittest.skipUnless(pyarrow, "pyarrow is not installed")
+    def test_arrow_stream_round_trips(self):
+        data, _, _ = self._export(USERS_EXPORT, "arrow")
+        table = pyarrow.ipc.open_stream(data).read_all()
+        self.assertEqual(table.column("email").to_pylist()[0],
+                         "1@example.com")
+
+    def test_memory_does_not_grow_with_table_size(self):
+        def peak(jobs):
+            with self.db.engine.begin() as connection:
+                connection.execute(insert(Jobs.__table__), [
+                    dict(title="bulk", description="x" * 200, poster_id=1,
+                         category="OTHER", amount=1, status="UNASSIGNED")
+                    for _ in range(jobs)])
+            tracemalloc.start()
+            for _ in stream_export(self.db, JOBS_EXPORT,
+                                   CsvEncoder(JOBS_EXPORT.columns), 500):
+                pass
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            return peak
+
+        small = peak(2_000)
+        large = peak(18_000)  # ten times the rows in total
+        self.assertLess(large, small * 2)
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            get_encoder("xlsx", JOBS_EXPORT.columns)
+
+
+@unittest.skipUnless(POSTGRES_URI, "set TEST_POSTGRES_URI to run")
+class TestPostgresExport(TestExport):
+    """
+    The same checks through a Postgres server-side cursor.
+    """
+
+    URI = POSTGRES_URI
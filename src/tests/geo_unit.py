@@ -0,0 +1,200 @@
+import random
+import unittest
+
+from sqlalchemy import insert, select
+
+from auth.enums import CATEGORY_STATES, JOB_STATUS_STATES
+from auth.models import User, Contractor_Additional
+from core import geo
+from core.database import Database
+from tests.claim_unit import _seed
+from work.dispatch import ContractorIndex, DispatchEngine, _Contractor
+from work.events import event_buffer
+from work.models import Jobs
+
+
+def _points(rng: random.Random, count: int, latitude: float,
+            longitude: float, spread: float):
+    return [(latitude + rng.uniform(-spread, spread),
+             (longitude + rng.uniform(-spread, spread) + 180) % 360 - 180)
+            for _ in range(count)]
+
+
+class TestGeo(unittest.TestCase):
+
+    def test_distance_and_geohash(self):
+        # Paris to London, about 344 km.
+        self.assertAlmostEqual(
+            geo.distance_km(48.8566, 2.3522, 51.5074, -0.1278), 343.5,
+            delta=1.0)
+        self.assertEqual(geo.encode(57.64911, 10.40744, 11), "u4pruydqqvj")
+        low, high = geo.prefix_range("u4pz")
+        self.assertEqual((low, high), ("u4pz", "u4q"))
+        self.assertEqual(geo.prefix_range("zz"), ("zz", None))
+
+    def test_covering_cells_contain_every_point_in_range(self):
+        rng = random.Random(3)
+        # Mid latitude, across the antimeridian and next to a pole.
+        for latitude, longitude in ((40.7, -74.0), (-16.5, 179.9),
+                                    (89.5, 30.0)):
+            for radius in (0.5, 20, 400):
+                boxes = geo.bounding_boxes(latitude, longitude, radius)
+                cells = geo.covering_cells(boxes)
+                self.assertLessEqual(len(cells), 16)
+                for point in _points(rng, 300, latitude, longitude,
+                                     radius / geo.KM_PER_DEGREE * 1.5):
+                    point = (max(-90.0, min(90.0, point[0])), point[1])
+                    if geo.distance_km(latitude, longitude,
+                                       *point) > radius:
+                        continue
+                    hashed = geo.encode(*point)
+                    self.assertTrue(any(
+                        hashed.startswith(cell) for cell in cells),
+                        (latitude, longitude, radius, point))
+                    self.assertTrue(any(
+                        low <= point[0] <= high and west <= point[1] <= east
+                        for low, west, high, east in boxes))
+
+    def test_grid_index_matches_brute_force(self):
+        rng = random.Random(5)
+        points = _points(rng, 2000, 52.5, 13.4, 1.0)
+        index = geo.GridIndex(cell_km=5.0)
+        for item, (latitude, longitude) in enumerate(points):
+            index.add(item, latitude, longitude)
+        self.assertEqual(len(index), len(points))
+
+        for latitude, longitude in _points(rng, 20, 52.5, 13.4, 1.0):
+            expected = sorted(
+                (geo.distance_km(latitude, longitude, *point), item)
+                for item, point in enumerate(points)
+                if item % 2 == 0)
+            expected = [hit for hit in expected if hit[0] <= 30][:10]
+            found = index.nearest(latitude, longitude, 10, 30,
+                                  accept=lambda item: item % 2 == 0)
+            self.assertEqual([item for _, item in found],
+                             [item for _, item in expected])
+
+
+class TestNearestJobs(unittest.TestCase):
+
+    def setUp(self):
+        self.db = Database("sqlite://")
+        self.addCleanup(self.db.dispose)
+        self.addCleanup(event_buffer(self.db).stop)
+        _seed(self.db, contractors=1, jobs=0)
+        rng = random.Random(11)
+        self.jobs = {}
+        rows = []
+        for number, (latitude, longitude) in enumerate(
+                _points(rng, 400, 48.85, 2.35, 0.8), start=1):
+            job = dict(id=number, title=f"job {number}", description="",
+                       poster_id=1, amount=number % 50,
+                       category=(CATEGORY_STATES.OTHER if number % 3
+                                 else CATEGORY_STATES.SERVER_SETUP),
+                       status=(JOB_STATUS_STATES.UNASSIGNED if number % 7
+                               else JOB_STATUS_STATES.ASSIGNED),
+                       latitude=latitude, longitude=longitude,
+                       geohash=geo.encode(latitude, longitude))
+            rows.append(job)
+            self.jobs[number] = job
+        # Remote work has no location and is never near anything.
+        rows.append(dict(id=401, title="remote", description="",
+                         poster_id=1, amount=1,
+                         category=CATEGORY_STATES.OTHER,
+                         status=JOB_STATUS_STATES.UNASSIGNED,
+                         latitude=None, longitude=None, geohash=None))
+        with self.db.engine.begin() as connection:
+            connection.execute(insert(Jobs.__table__), rows)
+
+    def _expected(self, latitude, longitude, limit, radius, accept):
+        hits = sorted(
+            (geo.distance_km(latitude, longitude, job["latitude"],
+                             job["longitude"]), number)
+            for number, job in self.jobs.items()
+            if job["status"] == JOB_STATUS_STATES.UNASSIGNED and accept(job))
+        return [number for distance, number in hits
+                if distance <= radius][:limit]
+
+    def test_matches_brute_force(self):
+        for latitude, longitude in _points(random.Random(2), 10, 48.85,
+                                           2.35, 0.8):
+            found = Jobs.nearest(self.db, latitude, longitude, limit=15,
+                                 max_radius_km=40)
+            self.assertEqual([job.id for _, job in found], self._expected(
+                latitude, longitude, 15, 40, lambda job: True))
+            self.assertEqual([distance for distance, _ in found],
+                             sorted(distance for distance, _ in found))
+
+    def test_filters_category_and_amount(self):
+        found = Jobs.nearest(self.db, 48.85, 2.35, limit=400,
+                             max_radius_km=30,
+                             categories=[CATEGORY_STATES.SERVER_SETUP],
+                             max_amount=20)
+        self.assertEqual([job.id for _, job in found], self._expected(
+            48.85, 2.35, 400, 30,
+            lambda job: (job["category"] == CATEGORY_STATES.SERVER_SETUP
+                         and job["amount"] <= 20)))
+
+    def test_location_changes_follow_the_job(self):
+        job = Jobs.get_by_id(self.db, 401)
+        job.update(self.db, {"latitude": 48.85, "longitude": 2.35})
+        found = Jobs.nearest(self.db, 48.85, 2.35, limit=1)
+        self.assertEqual(found[0][1].id, 401)
+        self.assertEqual(found[0][1].geohash, geo.encode(48.85, 2.35))
+
+
+class TestServiceAreaDispatch(unittest.TestCase):
+
+    def test_index_keeps_jobs_within_service_areas(self):
+        paris = _Contractor(1, capacity=5, max_amount=None, load=0,
+                            latitude=48.85, longitude=2.35, radius_km=20)
+        lyon = _Contractor(2, capacity=5, max_amount=None, load=0,
+                           latitude=45.76, longitude=4.84, radius_km=20)
+        index = ContractorIndex([paris, lyon], {})
+
+        self.assertEqual(
+            index.take(CATEGORY_STATES.OTHER, 10, 48.9, 2.3).id, 1)
+        self.assertEqual(
+            index.take(CATEGORY_STATES.OTHER, 10, 45.7, 4.9).id, 2)
+        self.assertIsNone(index.take(CATEGORY_STATES.OTHER, 10, 43.3, 5.4))
+        # Remote work goes to anyone.
+        self.assertIsNotNone(index.take(CATEGORY_STATES.OTHER, 10))
+
+    def test_contractors_without_area_take_on_site_jobs(self):
+        paris = _Contractor(1, capacity=1, max_amount=None, load=0,
+                            latitude=48.85, longitude=2.35, radius_km=20)
+        anywhere = _Contractor(2, capacity=5, max_amount=None, load=0)
+        index = ContractorIndex([paris, anywhere], {})
+
+        self.assertEqual(
+            index.take(CATEGORY_STATES.OTHER, 10, 48.86, 2.34).id, 1)
+        # Paris is full now.
+        self.assertEqual(
+            index.take(CATEGORY_STATES.OTHER, 10, 48.86, 2.34).id, 2)
+        self.assertEqual(
+            index.take(CATEGORY_STATES.OTHER, 10, 43.3, 5.4).id, 2)
+
+    def test_cycle_respects_service_areas(self):
+        db = Database("sqlite://")
+        self.addCleanup(db.dispose)
+        self.addCleanup(event_buffer(db).stop)
+        _seed(db, contractors=1, jobs=0)
+        _, before, _ = User.get_validators(db, 2)
+        Contractor_Additional.set_service_area(db, 2, 2, 48.85, 2.35, 20)
+        # The user's representation includes the area.
+        self.assertNotEqual(User.get_validators(db, 2)[1], before)
+        self.assertEqual(Contractor_Additional.dispatch_profile(db, 2), {
+            "latitude": 48.85, "longitude": 2.35, "service_radius_km": 20,
+            "max_job_amount": None, "skills": []})
+        poster = User.get_by_id(db, 1).additional
+        for number, (latitude, longitude) in enumerate(
+                ((48.86, 2.34), (43.3, 5.4), (None, None)), start=1):
+            Jobs(title=f"job {number}", description="", status="UNASSIGNED",
+                 category="OTHER", amount=10, poster=poster,
+                 latitude=latitude, longitude=longitude).create(db)
+
+        DispatchEngine(db).run_cycle()
+        with db.engine.connect() as connection:
+            taken = dict(connection.execute(
+                select(Jobs.id, Jobs.taken_by_user_id)).all())
+        self.assertEqual(taken, {1: 2, 2: None, 3: 2})
@@ -0,0 +1,178 @@
+import asyncio
+import unittest
+from datetime import datetime, timedelta
+
+import httpx
+from fastapi import FastAPI, HTTPException, Request
+from starlette.datastructures import Headers
+
+from core.config import JsonRender
+from core.database import Database, ModelBase
+from core.idempotency import Idempotency_Key, IdempotencyMiddleware
+from core.negotiation import (MSGPACK, NegotiationMiddleware, load_msgpack,
+                              msgpack_available)
+
+RULES = [(("POST",), r"/work$", "idempotent")]
+
+
+class TestIdempotencyKeys(unittest.TestCase):
+
+    def setUp(self):
+        self.db = Database("sqlite://")
+        ModelBase.metadata.create_all(
+            self.db.engine, tables=[Idempotency_Key.__table__])
+        self.runs = 0
+        self.fail = False
+        self.gate = None
+
+        app = FastAPI()
+
+        @app.post("/work")
+        async def work(request: Request):
+            self.runs += 1
+            if self.gate is not None:
+                await self.gate.wait()
+            if self.fail:
+                raise HTTPException(status_code=500, detail="broken")
+            return {"run": self.runs, "body": (await request.json())}
+
+        self.app = app
+
+    def tearDown(self):
+        self.db.dispose()
+
+    def _worker(self, wait: float = 5.0):
+        return IdempotencyMiddleware(self.app, self.db, "secret", RULES,
+                                     wait=wait)
+
+    def _post(self, worker, *requests):
+        """
+        Sends (key, body, headers) requests to `worker` concurrently.
+        """
+        async def run():
+            transport = httpx.ASGITransport(app=worker)
+            async with httpx.AsyncClient(transport=transport,
+                                         base_url="http://test") as client:
+                async def post(key, body, headers=None):
+                    headers = dict(headers or {})
+                    if key is not None:
+                        headers["Idempotency-Key"] = key
+                    return await client.post("/work", json=body,
+                                             headers=headers)
+                tasks = [asyncio.ensure_future(post(*request))
+                         for request in requests]
+                if self.gate is not None:
+                    await asyncio.sleep(0.1)
+                    self.gate.set()
+                return await asyncio.gather(*tasks)
+        return asyncio.run(run())
+
+    def test_retries_replay_the_first_response(self):
+        worker = self._worker()
+        first, = self._post(worker, ("a", {"n": 1}))
+        second, = self._post(worker, ("a", {"n": 1}))
+        self.assertEqual(self.runs, 1)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second.headers["idempotent-replayed"], "true")
+        self.assertNotIn("idempotent-replayed", first.headers)
+
+    def test_requests_without_a_key_always_run(self):
+        worker = self._worker()
+        self._post(worker, (None, {"n": 1}), (None, {"n": 1}))
+        self.assertEqual(self.runs, 2)
+
+    def test_reused_key_with_another_body_is_refused(self):
+        worker = self._worker()
+        self._post(worker, ("a", {"n": 1}))
+        response, = self._post(worker, ("a", {"n": 2}))
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.runs, 1)
+
+    def test_concurrent_duplicates_wait_for_the_first(self):
+        self.gate = asyncio.Event()
+        responses = self._post(self._worker(),
+                               *[("a", {"n": 1})] * 3)
+        self.assertEqual(self.runs, 1)
+        self.assertEqual({response.content for response in responses},
+                         {responses[0].content})
+
+    def test_waits_are_bounded(self):
+        self.gate = asyncio.Event()
+        worker = self._worker(wait=0.05)
+        first, second = self._post(worker, ("a", {"n": 1}),
+                                   ("a", {"n": 1}))
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 409)
+        self.assertIn("retry-after", second.headers)
+
+    def test_server_errors_are_not_kept(self):
+        worker = self._worker()
+        self.fail = True
+        first, = self._post(worker, ("a", {"n": 1}))
+        self.fail = False
+        second, = self._post(worker, ("a", {"n": 1}))
+        self.assertEqual(first.status_code, 500)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(self.runs, 2)
+
+    def test_workers_share_responses_through_the_table(self):
+        first, = self._post(self._worker(), ("a", {"n": 1}))
+        second, = self._post(self._worker(), ("a", {"n": 1}))
+        self.assertEqual(self.runs, 1)
+        self.assertEqual(second.content, first.content)
+
+    def test_keys_are_scoped_to_credentials(self):
+        worker = self._worker()
+        self._post(worker, ("a", {"n": 1}, {"Authorization": "Bearer x"}))
+        self._post(worker, ("a", {"n": 1}, {"Authorization": "Bearer y"}))
+        self.assertEqual(self.runs, 2)
+
+    @unittest.skipUnless(msgpack_available(), "msgpack is not installed")
+    def test_replays_follow_the_retry_accept_header(self):
+        @self.app.post("/rendered/work", response_class=JsonRender)
+        async def rendered(request: Request):
+            self.runs += 1
+            return {"run": self.runs}
+
+        worker = NegotiationMiddleware(IdempotencyMiddleware(
+            self.app, self.db, "secret", [(("POST",), r"/rendered/work$",
+                                           "idempotent")]))
+
+        async def run():
+            transport = httpx.ASGITransport(app=worker)
+            async with httpx.AsyncClient(transport=transport,
+                                         base_url="http://test") as client:
+                return [await client.post(
+                    "/rendered/work", json={}, headers={
+                        "Idempotency-Key": "a", "Accept": accept})
+                    for accept in (MSGPACK, "application/json", MSGPACK)]
+        packed, plain, repacked = asyncio.run(run())
+
+        self.assertEqual(self.runs, 1)
+        self.assertEqual(packed.headers["content-type"], MSGPACK)
+        self.assertEqual(load_msgpack(packed.content),
+                         {"data": {"run": 1}})
+        self.assertEqual(plain.headers["content-type"], "application/json")
+        self.assertEqual(plain.json(), {"data": {"run": 1}})
+        self.assertEqual(repacked.content, packed.content)
+
+    def test_abandoned_claims_expire(self):
+        worker = self._worker(wait=0.05)
+        key = worker._key({"method": "POST", "path": "/work"},
+                          Headers(), "a")
+        with self.db.get_db() as session:
+            session.add(Idempotency_Key(
+                key=key, fingerprint="-",
+                expires_on=datetime.utcnow() - timedelta(seconds=1)))
+            session.commit()
+        response, = self._post(worker, ("a", {"n": 1}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.runs, 1)
+        self.assertEqual(Idempotency_Key.purge_expired(self.db), 0)
+
+        with self.db.get_db() as session:
+            session.query(Idempotency_Key).update(
+                {"expires_on": datetime.utcnow() - timedelta(seconds=1)})
+            session.commit()
+        self.assertEqual(Idempotency_Key.purge_expired(self.db), 1)
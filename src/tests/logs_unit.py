@@ -0,0 +1,143 @@
+import io
+import json
+import logging
+import threading
+import unittest
+from time import perf_counter
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from core.logs import (REDACTED, RequestIdMiddleware, configure_logging,
+                       redact, request_id, stop_logging)
+
+logger = logging.getLogger("tests.logs")
+
+
+class _BlockingStream(io.StringIO):
+    """
+    A log sink that stalls until released, like a full pipe.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def write(self, text):
+        self.release.wait(5)
+        return super().write(text)
+
+
+class TestRedaction(unittest.TestCase):
+
+    def test_sensitive_fields_and_text(self):
+        self.assertEqual(redact({"password": "hunter2", "user": 1,
+                                 "nested": {"refresh_token": "x"}}),
+                         {"password": REDACTED, "user": 1,
+                          "nested": {"refresh_token": REDACTED}})
+        self.assertEqual(redact("Authorization: Bearer abc.def-1"),
+                         f"Authorization: Bearer {REDACTED}")
+        self.assertEqual(redact("jwt eyJhbGciOi.eyJzdWIiOjF9.c2ln ok"),
+                         f"jwt {REDACTED} ok")
+        self.assertEqual(redact("hash $argon2id$v=19$m=65536$salt$hash"),
+                         f"hash {REDACTED}")
+        self.assertEqual(redact("login password=hunter2&user=1"),
+                         f"login password={REDACTED}&user=1")
+
+
+class TestStructuredLogging(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(stop_logging)
+
+    def _lines(self, stream):
+        stop_logging()
+        return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    def test_records_carry_fields_and_request_id(self):
+        stream = io.StringIO()
+        configure_logging("DEBUG", stream=stream)
+        token = request_id.set("req-1")
+        try:
+            logger.info("user %s signed in", 7,
+                        extra={"user_id": 7, "token": "secret"})
+        finally:
+            request_id.reset(token)
+        try:
+            raise RuntimeError("password=hunter2")
+        except RuntimeError:
+            logger.exception("failed")
+
+        first, second = self._lines(stream)
+        self.assertEqual(first["message"], "user 7 signed in")
+        self.assertEqual(first["request_id"], "req-1")
+        self.assertEqual(first["user_id"], 7)
+        self.assertEqual(first["token"], REDACTED)
+        self.assertEqual(second["level"], "ERROR")
+        self.assertIn("RuntimeError", second["exc"])
+        self.assertNotIn("hunter2", second["exc"])
+
+    def test_sampling(self):
+        stream = io.StringIO()
+        configure_logging("DEBUG", stream=stream,
+                          sample_rates={"tests": 0.0})
+        for _ in range(100):
+            logger.info("noisy")
+            logging.getLogger("other").info("kept", extra={
+                "sample_rate": 0.0})
+        logger.warning("important")
+        logging.getLogger("testsuite").info("not a tests logger")
+
+        lines = self._lines(stream)
+        self.assertEqual([line["message"] for line in lines],
+                         ["important", "not a tests logger"])
+
+    def test_slow_sink_never_blocks_the_caller(self):
+        stream = _BlockingStream()
+        configure_logging("INFO", queue_size=10, stream=stream)
+        started = perf_counter()
+        for number in range(1000):
+            logger.info("record %d", number)
+        elapsed = perf_counter() - started
+        stream.release.set()
+
+        lines = self._lines(stream)
+        self.assertLess(elapsed, 1.0)
+        self.assertLess(len(lines), 1000)
+        self.assertTrue(any(line["message"].startswith(
+            "log queue full; dropped") for line in lines))
+
+    def test_stop_restores_previous_handlers(self):
+        root = logging.getLogger()
+        handlers = root.handlers[:]
+        configure_logging(stream=io.StringIO())
+        stop_logging()
+        self.assertEqual(root.handlers, handlers)
+
+
+class TestRequestIds(unittest.TestCase):
+
+    def setUp(self):
+        app = FastAPI()
+
+        @app.get("/")
+        async def index():
+            return {"request_id": request_id.get()}
+
+        self.client = TestClient(RequestIdMiddleware(app))
+
+    def test_new_id_per_request(self):
+        first = self.client.get("/")
+        second = self.client.get("/")
+        self.assertEqual(first.json()["request_id"],
+                         first.headers["x-request-id"])
+        self.assertNotEqual(first.headers["x-request-id"],
+                            second.headers["x-request-id"])
+
+    def test_caller_id_is_kept_when_plausible(self):
+        response = self.client.get("/", headers={"X-Request-ID": "abc-123"})
+        self.assertEqual(response.json()["request_id"], "abc-123")
+        response = self.client.get("/", headers={
+            "X-Request-ID": "bad id\" injected"})
+        self.assertNotEqual(response.json()["request_id"],
+                            "bad id\" injected")
@@ -0,0 +1,134 @@
+import importlib.util
+import threading
+import unittest
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from core.config import JsonRender
+from core.negotiation import (NegotiationMiddleware, accepted_encoding,
+                              accepted_media_type, negotiated_format)
+
+JOBS = [{"id": id, "title": f"job {id}", "description": "Synthetic job",
+         "status": "UNASSIGNED", "amount": 10.5} for id in range(200)]
+
+
+def _app():
+    app = FastAPI()
+
+    @app.get("/jobs", response_class=JsonRender)
+    async def jobs():
+        return JOBS
+
+    @app.get("/small", response_class=JsonRender)
+    async def small():
+        return {"status": "200"}
+
+    @app.get("/stream")
+    async def stream():
+        return StreamingResponse(iter([b"a,b\n" * 1000] * 3),
+                                 media_type="text/csv")
+
+    return app
+
+
+class TestAcceptHeaders(unittest.TestCase):
+
+    def test_media_type_preference(self):
+        offered = ("application/json", "application/msgpack")
+        self.assertEqual(accepted_media_type(None, offered),
+                         "application/json")
+        self.assertEqual(accepted_media_type("*/*", offered),
+                         "application/json")
+        self.assertEqual(accepted_media_type(
+            "application/json;q=0.5, application/msgpack", offered),
+            "application/msgpack")
+        self.assertEqual(accepted_media_type(
+            "application/*;q=0.2, application/json", offered),
+            "application/json")
+        self.assertIsNone(accepted_media_type("text/html", offered))
+
+    def test_encoding_preference(self):
+        offered = ("br", "gzip")
+        self.assertIsNone(accepted_encoding(None, offered))
+        self.assertEqual(accepted_encoding("gzip, br", offered), "br")
+        self.assertEqual(accepted_encoding("gzip, br;q=0.5", offered),
+                         "gzip")
+        self.assertEqual(accepted_encoding("*, br;q=0", offered), "gzip")
+        self.assertIsNone(accepted_encoding("identity", offered))
+
+    @unittest.skipUnless(importlib.util.find_spec("msgpack"),
+                         "msgpack is not installed")
+    def test_msgpack_only_when_preferred(self):
+        self.assertEqual(negotiated_format("application/msgpack"), "msgpack")
+        self.assertEqual(negotiated_format("application/x-msgpack, */*;q=0.1"),
+                         "msgpack")
+        self.assertEqual(negotiated_format("*/*"), "json")
+        self.assertEqual(negotiated_format(
+            "application/json, application/msgpack"), "json")
+
+
+class TestNegotiationMiddleware(unittest.TestCase):
+
+    def setUp(self):
+        self.middleware = NegotiationMiddleware(_app(), minimum_size=1024)
+        self.client = TestClient(self.middleware)
+
+    def _get(self, path, **headers):
+        headers.setdefault("accept-encoding", "identity")
+        return self.client.get(path, headers=headers)
+
+    def test_large_bodies_are_gzipped(self):
+        plain = self._get("/jobs")
+        response = self._get("/jobs", **{"accept-encoding": "gzip"})
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response.headers["vary"])
+        self.assertEqual(response.json(), {"data": JOBS})
+        self.assertLess(response.num_bytes_downloaded,
+                        plain.num_bytes_downloaded / 4)
+        self.assertEqual(int(response.headers["content-length"]),
+                         response.num_bytes_downloaded)
+
+    def test_small_and_identity_bodies_are_sent_as_they_are(self):
+        small = self._get("/small", **{"accept-encoding": "gzip"})
+        self.assertNotIn("content-encoding", small.headers)
+        self.assertEqual(small.json(), {"data": {"status": "200"}})
+        self.assertNotIn("content-encoding", self._get("/jobs").headers)
+
+    def test_streamed_responses_pass_through(self):
+        response = self._get("/stream", **{"accept-encoding": "gzip"})
+        self.assertNotIn("content-encoding", response.headers)
+        self.assertEqual(len(response.content), 12000)
+
+    def test_large_bodies_are_compressed_off_the_event_loop(self):
+        threads = []
+        compress = self.middleware.encoders["gzip"]
+
+        def recording(body):
+            threads.append(threading.current_thread())
+            return compress(body)
+
+        self.middleware.encoders["gzip"] = recording
+        self._get("/jobs", **{"accept-encoding": "gzip"})
+        self.middleware.thread_size = 1 << 30
+        self._get("/jobs", **{"accept-encoding": "gzip"})
+        self.assertNotEqual(threads[0], threads[1])
+
+    @unittest.skipUnless(importlib.util.find_spec("brotli"),
+                         "brotli is not installed")
+    def test_brotli_is_preferred(self):
+        response = self._get("/jobs", **{"accept-encoding": "gzip, br"})
+        self.assertEqual(response.headers["content-encoding"], "br")
+        self.assertEqual(response.json(), {"data": JOBS})
+
+    @unittest.skipUnless(importlib.util.find_spec("msgpack"),
+                         "msgpack is not installed")
+    def test_msgpack_representation(self):
+        import msgpack
+        response = self._get("/jobs", accept="application/msgpack")
+        self.assertEqual(response.headers["content-type"],
+                         "application/msgpack")
+        self.assertIn("Accept", response.headers["vary"])
+        self.assertEqual(msgpack.unpackb(response.content), {"data": JOBS})
+        self.assertEqual(self._get("/jobs").json(), {"data": JOBS})
@@ -0,0 +1,62 @@
+import unittest
+from unittest.mock import patch
+
+from core.ratelimit import MemoryRateLimitBackend, RateLimiter
+
+
+class TestMemoryRateLimitBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        clock = patch("core.ratelimit.monotonic", lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+        self.backend = MemoryRateLimitBackend(shards=4, max_keys=8)
+
+    def test_allows_up_to_limit_then_rejects(self):
+        results = [self.backend.hit("ip:1", limit=3, period=60)
+                   for _ in range(4)]
+
+        self.assertEqual(results[:3], [0.0, 0.0, 0.0])
+        self.assertAlmostEqual(results[3], 20.0)
+
+    def test_refills_over_time(self):
+        for _ in range(3):
+            self.backend.hit("ip:1", limit=3, period=60)
+
+        self.now += 20
+        self.assertEqual(self.backend.hit("ip:1", limit=3, period=60), 0.0)
+        self.assertGreater(self.backend.hit("ip:1", limit=3, period=60), 0)
+
+    def test_keys_are_independent(self):
+        for _ in range(3):
+            self.backend.hit("ip:1", limit=3, period=60)
+
+        self.assertEqual(self.backend.hit("ip:2", limit=3, period=60), 0.0)
+
+    def test_memory_is_bounded(self):
+        for index in range(1000):
+            self.backend.hit(f"ip:{index}", limit=3, period=60)
+
+        self.assertLessEqual(len(self.backend), 8)
+
+    def test_idle_buckets_expire(self):
+        backend = MemoryRateLimitBackend(shards=1)
+        backend.hit("ip:1", limit=3, period=60)
+        self.now += 61
+        backend.hit("ip:2", limit=3, period=60)
+
+        self.assertEqual(len(backend), 1)
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_scopes_do_not_share_buckets(self):
+        limiter = RateLimiter(MemoryRateLimitBackend())
+        for _ in range(2):
+            limiter.check("login:email", "a@example.com", 2, 60)
+
+        self.assertGreater(
+            limiter.check("login:email", "a@example.com", 2, 60), 0)
+        self.assertEqual(
+            limiter.check("register:email", "a@example.com", 2, 60), 0)
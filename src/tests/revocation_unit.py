@@ -0,0 +1,110 @@
+import unittest
+from datetime import datetime, timedelta
+
+from auth.models import Refresh_Token, User
+from auth.revocation import BloomFilter, RevocationIndex
+from core.database import Database, ModelBase
+
+
+class TestBloomFilter(unittest.TestCase):
+
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(capacity=1000)
+        items = [f"jti-{index}" for index in range(1000)]
+        for item in items:
+            bloom.add(item)
+
+        self.assertTrue(all(item in bloom for item in items))
+
+    def test_false_positive_rate_is_bounded(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for index in range(1000):
+            bloom.add(f"jti-{index}")
+
+        hits = sum(f"other-{index}" in bloom for index in range(10000))
+        self.assertLess(hits, 300)
+
+
+class TestRevocationIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.db = Database("sqlite://")
+        ModelBase.metadata.create_all(self.db.engine)
+        self.addCleanup(self.db.dispose)
+
+        user = User("Test", "test@example.com")
+        user.password = "unused"
+        with self.db.get_db() as session:
+            session.add(user)
+            session.commit()
+            self.user_id = user.id
+
+    def _issue(self, jti: str, family: str = "family") -> Refresh_Token:
+        now = datetime.utcnow()
+        token = Refresh_Token(jti, family, self.user_id, now,
+                              now + timedelta(days=14))
+        token.create(self.db)
+        return token
+
+    def test_local_add_is_visible_immediately(self):
+        index = RevocationIndex()
+        index.add("a" * 32, datetime.utcnow() + timedelta(days=1))
+
+        self.assertTrue(index.is_revoked("a" * 32))
+        self.assertFalse(index.is_revoked("b" * 32))
+
+    def test_sync_picks_up_other_workers_revocations(self):
+        worker = RevocationIndex()
+        worker.sync(self.db)
+        self._issue("first")
+        self._issue("second", family="other")
+
+        Refresh_Token.revoke(self.db, family="family")
+        worker.sync(self.db)
+        self.assertTrue(worker.is_revoked("first"))
+        self.assertFalse(worker.is_revoked("second"))
+
+        Refresh_Token.revoke(self.db, user_id=self.user_id)
+        worker.sync(self.db)
+        self.assertTrue(worker.is_revoked("second"))
+
+    def test_rotation_detects_reuse(self):
+        self._issue("current")
+        now = datetime.utcnow()
+        successor = Refresh_Token("next", "family", self.user_id, now,
+                                  now + timedelta(days=14))
+
+        self.assertTrue(Refresh_Token.rotate(self.db, "current", successor))
+        reused = Refresh_Token("again", "family", self.user_id, now,
+                               now + timedelta(days=14))
+        self.assertFalse(Refresh_Token.rotate(self.db, "current", reused))
+
+    def test_expired_tokens_are_purged(self):
+        self._issue("live")
+        now = datetime.utcnow()
+        Refresh_Token("expired", "family", self.user_id,
+                      now - timedelta(days=15),
+                      now - timedelta(days=1)).create(self.db)
+
+        self.assertEqual(Refresh_Token.purge_expired(self.db), 1)
+        self.assertIsNone(Refresh_Token.get_by_jti(self.db, "expired"))
+        self.assertIsNotNone(Refresh_Token.get_by_jti(self.db, "live"))
+
+    def test_expired_entries_are_pruned(self):
+        index = RevocationIndex(capacity=4)
+        index.add("expired", datetime.utcnow() - timedelta(seconds=1))
+        index.add("live", datetime.utcnow() + timedelta(days=1))
+
+        index.prune()
+        self.assertEqual(len(index), 1)
+        self.assertFalse(index.is_revoked("expired"))
+        self.assertTrue(index.is_revoked("live"))
+
+    def test_bloom_grows_with_the_exact_set(self):
+        index = RevocationIndex(capacity=2)
+        expires = datetime.utcnow() + timedelta(days=1)
+        for number in range(50):
+            index.add(f"jti-{number}", expires)
+
+        self.assertTrue(all(index.is_revoked(f"jti-{number}")
+                            for number in range(50)))
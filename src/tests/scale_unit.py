@@ -0,0 +1,216 @@
+import os
+import shutil
+import tempfile
+import unittest
+from contextlib import contextmanager
+from statistics import median
+from time import perf_counter
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event, func, select
+
+from auth.crud import TokenHandler
+from auth.enums import JOB_STATUS_STATES, USER_ROLES
+from auth.models import User, Additional
+from core.database import Database, ModelBase, database
+from seed import generate
+from work.events import event_buffer
+from work.models import Jobs
+
+SCALE_USERS = int(os.getenv("SCALE_TEST_USERS", "20000"))
+SCALE_JOBS = int(os.getenv("SCALE_TEST_JOBS", "100000"))
+# Median wall time allowed per request, checked only when set: timings
+# depend on the machine and on what else runs, while the statement
+# budgets below already catch accidental full scans and N+1 queries.
+LATENCY_BUDGET_MS = (float(os.environ["SCALE_LATENCY_BUDGET_MS"])
+                     if os.getenv("SCALE_LATENCY_BUDGET_MS") else None)
+
+
+class TestEndpointsAtScale(unittest.TestCase):
+    """
+    Runs the main read and write endpoints against SCALE_USERS users and
+    SCALE_JOBS jobs (seed.generate in a SQLite file) and checks each stays
+    within a SQL statement budget (and LATENCY_BUDGET_MS, if set).
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        uri = f"sqlite:///{cls.directory}/scale.db"
+        seeder = Database(uri)
+        ModelBase.metadata.create_all(seeder.engine)
+        generate(seeder, SCALE_USERS, SCALE_JOBS)
+        seeder.dispose()
+
+        # The routes use the application's database object.
+        cls.previous_uri = database.uri
+        database.dispose()
+        database.uri = uri
+        cls.client = TestClient(__import__("api.main").main.app,
+                                base_url="https://testserver")
+
+        users = User.__table__
+        additional = Additional.__table__
+        with database.get_db() as session:
+            def first(role, *conditions):
+                return session.execute(
+                    select(users.c.id, additional.c.id)
+                    .join(additional, additional.c.user_id == users.c.id)
+                    .where(users.c.type == role, *conditions)
+                    .order_by(users.c.id).limit(1)).first()
+
+            cls.admin, _ = first(USER_ROLES.ADMIN)
+            posters = select(Jobs.poster_id).group_by(Jobs.poster_id)\
+                .having(func.count(Jobs.id) > 1)
+            cls.client_user, cls.client_additional = first(
+                USER_ROLES.CLIENT, additional.c.id.in_(posters))
+            cls.contractor, _ = first(USER_ROLES.CONTRACTOR)
+            cls.job_id = session.execute(
+                select(Jobs.id).where(Jobs.poster_id == cls.client_additional)
+            ).scalar()
+
+    @classmethod
+    def tearDownClass(cls):
+        event_buffer(database).stop()
+        database.dispose()
+        database.uri = cls.previous_uri
+        shutil.rmtree(cls.directory, ignore_errors=True)
+
+    def _auth(self, user_id: int) -> dict:
+        refresh = TokenHandler.encode_token(user_id, "Refresh")
+        access = TokenHandler.encode_token(user_id, "Access")
+        return dict(headers={"Authorization": f"Bearer {access.token}"},
+                    cookies={"Authorization": refresh.token})
+
+    @contextmanager
+    def _count_queries(self):
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(database.engine, "before_cursor_execute", count)
+        try:
+            yield statements
+        finally:
+            event.remove(database.engine, "before_cursor_execute", count)
+
+    def _check(self, method, path, user_id, query_budget, runs=5,
+               warm_up=True, **kwargs):
+        """
+        Requests `path` `runs` times (after one unmeasured request that
+        fills caches) and checks every run issues at most `query_budget`
+        SQL statements and, when LATENCY_BUDGET_MS is set, the median run
+        is within it.
+        """
+        auth = self._auth(user_id)
+        self.client.cookies = auth["cookies"]
+        if warm_up:
+            self.client.request(method, path, headers=auth["headers"],
+                                **kwargs)
+
+        timings, counts = [], []
+        for _ in range(runs):
+            with self._count_queries() as statements:
+                started = perf_counter()
+                response = self.client.request(
+                    method, path, headers=auth["headers"], **kwargs)
+                timings.append((perf_counter() - started) * 1000)
+            counts.append(len(statements))
+            self.assertLess(response.status_code, 400, response.text)
+
+        self.assertLessEqual(max(counts), query_budget, path)
+        if LATENCY_BUDGET_MS is not None:
+            self.assertLess(median(timings), LATENCY_BUDGET_MS, path)
+        return response
+
+    def test_own_profile(self):
+        # Validators (user row, jobs fingerprint), then the user graph.
+        self._check("GET", "/auth/retrieve_user", self.client_user, 4)
+
+    def test_profile_as_admin(self):
+        self._check("GET", f"/auth/retrieve_user/{self.client_user}",
+                    self.admin, 6)
+
+    def test_posted_jobs(self):
+        response = self._check("GET", "/bookings/retrieve_jobs",
+                               self.client_user, 2)
+        self.assertGreater(len(response.json()["data"]), 1)
+
+    def test_job_detail(self):
+        self._check("GET", f"/bookings/retrieve_job/{self.job_id}",
+                    self.contractor, 2)
+
+    def test_users_by_id(self):
+        # One batch query for all 100, however many there are.
+        ids = ",".join(str(id) for id in range(1, 101))
+        response = self._check(
+            "GET", f"/auth/retrieve_users_by_id?ids={ids}", self.contractor,
+            2)
+        self.assertEqual(len(response.json()["data"]["users"]), 100)
+
+    def test_jobs_by_id(self):
+        ids = ",".join(str(id)
+                       for id in range(self.job_id, self.job_id + 100))
+        response = self._check(
+            "GET", f"/bookings/retrieve_jobs_by_id?ids={ids}",
+            self.contractor, 2)
+        self.assertEqual(len(response.json()["data"]["jobs"]), 100)
+
+    def test_marketplace_stats(self):
+        response = self._check("GET", "/bookings/stats", self.admin, 5)
+        self.assertEqual(response.json()["data"]["jobs"], SCALE_JOBS)
+
+    def test_history(self):
+        self._check("GET", "/bookings/history", self.client_user, 3)
+
+    def test_change_feed(self):
+        self._check("GET", "/bookings/events?cursor=0&limit=500",
+                    self.admin, 3)
+
+    def test_claim(self):
+        response = self._check("POST", "/bookings/claim_job",
+                               self.contractor, 4, warm_up=False, json={})
+        self.assertEqual(response.json()["data"]["status"], "200")
+
+
+class TestSeedGenerator(unittest.TestCase):
+
+    def setUp(self):
+        self.db = Database("sqlite://")
+        ModelBase.metadata.create_all(self.db.engine)
+        self.addCleanup(self.db.dispose)
+
+    def test_covers_every_role_and_status(self):
+        counts = generate(self.db, users=500, jobs=1000)
+        self.assertEqual(counts["user"], 500)
+        self.assertEqual(counts["jobs"], 1000)
+
+        with self.db.get_db() as session:
+            roles = set(session.execute(select(User.type).distinct())
+                        .scalars())
+            statuses = set(session.execute(select(Jobs.status).distinct())
+                           .scalars())
+            # Open jobs have no contractor; every other job has one.
+            unassigned_taken = session.execute(
+                select(func.count(Jobs.id)).where(
+                    Jobs.status == JOB_STATUS_STATES.UNASSIGNED,
+                    Jobs.taken_by_user_id.isnot(None))).scalar()
+            # Active users' additional rows carry their role.
+            mismatched = session.execute(
+                select(func.count(User.id)).join(
+                    Additional, Additional.user_id == User.id).where(
+                    User.type.notin_((USER_ROLES.INACTIVE,
+                                      USER_ROLES.REMOVED)),
+                    Additional.type != User.type)).scalar()
+        self.assertEqual(roles, set(USER_ROLES))
+        self.assertEqual(statuses, set(JOB_STATUS_STATES))
+        self.assertEqual(unassigned_taken, 0)
+        self.assertEqual(mismatched, 0)
+
+    def test_appends_after_existing_rows(self):
+        generate(self.db, users=10, jobs=10)
+        counts = generate(self.db, users=10, jobs=10, seed=1)
+        self.assertEqual(counts["user"], 10)
+        self.assertEqual(User.get_by_id(self.db, 20).email,
+                         "user20@seed.example.com")
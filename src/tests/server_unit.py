@@ -0,0 +1,40 @@
+import unittest
+from unittest.mock import patch
+
+from sqlalchemy import text
+
+import server
+from core.database import Database
+
+
+class TestLauncher(unittest.TestCase):
+
+    def test_worker_count(self):
+        with patch.object(server, "usable_cpus", return_value=64):
+            self.assertEqual(server.worker_count(None, maximum=16), 16)
+            self.assertEqual(server.worker_count(3, maximum=16), 3)
+        with patch.object(server, "usable_cpus", return_value=2):
+            self.assertEqual(server.worker_count(None, maximum=16), 2)
+        self.assertEqual(server.worker_count(-1), 1)
+
+    def test_gunicorn_options(self):
+        options = server.gunicorn_options("127.0.0.1:9000", 4)
+        self.assertTrue(options["preload_app"])
+        self.assertEqual(options["workers"], 4)
+        self.assertGreater(options["max_requests"], 0)
+        self.assertIsInstance(options["graceful_timeout"], int)
+        worker = options["worker_class"]
+        self.assertEqual(worker.CONFIG_KWARGS["loop"], server.event_loop())
+        self.assertIn(server.http_protocol(), ("httptools", "h11"))
+
+    def test_reset_after_fork_keeps_the_parents_connections(self):
+        db = Database("sqlite://")
+        parent = db.engine
+        connection = parent.connect()
+        self.addCleanup(connection.close)
+
+        db.reset_after_fork()
+        self.assertIsNot(db.engine, parent)
+        # The inherited connection was left alone, not closed.
+        self.assertEqual(connection.execute(text("SELECT 1")).scalar(), 1)
+        db.dispose()
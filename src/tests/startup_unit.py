@@ -0,0 +1,20 @@
+import os
+import unittest
+
+from benchmarks.import_time import measure_import
+
+
+class TestStartupImport(unittest.TestCase):
+    """
+    Guards worker boot time: importing the app must not pull in the
+    dependencies that are only needed on first use.
+    """
+
+    def test_deferred_modules_not_imported(self):
+        result = measure_import("api.main")
+        self.assertEqual(result["loaded"], [])
+
+    def test_import_within_budget(self):
+        budget = float(os.getenv("IMPORT_BUDGET_MS", "3000"))
+        result = measure_import("api.main")
+        self.assertLess(result["seconds"] * 1000, budget)
@@ -0,0 +1,76 @@
+import unittest
+
+from sqlalchemy import text
+
+from auth.enums import JOB_STATUS_STATES
+from core.database import Database
+from tests.claim_unit import POSTGRES_URI, _seed
+from work.dispatch import DispatchEngine
+from work.events import event_buffer
+from work.models import Jobs, Job_Stat
+from work.stats import _REBUILD_LOCK_KEY, job_stats, rebuild_job_stats
+
+
+class TestJobStats(unittest.TestCase):
+
+    def setUp(self):
+        self.db = Database("sqlite://")
+        self.addCleanup(self.db.dispose)
+        self.events = event_buffer(self.db)
+        self.addCleanup(self.events.stop)
+        _seed(self.db, contractors=2, jobs=6)
+
+    def test_first_read_builds_the_summary(self):
+        summary = job_stats(self.db)
+        self.assertEqual(summary["jobs"], 6)
+        self.assertEqual(summary["amount_total"], 60)
+        self.assertEqual(summary["amount_average"], 10)
+        self.assertEqual(summary["by_status"]["UNASSIGNED"]["jobs"], 6)
+        self.assertEqual(summary["active_by_contractor"], {})
+
+    def test_incremental_counters_match_a_rebuild(self):
+        rebuild_job_stats(self.db)
+
+        Jobs.claim(self.db, 2, job_id=1)
+        job = Jobs.get_by_id(self.db, 1)
+        job.transition(self.db, JOB_STATUS_STATES.IN_PROGRESS)
+        job.transition(self.db, JOB_STATUS_STATES.CANCELLED)
+        Jobs.get_by_id(self.db, 2).update(self.db, {"amount": 25.0,
+                                                    "category": 3})
+        DispatchEngine(self.db).run_cycle()
+        self.events.flush()
+        incremental = Job_Stat.summary(self.db)
+
+        rebuild_job_stats(self.db)
+        self.assertEqual(incremental, Job_Stat.summary(self.db))
+        self.assertEqual(incremental["by_status"]["CANCELLED"]["jobs"], 1)
+        self.assertEqual(incremental["amount_total"], 75)
+        self.assertEqual(sum(incremental["active_by_contractor"].values()), 5)
+
+    def test_rebuild_repairs_drift(self):
+        rebuild_job_stats(self.db)
+        with self.db.get_db() as session:
+            session.query(Job_Stat).filter_by(scope="all").update(
+                {"count": 999})
+            session.commit()
+        rebuild_job_stats(self.db)
+        self.assertEqual(Job_Stat.summary(self.db)["jobs"], 6)
+
+
+@unittest.skipUnless(POSTGRES_URI, "set TEST_POSTGRES_URI to run")
+class TestPostgresJobStats(unittest.TestCase):
+
+    def setUp(self):
+        self.db = Database(POSTGRES_URI)
+        self.addCleanup(self.db.dispose)
+        self.addCleanup(event_buffer(self.db).stop)
+        _seed(self.db, contractors=1, jobs=3)
+
+    def test_rebuild_is_skipped_while_another_worker_runs_it(self):
+        with self.db.engine.connect() as other:
+            with other.begin():
+                other.execute(text("SELECT pg_advisory_xact_lock(:key)"),
+                              {"key": _REBUILD_LOCK_KEY})
+                self.assertFalse(rebuild_job_stats(self.db))
+        self.assertTrue(rebuild_job_stats(self.db))
+        self.assertEqual(Job_Stat.summary(self.db)["jobs"], 3)
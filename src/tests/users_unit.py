@@ -0,0 +1,89 @@
+import os
+import unittest
+from datetime import datetime, timedelta
+
+from auth.enums import USER_ROLES
+from auth.models import User, user_observers
+from core.database import Database
+from tests.claim_unit import _seed
+from work.events import event_buffer
+
+# e.g. postgresql+psycopg2://postgres@localhost/final_labz_test
+POSTGRES_URI = os.getenv("TEST_POSTGRES_URI")
+
+
+class TestUserStateChanges(unittest.TestCase):
+
+    URI = "sqlite://"
+
+    def setUp(self):
+        self.db = Database(self.URI)
+        self.addCleanup(self.db.dispose)
+        self.addCleanup(event_buffer(self.db).stop)
+        # User 1 is a client, users 2-5 contractors.
+        _seed(self.db, contractors=4, jobs=1)
+
+        self.notified = []
+        user_observers.append(self.notified.extend)
+        self.addCleanup(user_observers.remove, self.notified.extend)
+
+    def _types(self):
+        with self.db.get_db() as session:
+            return dict(session.query(User.id, User.type).order_by(User.id))
+
+    def test_bulk_changes_return_the_affected_ids(self):
+        archived = User.change_state(self.db, "archive",
+                                     type=USER_ROLES.CONTRACTOR,
+                                     exclude=[5])
+        self.assertEqual(sorted(archived), [2, 3, 4])
+        self.assertEqual(self._types()[3], USER_ROLES.INACTIVE)
+        self.assertEqual(self._types()[5], USER_ROLES.CONTRACTOR)
+
+        # Already archived users are not archived again.
+        self.assertEqual(User.change_state(self.db, "archive", ids=[1, 2]),
+                         [1])
+        self.assertEqual(sorted(User.change_state(self.db, "remove",
+                                                  ids=[2, 3])), [2, 3])
+
+        restored = User.change_state(self.db, "restore", ids=[1, 2, 5])
+        self.assertEqual(sorted(restored), [1, 2])
+        types = self._types()
+        self.assertEqual(types[1], USER_ROLES.CLIENT)
+        self.assertEqual(types[2], USER_ROLES.CONTRACTOR)
+        self.assertEqual(types[3], USER_ROLES.REMOVED)
+        self.assertEqual(sorted(self.notified), [1, 1, 2, 2, 2, 3, 3, 4])
+
+    def test_filters_combine(self):
+        future = datetime.utcnow() + timedelta(days=1)
+        self.assertEqual(User.change_state(self.db, "archive", ids=[],
+                                           created_before=future), [])
+        self.assertEqual(User.change_state(
+            self.db, "archive", created_before=future - timedelta(days=2)),
+            [])
+        with self.assertRaises(ValueError):
+            User.change_state(self.db, "delete", ids=[1])
+
+    def test_instance_changes_bump_the_version(self):
+        user = User.get_by_id(self.db, 2)
+        version = user.version
+
+        user.archive_user(self.db)
+        self.assertEqual(user.type, USER_ROLES.INACTIVE)
+        user.restore_user(self.db)
+        self.assertEqual(user.type, USER_ROLES.CONTRACTOR)
+
+        user.update(self.db, {"name": "renamed"})
+        stored = User.get_by_id(self.db, 2)
+        self.assertEqual(stored.name, "renamed")
+        self.assertEqual(stored.email, "2@example.com")
+        self.assertEqual(stored.version, version + 3)
+        self.assertEqual(self.notified, [2, 2, 2])
+
+
+@unittest.skipUnless(POSTGRES_URI, "set TEST_POSTGRES_URI to run")
+class TestPostgresUserStateChanges(TestUserStateChanges):
+    """
+    The same checks through UPDATE ... RETURNING.
+    """
+
+    URI = POSTGRES_URI
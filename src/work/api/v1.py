@@ -1,12 +1,38 @@
-from fastapi import APIRouter, Depends, status, HTTPException
-from fastapi.responses import JSONResponse
+import asyncio
+import json as jsonlib
+from datetime import datetime, timedelta
+from typing import List, Optional, Set
 
-from auth.middleware import check_auth, get_current_user
-from auth.models import User
-from work.models import Jobs
+from fastapi import (APIRouter, Depends, status, HTTPException, Query,
+                     Request, Response, WebSocket, WebSocketDisconnect)
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.orm.exc import StaleDataError
+
+from starlette.concurrency import run_in_threadpool
+
+from auth.middleware import (check_auth, get_current_user,
+                             get_current_principal, get_current_admin,
+                             websocket_user)
+from auth.models import User, Contractor_Additional
+from auth.schemas import Principal
+from auth.enums import USER_ROLES
+from work.models import Jobs, Job_Event, Archived_Job, InvalidTransition
+from work.archive import archive_closed_jobs
+from work.cache import get_job_async, get_jobs_by_poster_async
+from work.dispatch import DispatchEngine
+from work.export import JOBS_EXPORT
+from work.feed import job_feed
+from work.stats import job_stats
 from work.emuns import JOB_STATUS_STATES, CATEGORY_STATES
-from work.schemas import Post_Job_Schema, Update_Job_Schema
-from core.config import JsonRender
+from work.schemas import (Post_Job_Schema, Update_Job_Schema,
+                          Update_Status_Schema, Assign_Contractor_Schema,
+                          Claim_Job_Schema, Service_Area_Schema)
+from core.conditional import (make_etag, is_not_modified, not_modified,
+                              set_validators)
+from core.config import JsonRender, get_settings
+from core.dataloader import DataLoader, parse_ids, request_loader
+from core.export import export_response
 from core.database import database
 
 router = APIRouter(
@@ -16,6 +42,41 @@ router = APIRouter(
 
 )
 
+# WebSocket routes cannot use check_auth (it needs an HTTP request), so
+# they live on their own router and authenticate the handshake instead.
+stream_router = APIRouter(
+    prefix="/bookings",
+    tags=["bookings"]
+)
+
+
+def jobs_loader(request: Request) -> DataLoader:
+    """
+    The request's Jobs.get_by_id loader; lookups made while handling one
+    request are answered by one Jobs.get_by_ids query.
+    """
+    return request_loader(request, "jobs",
+                          lambda ids: Jobs.get_by_ids(database, ids))
+
+
+def _feed_categories(categories: Optional[str]) -> Optional[Set[str]]:
+    """
+    Parses a comma separated list of category numbers or names into
+    category names; None or empty means every category.
+    """
+    if not categories:
+        return None
+    names = set()
+    for category in categories.split(","):
+        category = category.strip()
+        try:
+            names.add(CATEGORY_STATES(int(category)).name
+                      if category.isdigit()
+                      else CATEGORY_STATES[category.upper()].name)
+        except (KeyError, ValueError):
+            raise ValueError(f"Unknown category {category!r}")
+    return names
+
 
 # Get Routes defined below:
 @router.get("/", response_class=JsonRender,
@@ -26,20 +87,301 @@ async def check_router():
 
 @router.get("/retrieve_jobs", response_class=JsonRender,
             status_code=status.HTTP_200_OK)
-async def retrieve_user_jobs(user: User = Depends(get_current_user)):
-    jobs = Jobs.get_jobs_by_userId(database, user.additional.id)
+async def retrieve_user_jobs(user: Principal = Depends(get_current_principal)):
+    jobs = await get_jobs_by_poster_async(database, user.additional_id)
     return jobs
 
 
 @router.get("/retrieve_job/{job_id}", response_class=JsonRender,
             status_code=status.HTTP_200_OK)
-async def retrieve_select_job(job_id: int,
-                              user: User = Depends(get_current_user)
+async def retrieve_select_job(job_id: int, request: Request,
+                              response: Response,
+                              user: Principal = Depends(get_current_principal)
                               ) -> JSONResponse:
-    job = Jobs.get_by_id(database, job_id)
+    job = await get_job_async(database, job_id)
+    if job is None:
+        return None
+
+    etag = make_etag("job", job_id, job["version"])
+    last_modified = datetime.fromisoformat(job["updated_on"])
+    if is_not_modified(request, etag, last_modified):
+        return not_modified(etag, last_modified)
+
+    set_validators(response, etag, last_modified)
     return job
 
 
+@router.get("/retrieve_jobs_by_id", response_class=JsonRender,
+            status_code=status.HTTP_200_OK)
+async def retrieve_jobs_by_id(ids: List[str] = Query(...),
+                              user: Principal = Depends(get_current_principal),
+                              jobs: DataLoader = Depends(jobs_loader)
+                              ) -> JSONResponse:
+    """
+    Many jobs at once (?ids=1,2,3 or ?ids=1&ids=2), with one query. Jobs
+    that don't exist map to null.
+    """
+    job_ids = parse_ids(ids, get_settings().BATCH_LOOKUP_MAX_IDS)
+    found = await jobs.load_many(job_ids)
+    return {"jobs": {str(job_id): jsonable_encoder(job)
+                     for job_id, job in zip(job_ids, found)}}
+
+
+@router.get("/nearby_jobs", response_class=JsonRender,
+            status_code=status.HTTP_200_OK)
+async def nearby_jobs(latitude: Optional[float] = Query(None, ge=-90, le=90),
+                      longitude: Optional[float] = Query(None, ge=-180,
+                                                         le=180),
+                      radius_km: Optional[float] = Query(None, gt=0),
+                      limit: int = 20, category: Optional[int] = None,
+                      user: Principal = Depends(get_current_principal)
+                      ) -> JSONResponse:
+    """
+    The open jobs nearest to a point, nearest first, each with its
+    distance_km. For a contractor the point and radius default to their
+    service area, and only jobs they could take (skills, max_job_amount)
+    are listed.
+    """
+    settings = get_settings()
+    try:
+        categories = ([CATEGORY_STATES(category)] if category is not None
+                      else None)
+    except ValueError:
+        content = {
+            "status": 400,
+            "message": f"Unknown category {category!r}"
+        }
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=content)
+    max_amount = None
+    if user.type == USER_ROLES.CONTRACTOR:
+        profile = await run_in_threadpool(
+            Contractor_Additional.dispatch_profile, database,
+            user.additional_id)
+        if profile is not None:
+            if latitude is None and longitude is None:
+                latitude = profile["latitude"]
+                longitude = profile["longitude"]
+            radius_km = radius_km or profile["service_radius_km"]
+            max_amount = profile["max_job_amount"]
+            if profile["skills"]:
+                categories = [skill for skill in profile["skills"]
+                              if categories is None or skill in categories]
+
+    if latitude is None or longitude is None:
+        content = {
+            "status": 400,
+            "message": "latitude and longitude are required"
+        }
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=content)
+
+    radius_km = min(radius_km or settings.NEARBY_JOBS_MAX_RADIUS_KM,
+                    settings.NEARBY_JOBS_MAX_RADIUS_KM)
+    found = await run_in_threadpool(
+        Jobs.nearest, database, latitude, longitude,
+        max(1, min(limit, settings.NEARBY_JOBS_MAX_RESULTS)), radius_km,
+        categories, max_amount)
+    content = {
+        "jobs": [{**jsonable_encoder(job), "distance_km": round(distance, 3)}
+                 for distance, job in found],
+        "radius_km": radius_km
+    }
+    return content
+
+
+@router.get("/history", response_class=JsonRender,
+            status_code=status.HTTP_200_OK)
+async def retrieve_job_history(cursor: int = None, limit: int = 50,
+                               user: Principal = Depends(get_current_principal)
+                               ) -> JSONResponse:
+    """
+    Archived jobs newest first: those a client posted, those a contractor
+    worked on, or every archived job for an admin; other roles have no
+    history. Pass the returned cursor back to read further.
+    """
+    limit = max(1, min(limit, 500))
+    poster_id = contractor_id = None
+    if user.type == USER_ROLES.CLIENT:
+        poster_id = user.additional_id
+    elif user.type == USER_ROLES.CONTRACTOR:
+        contractor_id = user.additional_id
+    elif user.type != USER_ROLES.ADMIN:
+        content = {
+            "status": 403,
+            "message": "Only clients, contractors and admins have a job "
+                       "history."
+        }
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail=content)
+
+    jobs = await run_in_threadpool(Archived_Job.history, database, poster_id,
+                                   contractor_id, cursor, limit)
+    content = {
+        "jobs": [job.dict() for job in jobs],
+        "cursor": jobs[-1].id if len(jobs) == limit else None
+    }
+    return content
+
+
+@router.get("/history/{job_id}", response_class=JsonRender,
+            status_code=status.HTTP_200_OK)
+async def retrieve_archived_job(job_id: int,
+                                user: Principal = Depends(
+                                    get_current_principal)
+                                ) -> JSONResponse:
+    job = await run_in_threadpool(Archived_Job.get_by_id, database, job_id)
+
+    allowed = job is not None and (
+        user.type == USER_ROLES.ADMIN
+        or (user.type == USER_ROLES.CLIENT
+            and job.poster_id == user.additional_id)
+        or (user.type == USER_ROLES.CONTRACTOR
+            and job.taken_by_user_id == user.additional_id))
+    if not allowed:
+        content = {
+            "status": 404,
+            "message": "Archived job doesn't exist."
+        }
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=content)
+    return job.dict()
+
+
+@router.get("/events", response_class=JsonRender,
+            dependencies=[Depends(get_current_admin)],
+            status_code=status.HTTP_200_OK)
+async def job_change_feed(cursor: int = 0, limit: int = 500,
+                          job_id: int = None) -> JSONResponse:
+    """
+    Job events after `cursor`, oldest first. Passing back the returned
+    cursor reads every event exactly once (see Job_Event.since).
+    """
+    limit = max(1, min(limit, 5000))
+    events = await run_in_threadpool(Job_Event.since, database, cursor,
+                                     limit, job_id)
+    content = {
+        "events": [event.dict() for event in events],
+        "cursor": events[-1].id if events else cursor
+    }
+    return content
+
+
+@router.get("/feed/stream", status_code=status.HTTP_200_OK)
+async def job_feed_events(categories: str = None,
+                          user: Principal = Depends(get_current_principal)
+                          ) -> StreamingResponse:
+    """
+    Server-Sent Events stream of posted and status-changed jobs, filtered
+    by `categories` (comma separated numbers or names).
+    """
+    try:
+        topics = _feed_categories(categories)
+    except ValueError as exc:
+        content = {
+            "status": 400,
+            "message": str(exc)
+        }
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=content)
+
+    heartbeat = get_settings().JOB_FEED_HEARTBEAT_SECONDS
+    subscription = job_feed.subscribe(topics)
+
+    async def stream():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscription.get(),
+                                                     heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if message is None:
+                    if subscription.dropped:
+                        yield "event: dropped\ndata: {}\n\n"
+                    return
+                yield f"event: job\ndata: {jsonlib.dumps(message)}\n\n"
+        finally:
+            subscription.close()
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache",
+                                      "X-Accel-Buffering": "no"})
+
+
+@stream_router.websocket("/feed")
+async def job_feed_socket(websocket: WebSocket, categories: str = None):
+    """
+    WebSocket stream of posted and status-changed jobs, filtered by
+    `categories`. Closes with 1013 if the client falls too far behind.
+    """
+    user = await websocket_user(websocket)
+    try:
+        topics = _feed_categories(categories)
+    except ValueError:
+        user = None
+    if user is None:
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    subscription = job_feed.subscribe(topics)
+
+    async def watch_disconnect():
+        # Clients do not send anything; reading only notices them leave.
+        try:
+            while True:
+                await websocket.receive_text()
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+        finally:
+            subscription.close()
+
+    watcher = asyncio.create_task(watch_disconnect())
+    try:
+        async for message in subscription:
+            await websocket.send_json(message)
+        if subscription.dropped:
+            await websocket.close(code=1013)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        subscription.close()
+        watcher.cancel()
+
+
+@router.get("/stats", response_class=JsonRender,
+            dependencies=[Depends(get_current_admin)],
+            status_code=status.HTTP_200_OK)
+async def marketplace_stats(contractors: int = 100) -> JSONResponse:
+    return await run_in_threadpool(job_stats, database,
+                                   max(0, min(contractors, 1000)))
+
+
+@router.get("/export_jobs", dependencies=[Depends(get_current_admin)],
+            status_code=status.HTTP_200_OK)
+async def export_jobs(format: str = "csv", chunk_size: int = 5000):
+    try:
+        return export_response(database, JOBS_EXPORT, format,
+                               max(100, min(chunk_size, 50_000)))
+    except ValueError as exc:
+        content = {
+            "status": 400,
+            "message": str(exc)
+        }
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=content)
+    except RuntimeError as exc:
+        content = {
+            "status": 501,
+            "message": str(exc)
+        }
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED,
+                            detail=content)
+
+
 # POST Routes defined below:
 @router.post("/post_job", response_class=JsonRender,
              status_code=status.HTTP_200_OK)
@@ -50,8 +392,17 @@ async def user_job_post(json: Post_Job_Schema,
     job = Jobs(title=json.title, description=json.description,
                status=json.status.name,
                category=CATEGORY_STATES(json.category).name,
-               amount=json.amount, poster=decoded.additional)
-    job.create(database)
+               amount=json.amount, poster=decoded.additional,
+               latitude=json.latitude, longitude=json.longitude)
+    try:
+        job.create(database, actor_id=decoded.id)
+    except InvalidTransition as exc:
+        content = {
+            "status": 400,
+            "message": str(exc)
+        }
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=content)
 
     content = {
         "status": "200",
@@ -61,23 +412,118 @@ async def user_job_post(json: Post_Job_Schema,
 
 
 @router.post("/assign_contractor", response_class=JsonRender,
+             dependencies=[Depends(get_current_admin)],
              status_code=status.HTTP_200_OK)
-async def assign_contractor_to_job():
-    pass
+async def assign_contractor_to_job(json: Assign_Contractor_Schema
+                                   ) -> JSONResponse:
+    job = Jobs.get_by_id(database, json.job_id, readonly=False)
+    contractor = User.get_by_id(database, json.contractor_id)
+
+    if not job or job.status.name != JOB_STATUS_STATES.UNASSIGNED.name:
+        content = {
+            "status": 404,
+            "message": "Job doesn't exist or is already assigned."
+        }
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=content)
+
+    if not contractor or contractor.type != USER_ROLES.CONTRACTOR:
+        content = {
+            "status": 404,
+            "message": "Contractor doesn't exist."
+        }
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=content)
+
+    try:
+        result = job.assign_contractor(database, contractor)
+    except StaleDataError:
+        content = {
+            "status": 409,
+            "message": "Job was changed by someone else; reload and retry."
+        }
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail=content)
+    if result is not True:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail={"status": 500, "message": result})
+
+    content = {
+        "status": "200",
+        "message": "Contractor was successfully assigned to the job"
+    }
+    return content
+
+
+@router.post("/claim_job", response_class=JsonRender,
+             status_code=status.HTTP_200_OK)
+async def claim_job(json: Claim_Job_Schema,
+                    decoded: Principal = Depends(get_current_principal)
+                    ) -> JSONResponse:
+    if decoded.type != USER_ROLES.CONTRACTOR:
+        content = {
+            "status": 403,
+            "message": "Only contractors can claim jobs."
+        }
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail=content)
+
+    category = CATEGORY_STATES(json.category) if (
+        json.category is not None) else None
+    job_id = await run_in_threadpool(Jobs.claim, database,
+                                     decoded.additional_id, json.job_id,
+                                     category)
+    if job_id is None:
+        content = {
+            "status": 409,
+            "message": "No matching job is available; please try again."
+        }
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail=content)
+
+    content = {
+        "status": "200",
+        "job_id": job_id
+    }
+    return content
+
+
+@router.post("/dispatch", response_class=JsonRender,
+             dependencies=[Depends(get_current_admin)],
+             status_code=status.HTTP_200_OK)
+async def run_dispatch_cycle() -> JSONResponse:
+    settings = get_settings()
+    engine = DispatchEngine(database, settings.DISPATCH_BATCH_SIZE,
+                            settings.DISPATCH_MAX_JOBS)
+    report = await run_in_threadpool(engine.run_cycle)
+    return report.dict()
+
+
+@router.post("/archive", response_class=JsonRender,
+             dependencies=[Depends(get_current_admin)],
+             status_code=status.HTTP_200_OK)
+async def run_job_archive() -> JSONResponse:
+    settings = get_settings()
+    report = await run_in_threadpool(
+        archive_closed_jobs, database,
+        timedelta(days=settings.JOB_ARCHIVE_AFTER_DAYS),
+        settings.JOB_ARCHIVE_BATCH_SIZE)
+    return report.dict()
 
 
 # PUT Routes defined below:
 @router.put("/update_job", response_class=JsonRender,
             status_code=status.HTTP_200_OK)
 async def update_user_post(json: Update_Job_Schema,
-                           decoded: User = Depends(get_current_user),
+                           decoded: Principal = Depends(get_current_principal),
                            ) -> JSONResponse:
 
-    job = Jobs.get_by_id(database, json.job_id)
+    job = Jobs.get_by_id(database, json.job_id, readonly=False)
 
-    if (job.poster_id != decoded.additional.id) or (
+    if (job.poster_id != decoded.additional_id) or (
             decoded.type.name.lower() != "admin" and (
-            job.poster_id != decoded.additional.id)):
+            job.poster_id != decoded.additional_id)):
 
         content = {
             "status": 404,
@@ -86,10 +532,109 @@ async def update_user_post(json: Update_Job_Schema,
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail=content)
 
-    result = job.update(database, json.dict(exclude_unset=True))
+    try:
+        result = job.update(database, json.dict(exclude_unset=True),
+                            expected_version=json.version,
+                            actor_id=decoded.id)
+    except StaleDataError:
+        content = {
+            "status": 409,
+            "message": "Job was changed by someone else; reload and retry."
+        }
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail=content)
     return result
 
 
+@router.put("/update_status", response_class=JsonRender,
+            status_code=status.HTTP_200_OK)
+async def update_job_status(json: Update_Status_Schema,
+                            decoded: Principal = Depends(get_current_principal)
+                            ) -> JSONResponse:
+    job = Jobs.get_by_id(database, json.job_id, readonly=False)
+
+    allowed = job is not None and (
+        decoded.type == USER_ROLES.ADMIN
+        or job.poster_id == decoded.additional_id
+        or job.taken_by_user_id == decoded.additional_id)
+    if not allowed:
+        content = {
+            "status": 404,
+            "message": "Job doesn't exist; please check again later."
+        }
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=content)
+
+    if json.version is not None and json.version != job.version:
+        content = {
+            "status": 409,
+            "message": "Job was changed by someone else; reload and retry."
+        }
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail=content)
+
+    if json.status == JOB_STATUS_STATES.ASSIGNED:
+        content = {
+            "status": 400,
+            "message": "Jobs are assigned through claim_job or "
+                       "assign_contractor."
+        }
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=content)
+
+    try:
+        job.transition(database, json.status, actor_id=decoded.id)
+    except InvalidTransition as exc:
+        content = {
+            "status": 400,
+            "message": str(exc)
+        }
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=content)
+    except StaleDataError:
+        content = {
+            "status": 409,
+            "message": "Job was changed by someone else; reload and retry."
+        }
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail=content)
+
+    content = {
+        "status": "200",
+        "job_status": job.status.name,
+        "version": job.version
+    }
+    return content
+
+
+@router.put("/service_area", response_class=JsonRender,
+            status_code=status.HTTP_200_OK)
+async def update_service_area(json: Service_Area_Schema,
+                              decoded: Principal = Depends(
+                                  get_current_principal)
+                              ) -> JSONResponse:
+    """
+    Where a contractor takes on-site jobs: dispatch only sends them jobs
+    within radius_km of the point. All fields null clears it.
+    """
+    if decoded.type != USER_ROLES.CONTRACTOR:
+        content = {
+            "status": 403,
+            "message": "Only contractors have a service area."
+        }
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail=content)
+
+    await run_in_threadpool(Contractor_Additional.set_service_area,
+                            database, decoded.additional_id, decoded.id,
+                            json.latitude, json.longitude, json.radius_km)
+    content = {
+        "status": "200",
+        "service_area": json.dict()
+    }
+    return content
+
+
 # DELETE Routes defined below:
 @router.delete("/remove_job", response_class=JsonRender,
                status_code=status.HTTP_200_OK)
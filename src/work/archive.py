@@ -0,0 +1,111 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from time import perf_counter
+from typing import List, Optional
+
+from sqlalchemy import delete, insert, select
+
+from auth.enums import JOB_STATUS_STATES
+from core.database import Database
+from work.events import event_buffer, job_snapshot
+from work.models import Jobs, Archived_Job
+from work.schemas import Archive_Report
+
+logger = logging.getLogger(__name__)
+
+# Terminal statuses; jobs in them never change status again.
+CLOSED_STATUSES = (JOB_STATUS_STATES.COMPLETED, JOB_STATUS_STATES.CANCELLED)
+
+
+def _move_batch(session, cutoff: datetime, batch_size: int) -> List:
+    """
+    Moves up to `batch_size` closed jobs last updated before `cutoff`
+    from jobs to jobs_archive in the session's transaction.
+
+    Returns:
+        list: (id, status, category, amount, taken_by_user_id,
+        poster_id) of every job moved.
+    """
+    jobs = Jobs.__table__
+    archive = Archived_Job.__table__
+    copied = [jobs.c[field] for field in Archived_Job.COPIED_FIELDS]
+    snapshot = (jobs.c.id, jobs.c.status, jobs.c.category, jobs.c.amount,
+                jobs.c.taken_by_user_id, jobs.c.poster_id)
+    due = select(jobs.c.id).where(jobs.c.status.in_(CLOSED_STATUSES),
+                                  jobs.c.updated_on < cutoff
+                                  ).order_by(jobs.c.id).limit(batch_size)
+
+    if session.bind.dialect.name == "postgresql":
+        # One statement: the DELETE ... RETURNING feeds the INSERT, and
+        # SKIP LOCKED lets workers archiving at once take disjoint rows.
+        moved = delete(jobs).where(
+            jobs.c.id.in_(due.with_for_update(skip_locked=True))
+        ).returning(*copied).cte("moved")
+        return session.execute(
+            insert(archive).from_select(
+                list(Archived_Job.COPIED_FIELDS),
+                select(*(moved.c[field]
+                         for field in Archived_Job.COPIED_FIELDS)))
+            .returning(*(archive.c[column.name] for column in snapshot))
+        ).all()
+
+    rows = session.execute(
+        select(*snapshot).where(jobs.c.id.in_(due))
+    ).all()
+    if rows:
+        ids = [row.id for row in rows]
+        session.execute(insert(archive).from_select(
+            list(Archived_Job.COPIED_FIELDS),
+            select(*copied).where(jobs.c.id.in_(ids))))
+        session.execute(delete(jobs).where(jobs.c.id.in_(ids)))
+    return rows
+
+
+def archive_closed_jobs(db: Database, older_than: timedelta,
+                        batch_size: int = 1000,
+                        max_batches: Optional[int] = None
+                        ) -> Archive_Report:
+    """
+    Moves completed and cancelled jobs not updated for `older_than` into
+    jobs_archive, `batch_size` jobs per transaction, so the hot table is
+    never locked for long and a failed run keeps the batches already
+    committed.
+
+    Each archived job gets an "archived" event, which drops it from the
+    job stats and the job read cache.
+
+    Args:
+        older_than (timedelta): Minimum time since the job last changed.
+        batch_size (int): Jobs moved per transaction.
+        max_batches (int, optional): Stop after this many batches.
+
+    Returns:
+        Archive_Report: How many jobs were moved, in how many batches.
+    """
+    report = Archive_Report()
+    started = perf_counter()
+    cutoff = datetime.now(timezone.utc) - older_than
+    buffer = event_buffer(db)
+
+    while max_batches is None or report.batches < max_batches:
+        with db.get_db() as session:
+            rows = _move_batch(session, cutoff, batch_size)
+            session.commit()
+        if not rows:
+            break
+
+        report.archived += len(rows)
+        report.batches += 1
+        for row in rows:
+            buffer.append(row.id, "archived",
+                          job_snapshot(row.status, row.category, row.amount,
+                                       row.taken_by_user_id, row.poster_id),
+                          None)
+        if len(rows) < batch_size:
+            break
+
+    report.seconds = perf_counter() - started
+    if report.archived:
+        logger.info("archived %d closed jobs in %d batches (%.2fs)",
+                    report.archived, report.batches, report.seconds)
+    return report
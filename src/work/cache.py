@@ -0,0 +1,89 @@
+from typing import List, Optional
+from weakref import WeakKeyDictionary
+
+from fastapi.encoders import jsonable_encoder
+
+from core.cache import (ReadThroughCache, serializer_from_name,
+                        shared_backend)
+from core.config import get_settings
+from core.database import Database
+from work.events import event_buffer
+from work.models import Jobs
+
+# Keys name the query shape and the scope it was read for:
+#   detail:{job_id}     Jobs.get_by_id, visible to any signed in user
+#   poster:{poster_id}  Jobs.get_jobs_by_userId, the poster's own jobs
+_caches: "WeakKeyDictionary[Database, ReadThroughCache]" = (
+    WeakKeyDictionary())
+
+
+def job_cache(db: Database) -> ReadThroughCache:
+    """
+    Returns the job read cache for `db`, creating it on first use.
+
+    Every job change goes through the job event buffer, so the cache
+    observes it to drop exactly the keys a change affects.
+    """
+    cache = _caches.get(db)
+    if cache is None:
+        settings = get_settings()
+        backend = shared_backend(settings.JOB_CACHE_BACKEND_URL
+                                 or settings.CACHE_BACKEND_URL)
+        cache = _caches.setdefault(db, ReadThroughCache(
+            "jobs", settings.JOB_CACHE_SIZE, settings.JOB_CACHE_TTL_SECONDS,
+            backend=backend,
+            local_ttl=settings.JOB_CACHE_LOCAL_TTL_SECONDS if backend
+            else None,
+            serializer=serializer_from_name(settings.CACHE_SERIALIZER)))
+        event_buffer(db).observers.append(
+            lambda job_id, before, after: _invalidate(cache, job_id,
+                                                      before, after))
+    return cache
+
+
+def _invalidate(cache: ReadThroughCache, job_id: int,
+                before: Optional[dict], after: Optional[dict]):
+    keys = {f"detail:{job_id}"}
+    for snapshot in (before, after):
+        if snapshot and snapshot.get("poster_id") is not None:
+            keys.add(f"poster:{snapshot['poster_id']}")
+    cache.invalidate(*keys)
+
+
+def get_job(db: Database, job_id: int) -> Optional[dict]:
+    """
+    Jobs.get_by_id through the cache, as the JSON-ready dict the route
+    returns.
+    """
+    return job_cache(db).get_or_load(
+        f"detail:{job_id}",
+        lambda: jsonable_encoder(Jobs.get_by_id(db, job_id)))
+
+
+def get_jobs_by_poster(db: Database, poster_id: int) -> List[dict]:
+    """
+    Jobs.get_jobs_by_userId through the cache.
+    """
+    return job_cache(db).get_or_load(
+        f"poster:{poster_id}",
+        lambda: jsonable_encoder(Jobs.get_jobs_by_userId(db, poster_id)))
+
+
+async def get_job_async(db: Database, job_id: int) -> Optional[dict]:
+    """
+    get_job for the event loop; a miss is loaded in the threadpool.
+    """
+    return await job_cache(db).get_or_load_async(
+        f"detail:{job_id}",
+        lambda: jsonable_encoder(Jobs.get_by_id(db, job_id)))
+
+
+async def get_jobs_by_poster_async(db: Database,
+                                   poster_id: int) -> List[dict]:
+    """
+    get_jobs_by_poster for the event loop; a miss is loaded in the
+    threadpool.
+    """
+    return await job_cache(db).get_or_load_async(
+        f"poster:{poster_id}",
+        lambda: jsonable_encoder(Jobs.get_jobs_by_userId(db, poster_id)))
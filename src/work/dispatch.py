@@ -0,0 +1,370 @@
+import heapq
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Callable, Dict, Hashable, List, Optional
+
+from sqlalchemy import bindparam, func, select, text, update
+
+from auth.enums import CATEGORY_STATES, JOB_STATUS_STATES, USER_ROLES
+from auth.models import (User, Additional, Contractor_Additional,
+                         Contractor_Skill)
+from core.database import Database
+from core.geo import Grid, distance_km
+from work.events import event_buffer, job_snapshot
+from work.models import Jobs
+from work.schemas import Dispatch_Report
+
+logger = logging.getLogger(__name__)
+
+# Statuses that count against a contractor's max_active_jobs.
+ACTIVE_JOB_STATES = (JOB_STATUS_STATES.ASSIGNED,
+                     JOB_STATUS_STATES.IN_PROGRESS,
+                     JOB_STATUS_STATES.PENDING)
+
+# Arbitrary, fixed key for the Postgres advisory lock that keeps a single
+# worker dispatching at a time.
+_DISPATCH_LOCK_KEY = 0x6A6F6273
+
+
+class _Contractor:
+    __slots__ = ("id", "capacity", "max_amount", "load", "latitude",
+                 "longitude", "radius_km")
+
+    def __init__(self, id: int, capacity: int, max_amount: Optional[float],
+                 load: int, latitude: Optional[float] = None,
+                 longitude: Optional[float] = None,
+                 radius_km: Optional[float] = None):
+        self.id = id
+        self.capacity = capacity
+        self.max_amount = max_amount
+        self.load = load
+        self.latitude = latitude
+        self.longitude = longitude
+        self.radius_km = radius_km
+
+    @property
+    def has_service_area(self) -> bool:
+        return (self.latitude is not None and self.longitude is not None
+                and bool(self.radius_km) and self.radius_km > 0)
+
+    def accepts(self, amount: float) -> bool:
+        return self.max_amount is None or amount <= self.max_amount
+
+    def reaches(self, latitude: float, longitude: float) -> bool:
+        return distance_km(self.latitude, self.longitude, latitude,
+                           longitude) <= self.radius_km
+
+
+class _LoadHeaps:
+    """
+    Min-heaps of contractors ordered by current load, one per key.
+
+    A contractor sits in several heaps, so a load change leaves stale
+    entries behind in the others; entries are checked against the
+    contractor's live load when popped and re-pushed if outdated (lazy
+    deletion), keeping every update O(log n).
+
+    Jobs are offered in non-increasing amount order, so a contractor whose
+    max_job_amount is below the current job is parked (in a heap keyed by
+    that limit) until the amounts fall within it, instead of being popped
+    and skipped again for every larger job.
+    """
+
+    def __init__(self):
+        self._heaps: Dict[Hashable, list] = defaultdict(list)
+        self._parked: Dict[Hashable, list] = defaultdict(list)
+
+    def add(self, key: Hashable, contractor: _Contractor):
+        self._heaps[key].append((contractor.load, contractor.id, contractor))
+
+    def heapify(self):
+        for heap in self._heaps.values():
+            heapq.heapify(heap)
+
+    def _unpark(self, key: Hashable, amount: float):
+        parked = self._parked[key]
+        heap = self._heaps[key]
+        while parked and -parked[0][0] >= amount:
+            _, _, contractor = heapq.heappop(parked)
+            heapq.heappush(heap, (contractor.load, contractor.id,
+                                  contractor))
+
+    def take(self, key: Hashable, amount: float,
+             fits: Optional[Callable[[_Contractor], bool]] = None
+             ) -> Optional[_Contractor]:
+        """
+        Picks the least loaded contractor under `key` with spare capacity
+        who accepts a job of `amount` (and `fits` it, if given), and
+        counts the job against them. Successive calls must not increase
+        `amount`.
+        """
+        self._unpark(key, amount)
+        heap = self._heaps[key]
+        # Contractors that do not fit this job may fit the next one.
+        skipped = []
+        try:
+            while heap:
+                entry = heapq.heappop(heap)
+                load, _, contractor = entry
+                if contractor.load >= contractor.capacity:
+                    continue  # full; drop it from this heap for good
+                if load != contractor.load:
+                    heapq.heappush(heap, (contractor.load, contractor.id,
+                                          contractor))
+                    continue
+                if not contractor.accepts(amount):
+                    heapq.heappush(self._parked[key], (
+                        -contractor.max_amount, contractor.id, contractor))
+                    continue
+                if fits is not None and not fits(contractor):
+                    skipped.append(entry)
+                    continue
+
+                contractor.load += 1
+                if contractor.load < contractor.capacity:
+                    heapq.heappush(heap, (contractor.load, contractor.id,
+                                          contractor))
+                return contractor
+            return None
+        finally:
+            for entry in skipped:
+                heapq.heappush(heap, entry)
+
+
+class ContractorIndex:
+    """
+    Picks the contractor for each job, least loaded first.
+
+    Jobs without a location may go to any contractor with the skill
+    (per-category heaps). An on-site job goes to a contractor whose
+    service area covers it, or else to one without a service area.
+    Contractors with a service area are indexed under every cell of an
+    `area_cell_km` Grid their area overlaps, so only contractors near
+    the job are looked at, and each is checked for the exact distance.
+    """
+
+    def __init__(self, contractors: List[_Contractor],
+                 skills: Dict[int, List[CATEGORY_STATES]],
+                 area_cell_km: float = 10.0):
+        self._anywhere = _LoadHeaps()
+        self._without_area = _LoadHeaps()
+        self._areas = _LoadHeaps()
+        self._grid = Grid(area_cell_km)
+        for contractor in contractors:
+            if contractor.load >= contractor.capacity:
+                continue
+            categories = skills.get(contractor.id) or CATEGORY_STATES
+            cells = list(self._grid.cells(
+                contractor.latitude, contractor.longitude,
+                contractor.radius_km)) if contractor.has_service_area else ()
+            for category in categories:
+                self._anywhere.add(category, contractor)
+                if not cells:
+                    self._without_area.add(category, contractor)
+                for cell in cells:
+                    self._areas.add((cell, category), contractor)
+        for heaps in (self._anywhere, self._without_area, self._areas):
+            heaps.heapify()
+
+    def take(self, category: CATEGORY_STATES, amount: float,
+             latitude: Optional[float] = None,
+             longitude: Optional[float] = None) -> Optional[_Contractor]:
+        """
+        Picks the least loaded contractor with spare capacity who accepts
+        a job of `amount` in `category` (at the given location, if any),
+        and counts the job against them. Successive calls must not
+        increase `amount`.
+        """
+        if latitude is None or longitude is None:
+            return self._anywhere.take(category, amount)
+        cell = self._grid.cell(latitude, longitude)
+        contractor = self._areas.take(
+            (cell, category), amount,
+            lambda contractor: contractor.reaches(latitude, longitude))
+        if contractor is None:
+            contractor = self._without_area.take(category, amount)
+        return contractor
+
+
+class DispatchEngine:
+    """
+    Matches UNASSIGNED jobs to eligible contractors.
+
+    Each cycle loads a snapshot of contractors (with their skills and
+    current load) and of open jobs using plain column queries, matches
+    the highest paying (then oldest) jobs first against the per-category
+    contractor heaps, and writes the matches back in batches of
+    `batch_size` with one executemany UPDATE per batch. The UPDATE only
+    matches jobs that are still UNASSIGNED, so a job claimed elsewhere
+    since the snapshot is left alone.
+
+    Args:
+        db: The database to dispatch against.
+        batch_size: Assignments written per UPDATE round trip.
+        max_jobs: Upper bound of open jobs considered per cycle.
+    """
+
+    def __init__(self, db: Database, batch_size: int = 500,
+                 max_jobs: int = 50_000):
+        self.db = db
+        self.batch_size = batch_size
+        self.max_jobs = max_jobs
+
+    def _load_contractors(self, session) -> List[_Contractor]:
+        loads = select(Jobs.taken_by_user_id.label("contractor_id"),
+                       func.count(Jobs.id).label("load")).where(
+            Jobs.status.in_(ACTIVE_JOB_STATES)).group_by(
+            Jobs.taken_by_user_id).subquery()
+
+        # Plain tables rather than the polymorphic entities, which would
+        # add their own joins to the inheritance parent.
+        contractor = Contractor_Additional.__table__
+        additional = Additional.__table__
+        rows = session.execute(
+            select(contractor.c.id, contractor.c.max_active_jobs,
+                   contractor.c.max_job_amount,
+                   func.coalesce(loads.c.load, 0), contractor.c.latitude,
+                   contractor.c.longitude, contractor.c.service_radius_km)
+            .select_from(contractor)
+            .join(additional, additional.c.id == contractor.c.id)
+            .join(User.__table__, User.id == additional.c.user_id)
+            .outerjoin(loads, loads.c.contractor_id == contractor.c.id)
+            .where(User.type == USER_ROLES.CONTRACTOR))
+        return [_Contractor(id, capacity if capacity is not None else 3,
+                            max_amount, load, latitude, longitude, radius)
+                for id, capacity, max_amount, load, latitude, longitude,
+                radius in rows]
+
+    def _load_skills(self, session) -> Dict[int, List[CATEGORY_STATES]]:
+        skills = defaultdict(list)
+        for contractor_id, category in session.execute(
+                select(Contractor_Skill.contractor_id,
+                       Contractor_Skill.category)):
+            skills[contractor_id].append(category)
+        return skills
+
+    def _load_open_jobs(self, session) -> List[tuple]:
+        rows = session.execute(
+            select(Jobs.id, Jobs.category, Jobs.amount, Jobs.poster_id,
+                   Jobs.latitude, Jobs.longitude).where(
+                Jobs.status == JOB_STATUS_STATES.UNASSIGNED,
+                Jobs.taken_by_user_id.is_(None)
+            ).order_by(Jobs.id).limit(self.max_jobs))
+        # Highest amount first, then oldest (lowest id).
+        queue = [(-amount, job_id, category, poster_id, latitude, longitude)
+                 for job_id, category, amount, poster_id, latitude, longitude
+                 in rows]
+        heapq.heapify(queue)
+        return queue
+
+    @contextmanager
+    def _exclusive(self):
+        """
+        Yields True when this worker may dispatch. On Postgres a session
+        advisory lock, held on its own connection for the whole cycle,
+        keeps other workers from dispatching the same jobs concurrently.
+        """
+        engine = self.db.engine
+        if engine.dialect.name != "postgresql":
+            yield True
+            return
+
+        with engine.connect() as connection:
+            acquired = connection.execute(
+                text("SELECT pg_try_advisory_lock(:key)"),
+                {"key": _DISPATCH_LOCK_KEY}).scalar()
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    connection.execute(
+                        text("SELECT pg_advisory_unlock(:key)"),
+                        {"key": _DISPATCH_LOCK_KEY})
+
+    def _write(self, session, assignments: List[dict]) -> int:
+        statement = update(Jobs.__table__).where(
+            Jobs.__table__.c.id == bindparam("job_id"),
+            Jobs.__table__.c.status == JOB_STATUS_STATES.UNASSIGNED
+        ).values(taken_by_user_id=bindparam("contractor_id"),
+                 status=JOB_STATUS_STATES.ASSIGNED,
+                 version=Jobs.__table__.c.version + 1)
+        # Only the bound keys: other keys named like columns would be
+        # added to the SET clause.
+        result = session.execute(statement, [
+            {"job_id": row["job_id"], "contractor_id": row["contractor_id"]}
+            for row in assignments])
+        session.commit()
+
+        written = assignments
+        if result.rowcount != len(assignments):
+            # Some jobs were taken elsewhere since the snapshot; only record
+            # events for the ones this batch actually assigned.
+            owners = dict(session.execute(
+                select(Jobs.id, Jobs.taken_by_user_id).where(
+                    Jobs.id.in_([row["job_id"] for row in assignments]))))
+            written = [row for row in assignments
+                       if owners.get(row["job_id"]) == row["contractor_id"]]
+
+        events = event_buffer(self.db)
+        for row in written:
+            events.append(
+                row["job_id"], "status",
+                job_snapshot(JOB_STATUS_STATES.UNASSIGNED, row["category"],
+                             row["amount"], None, row["poster_id"]),
+                job_snapshot(JOB_STATUS_STATES.ASSIGNED, row["category"],
+                             row["amount"], row["contractor_id"],
+                             row["poster_id"]))
+        return result.rowcount
+
+    def run_cycle(self) -> Dispatch_Report:
+        """
+        Runs one dispatch cycle.
+
+        Returns:
+            Dispatch_Report: What was considered, matched and written.
+        """
+        started = perf_counter()
+        report = Dispatch_Report()
+
+        with self._exclusive() as acquired, self.db.get_db() as session:
+            if not acquired:
+                report.skipped = True
+                return report
+
+            contractors = self._load_contractors(session)
+            index = ContractorIndex(contractors, self._load_skills(session))
+            queue = self._load_open_jobs(session)
+            report.contractors = len(contractors)
+            report.jobs_considered = len(queue)
+
+            pending = []
+            while queue:
+                (negative_amount, job_id, category, poster_id, latitude,
+                 longitude) = heapq.heappop(queue)
+                contractor = index.take(category, -negative_amount,
+                                        latitude, longitude)
+                if contractor is None:
+                    report.unmatched += 1
+                    continue
+                report.matched += 1
+                pending.append({"job_id": job_id,
+                                "contractor_id": contractor.id,
+                                "category": category,
+                                "amount": -negative_amount,
+                                "poster_id": poster_id})
+                if len(pending) >= self.batch_size:
+                    report.assigned += self._write(session, pending)
+                    report.batches += 1
+                    pending = []
+
+            if pending:
+                report.assigned += self._write(session, pending)
+                report.batches += 1
+
+        report.seconds = perf_counter() - started
+        if report.seconds > 0:
+            report.matches_per_second = report.matched / report.seconds
+        logger.info("dispatch cycle: %s", report.dict())
+        return report
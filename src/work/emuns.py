@@ -1,18 +1,25 @@
-from enum import Enum
+# The job enums are defined once in auth.enums, which the models' Enum
+# columns are built from; members of a second, identical Enum class would
+# not compare equal to them or bind to those columns.
+from auth.enums import CATEGORY_STATES, JOB_STATUS_STATES  # noqa: F401
 
 
-class CATEGORY_STATES(Enum):
-    PC_CUSTOM_BUILD = 0
-    SOFTWARE_INSTALL = 1
-    SECURITY_HARDWARE_INSTALL = 2
-    SERVER_SETUP = 3
-    OTHER = 4
-
-
-class JOB_STATUS_STATES(Enum):
-    UNASSIGNED = 0
-    ASSIGNED = 1
-    IN_PROGRESS = 2
-    PENDING = 3
-    COMPLETED = 4
-    CANCELLED = 5
+# Allowed job status changes; COMPLETED and CANCELLED are final.
+JOB_STATUS_TRANSITIONS = {
+    JOB_STATUS_STATES.UNASSIGNED: frozenset((
+        JOB_STATUS_STATES.ASSIGNED,
+        JOB_STATUS_STATES.CANCELLED)),
+    JOB_STATUS_STATES.ASSIGNED: frozenset((
+        JOB_STATUS_STATES.IN_PROGRESS,
+        JOB_STATUS_STATES.UNASSIGNED,
+        JOB_STATUS_STATES.CANCELLED)),
+    JOB_STATUS_STATES.IN_PROGRESS: frozenset((
+        JOB_STATUS_STATES.PENDING,
+        JOB_STATUS_STATES.CANCELLED)),
+    JOB_STATUS_STATES.PENDING: frozenset((
+        JOB_STATUS_STATES.COMPLETED,
+        JOB_STATUS_STATES.IN_PROGRESS,
+        JOB_STATUS_STATES.CANCELLED)),
+    JOB_STATUS_STATES.COMPLETED: frozenset(),
+    JOB_STATUS_STATES.CANCELLED: frozenset(),
+}
@@ -0,0 +1,221 @@
+import json
+import logging
+from threading import Condition, RLock, Thread
+from typing import Callable, List, Optional
+from weakref import WeakKeyDictionary
+
+from sqlalchemy import insert, text
+
+from core.database import Database
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary, fixed key for the Postgres advisory lock that makes job event
+# batches commit in id order (see JobEventBuffer.flush).
+_EVENTS_LOCK_KEY = 0x6576656E
+
+
+def job_snapshot(status=None, category=None, amount=None,
+                 contractor_id=None, poster_id=None) -> dict:
+    """
+    The fields of a job that events record before and after a change.
+    Enum members are stored by name so the payload is plain JSON.
+    """
+    return {
+        "status": getattr(status, "name", status),
+        "category": getattr(category, "name", category),
+        "amount": amount,
+        "contractor_id": contractor_id,
+        "poster_id": poster_id,
+    }
+
+
+class JobEventBuffer:
+    """
+    Collects job events in memory and writes them to job_events in
+    batches from a background thread.
+
+    `append` only takes a lock and adds to a list, so request handlers
+    never wait on the event insert. The flusher thread wakes every
+    `interval` seconds, or as soon as `batch_size` events are pending, and
+    writes everything pending with one multi-row INSERT. If the writer
+    falls behind by more than `max_pending` events the caller flushes
+    inline rather than growing the buffer without bound.
+
+    Batches commit one at a time across every worker, in id order, so a
+    reader that has seen an event id has seen every lower one (see
+    Job_Event.since).
+
+    The thread exits once a wait passes with nothing pending and is
+    restarted by the next `append`. Events still in memory when a process
+    dies are lost; `stop` (called from the application's shutdown hook)
+    flushes what is left.
+    """
+
+    def __init__(self, db: Database, batch_size: int = 500,
+                 interval: float = 1.0, max_pending: int = 50_000):
+        self.db = db
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_pending = max_pending
+        # Called with (job_id, before, after) as each event is appended,
+        # before it is written; used for cache invalidation.
+        self.observers: List[Callable[[int, Optional[dict],
+                                       Optional[dict]], None]] = []
+        # Called with each batch of rows once it is committed.
+        self.listeners: List[Callable[[List[dict]], None]] = []
+        self._pending: List[dict] = []
+        self._condition = Condition()
+        # Serializes flushes so batches are written in order; held by
+        # anything that must not interleave with one (stats rebuilds).
+        self.flush_lock = RLock()
+        self._thread: Optional[Thread] = None
+        self._stopping = False
+
+    def append(self, job_id: int, event_type: str,
+               before: Optional[dict] = None, after: Optional[dict] = None,
+               actor_id: Optional[int] = None):
+        """
+        Queues one event.
+
+        Args:
+            job_id (int): The job the event is about.
+            event_type (str): "created", "updated", "status" or
+                "archived".
+            before (dict, optional): job_snapshot before the change.
+            after (dict, optional): job_snapshot after the change.
+            actor_id (int, optional): The user who made the change.
+        """
+        for observer in self.observers:
+            try:
+                observer(job_id, before, after)
+            except Exception:
+                logger.exception("job event observer failed")
+
+        row = {
+            "job_id": job_id,
+            "event_type": event_type,
+            "from_status": (before or {}).get("status"),
+            "to_status": (after or {}).get("status"),
+            "actor_id": actor_id,
+            "payload": json.dumps({"before": before, "after": after}),
+        }
+        with self._condition:
+            self._pending.append(row)
+            pending = len(self._pending)
+            if pending >= self.batch_size:
+                self._condition.notify()
+        self._ensure_started()
+
+        if pending >= self.max_pending:
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Writes every pending event now.
+
+        Returns:
+            int: The number of events written.
+        """
+        from work.models import Job_Event
+        from work.stats import apply_stat_deltas, stat_deltas
+
+        with self.flush_lock:
+            with self._condition:
+                rows, self._pending = self._pending, []
+            if not rows:
+                return 0
+
+            try:
+                with self.db.get_db() as session:
+                    if session.bind.dialect.name == "postgresql":
+                        # Held until commit, so the ids of a batch are
+                        # drawn only after every earlier batch, from any
+                        # worker, is visible. SQLite writers are already
+                        # serialized.
+                        session.execute(
+                            text("SELECT pg_advisory_xact_lock(:key)"),
+                            {"key": _EVENTS_LOCK_KEY})
+                    session.execute(insert(Job_Event.__table__), rows)
+                    # The summary counters move in the same transaction,
+                    # so each event is counted exactly once.
+                    apply_stat_deltas(session, stat_deltas(rows))
+                    session.commit()
+            except Exception:
+                # Put the batch back in front so the next flush retries it.
+                with self._condition:
+                    self._pending[:0] = rows
+                raise
+
+        for listener in self.listeners:
+            try:
+                listener(rows)
+            except Exception:
+                logger.exception("job event listener failed")
+        return len(rows)
+
+    def _ensure_started(self):
+        with self._condition:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = Thread(target=self._run, daemon=True,
+                                      name="job-event-flusher")
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if len(self._pending) < self.batch_size and (
+                        not self._stopping):
+                    self._condition.wait(self.interval)
+                stopping = self._stopping
+                if not self._pending:
+                    # Idle: let the thread end; the next append starts
+                    # a new one.
+                    self._thread = None
+                    return
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("flushing job events failed")
+            if stopping:
+                return
+
+    def stop(self):
+        """
+        Stops the flusher thread after a final flush.
+        """
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            with self._condition:
+                self._stopping = True
+                self._condition.notify()
+            thread.join()
+        self._thread = None
+        self.flush()
+
+
+_buffers: "WeakKeyDictionary[Database, JobEventBuffer]" = WeakKeyDictionary()
+
+
+def event_buffer(db: Database) -> JobEventBuffer:
+    """
+    Returns the event buffer that writes to `db`, creating it on first use.
+    """
+    buffer = _buffers.get(db)
+    if buffer is None:
+        from core.config import get_settings
+
+        settings = get_settings()
+        buffer = _buffers.setdefault(db, JobEventBuffer(
+            db, settings.JOB_EVENT_BATCH_SIZE,
+            settings.JOB_EVENT_FLUSH_SECONDS))
+    return buffer
+
+
+def stop_event_buffers():
+    """
+    Flushes and stops every event buffer; called on application shutdown.
+    """
+    for buffer in list(_buffers.values()):
+        buffer.stop()
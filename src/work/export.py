@@ -0,0 +1,21 @@
+from sqlalchemy import select
+
+from core.export import Dataset, ExportColumn
+from work.models import Jobs
+
+JOBS_EXPORT = Dataset(
+    name="jobs",
+    columns=(
+        ExportColumn("id", Jobs.id, "int"),
+        ExportColumn("title", Jobs.title),
+        ExportColumn("description", Jobs.description),
+        ExportColumn("category", Jobs.category),
+        ExportColumn("status", Jobs.status),
+        ExportColumn("amount", Jobs.amount, "float"),
+        ExportColumn("poster_id", Jobs.poster_id, "int"),
+        ExportColumn("taken_by_user_id", Jobs.taken_by_user_id, "int"),
+        ExportColumn("version", Jobs.version, "int"),
+        ExportColumn("updated_on", Jobs.updated_on, "datetime"),
+    ),
+    build_query=lambda columns: select(*columns).order_by(Jobs.id),
+)
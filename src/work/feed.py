@@ -0,0 +1,63 @@
+import json
+from typing import List, Optional, Tuple
+
+from core.broadcast import (Broadcaster, BroadcastBackend,
+                            MemoryBroadcastBackend, PostgresBroadcastBackend)
+from core.config import get_settings
+from core.database import Database
+from work.events import event_buffer
+
+# Events worth pushing to contractors looking for work.
+FEED_EVENT_TYPES = ("created", "status")
+
+job_feed = Broadcaster("job_feed")
+
+
+def feed_message(row: dict) -> Optional[Tuple[str, dict]]:
+    """
+    Turns a job_events row into a (category, message) pair for the feed,
+    or None for events the feed does not carry.
+    """
+    if row["event_type"] not in FEED_EVENT_TYPES:
+        return None
+    after = json.loads(row["payload"])["after"] or {}
+    message = {
+        "job_id": row["job_id"],
+        "event_type": row["event_type"],
+        "from_status": row["from_status"],
+        **after,
+    }
+    return after.get("category"), message
+
+
+def publish_job_events(rows: List[dict]):
+    messages = [message for message in map(feed_message, rows) if message]
+    job_feed.publish(messages)
+
+
+def _backend(db: Database, name: str) -> BroadcastBackend:
+    if name == "postgres":
+        return PostgresBroadcastBackend(db)
+    if name == "memory":
+        return MemoryBroadcastBackend()
+    raise ValueError(f"Unknown JOB_FEED_BACKEND {name!r}")
+
+
+def start_job_feed(db: Database):
+    """
+    Starts the feed on the running event loop and publishes every batch
+    of job events `db` writes from now on.
+    """
+    settings = get_settings()
+    job_feed.queue_size = settings.JOB_FEED_QUEUE_SIZE
+    job_feed.start(_backend(db, settings.JOB_FEED_BACKEND))
+    listeners = event_buffer(db).listeners
+    if publish_job_events not in listeners:
+        listeners.append(publish_job_events)
+
+
+def stop_job_feed(db: Database):
+    listeners = event_buffer(db).listeners
+    if publish_job_events in listeners:
+        listeners.remove(publish_job_events)
+    job_feed.stop()
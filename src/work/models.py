@@ -1,15 +1,31 @@
-from sqlalchemy import Column, String, Integer, Float
-from sqlalchemy import ForeignKey, Enum
+from sqlalchemy import Column, String, Integer, Float, Text
+from sqlalchemy import ForeignKey, Enum, Index, event, select, update
+from sqlalchemy import and_, or_, union_all
 from sqlalchemy.orm import relationship
+from sqlalchemy.orm.exc import StaleDataError
 from sqlalchemy.types import DateTime
 from sqlalchemy.sql import func
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError, DBAPIError
 
-from typing import Optional
+import json
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
 
 from auth.enums import CATEGORY_STATES, JOB_STATUS_STATES
 from auth.models import User, Client_Additional, Contractor_Additional
+from core import geo
 from core.database import ModelBase as Base, Database
+from work.emuns import JOB_STATUS_TRANSITIONS
+from work.events import event_buffer, job_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidTransition(ValueError):
+    """
+    Raised when a job is moved to a status its current status does not
+    allow (see JOB_STATUS_TRANSITIONS).
+    """
 
 
 class Jobs(Base):
@@ -18,83 +34,624 @@ class Jobs(Base):
     description = Column(String(length=512), nullable=False)
     category = Column(Enum(CATEGORY_STATES), nullable=False)
     poster = relationship("Client_Additional", back_populates="posted_jobs")
-    poster_id = Column(Integer, ForeignKey(Client_Additional.id))
-    taken_by_user_id = Column(Integer, ForeignKey(Contractor_Additional.id))
+    # Indexed: every user load joins a client's posted or a contractor's
+    # taken jobs through these.
+    poster_id = Column(Integer, ForeignKey(Client_Additional.id),
+                       index=True)
+    taken_by_user_id = Column(Integer, ForeignKey(Contractor_Additional.id),
+                              index=True)
     taken_by_user = relationship("Contractor_Additional",
                                  back_populates="jobs")
     amount = Column(Float, nullable=False)
     status = Column(Enum(JOB_STATUS_STATES), nullable=False,
                     default=JOB_STATUS_STATES.UNASSIGNED.value)
+    # Bumped on every write; ORM flushes check it automatically and the
+    # set-based writes below compare and increment it explicitly.
+    version = Column(Integer, nullable=False, default=1)
+    updated_on = Column(DateTime(timezone=True), server_default=func.now(),
+                        onupdate=func.now(), nullable=False)
+    # Where the work is done, if on site. geohash is derived from them
+    # (see core.geo) so the open jobs near a point are a few ranges of
+    # ix_jobs_status_geohash.
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    geohash = Column(String(length=12), nullable=True)
     # messages = relationship("Message", back_populates="job",
     #                        lazy="joined", uselist=True)
 
+    __mapper_args__ = {
+        "version_id_col": version
+    }
+    __table_args__ = (
+        # Finds closed jobs old enough to archive (work.archive).
+        Index("ix_jobs_status_updated_on", "status", "updated_on"),
+        # Finds open jobs near a point (`nearest`).
+        Index("ix_jobs_status_geohash", "status", "geohash", "latitude",
+              "longitude"),
+    )
+
+    # Columns a poster may edit through `update`.
+    EDITABLE_FIELDS = ("title", "description", "category", "amount",
+                       "latitude", "longitude")
+
     def __init__(self, title: str, description: str, category: CATEGORY_STATES,
-                 amount: float, status: JOB_STATUS_STATES, poster: User):
+                 amount: float, status: JOB_STATUS_STATES, poster: User,
+                 latitude: Optional[float] = None,
+                 longitude: Optional[float] = None):
         self.title = title
         self.description = description
         self.category = category
         self.amount = amount
         self.poster = poster
         self.status = status
+        self.latitude = latitude
+        self.longitude = longitude
+        self.geohash = _geohash(latitude, longitude)
+
+    def snapshot(self) -> dict:
+        return job_snapshot(self.status, self.category, self.amount,
+                            self.taken_by_user_id, self.poster_id)
+
+    def create(self, db: Database, actor_id: Optional[int] = None) -> int:
+        status = self.status or JOB_STATUS_STATES.UNASSIGNED
+        if JOB_STATUS_STATES[getattr(status, "name", status)] != (
+                JOB_STATUS_STATES.UNASSIGNED):
+            raise InvalidTransition("New jobs must start UNASSIGNED")
 
-    def create(self, db: Database) -> int:
         with db.get_db() as session:
             session.add(self)
             session.commit()
             session.refresh(self)
+            event_buffer(db).append(self.id, "created", None,
+                                    self.snapshot(), actor_id)
             return self.id
 
-    def update(self, db: Database, fields: dict) -> Optional[str]:
-        with db.get_db() as session:
+    def update(self, db: Database, fields: dict,
+               expected_version: Optional[int] = None,
+               actor_id: Optional[int] = None) -> Optional[str]:
+        """
+        Applies `fields` with a single compare-and-set UPDATE.
 
-            for field, value in fields.items():
-                setattr(self, field, value) if (
-                    field != "category"
-                ) else setattr(self, field, CATEGORY_STATES(value).name)
+        The row is only written if its version still matches the version
+        the caller read (`expected_version`, or this object's own), so
+        concurrent edits cannot silently overwrite each other.
+
+        Args:
+            fields (dict): The fields to change; anything outside
+                EDITABLE_FIELDS is ignored.
+            expected_version (int, optional): The version the client
+                last saw.
+
+        Returns:
+            A success message, or None if the database rejected the write.
+
+        Raises:
+            StaleDataError: If the job was modified since it was read.
+        """
+        values = {field: value for field, value in fields.items()
+                  if field in self.EDITABLE_FIELDS}
+        if "category" in values:
+            values["category"] = CATEGORY_STATES(values["category"])
+        if "latitude" in values or "longitude" in values:
+            values["geohash"] = _geohash(
+                values.get("latitude", self.latitude),
+                values.get("longitude", self.longitude))
+        version = expected_version if (
+            expected_version is not None) else self.version
+
+        with db.get_db() as session:
             try:
-                session.merge(self)
+                result = session.execute(
+                    update(Jobs).where(Jobs.id == self.id,
+                                       Jobs.version == version)
+                    .values(**values, version=Jobs.version + 1)
+                    .execution_options(synchronize_session=False))
                 session.commit()
-            except SQLAlchemyError as exc:
-                print(str(exc))
+            except SQLAlchemyError:
+                logger.exception("updating job %s failed", self.id)
                 return None
+
+        if result.rowcount != 1:
+            raise StaleDataError(
+                f"Job {self.id} was modified since version {version}")
+
+        # The version matched, so this object's values are the row's
+        # values from just before the update.
+        before = self.snapshot()
+        for field, value in values.items():
+            setattr(self, field, value)
+        self.version = version + 1
+        event_buffer(db).append(self.id, "updated", before, self.snapshot(),
+                                actor_id)
         return "Job was successfully updated."
 
-    def get_by_id(db: Database, job_id: int):
+    def transition(self, db: Database, new_status: JOB_STATUS_STATES,
+                   actor_id: Optional[int] = None):
+        """
+        Moves the job to `new_status` if JOB_STATUS_TRANSITIONS allows it.
+
+        The UPDATE matches on the status and version this object holds,
+        so a concurrent change makes it fail rather than skip a state.
+        Moving back to UNASSIGNED releases the assigned contractor. A job
+        only becomes ASSIGNED together with its contractor (`claim`,
+        `assign_contractor`, dispatch), never through here.
+
+        Raises:
+            InvalidTransition: If the change is not allowed.
+            StaleDataError: If the job changed since it was read.
+        """
+        current = self.status
+        if new_status not in JOB_STATUS_TRANSITIONS[current]:
+            raise InvalidTransition(
+                f"Cannot move a job from {current.name} to {new_status.name}")
+        if (new_status == JOB_STATUS_STATES.ASSIGNED
+                and self.taken_by_user_id is None):
+            raise InvalidTransition(
+                "A job is assigned by claiming it or assigning a contractor")
+
+        values = {"status": new_status, "version": Jobs.version + 1}
+        if new_status == JOB_STATUS_STATES.UNASSIGNED:
+            values["taken_by_user_id"] = None
+
         with db.get_db() as session:
+            result = session.execute(
+                update(Jobs.__table__).where(
+                    Jobs.id == self.id, Jobs.status == current,
+                    Jobs.version == self.version).values(**values))
+            session.commit()
+
+        if result.rowcount != 1:
+            raise StaleDataError(
+                f"Job {self.id} was modified since version {self.version}")
+
+        before = self.snapshot()
+        self.status = new_status
+        self.version += 1
+        if new_status == JOB_STATUS_STATES.UNASSIGNED:
+            self.taken_by_user_id = None
+        event_buffer(db).append(self.id, "status", before, self.snapshot(),
+                                actor_id)
+
+    def claim(db: Database, contractor_id: int,
+              job_id: Optional[int] = None,
+              category: Optional[CATEGORY_STATES] = None) -> Optional[int]:
+        """
+        Claims an UNASSIGNED job for a contractor.
+
+        On Postgres this is one round trip: an UPDATE whose target is
+        picked by a `SELECT ... FOR UPDATE SKIP LOCKED` subquery, so
+        contractors racing for the same jobs each lock a different row
+        instead of queueing behind one row lock. Other databases fall back
+        to a select followed by a conditional UPDATE, retried on conflict.
+
+        Args:
+            contractor_id (int): The Contractor_Additional id claiming.
+            job_id (int, optional): Claim this job only; otherwise the
+                oldest open job (in `category`, if given) is claimed.
+            category (CATEGORY_STATES, optional): Restrict the claim to a
+                category.
+
+        Returns:
+            int | None: The id of the claimed job, or None if no matching
+            job was available.
+        """
+        candidates = select(Jobs.id, Jobs.category, Jobs.amount,
+                            Jobs.poster_id).where(
+            Jobs.status == JOB_STATUS_STATES.UNASSIGNED,
+            Jobs.taken_by_user_id.is_(None))
+        if job_id is not None:
+            candidates = candidates.where(Jobs.id == job_id)
+        if category is not None:
+            candidates = candidates.where(Jobs.category == category)
+        candidates = candidates.order_by(Jobs.id).limit(1)
+
+        claim = update(Jobs.__table__).where(
+            Jobs.status == JOB_STATUS_STATES.UNASSIGNED
+        ).values(taken_by_user_id=contractor_id,
+                 status=JOB_STATUS_STATES.ASSIGNED,
+                 version=Jobs.version + 1)
+
+        claimed = None
+        with db.get_db() as session:
+            if session.bind.dialect.name == "postgresql":
+                target = candidates.with_only_columns(Jobs.id).with_for_update(
+                    skip_locked=True).scalar_subquery()
+                claimed = session.execute(
+                    claim.where(Jobs.id == target).returning(
+                        Jobs.id, Jobs.category, Jobs.amount, Jobs.poster_id)
+                ).first()
+                session.commit()
+            else:
+                for _ in range(5):
+                    target = session.execute(candidates).first()
+                    if target is None:
+                        break
+                    result = session.execute(
+                        claim.where(Jobs.id == target.id))
+                    session.commit()
+                    if result.rowcount == 1:
+                        claimed = target
+                        break
+
+        if claimed is None:
+            return None
+        event_buffer(db).append(
+            claimed.id, "status",
+            job_snapshot(JOB_STATUS_STATES.UNASSIGNED, claimed.category,
+                         claimed.amount, None, claimed.poster_id),
+            job_snapshot(JOB_STATUS_STATES.ASSIGNED, claimed.category,
+                         claimed.amount, contractor_id, claimed.poster_id))
+        return claimed.id
+
+    def get_by_id(db: Database, job_id: int, readonly: bool = True):
+        """
+        Retrieves a job by its id.
+
+        Args:
+            job_id (int): The id of the job to retrieve.
+            readonly (bool): False when the job is read in order to be
+                modified, so it comes from the primary rather than a
+                possibly lagging replica.
+
+        Returns:
+            Jobs | None: The job if found, None otherwise.
+        """
+        with db.get_db(readonly=readonly) as session:
             stored_obj: Jobs = session.query(
                 Jobs).filter_by(id=job_id).scalar()
             return stored_obj
 
+    def get_by_ids(db: Database, job_ids: List[int]) -> Dict[int, "Jobs"]:
+        """
+        Retrieves many jobs with one query.
+
+        Returns:
+            dict: Each job found, by id.
+        """
+        with db.get_db(readonly=True) as session:
+            jobs = session.query(Jobs).filter(Jobs.id.in_(job_ids)).all()
+        return {job.id: job for job in jobs}
+
+    def nearest(db: Database, latitude: float, longitude: float,
+                limit: int = 20, max_radius_km: float = 50.0,
+                categories: Optional[Iterable[CATEGORY_STATES]] = None,
+                max_amount: Optional[float] = None,
+                start_radius_km: float = 2.0
+                ) -> List[Tuple[float, "Jobs"]]:
+        """
+        The `limit` open jobs nearest to a point, within `max_radius_km`,
+        nearest first.
+
+        Each round reads the jobs inside a radius through
+        ix_jobs_status_geohash: the circle is covered with at most 16
+        geohash cells, each one index range, and rows outside the circle
+        are dropped. The index holds the coordinates too, so rows outside
+        the circle's bounding box are skipped without reading them. The
+        radius starts at `start_radius_km` and grows until `limit` jobs
+        are inside it, so every nearer job has been read.
+
+        Args:
+            categories (list, optional): Only jobs in these categories.
+            max_amount (float, optional): Only jobs paying at most this.
+
+        Returns:
+            list: (distance in km, job) pairs.
+        """
+        radius = min(start_radius_km, max_radius_km)
+        with db.get_db(readonly=True) as session:
+            while True:
+                found = []
+                for job in session.query(Jobs).from_statement(
+                        _nearby_query(latitude, longitude, radius,
+                                      categories, max_amount)):
+                    distance = geo.distance_km(latitude, longitude,
+                                               job.latitude, job.longitude)
+                    if distance <= radius:
+                        found.append((distance, job))
+                if len(found) >= limit or radius >= max_radius_km:
+                    found.sort(key=lambda hit: (hit[0], hit[1].id))
+                    return found[:limit]
+                radius = min(radius * 4, max_radius_km)
+
+    def get_validators(db: Database, job_id: int):
+        """
+        Reads a job's version and last update time without loading it.
+
+        Returns:
+            tuple | None: (version, updated_on), or None if the job does
+            not exist.
+        """
+        with db.get_db(readonly=True) as session:
+            return session.execute(
+                select(Jobs.version, Jobs.updated_on).where(
+                    Jobs.id == job_id)).first()
+
     def get_jobs_by_userId(db: Database, user_additional_id: int):
-        with db.get_db() as session:
+        with db.get_db(readonly=True) as session:
             return session.query(Jobs).filter_by(
                 poster_id=user_additional_id).all()
 
     def assign_contractor(self, db: Database, contractor) -> bool or str:
         """Assigns a contractor to this job and updates the database.
 
+        Like `claim`, the UPDATE only matches an UNASSIGNED job at the
+        version this object holds, so two admins assigning the same job
+        cannot both succeed.
+
         Args:
-            contractor: The User object representing the contractor.
+            contractor: The User object (or its Contractor_Additional)
+                representing the contractor.
 
         Returns:
             True on success, a descriptive error string on failure.
+
+        Raises:
+            StaleDataError: If the job changed since it was read.
         """
 
+        if isinstance(contractor, User):
+            contractor = contractor.additional
+
+        if JOB_STATUS_STATES.ASSIGNED not in JOB_STATUS_TRANSITIONS[
+                self.status]:
+            return f"Error assigning contractor: job is {self.status.name}"
+
         try:
             with db.get_db() as session:
-                self.takenByUser = contractor
-                session.merge(self)
+                result = session.execute(
+                    update(Jobs.__table__).where(
+                        Jobs.id == self.id,
+                        Jobs.status == JOB_STATUS_STATES.UNASSIGNED,
+                        Jobs.version == self.version
+                    ).values(taken_by_user_id=contractor.id,
+                             status=JOB_STATUS_STATES.ASSIGNED,
+                             version=Jobs.version + 1))
                 session.commit()
-                return True
         except IntegrityError as e:
             # Handle potential constraint violations, foreign key errors, etc.
-            session.rollback()
             return f"Error assigning contractor: {str(e)}, Integrity constraint violated."
-        except (DBAPIError, Exception) as e:
-            # Handle other database or unexpected errors
-            session.rollback()
+        except DBAPIError as e:
+            # Handle other database errors
             return f"Error assigning contractor: {str(e)}"
 
+        if result.rowcount != 1:
+            raise StaleDataError(
+                f"Job {self.id} was modified since version {self.version}")
+
+        before = self.snapshot()
+        self.taken_by_user_id = contractor.id
+        self.status = JOB_STATUS_STATES.ASSIGNED
+        self.version += 1
+        event_buffer(db).append(self.id, "status", before, self.snapshot())
+        return True
+
+def _geohash(latitude: Optional[float], longitude: Optional[float]
+             ) -> Optional[str]:
+    if latitude is None or longitude is None:
+        return None
+    return geo.encode(latitude, longitude)
+
+
+def _nearby_query(latitude: float, longitude: float, radius_km: float,
+                  categories: Optional[Iterable[CATEGORY_STATES]],
+                  max_amount: Optional[float]):
+    # Open jobs in the geohash cells and bounding boxes of the circle: one
+    # UNION ALL branch per cell, so each is a plain range scan of
+    # ix_jobs_status_geohash (planners tend to give up on ORs of ranges).
+    boxes = geo.bounding_boxes(latitude, longitude, radius_km)
+    filters = [
+        Jobs.status == JOB_STATUS_STATES.UNASSIGNED,
+        Jobs.taken_by_user_id.is_(None),
+        or_(*(and_(Jobs.latitude.between(min_lat, max_lat),
+                   Jobs.longitude.between(min_lon, max_lon))
+              for min_lat, min_lon, max_lat, max_lon in boxes)),
+    ]
+    if categories is not None:
+        filters.append(Jobs.category.in_(list(categories)))
+    if max_amount is not None:
+        filters.append(Jobs.amount <= max_amount)
+
+    branches = []
+    for cell in geo.covering_cells(boxes):
+        low, high = geo.prefix_range(cell)
+        cell_range = [Jobs.geohash >= low]
+        if high is not None:
+            cell_range.append(Jobs.geohash < high)
+        branches.append(select(Jobs).where(*cell_range, *filters))
+    return branches[0] if len(branches) == 1 else union_all(*branches)
+
+
+class Archived_Job(Base):
+    """
+    Completed and cancelled jobs moved out of jobs by work.archive once
+    they are older than JOB_ARCHIVE_AFTER_DAYS.
+
+    Keeping them apart keeps jobs, its indexes and the jobs eagerly
+    loaded with every user small. Archived jobs are only read through the
+    history API. Like job_events there are no foreign keys, so archived
+    rows do not hold up changes to users.
+    """
+
+    __tablename__ = "jobs_archive"
+
+    id = Column(Integer, primary_key=True, nullable=False)
+    title = Column(String(length=256), nullable=False)
+    description = Column(String(length=512), nullable=False)
+    category = Column(Enum(CATEGORY_STATES), nullable=False)
+    poster_id = Column(Integer, index=True)
+    taken_by_user_id = Column(Integer, index=True)
+    amount = Column(Float, nullable=False)
+    status = Column(Enum(JOB_STATUS_STATES), nullable=False)
+    version = Column(Integer, nullable=False)
+    updated_on = Column(DateTime(timezone=True), nullable=False)
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    archived_on = Column(DateTime(timezone=True), server_default=func.now(),
+                         nullable=False)
+
+    # Columns copied from jobs as they are.
+    COPIED_FIELDS = ("id", "title", "description", "category", "poster_id",
+                     "taken_by_user_id", "amount", "status", "version",
+                     "updated_on", "latitude", "longitude")
+
+    def get_by_id(db: Database, job_id: int):
+        """
+        Retrieves an archived job by its (original) id.
+
+        Returns:
+            Archived_Job | None: The job if it has been archived.
+        """
+        with db.get_db(readonly=True) as session:
+            return session.get(Archived_Job, job_id)
+
+    def history(db: Database, poster_id: Optional[int] = None,
+                contractor_id: Optional[int] = None,
+                cursor: Optional[int] = None,
+                limit: int = 50) -> List["Archived_Job"]:
+        """
+        Lists archived jobs newest first; pass the last id returned as the
+        next `cursor` to page back through the history.
+
+        Args:
+            poster_id (int, optional): Only jobs posted by this
+                Client_Additional.
+            contractor_id (int, optional): Only jobs taken by this
+                Contractor_Additional.
+            cursor (int, optional): Only jobs with a smaller id.
+            limit (int): Maximum number of jobs returned.
+        """
+        query = select(Archived_Job)
+        if poster_id is not None:
+            query = query.where(Archived_Job.poster_id == poster_id)
+        if contractor_id is not None:
+            query = query.where(
+                Archived_Job.taken_by_user_id == contractor_id)
+        if cursor is not None:
+            query = query.where(Archived_Job.id < cursor)
+        with db.get_db(readonly=True) as session:
+            return session.execute(query.order_by(Archived_Job.id.desc())
+                                   .limit(limit)).scalars().all()
+
+
+class Job_Event(Base):
+    """
+    Append-only history of job changes, written in batches by
+    work.events.JobEventBuffer and read incrementally through `since`.
+
+    `payload` holds the job_snapshot from before and after the change.
+    There is deliberately no foreign key to jobs, so history outlives
+    the job rows it describes.
+    """
+
+    __tablename__ = "job_events"
+
+    id = Column(Integer, primary_key=True, index=True, nullable=False)
+    job_id = Column(Integer, index=True, nullable=False)
+    event_type = Column(String(length=16), nullable=False)
+    from_status = Column(Enum(JOB_STATUS_STATES), nullable=True)
+    to_status = Column(Enum(JOB_STATUS_STATES), nullable=True)
+    actor_id = Column(Integer, nullable=True)
+    payload = Column(Text, nullable=False)
+    created_on = Column(DateTime(timezone=True), server_default=func.now(),
+                        nullable=False)
+
+    def dict(self, exclude_none=True):
+        content = super().dict(exclude_none)
+        content["payload"] = json.loads(self.payload)
+        return content
+
+    def since(db: Database, cursor: int = 0, limit: int = 500,
+              job_id: Optional[int] = None) -> List["Job_Event"]:
+        """
+        Lists events after `cursor` in id order; pass the last id seen as
+        the next cursor to read the feed incrementally.
+
+        No event is skipped: ids become visible in order because event
+        batches commit one at a time (see work.events.JobEventBuffer), so
+        no lower id can commit after a higher one has been read.
+
+        Args:
+            cursor (int): The last event id already consumed.
+            limit (int): Maximum number of events returned.
+            job_id (int, optional): Only return events for this job.
+
+        Returns:
+            list[Job_Event]: Up to `limit` events with id > cursor.
+        """
+        with db.get_db(readonly=True) as session:
+            query = session.query(Job_Event).filter(Job_Event.id > cursor)
+            if job_id is not None:
+                query = query.filter(Job_Event.job_id == job_id)
+            return query.order_by(Job_Event.id).limit(limit).all()
+
+
+@event.listens_for(Job_Event, "before_update")
+@event.listens_for(Job_Event, "before_delete")
+def _job_events_are_append_only(mapper, connection, target):
+    raise SQLAlchemyError("job_events is append-only")
+
+
+class Job_Stat(Base):
+    """
+    Summary counters over jobs, maintained incrementally from the job
+    event log (see work.stats) and periodically rebuilt from jobs.
+
+    One row per (scope, key):
+        all/jobs            every job
+        status/<STATUS>     jobs in each status
+        category/<NAME>     jobs in each category
+        contractor/<id>     a contractor's active (assigned, in progress
+                            or pending) jobs
+
+    `count` is the number of jobs and `amount` the sum of their amounts.
+    Archived jobs (see Archived_Job) are no longer counted.
+    """
+
+    __tablename__ = "job_stats"
+
+    scope = Column(String(length=16), primary_key=True)
+    key = Column(String(length=64), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    amount = Column(Float, nullable=False, default=0.0)
+
+    def summary(db: Database, contractors: int = 100) -> dict:
+        """
+        Reads the dashboard figures from the summary table; the cost does
+        not depend on the number of jobs.
+
+        Args:
+            contractors (int): How many of the busiest contractors to list.
+
+        Returns:
+            dict: Totals, averages and per status/category/contractor
+            counts.
+        """
+        with db.get_db(readonly=True) as session:
+            rows = session.execute(
+                select(Job_Stat.scope, Job_Stat.key, Job_Stat.count,
+                       Job_Stat.amount).where(
+                    Job_Stat.scope != "contractor")).all()
+            busiest = session.execute(
+                select(Job_Stat.key, Job_Stat.count).where(
+                    Job_Stat.scope == "contractor", Job_Stat.count > 0)
+                .order_by(Job_Stat.count.desc(), Job_Stat.key)
+                .limit(contractors)).all()
+
+        content = {"jobs": 0, "amount_total": 0.0, "amount_average": None,
+                   "by_status": {}, "by_category": {},
+                   "active_by_contractor": {
+                       int(key): count for key, count in busiest}}
+        for scope, key, count, amount in rows:
+            if scope == "all":
+                content["jobs"] = count
+                content["amount_total"] = amount
+                if count:
+                    content["amount_average"] = amount / count
+            elif scope in ("status", "category") and count:
+                content[f"by_{scope}"][key] = {"jobs": count,
+                                               "amount": amount}
+        return content
+
 
 # class Transaction(Base):
 #    id = Column(Integer, primary_key=True, index=True, nullable=False)
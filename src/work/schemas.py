@@ -1,15 +1,30 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, confloat, root_validator
 from typing import Optional
 
 from work.emuns import JOB_STATUS_STATES, CATEGORY_STATES
 
 
+Latitude = confloat(ge=-90, le=90)
+Longitude = confloat(ge=-180, le=180)
+
+
+def _both_or_neither(cls, values):
+    if (values.get("latitude") is None) != (values.get("longitude") is None):
+        raise ValueError("latitude and longitude go together")
+    return values
+
+
 class Post_Job_Schema(BaseModel):
     title: str
     description: str
     status: JOB_STATUS_STATES = JOB_STATUS_STATES.UNASSIGNED
     category: int
     amount: float
+    # Where the work is done, for on-site jobs.
+    latitude: Optional[Latitude] = None
+    longitude: Optional[Longitude] = None
+
+    _location = root_validator(allow_reuse=True)(_both_or_neither)
 
 
 class Update_Job_Schema(BaseModel):
@@ -18,3 +33,60 @@ class Update_Job_Schema(BaseModel):
     description: Optional[str]
     category: Optional[int]
     amount: Optional[float]
+    latitude: Optional[Latitude]
+    longitude: Optional[Longitude]
+    version: Optional[int]
+
+    _location = root_validator(allow_reuse=True)(_both_or_neither)
+
+
+class Service_Area_Schema(BaseModel):
+    """
+    A contractor's service area; all None clears it.
+    """
+    latitude: Optional[Latitude] = None
+    longitude: Optional[Longitude] = None
+    radius_km: Optional[confloat(gt=0, le=1000)] = None
+
+    @root_validator(allow_reuse=True)
+    def _complete(cls, values):
+        given = [values.get(field) is not None
+                 for field in ("latitude", "longitude", "radius_km")]
+        if any(given) and not all(given):
+            raise ValueError(
+                "latitude, longitude and radius_km go together")
+        return values
+
+
+class Update_Status_Schema(BaseModel):
+    job_id: int
+    status: JOB_STATUS_STATES
+    version: Optional[int]
+
+
+class Claim_Job_Schema(BaseModel):
+    job_id: Optional[int]
+    category: Optional[int]
+
+
+class Assign_Contractor_Schema(BaseModel):
+    job_id: int
+    contractor_id: int
+
+
+class Dispatch_Report(BaseModel):
+    contractors: int = 0
+    jobs_considered: int = 0
+    matched: int = 0
+    assigned: int = 0
+    unmatched: int = 0
+    batches: int = 0
+    skipped: bool = False
+    seconds: float = 0.0
+    matches_per_second: float = 0.0
+
+
+class Archive_Report(BaseModel):
+    archived: int = 0
+    batches: int = 0
+    seconds: float = 0.0
@@ -0,0 +1,171 @@
+import json
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select, text, update
+
+from core.database import Database
+from work.emuns import JOB_STATUS_STATES
+
+logger = logging.getLogger(__name__)
+
+# Statuses that count as a contractor's active jobs.
+ACTIVE_STATUSES = frozenset((JOB_STATUS_STATES.ASSIGNED.name,
+                             JOB_STATUS_STATES.IN_PROGRESS.name,
+                             JOB_STATUS_STATES.PENDING.name))
+
+# Arbitrary, fixed key for the Postgres advisory lock that keeps stats
+# rebuilds from running concurrently.
+_REBUILD_LOCK_KEY = 0x73746174
+
+StatKey = Tuple[str, str]
+
+
+def _contributions(snapshot: Optional[dict]):
+    """
+    The (scope, key) counters a job in the state `snapshot` is counted in.
+    """
+    if not snapshot:
+        return
+    yield "all", "jobs"
+    if snapshot.get("status"):
+        yield "status", snapshot["status"]
+    if snapshot.get("category"):
+        yield "category", snapshot["category"]
+    if snapshot.get("status") in ACTIVE_STATUSES and (
+            snapshot.get("contractor_id") is not None):
+        yield "contractor", str(snapshot["contractor_id"])
+
+
+def stat_deltas(rows: List[dict]) -> Dict[StatKey, List[float]]:
+    """
+    Folds a batch of job_events rows into net [count, amount] changes per
+    counter: each event removes the job's old state and adds its new one.
+    """
+    deltas: Dict[StatKey, List[float]] = defaultdict(lambda: [0, 0.0])
+    for row in rows:
+        payload = json.loads(row["payload"])
+        for sign, snapshot in ((-1, payload["before"]),
+                               (1, payload["after"])):
+            amount = (snapshot or {}).get("amount") or 0.0
+            for stat in _contributions(snapshot):
+                deltas[stat][0] += sign
+                deltas[stat][1] += sign * amount
+    return {stat: delta for stat, delta in deltas.items()
+            if delta[0] or delta[1]}
+
+
+def apply_stat_deltas(session, deltas: Dict[StatKey, List[float]]):
+    """
+    Adds `deltas` to job_stats inside the caller's transaction, with one
+    upsert per counter.
+    """
+    from work.models import Job_Stat
+
+    if not deltas:
+        return
+    table = Job_Stat.__table__
+    rows = [{"scope": scope, "key": key, "count": count, "amount": amount}
+            for (scope, key), (count, amount) in deltas.items()]
+
+    dialect = session.bind.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        statement = upsert(table)
+        session.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.scope, table.c.key],
+            set_={"count": table.c.count + statement.excluded.count,
+                  "amount": table.c.amount + statement.excluded.amount}),
+            rows)
+        return
+
+    for row in rows:
+        result = session.execute(
+            update(table).where(table.c.scope == row["scope"],
+                                table.c.key == row["key"])
+            .values(count=table.c.count + row["count"],
+                    amount=table.c.amount + row["amount"]))
+        if result.rowcount == 0:
+            session.execute(insert(table), [row])
+
+
+def rebuild_job_stats(db: Database, wait: bool = False) -> bool:
+    """
+    Recomputes every counter from the jobs table with GROUP BY queries and
+    replaces job_stats in one transaction.
+
+    Takes the job event buffer's flush lock and flushes it first, so no
+    batch of deltas is applied halfway through. A job change that commits
+    while the rebuild reads, but whose event is flushed after it, is
+    counted twice until the next rebuild; the error never accumulates.
+
+    On Postgres one worker rebuilds at a time; while another one is
+    rebuilding this returns False without doing anything, unless `wait`.
+
+    Returns:
+        bool: Whether this call rebuilt the table.
+    """
+    from work.events import event_buffer
+    from work.models import Jobs, Job_Stat
+
+    buffer = event_buffer(db)
+    with buffer.flush_lock:
+        buffer.flush()
+        with db.get_db() as session:
+            if session.bind.dialect.name == "postgresql":
+                if wait:
+                    session.execute(
+                        text("SELECT pg_advisory_xact_lock(:key)"),
+                        {"key": _REBUILD_LOCK_KEY})
+                elif not session.execute(
+                        text("SELECT pg_try_advisory_xact_lock(:key)"),
+                        {"key": _REBUILD_LOCK_KEY}).scalar():
+                    logger.debug("job stats rebuild already running")
+                    return False
+
+            rows = [{"scope": "all", "key": "jobs", "count": count,
+                     "amount": amount or 0.0}
+                    for count, amount in session.execute(
+                        select(func.count(Jobs.id), func.sum(Jobs.amount)))]
+            for scope, column in (("status", Jobs.status),
+                                  ("category", Jobs.category)):
+                rows += [{"scope": scope, "key": value.name, "count": count,
+                          "amount": amount or 0.0}
+                         for value, count, amount in session.execute(
+                             select(column, func.count(Jobs.id),
+                                    func.sum(Jobs.amount))
+                             .group_by(column))]
+            rows += [{"scope": "contractor", "key": str(contractor_id),
+                      "count": count, "amount": amount or 0.0}
+                     for contractor_id, count, amount in session.execute(
+                         select(Jobs.taken_by_user_id, func.count(Jobs.id),
+                                func.sum(Jobs.amount))
+                         .where(Jobs.status.in_(ACTIVE_STATUSES),
+                                Jobs.taken_by_user_id.isnot(None))
+                         .group_by(Jobs.taken_by_user_id))]
+
+            session.execute(delete(Job_Stat.__table__))
+            session.execute(insert(Job_Stat.__table__), rows)
+            session.commit()
+    logger.info("rebuilt job stats: %d counters", len(rows))
+    return True
+
+
+def job_stats(db: Database, contractors: int = 100) -> dict:
+    """
+    Returns the summary, building the table first if it has never been
+    built (e.g. right after the table was created on existing data).
+    """
+    from work.models import Job_Stat
+
+    with db.get_db(readonly=True) as session:
+        built = session.execute(
+            select(Job_Stat.key).where(Job_Stat.scope == "all")).first()
+    if built is None:
+        # Wait for a rebuild running elsewhere rather than read nothing.
+        rebuild_job_stats(db, wait=True)
+    return Job_Stat.summary(db, contractors)